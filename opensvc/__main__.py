@@ -50,6 +50,10 @@
 """
 
 def main(argv=None):
+    import_profile = os.environ.get("OSVC_IMPORT_PROFILE")
+    if import_profile:
+        from utilities.importprofile import start
+        start(import_profile)
     cwd = os.environ.get("OSVC_CWD")
     if cwd:
         try:
@@ -11,6 +11,7 @@
 import zlib
 import time
 import select
+import struct
 import sys
 from errno import ECONNREFUSED, EPIPE, EBUSY, EALREADY, EAGAIN, ETIMEDOUT
 
@@ -22,10 +23,9 @@ class DummyException(Exception):
     pass
 
 try:
+    # the h2 client modules are imported on first use, as most commands
+    # do not talk to a remote daemon.
     import ssl
-    import foreign.h2.connection
-    import foreign.hyper as hyper
-    from foreign.hyper.common.headers import HTTPHeaderMap
     SSLWantReadError = ssl.SSLWantReadError
     SSLError = ssl.SSLError
     ssl.HAS_ALPN # stack on Attribute error on py <3.5 and <2.7.10
@@ -66,6 +66,15 @@ def to_bytes(x):
 PAUSE = 0.2
 PING = ".".encode()
 
+# Seconds a pooled h2 client connection can stay unused before being closed
+H2_POOL_IDLE_TMO = 30
+
+# The maximum number of pooled h2 client connections to the same endpoint
+# with the same credentials. The daemon serves the streams of a connection
+# sequentially, so concurrent requests prefer an idle connection and
+# multiplex streams over the least busy connection only past this limit.
+H2_POOL_MAX_CONNS = 4
+
 # Number of received misencrypted data messages by senders
 BLACKLIST = {}
 
@@ -92,39 +101,39 @@ class SockReset(Exception):
         from Cryptodome import __version__ as version
         CRYPTO_MODULE = "pycryptodome %s" % version
 
-    def _encrypt(message, key, _iv):
+    def _encrypt(message, key, _iv, compress=zlib.compress):
         """
         Low level encrypter.
         """
         message = pyaes.util.append_PKCS7_padding(
-            zlib.compress(message)
+            compress(message)
         )
         obj = AES.new(to_bytes(key), AES.MODE_CBC, _iv)
         ciphertext = obj.encrypt(message)
         return ciphertext
 
-    def _decrypt(ciphertext, key, _iv):
+    def _decrypt(ciphertext, key, _iv, decompress=zlib.decompress):
         """
         Low level decrypter.
         """
         obj = AES.new(to_bytes(key), AES.MODE_CBC, _iv)
         message = obj.decrypt(ciphertext)
-        return zlib.decompress(pyaes.util.strip_PKCS7_padding(message))
+        return decompress(pyaes.util.strip_PKCS7_padding(message))
 except ImportError:
     CRYPTO_MODULE = "fallback"
 
-    def _encrypt(message, key, _iv):
+    def _encrypt(message, key, _iv, compress=zlib.compress):
         """
         Low level encrypter.
         """
         obj = pyaes.Encrypter(
             pyaes.AESModeOfOperationCBC(to_bytes(key), iv=_iv)
         )
-        ciphertext = obj.feed(zlib.compress(message))
+        ciphertext = obj.feed(compress(message))
         ciphertext += obj.feed()
         return ciphertext
 
-    def _decrypt(ciphertext, key, _iv):
+    def _decrypt(ciphertext, key, _iv, decompress=zlib.decompress):
         """
         Low level decrypter.
         """
@@ -133,7 +142,105 @@ def _decrypt(ciphertext, key, _iv):
         )
         message = obj.feed(ciphertext)
         message += obj.feed()
-        return zlib.decompress(message)
+        return decompress(message)
+
+# Binary heartbeat frames.
+#
+# A frame is a fixed size header, followed by the cluster name, the node
+# name and the ciphertext:
+#
+#   magic, version, flags, cluster name length, node name length, iv,
+#   ciphertext length
+#
+# Frames are self-delimited, so they can be concatenated on a stream.
+HB_FRAME = struct.Struct("!4sBBBB16sI")
+HB_FRAME_MAGIC = b"OSVB"
+HB_FRAME_VERSION = 1
+
+# Frame flags
+HB_FRAME_ZDICT = 0x01
+
+# The preset zlib dictionary used by HB_FRAME_ZDICT frames, made of the
+# strings the most frequently found in the node datasets. Changing this
+# dictionary requires a HB_FRAME_VERSION increment.
+HB_FRAME_ZDICT_DATA = (
+    '{"compat": "api": "agent": "arbitrators": "labels": "targets": '
+    '"min_avail_mem": "min_avail_swap": "speaker": "frozen": '
+    '"locks": "requester": "requested": "gen": "updated": '
+    '"config": {"csum": "scope": ["updated": "status": {"'
+    '"kind": "svc", "vol", "cfg", "sec", "usr", "ccfg", '
+    '"topology": "failover", "flex", "orchestrate": "ha", "no", '
+    '"placement": "nodes order", "none", "score", "load avg", '
+    '"constraints": true, "drp": false, "preserved": '
+    '"subsets": {}, "parallel": "running": [], "encap": {}, '
+    '"provisioned": "mixed", "n/a", "stdby up", "stdby down", '
+    '"monitor": {"status": "idle", "status_updated": '
+    '"global_expect": null, "global_expect_updated": '
+    '"local_expect": "started", "placement": "leader", '
+    '"resources": {"fs#1": "ip#0": "disk#1": "app#1": '
+    '"sync#i0": "container#1": "task#1": "volume#1": '
+    '"type": "label": "log": [], "tags": [], "optional": '
+    '"standby": "restart": "monitor": "disable": '
+    '"status_group": {"container": "app": "sync": "fs": '
+    '"share": "ip": "disk": "task": "volume": "stonith": '
+    '"avail": "overall": "n/a", "warn", "down", "up", '
+    '"stdby n/a", "ok", '
+).encode()
+
+try:
+    zlib.compressobj(zdict=HB_FRAME_ZDICT_DATA)
+    HAS_ZDICT = True
+except TypeError:
+    # zdict is supported since python 3.3
+    HAS_ZDICT = False
+
+def zdict_compress(message):
+    obj = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, zlib.MAX_WBITS,
+                           zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY, HB_FRAME_ZDICT_DATA)
+    return obj.compress(message) + obj.flush()
+
+def zdict_decompress(message):
+    obj = zlib.decompressobj(zdict=HB_FRAME_ZDICT_DATA)
+    return obj.decompress(message) + obj.flush()
+
+def hb_frame_caps():
+    """
+    The binary heartbeat frame capabilities announced to the peer nodes.
+    """
+    return {
+        "version": HB_FRAME_VERSION,
+        "zdict": HAS_ZDICT,
+        "deltas": True,
+    }
+
+def is_hb_frame(message):
+    """
+    Return True if <message> starts with a binary heartbeat frame.
+    """
+    return isinstance(message, (six.binary_type, bytearray)) and \
+           message[:len(HB_FRAME_MAGIC)] == HB_FRAME_MAGIC
+
+def hb_frame_len(buff):
+    """
+    Return the total length of the binary heartbeat frame starting at <buff>,
+    or None if the frame header is not yet complete.
+    """
+    if len(buff) < HB_FRAME.size:
+        return
+    _, _, _, cn_len, nn_len, _, data_len = HB_FRAME.unpack_from(bytes(buff[:HB_FRAME.size]))
+    return HB_FRAME.size + cn_len + nn_len + data_len
+
+def iter_hb_frames(buff):
+    """
+    Yield the binary heartbeat frames concatenated in <buff>.
+    """
+    offset = 0
+    while offset < len(buff):
+        size = hb_frame_len(buff[offset:offset+HB_FRAME.size])
+        if size is None:
+            return
+        yield buff[offset:offset+size]
+        offset += size
 
 def get_http2_client_ssl_context(cafile=None, keyfile=None, certfile=None):
     """
@@ -176,6 +283,139 @@ def get_http2_client_ssl_context(cafile=None, keyfile=None, certfile=None):
 
     return ctx
 
+
+class H2ConnectionPool(object):
+    """
+    A per-process pool of h2 client connections, keyed by endpoint and
+    tls identity, and a cache of the ssl contexts, keyed by credentials
+    files.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.conns = {}
+        self.ssl_contexts = {}
+        self.pid = os.getpid()
+
+    def check_fork(self):
+        """
+        Forget the connections inherited from the parent process, without
+        closing the sockets the parent still uses. The lock is replaced too,
+        as a parent thread may have held it at fork time.
+        """
+        if self.pid == os.getpid():
+            return
+        self.lock = threading.RLock()
+        self.conns = {}
+        self.pid = os.getpid()
+
+    def get_ssl_context(self, cafile=None, keyfile=None, certfile=None):
+        """
+        Return a cached ssl context for the credentials files. The cache
+        is invalidated when a file modification time changes.
+        """
+        def mtime(path):
+            try:
+                return os.path.getmtime(path)
+            except (TypeError, OSError):
+                return None
+        paths = (cafile, keyfile, certfile)
+        mtimes = tuple(mtime(path) for path in paths)
+        with self.lock:
+            try:
+                cached_mtimes, ctx = self.ssl_contexts[paths]
+                if cached_mtimes == mtimes:
+                    return ctx
+            except KeyError:
+                pass
+            ctx = get_http2_client_ssl_context(cafile=cafile, keyfile=keyfile, certfile=certfile)
+            self.ssl_contexts[paths] = (mtimes, ctx)
+            return ctx
+
+    def acquire(self, key, factory):
+        """
+        Return a pool entry for <key>, creating the connection with
+        <factory> if no pooled connection is reusable. The entry must
+        be given back with release().
+        """
+        now = time.time()
+        self.check_fork()
+        with self.lock:
+            self.evict_idle(now)
+            entries = self.conns.setdefault(key, [])
+            for entry in list(entries):
+                if entry.streams:
+                    continue
+                if not self.healthy(entry.conn):
+                    self.discard(entry)
+                    continue
+                entry.streams += 1
+                return entry
+            if len(entries) >= H2_POOL_MAX_CONNS:
+                entry = min(entries, key=lambda e: e.streams)
+                entry.streams += 1
+                return entry
+            entry = Storage(key=key, conn=factory(), streams=1, requests=0, last_used=now)
+            entries.append(entry)
+            return entry
+
+    def release(self, entry, reuse=True):
+        """
+        Give back a pool entry obtained with acquire(). Close the connection
+        and drop it from the pool if <reuse> is False.
+        """
+        with self.lock:
+            entry.streams -= 1
+            entry.last_used = time.time()
+            if not reuse:
+                self.discard(entry)
+
+    def discard(self, entry):
+        with self.lock:
+            try:
+                self.conns[entry.key].remove(entry)
+            except (KeyError, ValueError):
+                pass
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
+
+    def evict_idle(self, now=None):
+        now = now or time.time()
+        with self.lock:
+            for entries in list(self.conns.values()):
+                for entry in list(entries):
+                    if entry.streams == 0 and now - entry.last_used > H2_POOL_IDLE_TMO:
+                        self.discard(entry)
+            for key in [key for key, entries in self.conns.items() if not entries]:
+                del self.conns[key]
+
+    def clear(self):
+        with self.lock:
+            for entries in list(self.conns.values()):
+                for entry in list(entries):
+                    self.discard(entry)
+            self.conns = {}
+
+    @staticmethod
+    def healthy(conn):
+        """
+        Return False if an idle connection has data to read, which means
+        the peer sent a GOAWAY or closed the socket.
+        """
+        try:
+            return conn._sock is None or not conn._sock.can_read
+        except Exception:
+            return False
+
+
+H2_POOL = H2ConnectionPool()
+
+
+class StaleConnection(Exception):
+    pass
+
+
 class Crypt(object):
     """
     A class implement AES encrypt, decrypt and message padding.
@@ -191,18 +431,18 @@ def get_node(self):
         return Storage()
 
     @staticmethod
-    def _encrypt(message, key, _iv):
+    def _encrypt(message, key, _iv, compress=zlib.compress):
         """
         A wrapper over the low level encrypter.
         """
-        return _encrypt(message, key, _iv)
+        return _encrypt(message, key, _iv, compress=compress)
 
     @staticmethod
-    def _decrypt(ciphertext, key, _iv):
+    def _decrypt(ciphertext, key, _iv, decompress=zlib.decompress):
         """
         A wrapper over the low level decrypter.
         """
-        return _decrypt(ciphertext, key, _iv)
+        return _decrypt(ciphertext, key, _iv, decompress=decompress)
 
     @staticmethod
     def gen_iv(urandom=None, locker=None):
@@ -347,14 +587,36 @@ def msg_decode(self, message):
             return
         return json.loads(message)
 
+    def decrypt_key(self, msg_clustername, msg_nodename, cluster_name=None, secret=None, sender_id=None):
+        """
+        Validate the message meta and return the key to decrypt the message
+        data with, or None if the message must be discarded.
+        """
+        if secret is None:
+            if msg_nodename in self.cluster_drpnodes:
+                cluster_key = self.get_secret(Storage(server=msg_nodename), None)
+            else:
+                cluster_key = self.cluster_key
+        else:
+            cluster_key = secret
+        if cluster_name != "join" and \
+           msg_clustername not in set(["join"]) | self.cluster_names:
+            self.log.warning("discard message from cluster %s, sender %s",
+                             msg_clustername, sender_id)
+            return
+        if cluster_key is None:
+            return
+        if msg_nodename is None:
+            return
+        return cluster_key
+
     def decrypt(self, message, cluster_name=None, secret=None, sender_id=None, structured=True):
         """
         Validate the message meta, decrypt and return the data.
         """
-        if cluster_name is None:
-            cluster_names = self.cluster_names
-        else:
-            cluster_names = [cluster_name]
+        if is_hb_frame(message):
+            return self.decrypt_frame(message, cluster_name=cluster_name, secret=secret,
+                                      sender_id=sender_id, structured=structured)
         message = bdecode(message).rstrip("\0\x00")
         try:
             message = json.loads(message)
@@ -369,22 +631,10 @@ def decrypt(self, message, cluster_name=None, secret=None, sender_id=None, struc
             return None, None, None
         msg_clustername = message.get("clustername")
         msg_nodename = message.get("nodename")
-        if secret is None:
-            if msg_nodename in self.cluster_drpnodes:
-                cluster_key = self.get_secret(Storage(server=msg_nodename), None)
-            else:
-                cluster_key = self.cluster_key
-        else:
-            cluster_key = secret
-        if cluster_name != "join" and \
-           msg_clustername not in set(["join"]) | self.cluster_names:
-            self.log.warning("discard message from cluster %s, sender %s",
-                             msg_clustername, sender_id)
-            return None, None, None
+        cluster_key = self.decrypt_key(msg_clustername, msg_nodename, cluster_name=cluster_name,
+                                       secret=secret, sender_id=sender_id)
         if cluster_key is None:
             return None, None, None
-        if msg_nodename is None:
-            return None, None, None
         iv = message.get("iv")
         if iv is None:
             return None, None, None
@@ -392,8 +642,48 @@ def decrypt(self, message, cluster_name=None, secret=None, sender_id=None, struc
             return None, None, None
         iv = base64.urlsafe_b64decode(to_bytes(iv))
         data = base64.urlsafe_b64decode(to_bytes(message["data"]))
+        return self._decrypt_data(data, cluster_key, iv, msg_clustername, msg_nodename,
+                                  sender_id=sender_id, structured=structured)
+
+    def decrypt_frame(self, message, cluster_name=None, secret=None, sender_id=None, structured=True):
+        """
+        Validate the binary heartbeat frame meta, decrypt and return the data.
+        """
+        try:
+            _, version, flags, cn_len, nn_len, iv, data_len = HB_FRAME.unpack_from(bytes(message[:HB_FRAME.size]))
+        except struct.error:
+            self.log.error("misformatted frame from %s", sender_id)
+            return None, None, None
+        if version != HB_FRAME_VERSION:
+            self.log.error("unsupported frame version %s from %s", version, sender_id)
+            return None, None, None
+        offset = HB_FRAME.size
+        msg_clustername = bdecode(message[offset:offset+cn_len])
+        offset += cn_len
+        msg_nodename = bdecode(message[offset:offset+nn_len])
+        offset += nn_len
+        data = bytes(message[offset:offset+data_len])
+        if len(data) != data_len:
+            self.log.error("truncated frame from %s", sender_id)
+            return None, None, None
+        cluster_key = self.decrypt_key(msg_clustername, msg_nodename, cluster_name=cluster_name,
+                                       secret=secret, sender_id=sender_id)
+        if cluster_key is None:
+            return None, None, None
+        if self.blacklisted(sender_id):
+            return None, None, None
+        if flags & HB_FRAME_ZDICT:
+            decompress = zdict_decompress
+        else:
+            decompress = zlib.decompress
+        return self._decrypt_data(data, cluster_key, iv, msg_clustername, msg_nodename,
+                                  sender_id=sender_id, structured=structured,
+                                  decompress=decompress)
+
+    def _decrypt_data(self, data, cluster_key, iv, msg_clustername, msg_nodename,
+                      sender_id=None, structured=True, decompress=zlib.decompress):
         try:
-            data = self._decrypt(data, cluster_key, iv)
+            data = self._decrypt(data, cluster_key, iv, decompress=decompress)
         except Exception as exc:
             self.log.error("decrypt message from %s: %s", msg_nodename, str(exc))
             self.blacklist(sender_id)
@@ -445,6 +735,36 @@ def encrypt(self, data, cluster_name=None, secret=None, encode=True):
             return (json.dumps(message)+'\0').encode()
         return json.dumps(message)
 
+    def encrypt_frame(self, data, cluster_name=None, secret=None, zdict=False):
+        """
+        Encrypt and return data in a binary heartbeat frame.
+        """
+        if cluster_name is None:
+            cluster_name = self.cluster_name
+        if secret is None:
+            cluster_key = self.cluster_key
+        else:
+            cluster_key = secret
+        if cluster_key is None:
+            return
+        iv = self.gen_iv()
+        try:
+            data = json.dumps(data).encode()
+        except (UnicodeDecodeError, TypeError):
+            # already binary data
+            pass
+        flags = 0
+        if zdict and HAS_ZDICT:
+            flags |= HB_FRAME_ZDICT
+            ciphertext = self._encrypt(data, cluster_key, iv, compress=zdict_compress)
+        else:
+            ciphertext = self._encrypt(data, cluster_key, iv)
+        cluster_name = cluster_name.encode("utf-8")
+        nodename = Env.nodename.encode("utf-8")
+        header = HB_FRAME.pack(HB_FRAME_MAGIC, HB_FRAME_VERSION, flags, len(cluster_name),
+                               len(nodename), iv, len(ciphertext))
+        return header + cluster_name + nodename + ciphertext
+
     def blacklisted(self, sender_id):
         """
         Return True if the sender's problem count is above threshold.
@@ -722,9 +1042,12 @@ def socket_parms(self, server=None):
             # relay, arbitrator, node-to-node
             return self.socket_parms_inet_raw(server)
 
-    def get_http2_client_context(self, sp):
-        if not sp.tls:
-            return
+    @staticmethod
+    def get_http2_client_identity(sp):
+        """
+        Return the (cafile, keyfile, certfile) tls credentials to use for
+        the <sp> socket parameters.
+        """
         try:
             cafile = sp.context["cluster"]["certificate_authority"]
         except:
@@ -735,7 +1058,13 @@ def get_http2_client_context(self, sp):
         except:
             keyfile = None
             certfile = None
-        return get_http2_client_ssl_context(
+        return cafile, keyfile, certfile
+
+    def get_http2_client_context(self, sp):
+        if not sp.tls:
+            return
+        cafile, keyfile, certfile = self.get_http2_client_identity(sp)
+        return H2_POOL.get_ssl_context(
             cafile=cafile,
             keyfile=keyfile,
             certfile=certfile,
@@ -749,9 +1078,13 @@ def h2c(self, sp=None, **kwargs):
         else:
             host = sp.to
             port = 0
+        import foreign.hyper as hyper
         conn = hyper.HTTP20Connection(host, port=port, ssl_context=context, secure=sp.tls, **kwargs)
         return conn
 
+    def h2_pool_key(self, sp, timeout):
+        return sp.to, sp.tls, self.get_http2_client_identity(sp), timeout
+
     def daemon_get(self, *args, **kwargs):
         kwargs["method"] = "GET"
         return self.daemon_request(*args, **kwargs)
@@ -803,17 +1136,50 @@ def h2_daemon_request(self, data, server=None, node=None, with_result=True, sile
         headers = self.h2_headers(node=node, secret=secret, multiplexed=data.get("multiplexed"), af=sp.af)
         body = self.h2_body_from_data(data)
         headers.update({"Content-Length": str(len(body))})
-        conn = self.h2c(sp=sp, timeout=timeout)
+        key = self.h2_pool_key(sp, timeout)
+        while True:
+            entry = H2_POOL.acquire(key, lambda: self.h2c(sp=sp, timeout=timeout))
+            reuse = False
+            try:
+                data = self._h2_daemon_request(entry, method, path, headers, body, timeout)
+                reuse = isinstance(data, six.binary_type)
+            except StaleConnection:
+                # the pooled connection was closed by the peer, retry
+                # with a new connection
+                continue
+            finally:
+                H2_POOL.release(entry, reuse=reuse)
+            break
+        if not reuse:
+            return data
+        data = json.loads(bdecode(data))
+        return data
+
+    @staticmethod
+    def _h2_daemon_request(entry, method, path, headers, body, timeout):
+        """
+        Send the request on the pooled connection <entry> and return the
+        response body, or an error dict.
+
+        Raise StaleConnection if a connection error happens on a connection
+        already used by previous requests.
+        """
+        conn = entry.conn
+        reused = entry.requests > 0
         elapsed = 0
         while True:
             try:
-                conn.request(method, path, headers=headers, body=body)
+                stream_id = conn.request(method, path, headers=headers, body=body)
                 break
             except AssertionError as exc:
                 raise ex.Error(str(exc))
             except ConnectionResetError:
+                if reused:
+                    raise StaleConnection
                 return {"status": 1, "error": "%s %s connection reset"%(method, path)}
             except (ConnectionRefusedError, ssl.SSLError, socket.error) as exc:
+                if reused:
+                    raise StaleConnection
                 try:
                     errno = exc.errno
                 except AttributeError:
@@ -827,9 +1193,14 @@ def h2_daemon_request(self, data, server=None, node=None, with_result=True, sile
                     elapsed += PAUSE
                     continue
                 return {"status": 1, "error": "%s"%exc, "errno": errno}
-        resp = conn.get_response()
-        data = resp.read()
-        data = json.loads(bdecode(data))
+        try:
+            resp = conn.get_response(stream_id)
+            data = resp.read()
+        except (ConnectionResetError, socket.error):
+            if reused:
+                raise StaleConnection
+            raise
+        entry.requests += 1
         return data
 
     def raw_daemon_request(self, data, server=None, node=None, with_result=True, silent=False,
@@ -946,6 +1317,7 @@ def h2_path_from_data(data):
         return "/" + data.get("action", "").lstrip("/")
 
     def h2_headers(self, node=None, secret=None, multiplexed=None, af=None):
+        from foreign.hyper.common.headers import HTTPHeaderMap
         headers = HTTPHeaderMap()
         if node:
             if isinstance(node, (tuple, list, set)):
@@ -973,6 +1345,7 @@ def daemon_stream(self, *args, **kwargs):
             yield e
 
     def h2_daemon_stream(self, *args, **kwargs):
+        import foreign.hyper as hyper
         while True:
             try:
                 for msg in self._h2_daemon_stream(*args, **kwargs):
@@ -0,0 +1,194 @@
+"""
+The parsed configuration files cache.
+
+Parsing an ini file is the main cost of an object instantiation, so the
+parsed data is cached in memory, for the daemon and other long running
+processes, and on disk, for the short-lived commands.
+
+An entry is valid if the path, inode, size and mtime of the parsed files,
+and the cache format and agent versions, are unchanged. So a cache hit
+costs one stat per file and, for the disk cache, one json load.
+"""
+import json
+import os
+import threading
+import time
+
+from env import Env
+from utilities.hash.md5 import hexdigest
+
+try:
+    from collections import OrderedDict
+    best_dict = OrderedDict
+except ImportError:
+    best_dict = dict
+
+# Bump when the parsed data structure changes
+CACHE_VERSION = 1
+
+# A file modified less than RACY_DELAY seconds ago can be modified again
+# without a mtime change on coarse timestamp filesystems, so it is not
+# cached.
+RACY_DELAY = 2
+
+# Seconds between two scans for the cached files no longer existing
+PRUNE_INTERVAL = 60
+
+# The in-memory entries, one per config files list, replaced when the
+# files change
+CACHE = {}
+LAST_PRUNE = [0]
+LOCK = threading.RLock()
+STATS = {
+    "hit": 0,
+    "miss": 0,
+}
+VERSION = []
+
+
+def agent_version():
+    if VERSION:
+        return VERSION[0]
+    try:
+        from utilities.version.version import version
+    except ImportError:
+        version = "dev"
+    VERSION.append(version)
+    return version
+
+
+def cache_d():
+    return os.path.join(Env.paths.pathvar, "config_cache")
+
+
+def cache_fpath(fpaths):
+    return os.path.join(cache_d(), hexdigest("\0".join(fpaths)) + ".json")
+
+
+def file_key(fpath):
+    """
+    Return the [inode, size, mtime_ns] list identifying a version of
+    <fpath>, None if the file does not exist, or raise ValueError if the
+    file is too recently modified to be cached.
+    """
+    try:
+        st = os.stat(fpath)
+    except OSError:
+        return None
+    mtime_ns = getattr(st, "st_mtime_ns", None)
+    if mtime_ns is None:
+        mtime_ns = int(st.st_mtime * 1000000000)
+    if time.time() - st.st_mtime < RACY_DELAY:
+        raise ValueError("%s modified too recently" % fpath)
+    return [st.st_ino, st.st_size, mtime_ns]
+
+
+def cache_key(fpaths):
+    return [CACHE_VERSION, agent_version(), fpaths] + [file_key(fpath) for fpath in fpaths]
+
+
+def copy_data(data):
+    """
+    The cached data must not be modified by the callers, so return a
+    copy of the sections dicts. The values are immutable strings.
+    """
+    return best_dict((section, best_dict(options)) for section, options in data.items())
+
+
+def load(fpath, key):
+    try:
+        with open(fpath, "r") as ofile:
+            cached = json.load(ofile, object_pairs_hook=best_dict)
+    except (IOError, OSError, ValueError, TypeError):
+        return
+    if cached.get("key") != key:
+        return
+    return cached.get("data")
+
+
+def store(fpath, key, data):
+    dirpath = os.path.dirname(fpath)
+    tmpfpath = "%s.%d.%d" % (fpath, os.getpid(), threading.current_thread().ident)
+    try:
+        if not os.path.exists(dirpath):
+            os.makedirs(dirpath, 0o0700)
+        # the config files may contain secrets
+        fd = os.open(tmpfpath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o0600)
+        with os.fdopen(fd, "w") as ofile:
+            json.dump({"key": key, "data": data}, ofile, separators=(",", ":"))
+        os.rename(tmpfpath, fpath)
+    except (IOError, OSError, TypeError, ValueError):
+        try:
+            os.unlink(tmpfpath)
+        except OSError:
+            pass
+
+
+def get(fpaths, parser):
+    """
+    Return a copy of the parsed data of the <fpaths> config files, using
+    the <parser> function on cache miss.
+    """
+    if not isinstance(fpaths, (list, tuple)):
+        fpaths = [fpaths]
+    else:
+        fpaths = list(fpaths)
+    try:
+        key = cache_key(fpaths)
+    except ValueError:
+        return parser()
+    ckey = "\0".join(fpaths)
+    prune()
+    if not any(key[3:]):
+        # nothing to parse, and forget the entry of the deleted files
+        with LOCK:
+            CACHE.pop(ckey, None)
+        return parser()
+    with LOCK:
+        cached = CACHE.get(ckey)
+    if cached and cached[0] == key:
+        STATS["hit"] += 1
+        return copy_data(cached[1])
+    fpath = cache_fpath(fpaths)
+    data = load(fpath, key)
+    if data is None:
+        STATS["miss"] += 1
+        data = parser()
+        store(fpath, key, data)
+    else:
+        STATS["hit"] += 1
+    with LOCK:
+        CACHE[ckey] = (key, copy_data(data))
+    return copy_data(data)
+
+
+def drop(fpaths):
+    """
+    Forget the cached data of the <fpaths> config files.
+    """
+    if not isinstance(fpaths, (list, tuple)):
+        fpaths = [fpaths]
+    with LOCK:
+        CACHE.pop("\0".join(fpaths), None)
+    try:
+        os.unlink(cache_fpath(fpaths))
+    except OSError:
+        pass
+
+
+def prune(now=None):
+    """
+    Forget the cached data of the config files no longer existing, so the
+    deleted or renamed objects do not stay cached in the long running
+    processes. The scan runs at most once per PRUNE_INTERVAL.
+    """
+    now = now or time.time()
+    with LOCK:
+        if now - LAST_PRUNE[0] < PRUNE_INTERVAL:
+            return
+        LAST_PRUNE[0] = now
+        ckeys = list(CACHE)
+    for ckey in ckeys:
+        fpaths = ckey.split("\0")
+        if not any(os.path.exists(fpath) for fpath in fpaths):
+            drop(fpaths)
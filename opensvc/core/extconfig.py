@@ -10,6 +10,7 @@
 
 import foreign.six as six
 
+import core.configfile.cache
 import core.exceptions as ex
 from core.configfile import move_config_file
 from env import Env
@@ -174,13 +175,31 @@ def read_cf_comments(fpath):
     return data
 
 
+def copy_value(val):
+    """
+    Return a copy of the mutable memoized values, so the callers can't
+    alter the cache.
+    """
+    if isinstance(val, (list, dict, set)):
+        return copy.copy(val)
+    return val
+
+
 class ExtConfigMixin(object):
     def __init__(self, default_status_groups=None):
         self.ref_cache = {}
+        self.conf_cache = {}
+        self.conf_cache_cd = None
+        self.conf_cache_skip = 0
+        self.conf_cache_stats = {
+            "hit": 0,
+            "miss": 0,
+        }
         self.default_status_groups = default_status_groups
 
     def clear_ref_cache(self):
         self.ref_cache = {}
+        self.conf_cache = {}
 
     @lazy
     def has_default_section(self):
@@ -794,6 +813,8 @@ def _handle_reference(self, ref, _section, _v, scope=False,
             raise ex.Error("%s: section %s does not exist" % (ref, _section))
 
         if self.is_deferred(_section, _v):
+            # the value depends on the resource state, so must not be memoized
+            self.conf_cache_skip += 1
             try:
                 self.init_resources()
                 res = self.resources_by_id[_section]
@@ -949,6 +970,53 @@ def get_rtype(self, s, section, cd):
     def conf_get(self, s, o, t=None, scope=None, impersonate=None,
                  use_default=True, cd=None, verbose=True, rtype=None, stack=None):
         """
+        Memoize the top-level lookups in the object configuration, and the
+        OptNotFound they raise.
+
+        The lookups in an explicit cd and the nested lookups of references
+        are not memoized. Neither are the lookups incrementing
+        conf_cache_skip, because their result depends on the resources or
+        cluster state: the node selector conversions and the deferred
+        references.
+
+        The memoized results are dropped by clear_ref_cache(), called on
+        parse and commit, and when the cd lazy is replaced.
+        """
+        if cd is not None or stack:
+            return self.conf_get_uncached(s, o, t=t, scope=scope, impersonate=impersonate,
+                                          use_default=use_default, cd=cd, verbose=verbose,
+                                          rtype=rtype, stack=stack)
+        cd = self.cd
+        if cd is not self.conf_cache_cd:
+            self.conf_cache = {}
+            self.conf_cache_cd = cd
+        key = (s, o, t, scope, impersonate, use_default, rtype)
+        try:
+            found, val, msg = self.conf_cache[key]
+        except KeyError:
+            pass
+        else:
+            self.conf_cache_stats["hit"] += 1
+            if found:
+                return copy_value(val)
+            raise ex.OptNotFound(msg, default=copy_value(val))
+        self.conf_cache_stats["miss"] += 1
+        skip = self.conf_cache_skip
+        try:
+            val = self.conf_get_uncached(s, o, t=t, scope=scope, impersonate=impersonate,
+                                         use_default=use_default, verbose=verbose,
+                                         rtype=rtype)
+        except ex.OptNotFound as exc:
+            if skip == self.conf_cache_skip:
+                self.conf_cache[key] = (False, copy_value(exc.default), exc.value)
+            raise
+        if skip == self.conf_cache_skip:
+            self.conf_cache[key] = (True, copy_value(val), None)
+        return val
+
+    def conf_get_uncached(self, s, o, t=None, scope=None, impersonate=None,
+                          use_default=True, cd=None, verbose=True, rtype=None, stack=None):
+        """
         Handle keyword and section deprecation.
         """
         stack = stack or []
@@ -1083,6 +1151,8 @@ def _conf_get(self, s, o, t=None, scope=None, impersonate=None,
 
     def convert(self, converter, val):
         if converter == "nodes_selector":
+            # the value depends on the nodes labels, so must not be memoized
+            self.conf_cache_skip += 1
             if hasattr(self, "path"):
                 data = self.node.listener.nodes_info() if self.node.listener else None
                 return self.node.nodes_selector(val, data)
@@ -1609,6 +1679,10 @@ def parse_config_file(self, cf=None):
         self.clear_ref_cache()
         if cf is None:
             cf = self.paths.cf
+        return core.configfile.cache.get(cf, lambda: self._parse_config_file(cf))
+
+    @staticmethod
+    def _parse_config_file(cf):
         try:
             config = read_cf(cf)
         except Exception as exc:
@@ -448,6 +448,7 @@ def __init__(self, name=None, provision=False, keywords=None, deprecated_keyword
         self.provision = provision
         self.has_default_section = has_default_section
         self.modules = set()
+        self.registered_drivers = {}
 
         for keyword in keywords or []:
             sections = keyword.get("sections", [keyword.get("section")])
@@ -481,6 +482,14 @@ def keywords_count(self):
         return n
 
     def register_driver(self, driver_group, driver_basename, keywords=None, driver_basename_aliases=None, **kwargs):
+        if "name" in kwargs:
+            # remember the call, so it can be replayed from the drivers
+            # registry without importing the driver module.
+            self.registered_drivers[kwargs["name"]] = (driver_group, driver_basename, dict(
+                kwargs,
+                keywords=keywords,
+                driver_basename_aliases=driver_basename_aliases,
+            ))
         keywords = [
             dict(k, section=driver_group, rtype=driver_basename) for k in keywords
         ]
@@ -57,15 +57,6 @@
 from utilities.storage import Storage
 from utilities.string import bdecode, base64encode
 
-try:
-    from foreign.six.moves.urllib.request import Request, urlopen
-    from foreign.six.moves.urllib.error import HTTPError
-    from foreign.six.moves.urllib.parse import urlencode
-except ImportError:
-    # pylint false positive
-    pass
-
-
 if six.PY2:
     BrokenPipeError = IOError
 
@@ -2675,6 +2666,8 @@ def download_from_safe(self, safe_id, path=None):
         if not api["url"].startswith("https"):
             raise ex.Error("refuse to submit auth tokens through a non-encrypted transport")
 
+        from foreign.six.moves.urllib.request import urlopen
+        from foreign.six.moves.urllib.error import HTTPError
         kwargs = {}
         kwargs = self.set_ssl_context(kwargs)
         try:
@@ -2759,6 +2752,7 @@ def collector_request(self, rpath, path=None):
         if not url.startswith("https"):
             raise ex.Error("refuse to submit auth tokens through a "
                            "non-encrypted transport")
+        from foreign.six.moves.urllib.request import Request
         request = Request(url+rpath)
         auth_string = '%s:%s' % (api["username"], api["password"])
         base64string = base64encode(auth_string)
@@ -2802,6 +2796,9 @@ def collector_rest_request(self, rpath, data=None, path=None, get_method="GET"):
         """
         Make a request to the collector's rest api
         """
+        from foreign.six.moves.urllib.request import urlopen
+        from foreign.six.moves.urllib.error import HTTPError
+        from foreign.six.moves.urllib.parse import urlencode
         if data is not None and get_method == "GET":
             if len(data) == 0 or not isinstance(data, dict):
                 data = None
@@ -2840,6 +2837,8 @@ def collector_rest_get_to_file(self, rpath, fpath):
         """
         Download bulk chunked data from the collector's rest api
         """
+        from foreign.six.moves.urllib.request import urlopen
+        from foreign.six.moves.urllib.error import HTTPError
         request = self.collector_request(rpath)
         kwargs = {}
         kwargs = self.set_ssl_context(kwargs)
@@ -3053,6 +3052,7 @@ def svc_conf_setenv(self, args=None, interactive=False, env=None):
             raise ex.Error("--interactive is set but input fd is not a tty")
 
         def get_href(ref):
+            from foreign.six.moves.urllib.request import urlopen
             ref = ref.strip("[]")
             try:
                 response = urlopen(ref)
@@ -326,6 +326,27 @@
         "convert": "integer",
         "text": "Allow a maximum of :kw:`max_parallel` subprocesses to run simultaneously on :cmd:`om <selector> --parallel <action>` commands."
     },
+    {
+        "section": "node",
+        "keyword": "status_threads",
+        "default": 4,
+        "convert": "integer",
+        "text": "The number of threads refreshing the status of the thread-safe resources of an object concurrently. The resources of a non-parallel subset are refreshed sequentially in the same thread. Set to ``1`` to refresh all resources sequentially."
+    },
+    {
+        "section": "node",
+        "keyword": "status_workers",
+        "default": 4,
+        "convert": "integer",
+        "text": "The number of daemon pre-forked processes evaluating the objects instance status. These processes keep the objects loaded between evaluations, which is cheaper than forking a :cmd:`om <path> status --refresh` command. Set to ``0`` to disable the workers and fork the commands."
+    },
+    {
+        "section": "node",
+        "keyword": "sched_workers",
+        "default": 2,
+        "convert": "integer",
+        "text": "The number of daemon pre-forked processes running the :c-action:`status`, :c-action:`resource_monitor` and :c-action:`push_resinfo` scheduled tasks. These processes keep the objects loaded between runs, and run the tasks of the same object due at the same time in a single request. Set to ``0`` to disable the workers and fork a command per task."
+    },
     {
         "section": "node",
         "keyword": "allowed_networks",
@@ -743,6 +764,13 @@
         "example": "https://keycloak.opensvc.com/auth/realms/clusters/.well-known/openid-configuration",
         "text": "The url serving the well-known configuration of an openid provider. If set, the h2 listener will try to validate the Bearer token provided in the requests. If valid the user name is fetched from the 'preferred_username' claim (fallback on 'name'), and the user grants are fetched from the 'grant' claim. Grant can be a list, in which case a proper grant value is formatted via concatenation of the list elements."
     },
+    {
+        "section": "listener",
+        "keyword": "workers",
+        "convert": "integer",
+        "default": 8,
+        "text": "The number of daemon listener threads serving the api requests. The connections waiting for a request are multiplexed in a single thread, and the requests ready are served by these workers. The streaming requests, like the events subscriptions, are still served by a dedicated thread. Set to ``0`` to disable the workers and start a thread per connection."
+    },
     {
         "section": "listener",
         "keyword": "ui",
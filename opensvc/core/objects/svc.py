@@ -14,6 +14,7 @@
 import time
 from errno import ECONNREFUSED
 
+import core.configfile.cache
 import core.exceptions as ex
 import core.logger
 import core.status
@@ -2729,6 +2730,7 @@ def delete_service_conf(self):
                (os.path.islink(fpath) or os.path.isfile(fpath)):
                 self.log.info("remove %s", fpath)
                 os.unlink(fpath)
+        core.configfile.cache.drop(self.paths.cf)
         for dpath in dpaths:
             if os.path.exists(dpath):
                 self.log.info("remove %s", dpath)
@@ -2940,8 +2942,8 @@ def kwstore(self):
     @lazy
     def full_kwstore(self):
         from .svcdict import KEYS, SECTIONS, DATA_SECTIONS
-        from utilities.drivers import load_drivers
-        load_drivers(SECTIONS + DATA_SECTIONS)
+        from utilities.drivers import load_drivers_keywords
+        load_drivers_keywords(KEYS, SECTIONS + DATA_SECTIONS)
         return KEYS
 
     def load_driver(self, driver_group, driver_basename):
@@ -3966,11 +3968,78 @@ def get_rset_status(self, groups, refresh=False):
         """
         restore_environ = self.setup_environ()
         rsets_status = {}
-        for rset in self.get_resourcesets(groups):
-            rsets_status[rset.rid] = rset.status(refresh=refresh)
+        rsets = self.get_resourcesets(groups)
+        if refresh:
+            refreshed = self.parallel_resources_status(rsets)
+        else:
+            refreshed = None
+        for rset in rsets:
+            rsets_status[rset.rid] = rset.status(refresh=refresh, refreshed=refreshed)
         restore_environ()
         return rsets_status
 
+    @lazy
+    def status_threads(self):
+        try:
+            return self.get_node().oget("node", "status_threads")
+        except Exception:
+            return 1
+
+    def parallel_resources_status(self, rsets):
+        """
+        Refresh the status of the thread-safe resources of <rsets> using a
+        pool of node.status_threads threads, and return the set of refreshed
+        resource ids.
+
+        The resources of a parallel subset are refreshed concurrently. The
+        resources of other resourcesets are refreshed sequentially in the
+        same thread, so the resourcesets are the unit of concurrency. The
+        non-thread-safe resources are left to the caller, which refreshes
+        them after the thread-safe ones.
+        """
+        jobs = []
+        for rset in rsets:
+            resources = [res for res in rset.status_resources() if res.status_thread_safe]
+            if not resources:
+                continue
+            if rset.parallel:
+                jobs += [[res] for res in resources]
+            else:
+                jobs.append(resources)
+        if self.status_threads < 2 or len(jobs) < 2:
+            return set()
+
+        # init the lazy properties creating directories before forking threads
+        for resources in jobs:
+            for res in resources:
+                res.var_d
+
+        def job(resources):
+            refreshed = {}
+            for res in resources:
+                begin = time.time()
+                try:
+                    res.status(refresh=True)
+                except Exception:
+                    # the caller reports the error on refresh
+                    continue
+                refreshed[res.rid] = time.time() - begin
+            return refreshed
+
+        from utilities.concurrent_futures import get_concurrent_futures
+        concurrent_futures = get_concurrent_futures()
+        refreshed = {}
+        begin = time.time()
+        with concurrent_futures.ThreadPoolExecutor(max_workers=self.status_threads) as executor:
+            for result in executor.map(job, jobs):
+                refreshed.update(result)
+        duration = time.time() - begin
+        serial_duration = sum(refreshed.values())
+        self.log.debug("parallel status of %d resources in %d jobs: %.2fs, "
+                       "%.2fs serial, %.2fs saved", len(refreshed), len(jobs),
+                       duration, serial_duration, serial_duration - duration)
+        return set(refreshed)
+
     def need_encap_resource_monitor(self):
         for res in self.encap_resources.values():
             if res.monitor or res.restart:
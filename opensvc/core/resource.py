@@ -44,6 +44,11 @@ class Resource(object):
     refresh_provisioned_on_provision = False
     refresh_provisioned_on_unprovision = False
 
+    # Drivers whose status evaluation neither depends on other resources
+    # status nor alters the process global state set this to True, so the
+    # refresh can run in a thread concurrently with the other resources.
+    status_thread_safe = False
+
     def __init__(self,
                  rid=None,
                  type=None,
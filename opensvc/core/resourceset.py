@@ -139,20 +139,34 @@ def is_disabled(self):
             return self.svc.disabled
         return self.disabled
 
-    def status(self, **kwargs):
+    def status_resources(self):
         """
-        Return the aggregate status a ResourceSet.
+        Return the list of resources aggregated in the ResourceSet status.
         """
-        agg_status = core.status.Status()
+        resources = []
         for resource in self.resources:
             if resource.is_disabled():
                 continue
             if not self.svc.encap and resource.encap:
                 # don't evaluate encap service resources
                 continue
+            resources.append(resource)
+        return resources
+
+    def status(self, refreshed=None, **kwargs):
+        """
+        Return the aggregate status a ResourceSet.
 
+        The resources whose rid is in <refreshed> already had their status
+        refreshed, so their in-memory cached status is used.
+        """
+        agg_status = core.status.Status()
+        for resource in self.status_resources():
             try:
-                status = resource.status(**kwargs)
+                if refreshed and resource.rid in refreshed:
+                    status = resource.status(**dict(kwargs, refresh=False))
+                else:
+                    status = resource.status(**kwargs)
             except:
                 import traceback
                 exc = sys.exc_info()
@@ -0,0 +1,89 @@
+"""
+The listener-wide cache of the authenticated users and their grants.
+
+Each new listener connection used to instantiate the user object, verify
+the credential and parse the user grants against all the namespaces. The
+connections presenting a credential already verified now reuse the user
+object and grants, until the cache entry expires, the user configuration
+changes or the cluster namespaces change.
+"""
+import hashlib
+import threading
+import time
+
+from utilities.storage import Storage
+
+# Seconds an authenticated credential is trusted without verification
+DEFAULT_TTL = 60
+
+# The maximum number of cached credentials
+DEFAULT_SIZE = 1024
+
+
+def fingerprint(kind, credential):
+    """
+    Return the cache key of the <credential> of type <kind>. The
+    credentials are not stored in clear.
+    """
+    if not isinstance(credential, bytes):
+        credential = credential.encode()
+    return kind, hashlib.sha256(credential).hexdigest()
+
+
+class AuthCache(object):
+    def __init__(self, ttl=DEFAULT_TTL, size=DEFAULT_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self.lock = threading.RLock()
+        self.entries = {}
+
+    def get(self, key, now=None):
+        """
+        Return the entry cached for <key>, or None if not cached or expired.
+        """
+        now = now or time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return
+            if entry.expire <= now:
+                del self.entries[key]
+                return
+            return entry
+
+    def set(self, key, usr, grants, csum, ns_gen, ttl=None, now=None):
+        """
+        Cache the <usr> authenticated by the <key> credential, with its
+        <grants>, the <csum> of its configuration and the <ns_gen>
+        namespaces generation they were computed from.
+        """
+        now = now or time.time()
+        if ttl is None or ttl > self.ttl:
+            ttl = self.ttl
+        if ttl <= 0:
+            return
+        with self.lock:
+            if key not in self.entries and len(self.entries) >= self.size:
+                self.purge(now)
+                if len(self.entries) >= self.size:
+                    self.entries = {}
+            self.entries[key] = Storage({
+                "usr": usr,
+                "grants": grants,
+                "csum": csum,
+                "ns_gen": ns_gen,
+                "expire": now + ttl,
+            })
+
+    def drop(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def purge(self, now=None):
+        """
+        Drop the expired entries.
+        """
+        now = now or time.time()
+        with self.lock:
+            for key in [key for key, entry in self.entries.items() if entry.expire <= now]:
+                del self.entries[key]
@@ -0,0 +1,344 @@
+"""
+The listener connections front-end.
+
+The listener used to start a client handler thread per accepted
+connection, each waiting for its requests with its own blocking select.
+With many clients, most of these threads were idle, and the busy ones
+contended for the GIL with the idle ones waking up on their socket
+timeout.
+
+The front-end multiplexes the connections waiting for a request in a
+single I/O thread, using the selectors module, and dispatches the
+connections with a request ready to a bounded pool of worker threads. The
+workers execute the ClientHandler methods serving the request, so the
+handlers API is unchanged:
+
+* The connections serving a stream, like the events subscriptions or the
+  logs follow, are promoted to a dedicated ClientHandler thread.
+* The workers executing a handler that can block for long, like the
+  multiplexed requests or the wait handler, leave the pool, which starts
+  a replacement worker.
+"""
+import logging
+import socket
+import ssl
+import threading
+import time
+from errno import EAGAIN, ECONNRESET, EWOULDBLOCK
+
+from foreign.six.moves import queue
+from utilities.storage import Storage
+
+try:
+    import selectors
+except ImportError:
+    selectors = None
+
+# The default number of workers serving the requests
+DEFAULT_WORKERS = 8
+
+# The maximum duration of the tls handshake and of the raw request reception
+SESSION_TIMEOUT = 5.0
+
+HANDSHAKE = "handshake"
+RAW = "raw"
+H2 = "h2"
+
+
+def has_frontend():
+    return selectors is not None
+
+
+class ClientWorkers(object):
+    """
+    A pool of worker threads executing the jobs submitted by the client
+    loop.
+    """
+    name = "listener worker"
+
+    def __init__(self, size=DEFAULT_WORKERS, log=None):
+        self.size = size
+        self.log = log or logging.getLogger(__name__)
+        self.lock = threading.RLock()
+        self.queue = queue.Queue()
+        self.local = threading.local()
+        self.workers = set()
+        self.running = False
+        self.counter = 0
+        self._stats = {
+            "submitted": 0,
+            "detached": 0,
+        }
+
+    def start(self):
+        with self.lock:
+            self.running = True
+            for _ in range(self.size):
+                self.new_worker()
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            for _ in range(len(self.workers)):
+                self.queue.put(None)
+
+    def new_worker(self):
+        self.counter += 1
+        thr = threading.Thread(target=self.worker_main, name="%s %d" % (self.name, self.counter))
+        thr.daemon = True
+        self.workers.add(thr)
+        thr.start()
+
+    def worker_main(self):
+        self.local.worker = True
+        self.local.detached = False
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            fn, args = job
+            try:
+                fn(*args)
+            except Exception as exc:
+                self.log.exception(exc)
+            if self.local.detached:
+                break
+        with self.lock:
+            self.workers.discard(threading.current_thread())
+
+    def submit(self, fn, *args):
+        self._stats["submitted"] += 1
+        self.queue.put((fn, args))
+
+    def detach(self):
+        """
+        Called by a job about to block for long. The calling worker leaves
+        the pool after the job, and a replacement worker is started now.
+
+        Return True if the caller is a pool worker.
+        """
+        if not getattr(self.local, "worker", False) or self.local.detached:
+            return False
+        self.local.detached = True
+        with self.lock:
+            self._stats["detached"] += 1
+            self.workers.discard(threading.current_thread())
+            if self.running:
+                self.new_worker()
+        return True
+
+    def stats(self):
+        return Storage({
+            "size": self.size,
+            "workers": len(self.workers),
+            "queued": self.queue.qsize(),
+            "submitted": self._stats["submitted"],
+            "detached": self._stats["detached"],
+        })
+
+
+class Session(object):
+    """
+    A ClientHandler connection waiting in the client loop.
+    """
+    def __init__(self, thr, state):
+        self.thr = thr
+        self.state = state
+        self.events = selectors.EVENT_READ
+        self.deadline = None
+        self.chunks = []
+        if state != H2:
+            self.deadline = time.time() + SESSION_TIMEOUT
+
+    def fileobj(self):
+        if self.state == RAW:
+            return self.thr.conn
+        return self.thr.tls_conn
+
+
+class ClientLoop(threading.Thread):
+    """
+    The I/O thread waiting for the requests on the idle connections.
+    """
+    name = "listener client loop"
+
+    def __init__(self, workers, log=None):
+        threading.Thread.__init__(self, name=self.name)
+        self.daemon = True
+        self.workers = workers
+        self.log = log or logging.getLogger(__name__)
+        self.selector = selectors.DefaultSelector()
+        self.pending = queue.Queue()
+        self.sessions = {}
+        self._stop_event = threading.Event()
+        self.wakeup_r, self.wakeup_w = socket.socketpair()
+        self.wakeup_r.setblocking(False)
+        self.wakeup_w.setblocking(False)
+
+    def stop(self):
+        self._stop_event.set()
+        self.wakeup()
+
+    def stopped(self):
+        return self._stop_event.is_set()
+
+    def wakeup(self):
+        try:
+            self.wakeup_w.send(b"\0")
+        except (OSError, socket.error):
+            # the wakeup socket buffer is full, the loop will wake up anyway
+            pass
+
+    def add(self, thr):
+        """
+        Queue the <thr> ClientHandler connection for registration in the
+        selector. Thread-safe, called by the listener on accept and by the
+        workers when a request is served.
+        """
+        self.pending.put(thr)
+        self.wakeup()
+
+    def stats(self):
+        return Storage({
+            "sessions": len(self.sessions),
+            "workers": self.workers.stats(),
+        })
+
+    def run(self):
+        self.selector.register(self.wakeup_r, selectors.EVENT_READ, None)
+        try:
+            while not self.stopped():
+                self.loop()
+        finally:
+            for session in list(self.sessions.values()):
+                self.close(session)
+            self.selector.close()
+            self.wakeup_r.close()
+            self.wakeup_w.close()
+
+    def loop(self):
+        self.register_pending()
+        for key, mask in self.selector.select(self.timeout()):
+            if key.data is None:
+                self.drain_wakeup()
+                continue
+            try:
+                self.ready(key.data)
+            except Exception as exc:
+                if getattr(exc, "errno", None) not in (0, ECONNRESET):
+                    self.log.error("client loop: %s", exc)
+                self.close(key.data)
+        self.expire()
+
+    def timeout(self):
+        deadlines = [session.deadline for session in self.sessions.values() if session.deadline]
+        if not deadlines:
+            return 1.0
+        return min(max(min(deadlines) - time.time(), 0), 1.0)
+
+    def drain_wakeup(self):
+        try:
+            while self.wakeup_r.recv(4096):
+                pass
+        except (OSError, socket.error):
+            pass
+
+    def register_pending(self):
+        while True:
+            try:
+                thr = self.pending.get(False)
+            except queue.Empty:
+                break
+            try:
+                self.register(self.new_session(thr))
+            except Exception as exc:
+                self.log.error("client loop: register %s: %s", thr.addr[0], exc)
+                thr.close_session()
+
+    def new_session(self, thr):
+        if thr.scheme == "raw":
+            thr.conn.setblocking(False)
+            return Session(thr, RAW)
+        if thr.h2conn is not None:
+            thr.tls_conn.setblocking(False)
+            return Session(thr, H2)
+        thr.conn.setblocking(False)
+        if not thr.tls:
+            thr.tls_conn = thr.conn
+            return Session(thr, H2)
+        thr.tls_conn = thr.tls_context.wrap_socket(thr.conn, server_side=True, do_handshake_on_connect=False)
+        return Session(thr, HANDSHAKE)
+
+    def register(self, session):
+        fileobj = session.fileobj()
+        self.sessions[fileobj] = session
+        self.selector.register(fileobj, session.events, session)
+
+    def unregister(self, session):
+        fileobj = session.fileobj()
+        self.sessions.pop(fileobj, None)
+        try:
+            self.selector.unregister(fileobj)
+        except (KeyError, ValueError):
+            pass
+
+    def close(self, session):
+        self.unregister(session)
+        session.thr.close_session()
+
+    def dispatch(self, session, fn, *args):
+        self.unregister(session)
+        self.workers.submit(fn, *args)
+
+    def expire(self):
+        now = time.time()
+        for session in [session for session in self.sessions.values() if session.deadline and session.deadline < now]:
+            if session.state == RAW:
+                session.thr.log.warning("timeout waiting for data")
+            else:
+                session.thr.log.warning("timeout waiting for the tls handshake")
+            self.close(session)
+
+    def ready(self, session):
+        if session.state == HANDSHAKE:
+            self.handshake(session)
+        elif session.state == RAW:
+            self.raw_recv(session)
+        else:
+            self.dispatch(session, session.thr.serve_h2_ready, self)
+
+    def handshake(self, session):
+        events = selectors.EVENT_READ
+        try:
+            session.thr.tls_conn.do_handshake()
+        except ssl.SSLWantReadError:
+            pass
+        except ssl.SSLWantWriteError:
+            events = selectors.EVENT_WRITE
+        else:
+            # the h2 connection preface is expected right after the
+            # handshake, and may already be buffered in the ssl object
+            session.state = H2
+            session.deadline = None
+            self.dispatch(session, session.thr.serve_h2_ready, self)
+            return
+        if events != session.events:
+            session.events = events
+            self.selector.modify(session.fileobj(), events, session)
+
+    def raw_recv(self, session):
+        thr = session.thr
+        try:
+            chunk = thr.conn.recv(4096)
+        except (OSError, socket.error) as exc:
+            if exc.errno in (EAGAIN, EWOULDBLOCK):
+                return
+            raise
+        thr.parent.stats.sessions.rx += len(chunk)
+        thr.parent.stats.sessions.clients[thr.addr[0]].rx += len(chunk)
+        if chunk:
+            session.chunks.append(chunk)
+        if not chunk or chunk.endswith(b"\x00"):
+            data = b"".join(session.chunks)
+            session.chunks = []
+            self.dispatch(session, thr.serve_raw_request, data)
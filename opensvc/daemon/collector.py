@@ -263,13 +263,13 @@ def ping(self, data):
 
     def get_data(self):
         """
-        Get a copy of the monitor thread, expunged from encap services,
+        Get a snapshot of the monitor thread, expunged from encap services,
         to avoid missing changes happening during our work
         """
         if "monitor" not in shared.THREADS:
             # the monitor thread is not started
             return
-        data = self.daemon_status_data.get_copy(["monitor"])
+        data = self.daemon_status_data.snapshot(["monitor"])
         _data = {
             "cluster_id": self.cluster_id,
             "cluster_name": self.cluster_name,
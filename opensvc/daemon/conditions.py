@@ -0,0 +1,348 @@
+"""
+The daemon status conditions watcher, serving the wait handler.
+
+The wait conditions are compiled once and shared by the requests waiting
+for the same condition. The waiters are registered in a tree indexed by
+the literal prefix of their condition jsonpath, ie the leading keys before
+the first wildcard, filter or descendant operator. The listener notifies
+the watcher of the daemon status patch events, and only the conditions
+whose prefix is a parent or a child of a changed path are evaluated.
+
+The daemon status data is a copy-on-write tree, so a condition result is
+cached until the status subtree at its prefix is replaced by a new one.
+"""
+import json
+import re
+import threading
+
+import core.exceptions as ex
+from foreign.jsonpath_ng.ext import parse
+from utilities.converters import convert_boolean
+from utilities.naming import normalize_jsonpath
+from utilities.string import is_string
+
+OPERATORS = (">=", "<=", "=", ">", "<", "~", " in ")
+
+# The maximum number of compiled jsonpath expressions and conditions kept
+# in cache
+CACHE_SIZE = 1024
+
+JSONPATHS = {}
+CONDITIONS = {}
+
+
+def compile_jsonpath(path):
+    """
+    Return the parsed jsonpath expression <path>, from cache if possible.
+    """
+    try:
+        return JSONPATHS[path]
+    except KeyError:
+        pass
+    try:
+        jsonpath_expr = parse(path)
+    except Exception as exc:
+        raise ex.Error(exc)
+    if len(JSONPATHS) >= CACHE_SIZE:
+        JSONPATHS.clear()
+    JSONPATHS[path] = jsonpath_expr
+    return jsonpath_expr
+
+
+def compile_condition(condition):
+    """
+    Return the Condition compiled from the <condition> string, from cache
+    if possible.
+    """
+    try:
+        return CONDITIONS[condition]
+    except KeyError:
+        pass
+    compiled = Condition(condition)
+    if len(CONDITIONS) >= CACHE_SIZE:
+        CONDITIONS.clear()
+    CONDITIONS[condition] = compiled
+    return compiled
+
+
+def jsonpath_prefix(jsonpath_expr):
+    """
+    Return the list of the literal keys leading the <jsonpath_expr>
+    expression, and a boolean set to True if the expression has no other
+    element.
+
+    The nodes are identified by class name, because the vendored parser
+    mixes the classes of the foreign and system jsonpath_ng modules.
+    """
+    name = type(jsonpath_expr).__name__
+    if name in ("Root", "This"):
+        return [], True
+    if name == "Fields":
+        if len(jsonpath_expr.fields) == 1 and jsonpath_expr.fields[0] != "*":
+            return [jsonpath_expr.fields[0]], True
+        return [], False
+    if name == "Index":
+        return [jsonpath_expr.index], True
+    if name == "Child":
+        prefix, complete = jsonpath_prefix(jsonpath_expr.left)
+        if not complete:
+            return prefix, False
+        right, complete = jsonpath_prefix(jsonpath_expr.right)
+        return prefix + right, complete
+    return [], False
+
+
+def parse_condition(condition):
+    """
+    Split the <condition> string into the negation flag, the jsonpath,
+    the operator and the value.
+    """
+    oper = None
+    val = None
+
+    if condition[0] == "!":
+        path = condition[1:]
+        neg = True
+    else:
+        path = condition
+        neg = False
+
+    for op in OPERATORS:
+        idx = path.rfind(op)
+        if idx < 0:
+            continue
+        val = path[idx+len(op):].strip()
+        path = path[:idx].strip()
+        oper = op
+        if op == "~":
+            if not val.startswith(".*") and not val.startswith("^"):
+                val = ".*" + val
+            if not val.endswith(".*") and not val.endswith("$"):
+                val = val + ".*"
+        break
+
+    return neg, normalize_jsonpath(path), oper, val
+
+
+def eval_condition(jsonpath_expr, oper, val, data):
+    for match in jsonpath_expr.find(data):
+        if oper is None:
+            if match.value:
+                return True
+            else:
+                continue
+        obj_class = type(match.value)
+        try:
+            if obj_class == bool:
+                val = convert_boolean(val)
+            else:
+                val = obj_class(val)
+        except Exception as exc:
+            raise ex.Error("can not convert to a common type")
+        if oper == "=":
+            if match.value == val:
+                return True
+        elif oper == ">":
+            if match.value > val:
+                return True
+        elif oper == "<":
+            if match.value < val:
+                return True
+        elif oper == ">=":
+            if match.value >= val:
+                return True
+        elif oper == "<=":
+            if match.value <= val:
+                return True
+        elif is_string(match.value) and oper == "~":
+            if re.match(val, match.value):
+                return True
+        elif oper == " in ":
+            try:
+                l = json.loads(val)
+            except:
+                l = val.split(",")
+            if match.value in l:
+                return True
+    return False
+
+
+class Condition(object):
+    """
+    A compiled wait condition, expressed as
+    [!]<jsonpath>[<operator><value>].
+    """
+    def __init__(self, condition):
+        self.raw = condition
+        self.neg, path, self.oper, self.val = parse_condition(condition)
+        self.jsonpath_expr = compile_jsonpath(path)
+        self.prefix, _ = jsonpath_prefix(self.jsonpath_expr)
+        # the (prefix subtree, result) of the last evaluation
+        self.last = (None, None)
+
+    def lookup(self, data):
+        ref = data
+        for key in self.prefix:
+            try:
+                ref = ref[key]
+            except (KeyError, IndexError, TypeError):
+                return
+        return ref
+
+    def match(self, data):
+        """
+        Return True if the jsonpath lookup in the <data> daemon status
+        matches the operator and value, ignoring the negation flag.
+        """
+        ref = self.lookup(data)
+        last_ref, last_result = self.last
+        if last_result is not None and ref is last_ref:
+            return last_result
+        result = eval_condition(self.jsonpath_expr, self.oper, self.val, data)
+        self.last = (ref, result)
+        return result
+
+    def satisfied(self, data):
+        return self.neg ^ self.match(data)
+
+    def satisfied_by_event(self, event):
+        """
+        Return True if the jsonpath lookup in the <event> message matches.
+        The negated conditions are only evaluated against the daemon
+        status.
+        """
+        if self.neg:
+            return False
+        if self.prefix and self.prefix[0] not in event:
+            return False
+        return eval_condition(self.jsonpath_expr, self.oper, self.val, event)
+
+
+class Waiter(object):
+    """
+    A request waiting for a condition to become true.
+    """
+    def __init__(self, condition):
+        self.condition = condition
+        self.event = threading.Event()
+
+    def satisfied(self, data):
+        return self.event.is_set() or self.condition.satisfied(data)
+
+    def wait(self, timeout):
+        return self.event.wait(timeout)
+
+
+class PrefixNode(object):
+    def __init__(self):
+        self.children = {}
+        self.waiters = set()
+
+    def walk(self):
+        yield self
+        for child in self.children.values():
+            for node in child.walk():
+                yield node
+
+
+class ConditionWatcher(object):
+    """
+    The registry of the waiters, indexed by their condition prefix.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.root = PrefixNode()
+
+    def register(self, condition):
+        """
+        Return a new Waiter for the <condition> string.
+        """
+        waiter = Waiter(compile_condition(condition))
+        with self.lock:
+            node = self.root
+            for key in waiter.condition.prefix:
+                node = node.children.setdefault(key, PrefixNode())
+            node.waiters.add(waiter)
+        return waiter
+
+    def unregister(self, waiter):
+        with self.lock:
+            nodes = [(None, self.root)]
+            for key in waiter.condition.prefix:
+                try:
+                    nodes.append((key, nodes[-1][1].children[key]))
+                except KeyError:
+                    return
+            nodes[-1][1].waiters.discard(waiter)
+            for idx in range(len(nodes) - 1, 0, -1):
+                key, node = nodes[idx]
+                if node.waiters or node.children:
+                    break
+                del nodes[idx-1][1].children[key]
+
+    def touched(self, paths):
+        """
+        Return the set of waiters whose condition prefix is a parent or a
+        child of one of the changed <paths>.
+        """
+        waiters = set()
+        with self.lock:
+            for path in paths:
+                node = self.root
+                waiters |= node.waiters
+                for key in path:
+                    try:
+                        node = node.children[key]
+                    except (KeyError, TypeError):
+                        node = None
+                        break
+                    waiters |= node.waiters
+                if node is None:
+                    continue
+                for child in node.children.values():
+                    for _node in child.walk():
+                        waiters |= _node.waiters
+        return waiters
+
+    def all(self):
+        with self.lock:
+            return set(waiter for node in self.root.walk() for waiter in node.waiters)
+
+    def notify(self, event, data):
+        """
+        Evaluate the conditions impacted by the <event>, against the
+        <data> daemon status, and wake up the waiters whose condition is
+        satisfied.
+        """
+        if not event:
+            return
+        kind = event.get("kind")
+        if kind == "patch":
+            paths = []
+            for change in event.get("data", []):
+                try:
+                    paths.append(change[0])
+                except (IndexError, TypeError, KeyError):
+                    continue
+            waiters = self.touched(paths)
+        else:
+            waiters = self.all()
+        results = {}
+        for waiter in waiters:
+            if waiter.event.is_set():
+                continue
+            condition = waiter.condition
+            try:
+                satisfied = results[condition]
+            except KeyError:
+                try:
+                    if kind == "event":
+                        satisfied = condition.satisfied_by_event(event)
+                    else:
+                        satisfied = condition.satisfied(data)
+                except Exception:
+                    # the waiter will report the error on its own evaluation
+                    satisfied = False
+                results[condition] = satisfied
+            if satisfied:
+                waiter.event.set()
@@ -0,0 +1,133 @@
+"""
+The objects configuration files watcher.
+
+The monitor used to glob and stat all the objects configuration files on
+each loop. On Linux, this watcher uses inotify to tell which configuration
+files changed, so the monitor only needs a full scan on startup, on
+periodic consistency sweeps and when the watcher lost track of the tree.
+"""
+import os
+
+from env import Env
+from utilities.inotify import (IN_ATTRIB, IN_CLOSE_WRITE, IN_CREATE,
+                               IN_DELETE, IN_DELETE_SELF, IN_IGNORED,
+                               IN_ISDIR, IN_MOVED_FROM, IN_MOVED_TO,
+                               IN_ONLYDIR, IN_Q_OVERFLOW, Inotify)
+from utilities.naming import fmt_path, split_path
+
+MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_CREATE | IN_DELETE | IN_DELETE_SELF | \
+       IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+
+# The root directory kinds subdirectories
+ROOT_KINDS = ("vol", "cfg", "sec", "usr")
+
+
+def cf_path(fpath):
+    """
+    Return the object path of the <fpath> configuration file, as formatted
+    by list_services(), or None if <fpath> is not an object configuration
+    file path. The file does not need to exist.
+    """
+    if not fpath.endswith(".conf"):
+        return
+    etcns = os.path.join(Env.paths.pathetcns, "")
+    etc = os.path.join(Env.paths.pathetc, "")
+    if fpath.startswith(etcns):
+        path = fpath[len(etcns):-5]
+        if path.count(os.sep) == 1 and path.endswith(os.sep + "namespace"):
+            return path[:-9]
+        if path.count(os.sep) == 2:
+            return path
+        return
+    if not fpath.startswith(etc):
+        return
+    path = fpath[len(etc):-5]
+    if path.count(os.sep) > 1:
+        return
+    if os.sep in path and path.split(os.sep)[0] not in ROOT_KINDS:
+        return
+    try:
+        name, namespace, kind = split_path(path)
+    except ValueError:
+        return
+    return fmt_path(name, namespace, kind)
+
+
+class ConfigWatcher(object):
+    """
+    Report the configuration files created, modified or removed under
+    the etc and etc/namespaces directories.
+    """
+    def __init__(self):
+        self.inotify = Inotify()
+        self.dirs = {}
+        self.lost = True
+        self.watch()
+
+    def close(self):
+        self.inotify.close()
+
+    def watched_dirs(self):
+        etc = Env.paths.pathetc
+        etcns = Env.paths.pathetcns
+        dirs = [etc] + [os.path.join(etc, kind) for kind in ROOT_KINDS]
+        dirs.append(etcns)
+        try:
+            namespaces = os.listdir(etcns)
+        except OSError:
+            namespaces = []
+        for namespace in namespaces:
+            nsd = os.path.join(etcns, namespace)
+            dirs.append(nsd)
+            try:
+                kinds = os.listdir(nsd)
+            except OSError:
+                continue
+            dirs += [os.path.join(nsd, kind) for kind in kinds]
+        return [d for d in dirs if os.path.isdir(d)]
+
+    def watch(self):
+        """
+        Add watches on the configuration directories not yet watched.
+        Directories created later are not watched until the next call, so
+        the caller must rescan everything when changes() returns None.
+        """
+        watched = set(self.dirs.values())
+        for d in self.watched_dirs():
+            if d in watched:
+                continue
+            try:
+                wd = self.inotify.add_watch(d, MASK)
+            except OSError:
+                continue
+            self.dirs[wd] = d
+        self.lost = False
+
+    def changes(self):
+        """
+        Return the set of configuration files changed since the last call,
+        or None if the watcher lost track of some changes, in which case
+        the directories watches are refreshed.
+        """
+        fpaths = set()
+        for wd, mask, _, name in self.inotify.read():
+            if mask & IN_Q_OVERFLOW:
+                self.lost = True
+                continue
+            if mask & IN_IGNORED:
+                self.dirs.pop(wd, None)
+                self.lost = True
+                continue
+            if mask & (IN_ISDIR | IN_DELETE_SELF):
+                self.lost = True
+                continue
+            try:
+                d = self.dirs[wd]
+            except KeyError:
+                continue
+            if name.endswith(".conf"):
+                fpaths.add(os.path.join(d, name))
+        if self.lost:
+            self.watch()
+            return
+        return fpaths
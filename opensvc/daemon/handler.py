@@ -15,6 +15,8 @@ class BaseHandler(object):
     prototype = []
     stream = False
     multiplex = "on-demand"
+    # seconds to wait for a peer result when multiplexing, None to wait forever
+    multiplex_timeout = 60
     routes = (("", ""),)
 
     def get_origin(self, extra_info_func):
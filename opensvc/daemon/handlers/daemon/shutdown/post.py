@@ -14,6 +14,8 @@ class Handler(daemon.handler.BaseHandler):
     Beware, once shutdown, you won't be able to start the daemon from the api.
     This handler is meant to be used by the node shutdown sequence only.
     """
+    # may block longer than the default multiplexed request timeout
+    multiplex_timeout = None
     routes = (
         ("POST", "daemon_shutdown"),
         (None, "daemon_shutdown"),
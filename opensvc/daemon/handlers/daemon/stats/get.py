@@ -38,6 +38,7 @@ def action(self, nodename, thr=None, **kwargs):
                 "cpu": {
                     "time": shared.NODE.cpu_time(),
                  },
+                "conf_cache": dict(shared.NODE.conf_cache_stats),
             },
             "services": {},
         }
@@ -47,13 +48,20 @@ def action(self, nodename, thr=None, **kwargs):
         with shared.THREADS_LOCK:
             for dthr_id, dthr in shared.THREADS.items():
                 data[dthr_id] = dthr.thread_stats()
+        status_workers = shared.STATUS_WORKERS
+        if status_workers is not None:
+            data["status_workers"] = status_workers.stats()
         for path in paths:
             try:
                 svc = shared.SERVICES[path]
             except KeyError:
                 continue
-            _data = svc.pg_stats()
-            if _data:
-                data["services"][path] = _data
+            _data = svc.pg_stats() or {}
+            _data["conf_cache"] = dict(svc.conf_cache_stats)
+            if status_workers is not None:
+                status_eval = status_workers.object_stats(path)
+                if status_eval:
+                    _data["status_eval"] = status_eval
+            data["services"][path] = _data
         return {"status": 0, "data": data}
 
@@ -6,6 +6,8 @@ class Handler(daemon.handler.BaseHandler, daemon.clusterlock.LockMixin):
     Acquire a clusterwide lock identified by <name>.
     Other lockers for the same <name> will wait for <timeout> until release.
     """
+    # may block longer than the default multiplexed request timeout
+    multiplex_timeout = None
     routes = (
         ("POST", "lock"),
         (None, "lock"),
@@ -12,6 +12,8 @@ class Handler(daemon.handler.BaseHandler):
     """
     Execute a node action.
     """
+    # may block longer than the default multiplexed request timeout
+    multiplex_timeout = None
     routes = (
         ("POST", "node_action"),
         (None, "node_action"),
@@ -10,6 +10,8 @@ class Handler(daemon.handler.BaseHandler):
     Freeze the node and shutdown all running object instances.
     Return only when done.
     """
+    # may block longer than the default multiplexed request timeout
+    multiplex_timeout = None
     routes = (
         ("POST", "node_drain"),
         (None, "node_drain"),
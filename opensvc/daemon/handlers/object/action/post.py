@@ -69,6 +69,8 @@ class Handler(daemon.handler.BaseHandler, daemon.rbac.ObjectCreateMixin):
     """
     Execute an object instance action.
     """
+    # may block longer than the default multiplexed request timeout
+    multiplex_timeout = None
     routes = (
         ("POST", "object_action"),
         ("POST", "service_action"),
@@ -12,6 +12,8 @@ class Handler(daemon.handler.BaseHandler, daemon.rbac.ObjectCreateMixin):
     """
     Create new objects.
     """
+    # may block longer than the default multiplexed request timeout
+    multiplex_timeout = None
     routes = (
         ("POST", "object_create"),
         ("POST", "create"),
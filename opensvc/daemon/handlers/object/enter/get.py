@@ -19,6 +19,8 @@ class Handler(daemon.handler.BaseHandler):
     The basic auth credential is random.
     The port is random.
     """
+    # may block longer than the default multiplexed request timeout
+    multiplex_timeout = None
     routes = (
         ("GET", "object_enter"),
     )
@@ -0,0 +1,58 @@
+import daemon.handler
+import daemon.shared as shared
+
+class Handler(daemon.handler.BaseHandler):
+    """
+    Return the last relay heartbeat payloads emitted by the nodes of the
+    <cluster_id> cluster, indexed by slot name.
+    The payload of the slots not updated since the date set for the slot
+    in <updated> is not returned.
+    """
+    routes = (
+        ("GET", "relay_bulk_rx"),
+        (None, "relay_bulk_rx"),
+    )
+    prototype = [
+        {
+            "name": "cluster_id",
+            "desc": "The cluster.id keyword value of the emitting nodes.",
+            "required": False,
+            "format": "string",
+            "default": "",
+        },
+        {
+            "name": "slots",
+            "desc": "The names of the nodes to fetch the last heartbeat message from. Default to all the cluster slots.",
+            "required": False,
+            "format": "list",
+            "default": None,
+        },
+        {
+            "name": "updated",
+            "desc": "The slot name to last update time mapping of the heartbeat messages the client already has. The matching slots are returned without payload.",
+            "required": False,
+            "format": "dict",
+            "default": {},
+        },
+    ]
+    access = {
+        "roles": ["heartbeat"],
+    }
+
+    def action(self, nodename, thr=None, **kwargs):
+        options = self.parse_options(kwargs)
+        prefix = options.cluster_id + "/"
+        slots = set(options.slots) if options.slots else None
+        data = {}
+        with shared.RELAY_LOCK:
+            for key, _data in shared.RELAY_DATA.items():
+                if not key.startswith(prefix):
+                    continue
+                slot = key[len(prefix):]
+                if slots is not None and slot not in slots:
+                    continue
+                if options.updated.get(slot) == _data["updated"]:
+                    data[slot] = {"updated": _data["updated"]}
+                else:
+                    data[slot] = {"updated": _data["updated"], "msg": _data["msg"]}
+        return {"status": 0, "data": data}
@@ -9,6 +9,8 @@ class Handler(daemon.handler.BaseHandler):
     """
     Wait for the current data generation number to reach all live nodes.
     """
+    # may block longer than the default multiplexed request timeout
+    multiplex_timeout = None
     routes = (
         ("GET", "sync"),
     )
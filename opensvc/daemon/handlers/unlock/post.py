@@ -6,6 +6,8 @@ class Handler(daemon.handler.BaseHandler, daemon.clusterlock.LockMixin):
     Release a clusterwide lock identified by <name> and the <lock_id>
     returned by the lock handler call.
     """
+    # may block longer than the default multiplexed request timeout
+    multiplex_timeout = None
     routes = (
         ("POST", "unlock"),
         (None, "unlock"),
@@ -8,15 +8,22 @@
 import errno
 import contextlib
 import json
+import struct
 import time
 
 import daemon.shared as shared
 import core.exceptions as ex
+from core.comm import is_hb_frame
 from env import Env
 from .hb import Hb
 from utilities.string import bdecode
 #from utilities.converters import print_duration
 
+# The header of a slot containing binary heartbeat frames: magic, update
+# time, frames length. The frames follow.
+SLOT_FRAME = struct.Struct("!4sdI")
+SLOT_FRAME_MAGIC = b"OSVD"
+
 class HbDisk(Hb):
     """
     A class factorizing common methods and properties for the disk
@@ -152,9 +159,16 @@ def slot_offset(self, slot):
         return self.METASIZE + slot * self.SLOTSIZE
 
     def read_slot(self, slot, fo=None):
+        """
+        Return the slot data, either a json document or a SLOT_FRAME header
+        followed by binary heartbeat frames.
+        """
         offset = self.slot_offset(slot)
         fo.seek(offset, os.SEEK_SET)
         fo.readinto(self.slot_buff)
+        if self.slot_buff[:len(SLOT_FRAME_MAGIC)] == SLOT_FRAME_MAGIC:
+            _, _, size = SLOT_FRAME.unpack_from(self.slot_buff[:SLOT_FRAME.size])
+            return self.slot_buff[:SLOT_FRAME.size+size]
         data = bdecode(self.slot_buff[:])
         end = data.index("\0")
         return data[:end]
@@ -217,6 +231,8 @@ class HbDiskTx(HbDisk):
     """
     The disk heartbeat tx class.
     """
+    frame_capable = True
+
     def __init__(self, name):
         HbDisk.__init__(self, name, role="tx")
 
@@ -266,10 +282,13 @@ def _do(self, fo):
         if message is None:
             return
 
-        data = (json.dumps({
-            "msg": message,
-            "updated": time.time(),
-        })+'\0').encode()
+        if is_hb_frame(message):
+            data = SLOT_FRAME.pack(SLOT_FRAME_MAGIC, time.time(), len(message)) + message
+        else:
+            data = (json.dumps({
+                "msg": message,
+                "updated": time.time(),
+            })+'\0').encode()
         try:
             self.write_slot(slot, data, fo=fo)
             self.set_last()
@@ -349,8 +368,16 @@ def _do(self, fo):
             if data["slot"] < 0:
                 continue
             try:
-                slot_data = json.loads(self.read_slot(data["slot"], fo=fo))
-                _clustername, _nodename, _data = self.decrypt(slot_data["msg"])
+                slot_data = self.read_slot(data["slot"], fo=fo)
+                if slot_data[:len(SLOT_FRAME_MAGIC)] == SLOT_FRAME_MAGIC:
+                    _, updated, _ = SLOT_FRAME.unpack_from(slot_data)
+                    messages = self.split_message(slot_data[SLOT_FRAME.size:])
+                else:
+                    slot_data = json.loads(slot_data)
+                    updated = slot_data["updated"]
+                    messages = [slot_data["msg"]]
+                results = [self.decrypt(message) for message in messages]
+                _clustername, _nodename, _data = results[0]
                 if _clustername != self.cluster_name:
                     continue
                 if _nodename is None:
@@ -362,7 +389,6 @@ def _do(self, fo):
                     self.log.warning("node %s has written its data in node %s "
                                      "reserved slot", _nodename, nodename)
                     nodename = _nodename
-                updated = slot_data["updated"]
                 last_updated = self.last_updated.get(nodename)
                 if last_updated is not None and last_updated == updated:
                     # remote tx has not rewritten its slot
@@ -372,7 +398,9 @@ def _do(self, fo):
                     # discard too old dataset
                     #self.log.info("node %s has a too old dataset (age: %s)", nodename, print_duration(time.time()-updated))
                     continue
-                self.queue_rx_data(_data, nodename)
+                for _, _, _data in results:
+                    if _data is not None:
+                        self.queue_rx_data(_data, nodename)
                 self.push_stats(len(slot_data))
                 self.set_last(nodename)
                 self.last_updated[nodename] = updated
@@ -7,6 +7,7 @@
 import daemon.shared as shared
 import core.exceptions as ex
 import utilities.ifconfig
+from core.comm import HAS_ZDICT, HB_FRAME_VERSION, is_hb_frame, iter_hb_frames
 from env import Env
 from utilities.storage import Storage
 
@@ -17,6 +18,9 @@ class Hb(shared.OsvcThread):
     interval = 5
     timeout = None
 
+    # True if the driver can carry binary heartbeat frames
+    frame_capable = False
+
     def __init__(self, name, role=None):
         shared.OsvcThread.__init__(self)
         self.name = name
@@ -27,7 +31,8 @@ def __init__(self, name, role=None):
         self.reset_stats()
         self.hb_nodes = []
         self.get_hb_nodes()
-        self.msg_type = None
+        self.msg_types = {}
+        self.trailer = None
 
     def get_hb_nodes(self):
         try:
@@ -52,8 +57,23 @@ def reset_stats(self):
             "beats": 0,
             "bytes": 0,
             "errors": 0,
+            "messages": {},
         })
 
+    def push_message_stats(self, nodename, kind, size):
+        """
+        Account a prepared message in the per-peer message stats.
+        """
+        nodename = nodename or "*"
+        try:
+            stats = self.stats.messages[nodename]
+        except KeyError:
+            stats = {"full": 0, "patch": 0, "ping": 0, "bytes": 0, "full_ratio": 0.0}
+            self.stats.messages[nodename] = stats
+        stats[kind] += 1
+        stats["bytes"] += size
+        stats["full_ratio"] = float(stats["full"]) / (stats["full"] + stats["patch"] or 1)
+
     def status(self, **kwargs):
         data = shared.OsvcThread.status(self, **kwargs)
         running = data.get("state") == "running"
@@ -156,66 +176,188 @@ def get_ip_address(ifname):
             addr = intf.ipaddr
         return addr
 
+    def get_frame_opts(self):
+        """
+        Return None if the driver or a peer node does not support the binary
+        heartbeat frames, else the frame options supported by all peers.
+
+        The peers announce their support in the "hb_frame" key of their
+        dataset, so the legacy message format is used until a full dataset
+        is received from every peer.
+        """
+        if not self.frame_capable:
+            return
+        zdict = HAS_ZDICT
+        deltas = True
+        for nodename in self.hb_nodes:
+            if nodename == Env.nodename:
+                continue
+            try:
+                caps = self.daemon_status_data.get(["monitor", "nodes", nodename, "hb_frame"])
+            except KeyError:
+                return
+            if not caps or caps.get("version", 0) < HB_FRAME_VERSION:
+                return
+            zdict = zdict and caps.get("zdict", False)
+            deltas = deltas and caps.get("deltas", False)
+        return {"zdict": zdict, "deltas": deltas}
+
+    def encrypt_message(self, data, frame_opts):
+        if frame_opts is None:
+            return self.encrypt(data, encode=False)
+        return self.encrypt_frame(data, zdict=frame_opts["zdict"])
+
+    @staticmethod
+    def message_format(frame_opts):
+        if frame_opts is None:
+            return "json"
+        elif frame_opts["zdict"]:
+            return "frame+zdict"
+        else:
+            return "frame"
+
+    def set_msg_type(self, nodename, msg_type):
+        if self.msg_types.get(nodename) == msg_type:
+            return
+        self.msg_types[nodename] = msg_type
+        if nodename:
+            self.log.info('change message type to %s for %s (gen %s)', msg_type, nodename, shared.GEN)
+        else:
+            self.log.info('change message type to %s (gen %s)', msg_type, shared.GEN)
+
     def get_message(self, nodename=None):
+        """
+        Return the message to send to <nodename>, or to all peers if
+        <nodename> is None, and its length.
+        """
+        message, kind = self._get_message(nodename)
+        if message is None:
+            return None, 0
+        message_bytes = len(message)
+        self.push_message_stats(nodename, kind, message_bytes)
+        return message, message_bytes
+
+    def _get_message(self, nodename=None):
+        frame_opts = self.get_frame_opts()
         begin, num = self.get_oldest_gen(nodename)
+        deltas = []
+        if 0 < begin < shared.GEN:
+            try:
+                deltas = [(gen, shared.GEN_DIFF[gen]) for gen in sorted(shared.GEN_DIFF) if gen > begin]
+            except (KeyError, RuntimeError):
+                # Protect from GEN_DIFF 'dictionary changed size' during iteration
+                # - purge_log()
+                # - reset during monitor crash init_data()
+                self.log.info("wait next iteration to create patch message (gen %s)", shared.GEN)
+                return None, None
+            if begin < shared.GEN - 1 and (not deltas or deltas[0][0] != begin + 1):
+                # the peer lags behind the deltas log window.
+                # the newest gen delta may be not yet logged.
+                self.log.debug("gen %d delta already purged for %s", begin + 1, nodename if nodename else "*")
+                begin = 0
         if num == 0:
             # we're alone for now. don't send a full status payload.
             # sent a presence announce payload instead.
             self.log.debug("ping node %s", nodename if nodename else "*")
-            if self.msg_type != 'ping':
-                self.msg_type = 'ping'
-                self.log.info('change message type to %s (gen %s)', self.msg_type, shared.GEN)
-            message = self.encrypt({
+            self.set_msg_type(nodename, 'ping')
+            message = self.encrypt_message({
                 "kind": "ping",
                 "compat": shared.COMPAT_VERSION,
                 "gen": self.get_gen(),
                 "monitor": self.get_node_monitor(),
                 "updated": time.time(), # for hb and relay readers
-            }, encode=False)
-            return message, len(message) if message else 0
+            }, frame_opts)
+            return message, "ping"
         if begin == 0 or begin > shared.GEN:
             self.log.debug("send full node data to %s", nodename if nodename else "*")
             if not self.node_data.exists(["monitor"]):
                 # no pertinent data to send yet (pre-init)
                 self.log.debug("no pertinent data to send yet (pre-init)")
-                return None, 0
-            if self.msg_type != 'full':
-                self.msg_type = 'full'
-                self.log.info('change message type to %s (gen %s)', self.msg_type, shared.GEN)
+                return None, None
+            self.set_msg_type(nodename, 'full')
+            fmt = self.message_format(frame_opts)
             with shared.HB_MSG_LOCK:
-                if shared.HB_MSG is not None:
-                    return shared.HB_MSG, shared.HB_MSG_LEN
+                message = shared.HB_MSG.get(fmt)
+                if message is not None:
+                    return message, "full"
                 data = self.node_data.get_full()
-                shared.HB_MSG = self.encrypt(data, encode=False)
-                if shared.HB_MSG is None:
-                    shared.HB_MSG_LEN = 0
-                else:
-                    shared.HB_MSG_LEN = len(shared.HB_MSG)
-                return shared.HB_MSG, shared.HB_MSG_LEN
+                message = self.encrypt_message(data, frame_opts)
+                if message is None:
+                    return None, None
+                shared.HB_MSG[fmt] = message
+                return message, "full"
         else:
             self.log.debug("send gen %d-%d deltas to %s", begin, shared.GEN, nodename if nodename else "*") # COMMENT
-            if self.msg_type != 'patch':
-                self.msg_type = 'patch'
-                self.log.info('change message type to %s (gen %s)', self.msg_type, shared.GEN)
-            data = {}
-            try:
-                for gen, delta in shared.GEN_DIFF.items():
-                    if gen <= begin:
-                        continue
-                    data[gen] = delta
-            except:
-                # Protect from GEN_DIFF 'dictionary changed size' during iteration
-                # - purge_log()
-                # - reset during monitor crash init_data()
-                self.log.info("wait next iteration to create patch message (gen %s)", shared.GEN)
-                return None, 0
-            message = self.encrypt({
+            self.set_msg_type(nodename, 'patch')
+            if frame_opts and frame_opts["deltas"]:
+                return self.get_deltas_message(deltas, frame_opts), "patch"
+            message = self.encrypt_message({
                 "kind": "patch",
-                "deltas": data,
+                "deltas": dict(deltas),
                 "gen": self.get_gen(),
                 "updated": time.time(), # for hb and relay readers
-            }, encode=False)
-            return message, len(message) if message else 0
+            }, frame_opts)
+            return message, "patch"
+
+    def get_deltas_message(self, deltas, frame_opts):
+        """
+        Return the concatenation of the encrypted frames of each gen delta,
+        followed by a patch frame with no delta carrying our merged gens.
+
+        The gen delta frames do not depend on the peer, so they are
+        encrypted once and cached until the delta is purged from the log.
+        """
+        fmt = self.message_format(frame_opts)
+        fragments = []
+        with shared.HB_MSG_LOCK:
+            for gen, delta in deltas:
+                key = (fmt, gen)
+                cached = shared.HB_DELTA_MSG.get(key)
+                if cached is None or cached[0] is not delta:
+                    fragment = self.encrypt_message({
+                        "kind": "delta",
+                        "deltas": {gen: delta},
+                    }, frame_opts)
+                    if fragment is None:
+                        return
+                    cached = (delta, fragment)
+                    shared.HB_DELTA_MSG[key] = cached
+                fragments.append(cached[1])
+            for key in [key for key in shared.HB_DELTA_MSG if key[1] not in shared.GEN_DIFF]:
+                del shared.HB_DELTA_MSG[key]
+        trailer = self.get_trailer(frame_opts)
+        if trailer is None:
+            return
+        fragments.append(trailer)
+        return b"".join(fragments)
+
+    def get_trailer(self, frame_opts):
+        """
+        Return the encrypted patch frame closing a deltas message. The frame
+        is reused for all the peers while our merged gens do not change.
+        """
+        fmt = self.message_format(frame_opts)
+        gen = self.get_gen()
+        key = (fmt, sorted(gen.items()))
+        now = time.time()
+        if self.trailer and self.trailer[0] == key and now - self.trailer[1] < 1:
+            return self.trailer[2]
+        message = self.encrypt_message({
+            "kind": "patch",
+            "deltas": {},
+            "gen": gen,
+            "updated": now, # for hb and relay readers
+        }, frame_opts)
+        self.trailer = (key, now, message)
+        return message
+
+    def split_message(self, message):
+        """
+        Return the list of messages concatenated in <message>.
+        """
+        if not is_hb_frame(message):
+            return [message]
+        return list(iter_hb_frames(message))
 
     def queue_rx_data(self, data, nodename):
         shared.RX.put((nodename, data, self.name))
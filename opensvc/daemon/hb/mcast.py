@@ -11,6 +11,7 @@
 
 import core.exceptions as ex
 import daemon.shared as shared
+from core.comm import is_hb_frame
 from env import Env
 from utilities.chunker import chunker
 from utilities.string import bdecode
@@ -19,6 +20,11 @@
 MAX_MESSAGES = 100
 MAX_FRAGMENTS = 1000
 
+# Binary heartbeat frame fragment header: magic, message id, fragment index,
+# fragments count
+FRAGMENT = struct.Struct("!4s16sHH")
+FRAGMENT_MAGIC = b"OSVF"
+
 class HbMcast(Hb):
     """
     A class factorizing common methods and properties for the multicast
@@ -30,6 +36,7 @@ class HbMcast(Hb):
     addr = None
     sock = None
     max_data = 1000
+    frame_capable = True
 
     def status(self, **kwargs):
         data = Hb.status(self, **kwargs)
@@ -172,17 +179,24 @@ def do(self):
         #self.log.info("sending to %s:%s", self.addr, self.port)
         try:
             idx = 1
-            mid = str(uuid.uuid4())
+            frame = is_hb_frame(message)
+            if frame:
+                mid = uuid.uuid4().bytes
+            else:
+                mid = str(uuid.uuid4())
             total = message_bytes // self.max_data
             if message_bytes % self.max_data:
                 total += 1
             for chunk in chunker(message, self.max_data):
-                payload = (json.dumps({
-                    "id": mid,
-                    "i": idx,
-                    "n": total,
-                    "c": chunk,
-                }) + "\0").encode()
+                if frame:
+                    payload = FRAGMENT.pack(FRAGMENT_MAGIC, mid, idx, total) + chunk
+                else:
+                    payload = (json.dumps({
+                        "id": mid,
+                        "i": idx,
+                        "n": total,
+                        "c": chunk,
+                    }) + "\0").encode()
                 sent = self.sock.sendto(payload, self.group)
                 #self.log.info("send %s %d/%d", mid, idx, total)
                 idx += 1
@@ -284,20 +298,27 @@ def handle(data, addr):
             self.fragments = {}
             return
 
-        try:
-            payload = json.loads(bdecode(data).rstrip("\0\x00"))
-        except (ValueError, TypeError) as exc:
-            # old format ? try decrypt. will blacklist if failed.
-            handle(data, addr)
-            return
+        if data[:len(FRAGMENT_MAGIC)] == FRAGMENT_MAGIC:
+            try:
+                _, mid, idx, total = FRAGMENT.unpack_from(data)
+            except struct.error:
+                return
+            chunk = data[FRAGMENT.size:]
+        else:
+            try:
+                payload = json.loads(bdecode(data).rstrip("\0\x00"))
+            except (ValueError, TypeError) as exc:
+                # old format ? try decrypt. will blacklist if failed.
+                handle(data, addr)
+                return
 
-        try:
-            mid = payload["id"]
-            chunk = payload["c"]
-            idx = payload["i"]
-            total = payload["n"]
-        except KeyError:
-            return
+            try:
+                mid = payload["id"]
+                chunk = payload["c"]
+                idx = payload["i"]
+                total = payload["n"]
+            except KeyError:
+                return
 
         # verify message DoS
         if addr not in self.fragments:
@@ -322,13 +343,16 @@ def handle(data, addr):
             return
 
         #self.log.debug("message %s complete", mid)
-        message = ""
-        for idx in sorted(self.fragments[addr][mid].keys()):
-            message += self.fragments[addr][mid][idx]
+        chunks = [self.fragments[addr][mid][idx] for idx in sorted(self.fragments[addr][mid].keys())]
+        message = chunks[0][:0].join(chunks)
         handle(message, addr)
         self.fragments[addr] = {}
 
     def handle_client(self, message, addr):
+        for message in self.split_message(message):
+            self._handle_client(message, addr)
+
+    def _handle_client(self, message, addr):
         clustername, nodename, data = self.decrypt(message, sender_id=addr[0])
         if clustername != self.cluster_name:
             # surely from drp node
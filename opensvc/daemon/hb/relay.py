@@ -3,10 +3,12 @@
 """
 import sys
 import os
+import time
 
 import daemon.shared as shared
 import core.exceptions as ex
 from env import Env
+from utilities.concurrent_futures import get_concurrent_futures
 from .hb import Hb
 
 class HbRelay(Hb):
@@ -121,13 +123,32 @@ def send(self, message):
 
 
 
+class BulkUnsupported(Exception):
+    """
+    Raised when the relay does not support the bulk slots read.
+    """
+
+
 class HbRelayRx(HbRelay):
     """
     The relay heartbeat rx class.
+
+    The slots of all peer nodes are fetched with a single bulk request,
+    and the relay transfers only the slots updated since the previous
+    read. With a relay not supporting the bulk request, the slots are
+    read concurrently, one request per slot.
     """
+    # the delay before retrying a bulk request after the relay refused one
+    bulk_retry_interval = 10 * 60
+
+    # the maximum number of per-slot requests submitted concurrently
+    max_workers = 8
+
     def __init__(self, name):
         HbRelay.__init__(self, name, role="rx")
         self.last_updated = {}
+        self.bulk_retry = 0
+        self.executor = None
 
     def run(self):
         self.set_tid()
@@ -143,47 +164,135 @@ def run(self):
         while True:
             self.do()
             if self.stopped():
+                self.shutdown()
                 self.exit()
             with shared.HB_TX_TICKER:
                 shared.HB_TX_TICKER.wait(self.interval)
 
+    def shutdown(self):
+        if self.executor:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
     def do(self):
         self.janitor_procs()
         self.reload_config()
-        for nodename in self.hb_nodes:
-            if nodename == Env.nodename:
-                continue
+        nodenames = [nodename for nodename in self.hb_nodes if nodename != Env.nodename]
+        if not nodenames:
+            return
+        if time.time() >= self.bulk_retry:
             try:
-                updated, slot_data = self.receive(nodename)
-                _clustername, _nodename, _data = self.decrypt(slot_data, sender_id=self.relay)
-                if _clustername != self.cluster_name:
-                    continue
-                if _nodename is None:
-                    # invalid crypt
-                    #self.log.warning("can't decrypt data in node %s slot",
-                    #                 nodename)
-                    continue
-                if _nodename != nodename:
-                    self.log.warning("node %s has written its data in node %s "
-                                     "reserved slot", _nodename, nodename)
-                    nodename = _nodename
-                last_updated = self.last_updated.get(nodename)
-                if last_updated is not None and last_updated == updated:
-                    # remote tx has not rewritten its slot
-                    #self.log.info("node %s has not updated its slot", nodename)
-                    continue
-                self.last_updated[nodename] = updated
-                self.queue_rx_data(_data, nodename)
-                self.push_stats(len(_data))
-                self.set_last(nodename)
+                slots = self.receive_bulk(nodenames)
+            except BulkUnsupported as exc:
+                self.log.info("relay %s does not support bulk reads (%s), fallback to per-slot reads",
+                              self.relay, exc)
+                self.bulk_retry = time.time() + self.bulk_retry_interval
             except Exception as exc:
-                self.push_stats()
-                if self.get_last(nodename).success:
-                    self.log.error("read from relay %s slot %s error: %s", self.relay,
-                                   nodename, str(exc))
-                self.set_last(nodename, success=False)
-            finally:
-                self.set_beating(nodename)
+                # report the error on each slot
+                for nodename in nodenames:
+                    self._do(nodename, self.raise_exc, exc)
+                return
+            else:
+                for nodename in nodenames:
+                    self._do(nodename, self.bulk_slot, slots, nodename)
+                return
+
+        if len(nodenames) < 2:
+            for nodename in nodenames:
+                self._do(nodename, self.receive, nodename)
+            return
+        if self.executor is None:
+            concurrent_futures = get_concurrent_futures()
+            self.executor = concurrent_futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        else:
+            concurrent_futures = get_concurrent_futures()
+        futures = [self.executor.submit(self._do, nodename, self.receive, nodename) for nodename in nodenames]
+        concurrent_futures.wait(futures)
+
+    def _do(self, nodename, fn, *args):
+        """
+        Process the <nodename> slot data returned by <fn>.
+        """
+        try:
+            updated, slot_data = fn(*args)
+            if slot_data is None:
+                # remote tx has not rewritten its slot since the last bulk read
+                return
+            _clustername, _nodename, _data = self.decrypt(slot_data, sender_id=self.relay)
+            if _clustername != self.cluster_name:
+                return
+            if _nodename is None:
+                # invalid crypt
+                #self.log.warning("can't decrypt data in node %s slot",
+                #                 nodename)
+                return
+            if _nodename != nodename:
+                self.log.warning("node %s has written its data in node %s "
+                                 "reserved slot", _nodename, nodename)
+                nodename = _nodename
+            last_updated = self.last_updated.get(nodename)
+            if last_updated is not None and last_updated == updated:
+                # remote tx has not rewritten its slot
+                #self.log.info("node %s has not updated its slot", nodename)
+                return
+            self.last_updated[nodename] = updated
+            self.queue_rx_data(_data, nodename)
+            self.push_stats(len(_data))
+            self.set_last(nodename)
+        except Exception as exc:
+            self.push_stats()
+            if self.get_last(nodename).success:
+                self.log.error("read from relay %s slot %s error: %s", self.relay,
+                               nodename, str(exc))
+            self.set_last(nodename, success=False)
+        finally:
+            self.set_beating(nodename)
+
+    @staticmethod
+    def raise_exc(exc):
+        raise exc
+
+    def receive_bulk(self, nodenames):
+        """
+        Return the <nodenames> slots stored in the relay, as a dict indexed
+        by slot name. The slots not updated since the last read have no
+        "msg" key.
+        """
+        request = {
+            "action": "relay_bulk_rx",
+            "options": {
+                "slots": nodenames,
+                "cluster_id": self.cluster_id,
+                "updated": dict((nodename, self.last_updated[nodename]) for nodename in nodenames if nodename in self.last_updated),
+            },
+        }
+        resp = self.daemon_get(request, cluster_name="join", server="raw://"+self.relay, secret=self.secret, timeout=self.timeout)
+        if resp is None:
+            raise ex.Error("no response reading relay slots")
+        if resp.get("status", 1) != 0:
+            # old relays respond "handler not supported"
+            raise BulkUnsupported(resp.get("error", "return status not 0"))
+        if not isinstance(resp.get("data"), dict):
+            raise BulkUnsupported("no data in response reading relay slots")
+        return resp["data"]
+
+    @staticmethod
+    def bulk_slot(slots, nodename):
+        try:
+            slot = slots[nodename]
+        except KeyError:
+            raise ex.Error("no data in relay slot %s" % nodename)
+        if slot.get("updated") is None:
+            raise ex.Error("no 'updated' key in relay slot %s" % nodename)
+        if "msg" not in slot:
+            return slot["updated"], None
+        if slot["msg"] is None:
+            raise ex.Error("no data in relay slot %s" % nodename)
+        try:
+            # python3
+            return slot["updated"], bytes(slot["msg"], "ascii")
+        except TypeError:
+            return slot["updated"], slot["msg"]
 
     def receive(self, nodename):
         request = {
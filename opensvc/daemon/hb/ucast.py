@@ -2,6 +2,7 @@
 Unicast Heartbeat module
 """
 import sys
+import select
 import socket
 import threading
 import time
@@ -12,7 +13,10 @@
 import daemon.shared as shared
 from env import Env
 from .hb import Hb
+from core.comm import HB_FRAME_MAGIC, hb_frame_len, is_hb_frame
+from utilities.concurrent_futures import get_concurrent_futures
 from utilities.render.listener import fmt_listener
+from utilities.storage import Storage
 
 
 class HbUcast(Hb):
@@ -91,11 +95,25 @@ def _configure(self):
 class HbUcastTx(HbUcast):
     """
     The unicast heartbeat tx class.
+
+    A connection is kept open to each peer and reused by the next beats.
+    The messages are sent to the peers concurrently, so an unreachable
+    peer does not delay the beats sent to the others.
     """
     sock_tmo = 1.0
+    frame_capable = True
+
+    # the maximum delay between two connection attempts to an unreachable
+    # peer
+    backoff_max = 8.0
+
+    # the maximum number of messages sent concurrently
+    max_workers = 16
 
     def __init__(self, name, role="tx"):
         super(HbUcastTx, self).__init__(name, role=role)
+        self.conns = {}
+        self.executor = None
 
     def run(self):
         self.set_tid()
@@ -109,11 +127,21 @@ def run(self):
             while True:
                 self.do()
                 if self.stopped():
+                    self.shutdown()
                     self.exit()
                 with shared.HB_TX_TICKER:
                     shared.HB_TX_TICKER.wait(self.interval)
         except Exception as exc:
             self.log.exception(exc)
+            self.shutdown()
+
+    def shutdown(self):
+        if self.executor:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        for nodename in list(self.conns):
+            self.close_conn(nodename)
+        self.conns = {}
 
     def status(self, **kwargs):
         data = HbUcast.status(self, **kwargs)
@@ -123,21 +151,60 @@ def status(self, **kwargs):
     def do(self):
         self.janitor_procs()
         self.reload_config()
-        message, message_bytes = self.get_message()
-        if message is None:
-            return
+        frame_opts = self.get_frame_opts()
+        if frame_opts and frame_opts["deltas"]:
+            # peer-specific messages, see get_message()
+            message, message_bytes = None, 0
+        else:
+            message, message_bytes = self.get_message()
+            if message is None:
+                return
 
+        peers = []
         for nodename, config in self.peer_config.items():
             if nodename == Env.nodename:
                 continue
-            self._do(message, message_bytes, nodename, config)
+            if nodename not in self.conns:
+                self.conns[nodename] = Storage({
+                    "sock": None,
+                    "addr": None,
+                    "port": None,
+                    "failures": 0,
+                    "next_attempt": 0,
+                })
+            peers.append((nodename, config))
+        for nodename in [nodename for nodename in self.conns if nodename not in self.peer_config]:
+            self.close_conn(nodename)
+            del self.conns[nodename]
+
+        if message is None:
+            messages = [self.get_message(nodename) for nodename, _ in peers]
+        else:
+            messages = [(message, message_bytes)] * len(peers)
+        jobs = [(_message, _message_bytes, nodename, config)
+                for (_message, _message_bytes), (nodename, config) in zip(messages, peers)
+                if _message is not None]
+
+        if len(jobs) < 2:
+            for job in jobs:
+                self._do(*job)
+            return
+        if self.executor is None:
+            concurrent_futures = get_concurrent_futures()
+            self.executor = concurrent_futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        else:
+            concurrent_futures = get_concurrent_futures()
+        futures = [self.executor.submit(self._do, *job) for job in jobs]
+        concurrent_futures.wait(futures)
 
     def _do(self, message, message_bytes, nodename, config):
-        sock = None
+        if is_hb_frame(message):
+            # frames are self-delimited
+            data = message
+        else:
+            data = (message+"\0").encode()  # pylint: disable=no-member
         try:
-            # self.log.info("sending to %s:%s", config["addr"], config["port"])
-            sock = socket.create_connection((config["addr"], config["port"]), self.sock_tmo)
-            sock.sendall((message+"\0").encode())  # pylint: disable=no-member
+            self.send(nodename, config, data)
             self.set_last(nodename)
             self.push_stats(message_bytes)
         except socket.timeout:
@@ -160,8 +227,65 @@ def _do(self, message, message_bytes, nodename, config):
             self.set_last(nodename, success=False)
         finally:
             self.set_beating(nodename)
-            if sock is not None:
-                sock.close()
+
+    def send(self, nodename, config, data):
+        """
+        Send <data> to the peer <nodename>, reusing the connection opened by
+        the previous beats if still usable.
+
+        A send error on a reused connection is retried once on a new
+        connection, as the peer may have closed the idle connection. After
+        a connection error, the connection attempts to this peer are spaced
+        by an exponential backoff delay.
+        """
+        conn = self.conns[nodename]
+        if conn.sock is not None and (conn.addr, conn.port) != (config["addr"], config["port"]):
+            self.close_conn(nodename)
+        if conn.sock is not None and not self.reusable(conn.sock):
+            self.close_conn(nodename)
+        if conn.sock is not None:
+            try:
+                conn.sock.sendall(data)
+                return
+            except socket.error:
+                self.close_conn(nodename)
+        now = time.time()
+        if now < conn.next_attempt:
+            raise socket.error("connection retry in %.1fs" % (conn.next_attempt - now))
+        try:
+            conn.sock = socket.create_connection((config["addr"], config["port"]), self.sock_tmo)
+            conn.addr = config["addr"]
+            conn.port = config["port"]
+            conn.sock.sendall(data)
+        except Exception:
+            self.close_conn(nodename)
+            conn.failures += 1
+            conn.next_attempt = time.time() + min(self.sock_tmo * 2 ** conn.failures, self.backoff_max)
+            raise
+        conn.failures = 0
+        conn.next_attempt = 0
+
+    def close_conn(self, nodename):
+        conn = self.conns.get(nodename)
+        if conn is None or conn.sock is None:
+            return
+        try:
+            conn.sock.close()
+        except Exception:
+            pass
+        conn.sock = None
+
+    @staticmethod
+    def reusable(sock):
+        """
+        Return False if the peer closed the connection. The peer never sends
+        data, so a readable socket means an eof or an error is pending.
+        """
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+        except Exception:
+            return False
+        return not readable
 
 
 class HbUcastRx(HbUcast):
@@ -250,6 +374,7 @@ def do(self):
         if len(self.threads) >= self.max_handlers:
             self.log.warning("drop message received from %s: too many running handlers (%d)",
                              addr, self.max_handlers)
+            conn.close()
             return
         try:
             thr = threading.Thread(target=self.handle_client, args=(conn, addr))
@@ -266,17 +391,49 @@ def handle_client(self, conn, addr):
             conn.close()
 
     def _handle_client(self, conn, addr):
-        chunks = []
+        """
+        Handle the messages received on a peer connection, until the peer
+        closes the connection or sends nothing for longer than the
+        heartbeat timeout. The messages are either null terminated or
+        binary heartbeat frames.
+        """
+        buff = bytearray()
         buff_size = 4096
-        while True:
-            chunk = conn.recv(buff_size)
-            if chunk:
-                chunks.append(chunk)
-            if not chunk or chunk.endswith(b"\x00"):
+        conn.settimeout(self.sock_recv_tmo)
+        last = time.time()
+        scanned = 0
+        while not self.stopped():
+            try:
+                chunk = conn.recv(buff_size)
+            except socket.timeout:
+                if time.time() - last > max(self.timeout, self.sock_recv_tmo):
+                    return
+                continue
+            if not chunk:
                 break
-        data = six.b("").join(chunks)
+            last = time.time()
+            buff += chunk
+            while buff:
+                if buff[:1] == HB_FRAME_MAGIC[:1]:
+                    size = hb_frame_len(buff)
+                    if size is None or len(buff) < size:
+                        break
+                else:
+                    idx = buff.find(b"\x00", scanned)
+                    if idx < 0:
+                        scanned = len(buff)
+                        break
+                    size = idx + 1
+                data = bytes(buff[:size])
+                del buff[:size]
+                scanned = 0
+                self.handle_message(data, addr)
+        if buff:
+            # the last message was not terminated
+            self.handle_message(bytes(buff), addr)
+
+    def handle_message(self, data, addr):
         self.push_stats(len(data))
-        del chunks
 
         clustername, nodename, data = self.decrypt(data, sender_id=addr[0])
         if clustername != self.cluster_name:
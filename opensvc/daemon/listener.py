@@ -9,6 +9,7 @@
 
 import socket
 import logging
+import threading
 import time
 import select
 import shutil
@@ -19,7 +20,7 @@
 import datetime
 from foreign.six.moves.urllib.parse import urlparse, parse_qs # pylint: disable=import-error
 from subprocess import Popen
-from errno import EADDRINUSE, ECONNRESET, EPIPE, EBADF, EAFNOSUPPORT
+from errno import EADDRINUSE, ECONNRESET, EPIPE, EBADF, EAFNOSUPPORT, EAGAIN, EWOULDBLOCK
 
 from core.objects.usr import Usr
 
@@ -43,12 +44,16 @@
 
 import foreign.six as six
 import daemon.shared as shared
+from daemon.authcache import AuthCache, fingerprint
+from daemon.clientloop import ClientLoop, ClientWorkers, has_frontend
+from daemon.conditions import ConditionWatcher
 import core.exceptions as ex
 from foreign.six.moves import queue
 from env import Env
 from utilities.storage import Storage
 from core.comm import Headers
 from utilities.chunker import chunker
+from utilities.concurrent_futures import get_concurrent_futures
 from utilities.naming import split_path, fmt_path, factory, split_fullname
 from utilities.files import makedirs
 from utilities.drivers import driver_import
@@ -68,6 +73,7 @@ class _ConnectionAbortedError(Exception):
 
 
 LISTENER_SLOTS = 128
+MULTIPLEX_WORKERS = 16
 RE_LOG_LINE = re.compile(r"^[0-9]{4}-[0-9]{2}-[0-9]{2} [0-2][0-9]:[0-6][0-9]:[0-6][0-9],[0-9]{3} .* \| ")
 JANITORS_INTERVAL = 0.5
 ICON = base64.b64decode("iVBORw0KGgoAAAANSUhEUgAAABAAAAAQCAYAAAAf8/9hAAAABHNCSVQICAgIfAhkiAAAAAlwSFlzAAABigAAAYoBM5cwWAAAABl0RVh0U29mdHdhcmUAd3d3Lmlua3NjYXBlLm9yZ5vuPBoAAAJKSURBVDiNbZJLSNRRFMZ/5/5HbUidRSVSuGhMzUKiB9SihYaJQlRSm3ZBuxY9JDRb1NSi7KGGELRtIfTcJBjlItsohT0hjcpQSsM0CMfXzP9xWszM35mpA/dy7+Wc7/vOd67wn9gcuZ8bisa3xG271LXthTdNL/rZ0B0VQbNzA+mX2ra+kL04d86NxY86QpEI8catv0+SIyOMNnr6aa4ba/aylL2cTdVI6tBwrbfUXvKeOXY87Ng2jm3H91dNnWrd++U89kIx7jw48+DMf0bcOtk0MA5gABq6egs91+pRCKc01lXOnG2tn4yAKUYkmWpATDlqevRjdb4PYMWDrSiVqIKCosMX932vAYoQQ8bCgGoVajcDmIau3jxP9bj6/igoFqiTuCeLkDQQQOSEDm3PMQEnfxeqhYlSH6Si6WF4EJjIZE+1AqiGCAZ3GoT1yYcEuSqqMDBacOXMo5JORDJBRJa9V0qMqkiGfHwt1vORlW3ND9ZdB/mZNDANJNmgUXcsnTmx+WCBvuH8G6/GC276BpLmA95XMxvVQdC5NOYkkC8ocG9odRCRzEkI0yzF3pn+SM2SKrfJiCRQYp9uqf9l/p2E3pIdr20DkCvBS6o64tMvtzLTfmTiQlGh05w1iSFyQ23+R3rcsjsqrlPr4X3Q5f6nOw7/iOwpX+wEsyLNwLcIB6TsSQzASon+1n83unbboTtiaczz3FVXD451VG+cawfyEAHPGcdzruPOHpOKp39SdcvzyAqdOh3GsyoBsLxJ1hS+F4l42Xl/Abn0Ctwc5dldAAAAAElFTkSuQmCC")
@@ -90,6 +96,33 @@ def defer_stop_client(session_id):
         shared.DEFERRED_STOP_LISTENER_CLIENTS.add(session_id)
 
 
+class SharedEvent(object):
+    """
+    An event filtered for a class of events clients with the same selector
+    and namespaces grants. The same instance is queued to all the clients
+    of the class, so the event encodings are done only once.
+    """
+    def __init__(self, data):
+        self.data = data
+        self.encoded = {}
+
+    def encode(self, fmt, fn):
+        """
+        Return the <fmt> encoding of the event, as produced by <fn>,
+        from the cache if possible.
+        """
+        try:
+            return self.encoded[fmt]
+        except KeyError:
+            pass
+        buff = fn(self.data)
+        self.encoded[fmt] = buff
+        return buff
+
+    def json(self):
+        return self.encode("json", json.dumps)
+
+
 class Close(Exception):
     pass
 
@@ -118,6 +151,10 @@ class Listener(shared.OsvcThread):
     port = -1
     addr = None
     handlers = {}
+    auth_cache = AuthCache()
+    waiters = ConditionWatcher()
+    client_loop = None
+    client_workers = None
 
     @lazy
     def certfs(self):
@@ -306,10 +343,20 @@ def run(self):
                 "alive": Storage({}),
                 "clients": Storage({})
             }),
+            "events": Storage({
+                "received": 0,
+                "sent": 0,
+                "rate": 0.0,
+                "classes": 0,
+                "fanout_time": 0.0,
+                "last_fanout_time": 0.0,
+            }),
         })
+        self.last_janitor_events = time.time()
 
         self.register_handlers()
         self.setup_socks()
+        self.init_frontend()
         self.stage = "ready"
 
         while True:
@@ -324,6 +371,7 @@ def run(self):
             if self.stopped():
                 for sock in self.sockmap.values():
                     sock.close()
+                self.stop_frontend()
                 self.join_threads()
                 if Env.sysname == "Linux":
                     self.certfs.stop()
@@ -331,13 +379,52 @@ def run(self):
 
     def status(self, **kwargs):
         data = shared.OsvcThread.status(self, **kwargs)
+        for thr in self.events_clients:
+            try:
+                self.stats.sessions.alive[thr.sid].events_queued = thr.event_queue.qsize()
+            except (KeyError, AttributeError):
+                pass
         data["stats"] = self.stats
+        if self.client_loop:
+            data["frontend"] = self.client_loop.stats()
         data["config"] = {
             "port": self.port,
             "addr": self.addr,
         }
         return data
 
+    def init_frontend(self):
+        """
+        Start the client loop multiplexing the idle connections, and the
+        pool of workers serving their requests. If disabled, a client
+        handler thread is started for each accepted connection.
+        """
+        self.stop_frontend()
+        try:
+            size = shared.NODE.oget("listener", "workers")
+        except Exception:
+            size = 0
+        if not size or size < 0:
+            self.log.info("client loop disabled")
+            return
+        if not has_frontend():
+            self.log.info("client loop disabled: the selectors module is not available")
+            return
+        self.log.info("start the client loop with %d workers", size)
+        self.client_workers = ClientWorkers(size=size, log=self.log)
+        self.client_workers.start()
+        self.client_loop = ClientLoop(self.client_workers, log=self.log)
+        self.client_loop.start()
+
+    def stop_frontend(self):
+        if self.client_loop is not None:
+            self.client_loop.stop()
+            self.client_loop.join(5)
+            self.client_loop = None
+        if self.client_workers is not None:
+            self.client_workers.stop()
+            self.client_workers = None
+
     def reconfigure(self):
         shared.NODE.listener = self
         unset_lazy(self, "ca")
@@ -460,8 +547,12 @@ def do(self):
                 continue
             try:
                 thr = ClientHandler(self, conn, addr, encrypted, scheme, tls, self.tls_context)
-                thr.start()
-                self.threads.append(thr)
+                if self.client_loop is None:
+                    thr.start()
+                    self.threads.append(thr)
+                else:
+                    thr.open_session()
+                    self.client_loop.add(thr)
             except RuntimeError as exc:
                 self.log.warning(exc)
                 conn.close()
@@ -554,39 +645,88 @@ def janitor_events(self):
                 self.events_grace_period = False
             else:
                 return
-        done = []
+        now = time.time()
+        received = 0
         while True:
             try:
                 event = shared.EVENT_Q.get(False, 0)
             except queue.Empty:
                 break
-            to_remove = []
-            for idx, thr in enumerate(self.events_clients):
-                if thr not in self.threads:
+            received += 1
+            self.waiters.notify(event, shared.DAEMON_STATUS.get())
+            self.fanout_event(event)
+        elapsed = now - self.last_janitor_events
+        if elapsed > 0:
+            self.stats.events.rate = received / elapsed
+        self.stats.events.received += received
+        self.last_janitor_events = now
+
+    def fanout_event(self, event):
+        """
+        Queue the <event> to the subscribed clients.
+
+        The event is filtered once per class of clients with the same
+        selector and namespaces grants, and the filtered event is shared
+        by the clients of the class.
+        """
+        begin = time.time()
+        classes = {}
+        to_remove = []
+        for idx, thr in enumerate(self.events_clients):
+            if thr not in self.threads and thr.sid not in self.stats.sessions.alive:
+                # the session is neither served by a client thread nor
+                # by a listener worker
+                to_remove.append(idx)
+                continue
+            if thr.h2conn:
+                if not thr.events_stream_ids:
                     to_remove.append(idx)
                     continue
-                # make a copy, filter_event may change data, avoid being replaced while queued
-                fevent = self.filter_event(json.loads(json.dumps(event)), thr)
-                if fevent is None:
-                    continue
-                if thr.h2conn:
-                    if not thr.events_stream_ids:
-                        to_remove.append(idx)
-                        continue
-                thr.event_queue.put(fevent)
-            for idx in to_remove:
-                try:
-                    del self.events_clients[idx]
-                except IndexError:
-                    pass
+            if self.events_client_is_root(thr):
+                key = None
+                namespaces = None
+            else:
+                namespaces = thr.get_namespaces()
+                key = (thr.selector, frozenset(namespaces))
+            try:
+                fevent = classes[key]
+            except KeyError:
+                fevent = self.filter_event(event, thr, namespaces=namespaces)
+                if fevent is not None:
+                    fevent = SharedEvent(fevent)
+                classes[key] = fevent
+            if fevent is None:
+                continue
+            thr.event_queue.put(fevent)
+            self.stats.events.sent += 1
+        for idx in reversed(to_remove):
+            try:
+                del self.events_clients[idx]
+            except IndexError:
+                pass
+        duration = time.time() - begin
+        self.stats.events.classes = len(classes)
+        self.stats.events.last_fanout_time = duration
+        self.stats.events.fanout_time += duration
 
-    def filter_event(self, event, thr):
+    @staticmethod
+    def events_client_is_root(thr):
+        return thr.selector in (None, "**") and (thr.usr is False or "root" in thr.usr_grants)
+
+    def filter_event(self, event, thr, namespaces=None):
+        """
+        Return the <event> filtered for the client <thr>.
+
+        The <event> structure is not modified, so it can be shared by
+        the filtered events.
+        """
         if event is None:
             return
-        if thr.selector in (None, "**") and (thr.usr is False or "root" in thr.usr_grants):
+        if self.events_client_is_root(thr):
             # root and no selector => fast path
             return event
-        namespaces = thr.get_namespaces()
+        if namespaces is None:
+            namespaces = thr.get_namespaces()
         kind = event.get("kind")
         if kind == "full":
             return event
@@ -699,8 +839,7 @@ def filter_change(change):
             #    print("ACCEPT", thr.usr.name if thr.usr else "", filtered_change)
             #else:
             #    print("DROP  ", thr.usr.name if thr.usr else "", change)
-        event["data"] = changes
-        return event
+        return dict(event, data=changes)
 
     def bind_inet(self, sock, addr, port):
         """
@@ -900,6 +1039,7 @@ def __init__(self, parent, conn, addr, encrypted, scheme, tls, tls_context):
         self.parent = parent
         self.event_queue = None
         self.conn = conn
+        self.tls_conn = None
         self.addr = addr
         self.encrypted = encrypted
         self.scheme = scheme
@@ -910,6 +1050,7 @@ def __init__(self, parent, conn, addr, encrypted, scheme, tls, tls_context):
         self.h2conn = None
         self.events_stream_ids = []
         self.usr_cf_sum = None
+        self.jwt_expire = None
         self.same_auth = lambda h: False
         if scheme == "raw":
             self.usr = False
@@ -921,6 +1062,7 @@ def __init__(self, parent, conn, addr, encrypted, scheme, tls, tls_context):
             self.usr_grants = {}
         self.events_counter = 0
         self.sid = str(uuid.uuid4())
+        self.resume = None
 
 
     def __str__(self):
@@ -937,19 +1079,46 @@ def __str__(self):
         )
 
     def run(self):
+        if self.resume:
+            # promoted by a listener worker
+            fn, args = self.resume
+            self.parent.stats.sessions.alive[self.sid].ident = self.ident
+            self.serve(fn, *args)
+            return
+        self.open_session()
+        if self.scheme == "h2":
+            self.serve(self.handle_h2_client)
+        else:
+            self.serve(self.handle_raw_client)
+
+    def open_session(self):
+        self.parent.stats.sessions.alive[self.sid] = Storage({
+            "created": time.time(),
+            "addr": self.addr[0],
+            "encrypted": self.encrypted,
+            "progress": "init",
+            "ident": self.ident,
+        })
+
+    def close_session(self):
+        try:
+            del self.parent.stats.sessions.alive[self.sid]
+        except KeyError:
+            pass
+        if self.h2conn:
+            self.h2conn.close_connection()
+        if self.tls_conn is not None and self.tls_conn is not self.conn:
+            # the tls socket owns the file descriptor
+            self.tls_conn.close()
+        self.conn.close()
+
+    def serve(self, fn, *args):
+        """
+        Execute <fn>, and close the session unless <fn> raised DontClose.
+        """
         close = True
         try:
-            self.parent.stats.sessions.alive[self.sid] = Storage({
-                "created": time.time(),
-                "addr": self.addr[0],
-                "encrypted": self.encrypted,
-                "progress": "init",
-                "ident": self.ident,
-            })
-            if self.scheme == "h2":
-                self.handle_h2_client()
-            else:
-                self.handle_raw_client()
+            fn(*args)
         except Close:
             pass
         except DontClose:
@@ -969,10 +1138,115 @@ def run(self):
                 traceback.print_exc()
         finally:
             if close:
-                del self.parent.stats.sessions.alive[self.sid]
-                if self.h2conn:
-                    self.h2conn.close_connection()
-                self.conn.close()
+                self.close_session()
+
+    def promote(self, fn, *args):
+        """
+        Continue serving the connection in a dedicated thread executing
+        <fn>. Used by the listener workers for the streaming sessions.
+        """
+        self.resume = (fn, args)
+        self.parent.threads.append(self)
+        self.start()
+        raise DontClose
+
+    def detach_worker(self):
+        """
+        Called before executing a handler that can block for long. If
+        executed by a listener worker, the worker leaves the pool and is
+        replaced.
+        """
+        client_workers = getattr(self.parent, "client_workers", None)
+        if client_workers is None:
+            return
+        client_workers.detach()
+
+    def serve_h2_ready(self, loop):
+        """
+        Executed by a listener worker when the client loop detects data
+        ready to read on the h2 connection.
+        """
+        self.parent.stats.sessions.alive[self.sid].ident = threading.current_thread().ident
+        self.serve(self.handle_h2_ready, loop)
+
+    def handle_h2_ready(self, loop):
+        if self.h2conn is None:
+            self.check_negotiated_protocol()
+            self.tls_conn.settimeout(self.sock_tmo)
+            if not self.h2_init():
+                return
+        try:
+            data = self.recv_ready()
+        except ssl.SSLError:
+            return
+        if data == b"":
+            return
+        self.tls_conn.settimeout(self.sock_tmo)
+        if data:
+            self.parent.stats.sessions.rx += len(data)
+            self.parent.stats.sessions.clients[self.addr[0]].rx += len(data)
+            try:
+                self.h2_received(data)
+            except (h2.exceptions.StreamClosedError, ConnectionResetError):
+                return
+        self.h2_run_pushers()
+        self.h2_flush()
+        if self.stopped():
+            return
+        if self.events_stream_ids or self.h2_pushers():
+            self.promote(self.h2_loop)
+        loop.add(self)
+        raise DontClose
+
+    def recv_ready(self):
+        """
+        Return the data available on the connection, without blocking.
+        Return None if no data is available, and an empty bytes if the
+        connection is closed by the client.
+        """
+        chunks = []
+        self.tls_conn.settimeout(0)
+        while True:
+            try:
+                chunk = self.tls_conn.recv(65535)
+            except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+                break
+            except (OSError, socket.error) as exc:
+                if exc.errno in (EAGAIN, EWOULDBLOCK):
+                    break
+                raise
+            if not chunk:
+                if not chunks:
+                    return b""
+                break
+            chunks.append(chunk)
+        if not chunks:
+            # the readiness was a tls protocol record
+            return None
+        return b"".join(chunks)
+
+    def serve_raw_request(self, data):
+        """
+        Executed by a listener worker when the client loop received the
+        full raw request <data>.
+        """
+        self.parent.stats.sessions.alive[self.sid].ident = threading.current_thread().ident
+        self.serve(self.handle_raw_request, data)
+
+    def handle_raw_request(self, data):
+        decoded = self.raw_decode(data)
+        if decoded is None:
+            return
+        nodename, data = decoded
+        if self.raw_is_stream(data):
+            self.promote(self.raw_route, nodename, data)
+        self.raw_route(nodename, data)
+
+    def raw_is_stream(self, data):
+        try:
+            return self.get_handler(data.get("method"), data["action"].lstrip("/")).stream
+        except Exception:
+            return False
 
     def negotiate_tls(self):
         """
@@ -994,6 +1268,12 @@ def negotiate_tls(self):
                 raise
             raise RuntimeError("tls wrap error: %s"%exc)
 
+        self.check_negotiated_protocol()
+
+    def check_negotiated_protocol(self):
+        if not self.tls:
+            return
+
         # Always prefer the result from ALPN to that from NPN.
         # You can only check what protocol was negotiated once the handshake is
         # complete.
@@ -1004,8 +1284,42 @@ def negotiate_tls(self):
         if negotiated_protocol != "h2":
             raise RuntimeError("couldn't negotiate h2: %s" % negotiated_protocol)
 
-    def current_usr_cf_sum(self):
-        return self.node_data.get(["services", "config", self.usr.path, "csum"], default="unknown")
+    def current_usr_cf_sum(self, usr=None):
+        usr = usr or self.usr
+        return self.node_data.get(["services", "config", usr.path, "csum"], default="unknown")
+
+    def authenticate_client_cached(self, kind, credential, authenticate, *args):
+        """
+        Set the user and grants authenticated by <credential>, reusing the
+        listener-wide cache entry if the user configuration and the
+        namespaces did not change since it was cached. Otherwise call
+        <authenticate> with <args> and cache the result.
+        """
+        auth_cache = self.parent.auth_cache
+        ns_gen = self.object_index().namespaces_gen
+        key = fingerprint("%s:%s" % (kind, self.tls), credential) if credential else None
+        if key:
+            entry = auth_cache.get(key)
+            if entry:
+                if entry.ns_gen == ns_gen and entry.csum == self.current_usr_cf_sum(entry.usr):
+                    self.usr = entry.usr
+                    self.usr_grants = entry.grants
+                    return
+                auth_cache.drop(key)
+        self.usr = authenticate(*args)
+        self.usr_grants = self.user_grants()
+        if not key:
+            return
+        ttl = None
+        if kind == "jwt" and self.jwt_expire:
+            ttl = self.jwt_expire - time.time()
+        auth_cache.set(key, self.usr, self.usr_grants, self.current_usr_cf_sum(), ns_gen, ttl=ttl)
+
+    def peer_cert(self):
+        try:
+            return self.tls_conn.getpeercert(binary_form=True)
+        except Exception:
+            return
 
     def authenticate_client(self, headers):
         if self.usr is False:
@@ -1036,24 +1350,21 @@ def authenticate_client(self, headers):
         authorization = headers.get("authorization")
         if authorization:
             if authorization.startswith("Bearer "):
-                self.usr = self.authenticate_client_jwt(authorization)
+                self.authenticate_client_cached("jwt", authorization, self.authenticate_client_jwt, authorization)
                 self.usr_auth = "jwt"
-                self.usr_grants = self.user_grants()
                 self.last_auth = authorization
                 self.same_auth = lambda h: h.get("authorization") == self.last_auth
                 return
             elif authorization.startswith("Basic "):
-                self.usr = self.authenticate_client_basic(authorization)
+                self.authenticate_client_cached("basic", authorization, self.authenticate_client_basic, authorization)
                 self.usr_auth = "basic"
-                self.usr_grants = self.user_grants()
                 self.usr_cf_sum = self.current_usr_cf_sum()
                 self.last_auth = authorization
                 self.same_auth = lambda h: h.get("authorization") == self.last_auth
                 return
         try:
-            self.usr = self.authenticate_client_x509()
+            self.authenticate_client_cached("x509", self.peer_cert(), self.authenticate_client_x509)
             self.usr_auth = "x509"
-            self.usr_grants = self.user_grants()
             self.usr_cf_sum = self.current_usr_cf_sum()
             #self.log.info("loaded grants for %s, conf %s", self.usr.path, self.usr_cf_sum)
             self.last_auth = None
@@ -1109,6 +1420,7 @@ def authenticate_client_jwt(self, authorization=None):
         algorithm = header['alg']
         public_key = self.jwt_provider_keys[key_id]
         decoded = jwt.decode(token, public_key, audience=self.cluster_name, algorithms=algorithm)
+        self.jwt_expire = decoded.get("exp")
         grant = decoded.get("grant", "")
         if isinstance(grant, list):
             grant = " ".join(grant)
@@ -1179,7 +1491,10 @@ def prepare_response(self, stream_id, status, data, content_type="application/js
         if "json" in content_type:
             if data is None:
                 data = {}
-            data = json.dumps(data).encode()
+            if isinstance(data, SharedEvent):
+                data = data.json().encode()
+            else:
+                data = json.dumps(data).encode()
         elif isinstance(data, six.string_types):
             data = bencode(data)
         elif data is None:
@@ -1414,8 +1729,11 @@ def h2_received(self, data):
     def handle_h2_client(self):
         self.negotiate_tls()
         self.tls_conn.settimeout(self.sock_tmo)
+        if not self.h2_init():
+            return
+        self.h2_loop()
 
-        # init h2 connection
+    def h2_init(self):
         h2config = H2Configuration(client_side=False)
         self.h2conn = H2Connection(config=h2config)
         self.h2conn.initiate_connection()
@@ -1424,9 +1742,11 @@ def handle_h2_client(self):
         except socket.error as exc:
             if exc.errno == EPIPE:
                 # daemon restart with connected clients
-                return
+                return False
             raise
+        return True
 
+    def h2_loop(self):
         while True:
             if self.stopped():
                 break
@@ -1450,23 +1770,32 @@ def handle_h2_client(self):
                 traceback.print_exc()
                 return
 
-            # execute all registered pushers
-            pushers_per_stream = [(stream_id, stream.get("pushers", [])) for stream_id, stream in self.streams.items() if stream.get("pushers")]
-            for stream_id, pushers in pushers_per_stream:
-                for pusher in pushers:
-                    fn = pusher.get("fn")
-                    args = pusher.get("args", [])
-                    kwargs = pusher.get("kwargs", {})
-                    if not fn:
-                        continue
-                    try:
-                        getattr(self, fn)(stream_id, *args, **kwargs)
-                    except Exception as exc:
-                        print(exc)
+            self.h2_run_pushers()
+            self.h2_flush()
 
-            data_to_send = self.h2conn.data_to_send()
-            if data_to_send:
-                self.tls_conn.sendall(data_to_send)
+    def h2_pushers(self):
+        return [(stream_id, stream.get("pushers", [])) for stream_id, stream in self.streams.items() if stream.get("pushers")]
+
+    def h2_run_pushers(self):
+        """
+        Execute all registered pushers.
+        """
+        for stream_id, pushers in self.h2_pushers():
+            for pusher in pushers:
+                fn = pusher.get("fn")
+                args = pusher.get("args", [])
+                kwargs = pusher.get("kwargs", {})
+                if not fn:
+                    continue
+                try:
+                    getattr(self, fn)(stream_id, *args, **kwargs)
+                except Exception as exc:
+                    print(exc)
+
+    def h2_flush(self):
+        data_to_send = self.h2conn.data_to_send()
+        if data_to_send:
+            self.tls_conn.sendall(data_to_send)
 
     def handle_raw_client(self):
         chunks = []
@@ -1498,6 +1827,16 @@ def handle_raw_client(self):
         self.handle_raw_client_data(data)
 
     def handle_raw_client_data(self, data):
+        decoded = self.raw_decode(data)
+        if decoded is None:
+            return
+        self.raw_route(*decoded)
+
+    def raw_decode(self, data):
+        """
+        Return the (nodename, data) tuple decoded from the raw request
+        <data>, or None if the request is already served.
+        """
         if six.PY3:
             dequ = data == b"dequeue_actions"
         else:
@@ -1508,7 +1847,7 @@ def handle_raw_client_data(self, data):
             p = Popen(Env.om + ["node", 'dequeue_actions'],
                       stdout=None, stderr=None, stdin=None,
                       close_fds=os.name!="nt")
-            return
+            return None
 
         def peer_clustername(nodename):
             cname = shared.NODE.oget("cluster", "name", impersonate=nodename)
@@ -1521,18 +1860,20 @@ def peer_clustername(nodename):
             if nodename in self.cluster_drpnodes:
                 result = {"status": 401, "error": "drp node %s is not allowed to request" % nodename}
                 self.raw_send_result(result)
-                return
+                return None
             if clustername != "join" and peer_clustername(nodename) != clustername:
                 result = {"status": 401, "error": "node %s is not a cluster %s node" % (nodename, clustername)}
                 self.raw_send_result(result)
-                return
+                return None
         else:
             try:
                 data = self.msg_decode(data)
             except ValueError:
                 pass
             nodename = Env.nodename
+        return nodename, data
 
+    def raw_route(self, nodename, data):
         #self.log.info("received %s from %s", str(data), nodename)
         self.parent.stats.sessions.auth_validated += 1
         self.parent.stats.sessions.clients[self.addr[0]].auth_validated += 1
@@ -1609,13 +1950,7 @@ def options_path(options, required=True):
     #
     #########################################################################
     def get_all_ns(self):
-        data = set()
-        for path in self.list_cluster_paths():
-            _, ns, _ = split_path(path)
-            if ns is None:
-                ns = "root"
-            data.add(ns)
-        return data
+        return set(self.object_index().namespaces)
 
     def get_namespaces(self, role="guest"):
         if self.usr is False or "root" in self.usr_grants:
@@ -1762,6 +2097,7 @@ def multiplex(self, node, handler, options, data, original_nodename, action, str
                 nodenames = [n for n in nodenames if n in svcnodes]
 
         def do_node(nodename):
+            begin = time.time()
             if nodename == Env.nodename:
                 try:
                     _result = handler.action(nodename, action=action, options=options, stream_id=stream_id, thr=self)
@@ -1775,12 +2111,6 @@ def do_node(nodename):
                     status = 500
                     _result = {"status": status, "error": str(exc), "traceback": traceback.format_exc()}
                     self.log.exception(exc)
-                result["nodes"][nodename] = _result
-                try:
-                    result["status"] += 1 if _result.get("status") else 0
-                except AttributeError:
-                    # result is not a dict
-                    pass
             else:
                 if handler.stream:
                     sp = self.socket_parms("https://"+nodename)
@@ -1791,19 +2121,56 @@ def do_node(nodename):
                     })
                     _result = {}
                 else:
-                    _result = self.daemon_request(data, server=nodename, silent=True, method=method)
-                result["nodes"][nodename] = _result
-                try:
+                    _result = self.daemon_request(data, server=nodename, silent=True, method=method,
+                                                  timeout=handler.multiplex_timeout)
+            return _result, time.time() - begin
+
+        def add_result(nodename, _result, elapsed):
+            if isinstance(_result, dict):
+                _result["elapsed"] = elapsed
+            result["nodes"][nodename] = _result
+            try:
+                if nodename == Env.nodename:
+                    result["status"] += 1 if _result.get("status") else 0
+                else:
                     result["status"] += _result.get("status", 0)
-                except AttributeError:
-                    # result is not a dict
-                    pass
+            except AttributeError:
+                # result is not a dict
+                pass
 
-        for nodename in nodenames:
-            try:
-                do_node(nodename)
-            except Exception:
-                continue
+        peers = [nodename for nodename in nodenames if nodename != Env.nodename]
+        futures = {}
+        if peers:
+            # request the peers concurrently, so the request duration is
+            # the slowest peer latency, not the sum of the peers latencies.
+            concurrent_futures = get_concurrent_futures()
+            executor = concurrent_futures.ThreadPoolExecutor(max_workers=min(MULTIPLEX_WORKERS, len(peers)))
+            for nodename in peers:
+                futures[executor.submit(do_node, nodename)] = nodename
+
+        try:
+            if Env.nodename in nodenames:
+                try:
+                    add_result(Env.nodename, *do_node(Env.nodename))
+                except Exception:
+                    pass
+            if futures:
+                done = set()
+                try:
+                    for future in concurrent_futures.as_completed(futures, timeout=handler.multiplex_timeout):
+                        done.add(future)
+                        try:
+                            add_result(futures[future], *future.result())
+                        except Exception:
+                            continue
+                except concurrent_futures.TimeoutError:
+                    for future, nodename in futures.items():
+                        if future in done:
+                            continue
+                        add_result(nodename, {"status": 1, "error": "timeout"}, handler.multiplex_timeout)
+        finally:
+            if futures:
+                executor.shutdown(wait=False)
 
         if handler.stream:
             return
@@ -1958,11 +2325,16 @@ def router(self, nodename, data, stream_id=None, handler=None):
             self.rbac_requires(action=action)
 
         if action in ("create", "object_create"):
+            self.detach_worker()
             return self.create_multiplex(handler, options, data, nodename, action, stream_id=stream_id)
         node = data.get("node")
+        if handler.multiplex_timeout is None:
+            # the handler may block longer than usual
+            self.detach_worker()
         if data.get("multiplexed") or handler.multiplex == "never":
             return handler.action(nodename, action=action, options=options, stream_id=stream_id, thr=self)
         if handler.multiplex == "always" or node:
+            self.detach_worker()
             return self.multiplex(node, handler, options, data, nodename, action, stream_id=stream_id)
         return handler.action(nodename, action=action, options=options, stream_id=stream_id, thr=self)
 
@@ -1997,7 +2369,12 @@ def raw_push_action_events(self):
             except queue.Empty:
                 continue
 
-            if self.encrypted:
+            if isinstance(msg, SharedEvent):
+                if self.encrypted:
+                    msg = msg.encode("encrypted", self.encrypt)
+                else:
+                    msg = msg.encode("raw", self.msg_encode)
+            elif self.encrypted:
                 msg = self.encrypt(msg)
             else:
                 msg = self.msg_encode(msg)
@@ -2090,7 +2467,10 @@ def h2_push_logs(self, stream_id, ofile, follow):
     def h2_sse_stream_send(self, stream_id, data):
         self.events_counter += 1
         msg = "id: %d\n" % self.events_counter
-        msg += "data: %s\n\n" % json.dumps(data)
+        if isinstance(data, SharedEvent):
+            msg += "data: %s\n\n" % data.json()
+        else:
+            msg += "data: %s\n\n" % json.dumps(data)
         self.streams[stream_id]["outbound"] += msg.encode()
         self.send_outbound(stream_id)
 
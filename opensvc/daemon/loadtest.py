@@ -0,0 +1,122 @@
+"""
+Drive concurrent clients against the local daemon listener, and report the
+requests rate and latencies:
+
+    cd /usr/share/opensvc/opensvc
+    python -m daemon.loadtest --clients 200 --requests 20 --scheme h2
+
+Each client is a thread submitting its requests in sequence. The h2
+clients reuse their connection, the raw clients open a connection per
+request, like the peer nodes do.
+"""
+from __future__ import print_function
+
+import optparse
+import sys
+import threading
+import time
+
+from env import Env
+
+SCHEMES = {
+    "h2": lambda: Env.paths.lsnruxh2sock,
+    "raw": lambda: Env.paths.lsnruxsock,
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    idx = int(round(pct / 100.0 * (len(values) - 1)))
+    return values[idx]
+
+
+class LoadTest(object):
+    def __init__(self, clients=50, requests=10, scheme="h2", action="whoami", timeout=30):
+        from core.node import Node
+        self.node = Node()
+        self.clients = clients
+        self.requests = requests
+        self.server = SCHEMES[scheme]()
+        self.action = action
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.errors = 0
+        self.start_event = threading.Event()
+
+    def client(self):
+        self.start_event.wait()
+        for _ in range(self.requests):
+            begin = time.time()
+            try:
+                data = self.node.daemon_get({"action": self.action}, server=self.server, timeout=self.timeout)
+                failed = not isinstance(data, dict) or data.get("status", 0) not in (0, None)
+            except Exception:
+                failed = True
+            elapsed = time.time() - begin
+            with self.lock:
+                self.latencies.append(elapsed)
+                if failed:
+                    self.errors += 1
+
+    def frontend_stats(self):
+        try:
+            data = self.node.daemon_get({"action": "daemon_status"}, server=SCHEMES["h2"](), timeout=self.timeout)
+            return data["listener"]["frontend"]
+        except Exception:
+            return
+
+    def run(self):
+        threads = [threading.Thread(target=self.client) for _ in range(self.clients)]
+        for thr in threads:
+            thr.daemon = True
+            thr.start()
+        begin = time.time()
+        self.start_event.set()
+        for thr in threads:
+            thr.join()
+        return time.time() - begin
+
+    def report(self, duration):
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+        print("clients:   %d" % self.clients)
+        print("requests:  %d" % count)
+        print("errors:    %d" % self.errors)
+        print("duration:  %.3fs" % duration)
+        print("rate:      %.1f req/s" % (count / duration if duration else 0))
+        for pct in (50, 90, 99, 100):
+            print("p%-3d       %.4fs" % (pct, percentile(latencies, pct)))
+        stats = self.frontend_stats()
+        if stats:
+            print("frontend:  %d idle sessions, %d workers, %d detached, %d submitted" % (
+                stats["sessions"],
+                stats["workers"]["workers"],
+                stats["workers"]["detached"],
+                stats["workers"]["submitted"],
+            ))
+
+
+def main(argv=None):
+    parser = optparse.OptionParser()
+    parser.add_option("-c", "--clients", default=50, action="store", type="int",
+                      dest="clients", help="The number of concurrent clients")
+    parser.add_option("-n", "--requests", default=10, action="store", type="int",
+                      dest="requests", help="The number of requests submitted by each client")
+    parser.add_option("-s", "--scheme", default="h2", action="store", choices=sorted(SCHEMES),
+                      dest="scheme", help="The listener unix socket to submit the requests to: h2 or raw")
+    parser.add_option("-a", "--action", default="whoami", action="store",
+                      dest="action", help="The GET handler to request")
+    parser.add_option("-t", "--timeout", default=30, action="store", type="int",
+                      dest="timeout", help="The requests timeout")
+    (options, _) = parser.parse_args(argv)
+    test = LoadTest(clients=options.clients, requests=options.requests, scheme=options.scheme,
+                    action=options.action, timeout=options.timeout)
+    duration = test.run()
+    test.report(duration)
+    return 1 if test.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -14,8 +14,11 @@
 import uuid
 
 import daemon.shared as shared
+from core.comm import hb_frame_caps
 from core.configfile import move_config_file
 from core.freezer import Freezer
+from daemon.configwatcher import ConfigWatcher, cf_path
+from daemon.statusworkers import StatusWorkers
 from env import Env
 # noinspection PyUnresolvedReferences
 from foreign.six.moves import queue
@@ -628,6 +631,7 @@ class Monitor(shared.OsvcThread, MonitorObjectOrchestratorManualMixin):
     monitor_period = 0.5
     arbitrators_check_period = 60
     max_shortloops = 30
+    config_sweep_period = 60
     default_stdby_nb_restart = 2
     arbitrators_data = None
     last_arbitrator_ping = 0
@@ -639,6 +643,8 @@ def __init__(self):
         self.last_node_data = None
         self.init_steps = set()
         self.transitions = set([])
+        self.config_watcher = None
+        self.last_config_sweep = 0
 
     def init(self):
         self.set_tid()
@@ -668,6 +674,8 @@ def init(self):
         except (TypeError, ValueError):
             pass
         self.log.info("boot id %s, last %s", boot_id, last_boot_id)
+        self.init_config_watcher()
+        self.init_status_workers()
         self.wait_listener()
         if last_boot_id in (None, boot_id):
             self.services_init_status()
@@ -681,6 +689,41 @@ def init(self):
         # we are in init state.
         self.update_hb_data()
 
+    def init_config_watcher(self):
+        self.stop_config_watcher()
+        try:
+            self.config_watcher = ConfigWatcher()
+        except OSError as exc:
+            self.log.info("config watcher disabled: %s", exc)
+            return
+        self.log.info("config watcher started")
+
+    def stop_config_watcher(self):
+        if self.config_watcher is None:
+            return
+        self.config_watcher.close()
+        self.config_watcher = None
+
+    def init_status_workers(self):
+        self.stop_status_workers()
+        try:
+            size = shared.NODE.oget("node", "status_workers")
+        except Exception:
+            size = 0
+        if not size or size < 0:
+            self.log.info("status workers disabled")
+            return
+        self.log.info("start %d status workers", size)
+        shared.STATUS_WORKERS = StatusWorkers(size=size, log=self.log)
+        shared.STATUS_WORKERS.start()
+
+    @staticmethod
+    def stop_status_workers():
+        if shared.STATUS_WORKERS is None:
+            return
+        shared.STATUS_WORKERS.stop()
+        shared.STATUS_WORKERS = None
+
     def wait_listener(self):
         while True:
             lsnr = shared.THREADS.get("listener")
@@ -707,6 +750,7 @@ def init_data(self):
             self.transitions = set([])
         initial_data = {
             "compat": shared.COMPAT_VERSION,
+            "hb_frame": hb_frame_caps(),
             "api": shared.API_VERSION,
             "agent": shared.NODE.agent_version,
             "monitor": {
@@ -741,6 +785,8 @@ def run(self):
                 if self.stopped():
                     self.join_threads()
                     self.kill_procs()
+                    self.stop_status_workers()
+                    self.stop_config_watcher()
                     sys.exit(0)
         except Exception as exc:
             self.log.exception(exc)
@@ -781,6 +827,8 @@ def reconfigure(self):
                 self.add_service(path)
             except Exception as exc:
                 continue
+        # the objects scopes may have changed
+        self.last_config_sweep = 0
 
     def do(self):
         terminated = self.janitor_procs() + self.janitor_threads()
@@ -1084,12 +1132,22 @@ def service_status(self, path):
         if self.has_proc([path] +  cmd):
             # no need to run status twice
             return
-        proc = self.service_command(path, cmd, local=False)
+        proc = self.status_command([path], cmd)
         self.push_proc(
             proc=proc,
             cmd=[path] + cmd,
         )
 
+    def status_command(self, paths, cmd):
+        """
+        Submit the status evaluation of <paths> to the status workers, or
+        fork the status <cmd> if the workers are disabled. The returned
+        object can be pushed to the procs queue.
+        """
+        if shared.STATUS_WORKERS is not None:
+            return shared.STATUS_WORKERS.submit(paths)
+        return self.service_command(",".join(paths), cmd, local=False)
+
     def service_toc(self, path):
         self.set_smon(path, "tocing")
         try:
@@ -1400,7 +1458,7 @@ def services_init_status(self):
             self.log.info("no objects to get an initial status from")
             return
         self.services_purge_status(paths=svcs)
-        proc = self.service_command(",".join(svcs), ["status", "--parallel", "--refresh"], local=False)
+        proc = self.status_command(svcs, ["status", "--parallel", "--refresh"])
         self.add_init_step("boot")
         self.push_proc(
             proc=proc,
@@ -1421,7 +1479,7 @@ def services_init_boot(self):
             on_error="add_init_step",
             on_error_args=["boot"],
         )
-        proc2 = self.service_command(",".join(list_services(kinds=["usr", "cfg", "sec", "ccfg"])), ["status", "--parallel", "--refresh"], local=False)
+        proc2 = self.status_command(list_services(kinds=["usr", "cfg", "sec", "ccfg"]), ["status", "--parallel", "--refresh"])
         self.push_proc(
             proc=proc2,
             on_success="add_init_step",
@@ -3303,48 +3361,50 @@ def update_status(self):
         })
         self.thread_data.merge([], data)
 
+    def changed_services_config(self):
+        """
+        Return the paths of the objects which configuration file changed
+        according to the config watcher, or None if all the configuration
+        files must be scanned.
+        """
+        if self.config_watcher is None:
+            return
+        try:
+            fpaths = self.config_watcher.changes()
+        except OSError as exc:
+            self.log.warning("config watcher error: %s", exc)
+            self.stop_config_watcher()
+            return
+        if fpaths is None:
+            return
+        if time.time() > self.last_config_sweep + self.config_sweep_period:
+            return
+        paths = set()
+        for fpath in fpaths:
+            path = cf_path(fpath)
+            if path is not None:
+                paths.add(path)
+        return paths
+
     def update_services_config(self):
-        config = {}
-        for path in list_services():
-            cfg = svc_pathcf(path)
-            try:
-                config_mtime = os.path.getmtime(cfg)
-            except Exception as exc:
-                self.log.warning("failed to get %s mtime: %s", cfg, str(exc))
-                config_mtime = 0
-            last_config = self.get_service_config(path, Env.nodename)
-            if last_config is None or config_mtime > last_config["updated"]:
-                # self.log.debug("compute service %s config checksum", path)
-                try:
-                    csum = fsum(cfg)
-                except (OSError, IOError) as exc:
-                    self.log.warning("service %s config checksum error: %s", path, exc)
-                    continue
-                try:
-                    self.add_service(path)
-                except Exception as exc:
-                    self.log.error("%s build error: %s", path, str(exc))
-                    continue
+        """
+        Update the local objects config data. Only the objects with a
+        configuration change reported by the config watcher are refreshed,
+        except on consistency sweeps, or if the watcher is not available.
+        """
+        paths = self.changed_services_config()
+        if paths is None:
+            self.last_config_sweep = time.time()
+            config = {}
+            paths = list_services()
+        else:
+            config = dict(self.node_data.get(["services", "config"], default={}))
+        for path in paths:
+            data = self.update_service_config(path)
+            if data is None:
+                config.pop(path, None)
             else:
-                csum = last_config["csum"]
-            if last_config is None or last_config["csum"] != csum:
-                if last_config is not None:
-                    self.log.info("service %s configuration change" % path)
-                try:
-                    status_mtime = os.path.getmtime(shared.SERVICES[path].status_data_dump)
-                    if config_mtime > status_mtime:
-                        self.log.info("service %s refresh instance status older than config", path)
-                        self.service_status(path)
-                except OSError:
-                    pass
-                shared.reconfigure_scheduler()
-            with shared.SERVICES_LOCK:
-                scope = sorted(list(shared.SERVICES[path].peers))
-            config[path] = {
-                "updated": config_mtime,
-                "csum": csum,
-                "scope": scope,
-            }
+                config[path] = data
 
         # purge deleted services
         with shared.SERVICES_LOCK:
@@ -3357,6 +3417,55 @@ def update_services_config(self):
         self.node_data.set(["services", "config"], config)
         return config
 
+    def update_service_config(self, path):
+        """
+        Return the local config data of the object <path>, rebuilding the
+        object if its configuration file changed, or None if the object
+        configuration is not usable.
+        """
+        cfg = svc_pathcf(path)
+        try:
+            config_mtime = os.path.getmtime(cfg)
+        except Exception as exc:
+            if not os.path.exists(cfg):
+                # deleted
+                return
+            self.log.warning("failed to get %s mtime: %s", cfg, str(exc))
+            config_mtime = 0
+        last_config = self.get_service_config(path, Env.nodename)
+        if last_config is None or config_mtime > last_config["updated"]:
+            # self.log.debug("compute service %s config checksum", path)
+            try:
+                csum = fsum(cfg)
+            except (OSError, IOError) as exc:
+                self.log.warning("service %s config checksum error: %s", path, exc)
+                return
+            try:
+                self.add_service(path)
+            except Exception as exc:
+                self.log.error("%s build error: %s", path, str(exc))
+                return
+        else:
+            csum = last_config["csum"]
+        if last_config is None or last_config["csum"] != csum:
+            if last_config is not None:
+                self.log.info("service %s configuration change" % path)
+            try:
+                status_mtime = os.path.getmtime(shared.SERVICES[path].status_data_dump)
+                if config_mtime > status_mtime:
+                    self.log.info("service %s refresh instance status older than config", path)
+                    self.service_status(path)
+            except OSError:
+                pass
+            shared.reconfigure_scheduler()
+        with shared.SERVICES_LOCK:
+            scope = sorted(list(shared.SERVICES[path].peers))
+        return {
+            "updated": config_mtime,
+            "csum": csum,
+            "scope": scope,
+        }
+
     def get_last_svc_status_mtime(self, path):
         """
         Return the mtime of the specified service configuration file on the
@@ -3377,10 +3486,13 @@ def service_status_fallback(self, path):
         status.json doesn't exist, we don't have to specify --refresh.
         """
         self.log.info("synchronous service status eval: %s", path)
-        cmd = ["status", "--refresh"]
-        proc = self.service_command(path, cmd, local=False)
-        self.push_proc(proc=proc)
-        proc.communicate()
+        if shared.STATUS_WORKERS is not None:
+            shared.STATUS_WORKERS.submit([path]).wait()
+        else:
+            cmd = ["status", "--refresh"]
+            proc = self.service_command(path, cmd, local=False)
+            self.push_proc(proc=proc)
+            proc.communicate()
         fpath = svc_pathvar(path, "status.json")
         return self.load_instance_status_cache(fpath)
 
@@ -3874,8 +3986,7 @@ def update_hb_data(self):
         with shared.HB_MSG_LOCK:
             # reset the full status cache. get_message() will refill if
             # needed.
-            shared.HB_MSG = None
-            shared.HB_MSG_LEN = 0
+            shared.HB_MSG = {}
         shared.wake_heartbeat_tx()
 
     def _update_hb_data_locked(self):
@@ -4395,6 +4506,11 @@ def _merge_rx_locked(self, nodename, data, hbname):
         peer_gen_from_message = data.get("gen", {}).get(nodename, 0)
         kind = data.get("kind", "full")
         change = False
+        if kind == "delta":
+            # a gen delta of a deltas message, which trailing patch carries
+            # the gens merged by the peer.
+            kind = "patch"
+            local_gen_merged_on_peer_from_message = local_gen_merged_on_peer
         # self.log.debug("received %s from node %s: current gen %d, our gen local:%s peer:%s",
         #                kind, nodename, current_gen, shared.LOCAL_GEN.get(nodename), our_gen_on_peer) # COMMENT
 
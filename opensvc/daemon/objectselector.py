@@ -0,0 +1,367 @@
+"""
+The daemon object selector engine.
+
+The selectors are compiled once and cached. They are evaluated against an
+index of the cluster objects paths by namespace, kind and normalized path,
+so path globs with a literal prefix only test the paths sharing this
+prefix.
+
+The index is refreshed only when a node services config branch of the
+daemon status data changed. The daemon status data is a copy-on-write
+tree, so an unchanged branch is the same object as the one the index was
+built from. The keyword and status selector fragments results are cached
+per object, and recomputed only when the object instance, or the object
+status and config branches, changed.
+"""
+import bisect
+import fnmatch
+import threading
+
+from foreign.jsonpath_ng.ext import parse
+from utilities.naming import path_data, path_glob_pattern
+from utilities.selector import (selector_config_match, selector_parse_fragment,
+                                selector_parse_op_fragment, selector_value_match)
+
+# The maximum number of compiled selectors, and of selector fragments
+# results, kept in cache
+SELECTOR_CACHE_SIZE = 1024
+
+# Below this number of candidates, globs are matched against each candidate
+# instead of the normalized paths index
+GLOB_SCAN_MAX = 64
+
+GLOB_CHARS = "*?["
+
+COMPILED = {}
+
+
+class Fragment(object):
+    """
+    A compiled selector fragment, ie a selector element between "," and
+    "+" separators.
+    """
+    def __init__(self, s):
+        self.raw = s
+        self.negate = False
+        self.pattern = None
+        self.param = None
+        self.op = None
+        self.value = None
+        self.jsonpath_expr = None
+        self.valid = bool(s)
+        if not s:
+            return
+        self.negate, s, elts = selector_parse_fragment(s)
+        if len(elts) == 1:
+            self.pattern = s
+            return
+        try:
+            self.param, self.op, self.value = selector_parse_op_fragment(elts)
+        except ValueError:
+            self.valid = False
+            return
+        param = self.param
+        if param.startswith("."):
+            param = "$" + param
+        if param.startswith("$."):
+            self.jsonpath_expr = parse(param)
+
+
+def compile_selector(selector):
+    """
+    Return the <selector> compiled as a list of "," separated alternatives,
+    each one a list of "+" separated fragments.
+    """
+    try:
+        return COMPILED[selector]
+    except KeyError:
+        pass
+    compiled = [[Fragment(s) for s in alternative.split("+")] for alternative in selector.split(",")]
+    if len(COMPILED) >= SELECTOR_CACHE_SIZE:
+        COMPILED.clear()
+    COMPILED[selector] = compiled
+    return compiled
+
+
+def fragment_cache(caches, raw):
+    """
+    Return the results cache of the <raw> fragment in <caches>, clearing
+    <caches> when it holds the results of too many fragments.
+    """
+    try:
+        return caches[raw]
+    except KeyError:
+        pass
+    if len(caches) >= SELECTOR_CACHE_SIZE:
+        caches.clear()
+    cache = caches[raw] = {}
+    return cache
+
+
+def same(refs1, refs2):
+    if refs1 is None or refs2 is None or len(refs1) != len(refs2):
+        return False
+    for ref1, ref2 in zip(refs1, refs2):
+        if ref1 is not ref2:
+            return False
+    return True
+
+
+class ObjectIndex(object):
+    """
+    The index of the cluster objects, and the selector fragments results
+    cache.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.configs = None
+        self.paths = set()
+        self.pds = {}
+        self.by_namespace = {}
+        self.by_kind = {}
+        self.namespaces = frozenset()
+        self.namespaces_gen = 0
+        self.normalized = []
+        self.config_matches = {}
+        self.status_matches = {}
+
+    def refresh(self, data, nodenames):
+        """
+        Update the index from the <data> daemon status if the services
+        config of one of the <nodenames> changed since the last refresh.
+        """
+        try:
+            nodes = data["monitor"]["nodes"]
+        except (KeyError, TypeError):
+            nodes = {}
+        configs = []
+        for nodename in nodenames:
+            try:
+                configs.append(nodes[nodename]["services"]["config"])
+            except (KeyError, TypeError):
+                configs.append(None)
+        with self.lock:
+            if same(configs, self.configs):
+                return
+            paths = set()
+            for config in configs:
+                if config:
+                    paths.update(config)
+            self.update(paths)
+            self.configs = configs
+
+    def update(self, paths):
+        added = paths - self.paths
+        removed = self.paths - paths
+        if not added and not removed:
+            return
+        for path in removed:
+            pd = self.pds.pop(path)
+            self.by_namespace[pd["namespace"]].discard(path)
+            self.by_kind[pd["kind"]].discard(path)
+            for cache in list(self.config_matches.values()) + list(self.status_matches.values()):
+                cache.pop(path, None)
+        for path in added:
+            try:
+                pd = path_data(path)
+            except ValueError:
+                continue
+            self.pds[path] = pd
+            self.by_namespace.setdefault(pd["namespace"], set()).add(path)
+            self.by_kind.setdefault(pd["kind"], set()).add(path)
+        self.paths = set(self.pds)
+        self.normalized = sorted((pd["normalized"], path) for path, pd in self.pds.items())
+        namespaces = frozenset(namespace for namespace, paths in self.by_namespace.items() if paths)
+        if namespaces != self.namespaces:
+            self.namespaces = namespaces
+            self.namespaces_gen += 1
+
+    def path_data(self, path):
+        try:
+            return self.pds[path]
+        except KeyError:
+            return path_data(path)
+
+    def candidates(self, paths, namespaces, kind=None):
+        """
+        Return the set of <paths> in <namespaces>, and of <kind> if set.
+        """
+        if paths is self.paths:
+            selected = set()
+            for namespace in namespaces:
+                selected |= self.by_namespace.get(namespace, set())
+            if kind:
+                selected &= self.by_kind.get(kind, set())
+            return selected
+        selected = set()
+        for path in paths:
+            try:
+                pd = self.path_data(path)
+            except ValueError:
+                continue
+            if pd["namespace"] not in namespaces:
+                continue
+            if kind and pd["kind"] != kind:
+                continue
+            selected.add(path)
+        return selected
+
+    def glob(self, pattern, candidates, namespace=None, kind=None, negate=False):
+        """
+        Return the set of <candidates> matching the <pattern> path glob.
+        """
+        _selector = path_glob_pattern(pattern, namespace=namespace, kind=kind)
+        if _selector is None:
+            return set()
+        if len(candidates) <= GLOB_SCAN_MAX:
+            return set(path for path in candidates
+                       if negate ^ fnmatch.fnmatch(self.path_data(path)["normalized"], _selector))
+        prefix = _selector
+        for char in GLOB_CHARS:
+            prefix = prefix.split(char, 1)[0]
+        matched = set()
+        for idx in range(bisect.bisect_left(self.normalized, (prefix,)), len(self.normalized)):
+            normalized, path = self.normalized[idx]
+            if not normalized.startswith(prefix):
+                break
+            if path in candidates and fnmatch.fnmatch(normalized, _selector):
+                matched.add(path)
+        if negate:
+            return candidates - matched
+        return matched
+
+    def config_match(self, fragment, path, svc):
+        """
+        Return True if the <svc> object keywords match the <fragment>,
+        caching the result until the object is reinstantiated.
+        """
+        cache = fragment_cache(self.config_matches, fragment.raw)
+        try:
+            cached_svc, matched = cache[path]
+            if cached_svc is svc:
+                return matched
+        except KeyError:
+            pass
+        matched = selector_config_match(svc, fragment.param, fragment.op, fragment.value)
+        cache[path] = (svc, matched)
+        return matched
+
+    def status_match(self, fragment, path, data, nodenames):
+        """
+        Return True if the object <path> status data matches the jsonpath
+        <fragment>, caching the result until the object aggregated status
+        or one of its instances status or config changes.
+        """
+        try:
+            agg = data["monitor"]["services"].get(path)
+        except (KeyError, TypeError, AttributeError):
+            agg = None
+        try:
+            nodes = data["monitor"]["nodes"]
+        except (KeyError, TypeError):
+            nodes = {}
+        refs = [agg]
+        for nodename in nodenames:
+            try:
+                services = nodes[nodename]["services"]
+                refs += [services["status"][path], services["config"][path]]
+            except (KeyError, TypeError):
+                refs += [None, None]
+        cache = fragment_cache(self.status_matches, fragment.raw)
+        try:
+            cached_refs, matched = cache[path]
+            if same(refs, cached_refs):
+                return matched
+        except KeyError:
+            pass
+        matched = self._status_match(fragment, refs, nodenames)
+        cache[path] = (refs, matched)
+        return matched
+
+    @staticmethod
+    def _status_match(fragment, refs, nodenames):
+        obj_data = dict(refs[0] or {})
+        obj_data["nodes"] = {}
+        for idx, nodename in enumerate(nodenames):
+            status, config = refs[1+2*idx], refs[2+2*idx]
+            if status is None or config is None:
+                continue
+            obj_data["nodes"][nodename] = {
+                "status": status,
+                "config": config,
+            }
+        try:
+            for match in fragment.jsonpath_expr.find(obj_data):
+                if selector_value_match(match.value, fragment.op, fragment.value):
+                    return True
+        except Exception:
+            return False
+        return False
+
+    def select(self, selector, paths, candidates, services, data, nodenames, namespace=None, kind=None):
+        """
+        Return the list of paths selected by the <selector> expression.
+
+        <paths> are the paths the keyword and status fragments and the
+        explicit paths are evaluated against, <candidates> the paths the
+        globs are evaluated against.
+        """
+        compiled = compile_selector(selector)
+        with self.lock:
+            return self._select(compiled, paths, candidates, services, data, nodenames,
+                                namespace=namespace, kind=kind)
+
+    def _select(self, compiled, paths, candidates, services, data, nodenames, namespace=None, kind=None):
+        selected = []
+        seen = set()
+        for alternative in compiled:
+            expanded = None
+            for fragment in alternative:
+                _expanded = self.select_fragment(fragment, paths, candidates, services, data, nodenames,
+                                                 namespace=namespace, kind=kind)
+                if expanded is None:
+                    expanded = _expanded
+                else:
+                    expanded &= _expanded
+                if not expanded:
+                    break
+            for path in expanded or ():
+                if path in seen:
+                    continue
+                seen.add(path)
+                selected.append(self.path_data(path)["display"])
+        return selected
+
+    def select_fragment(self, fragment, paths, candidates, services, data, nodenames, namespace=None, kind=None):
+        if not fragment.raw:
+            return set()
+
+        # explicit object path
+        if fragment.raw in self.paths:
+            if fragment.raw not in paths:
+                return set()
+            return set([fragment.raw])
+
+        if not fragment.valid:
+            return set()
+
+        # fnmatch expression
+        if fragment.pattern is not None:
+            return self.glob(fragment.pattern, candidates, namespace=namespace, kind=kind, negate=fragment.negate)
+
+        expanded = set()
+        if fragment.jsonpath_expr:
+            for path in paths:
+                if self.status_match(fragment, path, data, nodenames) ^ fragment.negate:
+                    expanded.add(path)
+            return expanded
+        for path in paths:
+            try:
+                svc = services[path]
+            except KeyError:
+                matched = False
+            else:
+                matched = self.config_match(fragment, path, svc)
+            if matched ^ fragment.negate:
+                expanded.add(path)
+        return expanded
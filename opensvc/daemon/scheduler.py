@@ -1,6 +1,14 @@
 """
 Scheduler Thread
+
+The queued tasks are indexed by their expire time in a heap, and the
+objects schedules are recomputed only when the object configuration,
+aggregated status or instance changed, or when one of its tasks left the
+queue, so the scheduler loop cost is proportional to the number of due
+tasks, not to the number of objects.
 """
+import heapq
+import itertools
 import logging
 import os
 from shutil import rmtree
@@ -12,6 +20,7 @@
 import daemon.shared as shared
 import core.exceptions as ex
 import core.logger
+from daemon.taskworkers import WARM_ACTIONS, TaskRun, TaskWorkers
 from env import Env
 from utilities.cache import purge_cache_session
 from utilities.converters import print_duration
@@ -41,6 +50,10 @@
 class Scheduler(shared.OsvcThread):
     name = "scheduler"
     delayed = {}
+    delayed_heap = []
+    delayed_seq = itertools.count()
+    sched_keys = {}
+    sched_dirty = set()
     blacklist = {}
     lasts = {}
     session_ids = {}
@@ -48,6 +61,7 @@ class Scheduler(shared.OsvcThread):
     dropped_via_notify = set()
     certificates = {}
     last_janitor_certs = 0
+    task_workers = None
 
     def max_tasks(self):
         if self.node_overloaded():
@@ -94,6 +108,7 @@ def run(self):
             devnull = "/dev/null"
         self.devnull = os.open(devnull, os.O_RDWR)
         self.purge_trace()
+        self.init_task_workers()
 
         while True:
             try:
@@ -104,9 +119,29 @@ def run(self):
                 time.sleep(0.2)
             if self.stopped():
                 self.kill_procs()
+                self.stop_task_workers()
                 self.purge_trace()
                 self.exit()
 
+    def init_task_workers(self):
+        self.stop_task_workers()
+        try:
+            size = shared.NODE.oget("node", "sched_workers")
+        except Exception:
+            size = 0
+        if not size or size < 0:
+            self.privlog.info("task workers disabled")
+            return
+        self.privlog.info("start %d task workers", size)
+        self.task_workers = TaskWorkers(size=size, log=self.privlog)
+        self.task_workers.start()
+
+    def stop_task_workers(self):
+        if self.task_workers is None:
+            return
+        self.task_workers.stop()
+        self.task_workers = None
+
     @lazy
     def privlog(self):
         log_file = os.path.join(Env.paths.pathlog, "node.scheduler.log")
@@ -200,6 +235,7 @@ def janitor_run_done(self):
             return
         self.privlog.debug("run done notifications: %s", inter)
         self.running -= inter
+        self.set_dirty(inter)
         self.dropped_via_notify |= inter
         #self.privlog.debug("dropped_via_notify: %s", self.dropped_via_notify)
         return
@@ -232,6 +268,7 @@ def drop_running(self, sigs):
         not_dropped_yet = sigs - self.dropped_via_notify
         self.running -= not_dropped_yet
         self.dropped_via_notify -= sigs
+        self.set_dirty(sigs)
         self.purge_cache()
 
     def purge_cache(self):
@@ -251,28 +288,42 @@ def purge_trace(self):
             except Exception:
                 pass
 
-    def exec_action(self, sigs, path, action, rids, queued, now, session_id):
+    def exec_action(self, sigs, path, action, rids, queued, now, session_id, warm_runs=None):
+        """
+        Run the task, forking a command or submitting the run to a task
+        worker. The warm runs are appended to the <warm_runs> list instead
+        of submitted, if set, so the caller can submit them together.
+        """
         cmd_args = self.get_cmd_args(action, path, rids)
         cmd_log = ["om",] + cmd_args
         cmd = Env.om + cmd_args
-        self.privlog.info("run '%s'", " ".join(cmd_log))
 
         flag_name = "launched.%s.%s" % (uuid.uuid4(), session_id)
         flag_launched = str(os.path.join(self.trace_dir, flag_name))
-        env = os.environ.copy()
-        env["OSVC_ACTION_ORIGIN"] = "daemon"
-        env["OSVC_SCHED_TIME"] = str(now)
-        env["OSVC_SCHED_FLAG"] = flag_launched
-        env["OSVC_PARENT_SESSION_UUID"] = session_id
-
-        kwargs = dict(stdout=self.devnull, stderr=self.devnull,
-                      stdin=self.devnull, close_fds=os.name!="nt",
-                      env=env)
-        try:
-            proc = Popen(cmd, **kwargs)
-        except KeyboardInterrupt as err:
-            self.privlog.warning("unable to start cmd: '%s' failed with %s", cmd, str(err))
-            return
+
+        if self.task_workers is not None and path and action in WARM_ACTIONS:
+            self.privlog.info("run '%s' in a task worker", " ".join(cmd_log))
+            proc = TaskRun(action, rids, now, flag_launched, session_id)
+            if warm_runs is None:
+                self.task_workers.submit(path, proc)
+            else:
+                warm_runs.append((path, proc))
+        else:
+            self.privlog.info("run '%s'", " ".join(cmd_log))
+            env = os.environ.copy()
+            env["OSVC_ACTION_ORIGIN"] = "daemon"
+            env["OSVC_SCHED_TIME"] = str(now)
+            env["OSVC_SCHED_FLAG"] = flag_launched
+            env["OSVC_PARENT_SESSION_UUID"] = session_id
+
+            kwargs = dict(stdout=self.devnull, stderr=self.devnull,
+                          stdin=self.devnull, close_fds=os.name!="nt",
+                          env=env)
+            try:
+                proc = Popen(cmd, **kwargs)
+            except KeyboardInterrupt as err:
+                self.privlog.warning("unable to start cmd: '%s' failed with %s", cmd, str(err))
+                return
         sigset = set(sigs)
         self.running |= sigset
         try:
@@ -303,18 +354,55 @@ def get_cmd_args(action, path=None, rids=None):
         cmd.append("--cron")
         return cmd
 
+    def set_dirty(self, sigs):
+        """
+        Mark the objects of the <sigs> tasks for schedule recomputation.
+        """
+        for action, path, rid in sigs:
+            if path:
+                self.sched_dirty.add(path)
+
+    def push_delayed(self, sig):
+        heapq.heappush(self.delayed_heap, (self.delayed[sig]["expire"], next(self.delayed_seq), sig))
+
+    def is_stale(self, entry):
+        """
+        Return True if the <entry> heap entry no longer references a queued
+        task, or references it with an outdated expire time. Stale entries
+        are left in the heap and dropped when they reach its top.
+        """
+        expire, _, sig = entry
+        try:
+            return self.delayed[sig]["expire"] != expire
+        except KeyError:
+            return True
+
+    def pop_due(self, now):
+        """
+        Pop and return the heap entries of the queued tasks expired at <now>.
+        """
+        due = []
+        while self.delayed_heap and self.delayed_heap[0][0] <= now:
+            entry = heapq.heappop(self.delayed_heap)
+            if not self.is_stale(entry):
+                due.append(entry)
+        return due
+
     def promote_queued_action(self, sig, delay, now):
         if delay == 0 and self.delayed[sig]["delay"] > 0 and self.delayed[sig]["expire"] > now:
             self.privlog.debug("promote queued action '%s' to run asap", sig)
             self.delayed[sig]["delay"] = 0
             self.delayed[sig]["expire"] = now
+            self.push_delayed(sig)
         else:
             self.privlog.debug("skip already queued action '%s'", sig)
 
     def next_expire(self, now):
+        while self.delayed_heap and self.is_stale(self.delayed_heap[0]):
+            heapq.heappop(self.delayed_heap)
         try:
-            return min([t["expire"] for t in self.delayed.values()])
-        except ValueError:
+            return self.delayed_heap[0][0]
+        except IndexError:
             return now + DEQUEUE_INTERVAL
 
     def queue_action(self, action, delay=0, path=None, rid=None, now=None, csum=None):
@@ -334,6 +422,7 @@ def queue_action(self, action, delay=0, path=None, rid=None, now=None, csum=None
             "delay": delay,
             "csum": csum,
         }
+        self.push_delayed(sig)
         if not delay:
             self.privlog.debug("queued action '%s' for run in %s", sig, print_duration(exp-now))
         else:
@@ -351,10 +440,14 @@ def get_todo(self, now):
         open_slots = max(self.max_tasks() - len(self.procs), 0)
         if not open_slots:
             return []
-        self.janitor_delayed()
+        due = self.pop_due(now)
+        self.janitor_delayed([sig for _, _, sig in due])
 
-        for sig, task in self.delayed.items():
-            if task["expire"] > now:
+        for _, _, sig in due:
+            try:
+                task = self.delayed[sig]
+            except KeyError:
+                # dropped by the janitor
                 continue
             action, path, rid = sig
             merge_key = (action, path)
@@ -378,7 +471,16 @@ def get_todo(self, now):
                 "sigs": sigs,
                 "queued": data["task"]["queued"],
             })
-        return sorted(todo, key=lambda task: task["queued"])[:open_slots]
+        todo = sorted(todo, key=lambda task: task["queued"])[:open_slots]
+
+        # requeue the due tasks not dequeued this time
+        dequeued = set()
+        for task in todo:
+            dequeued |= set(task["sigs"])
+        for entry in due:
+            if entry[2] not in dequeued and not self.is_stale(entry):
+                heapq.heappush(self.delayed_heap, entry)
+        return todo
 
     def janitor_blacklist(self):
         csum = self.csum()
@@ -394,11 +496,20 @@ def janitor_blacklist(self):
                 if _csum != ocsum:
                     self.privlog.info("remove from blacklist: %s %s %s", path, action, rid or None)
                     del self.blacklist[sig]
+                    self.sched_dirty.add(path)
 
-    def janitor_delayed(self):
+    def janitor_delayed(self, sigs):
+        """
+        Drop the <sigs> queued tasks invalidated by a config change, an
+        object deletion or unsatisfied run requirements.
+        """
         drop = []
         csum = self.csum()
-        for sig, task in self.delayed.items():
+        for sig in sigs:
+            try:
+                task = self.delayed[sig]
+            except KeyError:
+                continue
             action, path, rid = sig
             if not path:
                 if csum and csum != task["csum"]:
@@ -443,9 +554,12 @@ def dequeue_actions(self, now):
         unset_lazy(self, "run_cluster_data")
         dequeued = []
         session_id = str(uuid.uuid4())
+        warm_runs = []
         for task in self.get_todo(now):
-            self.exec_action(task["sigs"], task["path"], task["action"], task["rids"], task["queued"], now, session_id)
+            self.exec_action(task["sigs"], task["path"], task["action"], task["rids"], task["queued"], now, session_id, warm_runs)
             dequeued += task["sigs"]
+        if warm_runs:
+            self.task_workers.submit_runs(warm_runs)
         self.delete_queued(dequeued)
 
     def delete_queued(self, sigs):
@@ -456,7 +570,29 @@ def delete_queued(self, sigs):
                 del self.delayed[sig]
             except KeyError:
                 #print(sig, self.delayed)
-                pass
+                continue
+            path = sig[1]
+            if path:
+                self.sched_dirty.add(path)
+
+    def janitor_sched_keys(self):
+        """
+        Drop the queued tasks of the deleted objects.
+        """
+        deleted = set(self.sched_keys) - set(shared.SERVICES)
+        if not deleted:
+            return
+        self.delete_queued([sig for sig in self.delayed if sig[1] in deleted])
+        for path in deleted:
+            del self.sched_keys[path]
+            self.sched_dirty.discard(path)
+
+    def sched_key(self, svc, csum, agg):
+        """
+        Return the data the <svc> schedules depend on, except the tasks
+        last run, which change only when a task leaves the queue.
+        """
+        return (id(svc), csum, agg.provisioned, self.csum(), shared.NODE.collector_env.dbopensvc)
 
     def get_lasts(self, svc):
         data = {}
@@ -530,6 +666,9 @@ def run_scheduler(self, now):
                 if p.req_collector and not shared.NODE.collector_env.dbopensvc:
                     continue
                 sig = (action, None, None)
+                if sig in self.delayed and self.delayed[sig]["csum"] != csum:
+                    self.privlog.info("drop action '%s': node or cluster config changed", action)
+                    self.delete_queued(sig)
                 if sig in self.delayed:
                     continue
                 if sig in self.blacklist:
@@ -550,18 +689,30 @@ def run_scheduler(self, now):
                 delay = _next - now
                 self.queue_action(action, delay, None, None, now=now, csum=csum)
 
+        self.janitor_sched_keys()
         for path in list(shared.SERVICES):
             try:
                 svc = shared.SERVICES[path]
             except KeyError:
                 # deleted during previous iterations
                 continue
-            svc.options.cron = True
-            svc.sched.configure()
             csum = self.node_data.get(["services", "config", path, "csum"], None)
             agg = self.get_service_agg(path)
             if not agg:
                 continue
+            key = self.sched_key(svc, csum, agg)
+            last_key = self.sched_keys.get(path)
+            if key == last_key and path not in self.sched_dirty:
+                continue
+            if last_key and last_key[1] != csum:
+                drop = [sig for sig, task in self.delayed.items() if sig[1] == path and task["csum"] != csum]
+                if drop:
+                    self.privlog.info("drop %s queued actions: object config changed", path)
+                    self.delete_queued(drop)
+            self.sched_keys[path] = key
+            self.sched_dirty.discard(path)
+            svc.options.cron = True
+            svc.sched.configure()
             lasts = self.get_lasts(svc)
             for action, parms in svc.sched.actions.items():
                 if agg.provisioned in ("mixed", False) and action in ACTIONS_SKIP_ON_UNPROV:
@@ -602,7 +753,8 @@ def run_scheduler(self, now):
                         except (KeyError, AttributeError):
                             continue
                         except (ex.Error, ex.ContinueAction) as exc:
-                            # run_requires not satisfied
+                            # run_requires not satisfied, retry next loop
+                            self.sched_dirty.add(path)
                             continue
                     _next = time.mktime(_next.timetuple())
                     delay = _next - now
@@ -20,16 +20,15 @@
 import core.exceptions as ex
 from core.node.nodedict import DEFAULT_COLLECTOR_DB_UPDATE_INTERVAL, DEFAULT_COLLECTOR_DB_MIN_UPDATE_INTERVAL, \
     DEFAULT_COLLECTOR_DB_MIN_PING_INTERVAL
-from foreign.jsonpath_ng.ext import parse
 from env import Env
 from utilities.journaled_data import JournaledData
 from utilities.lazy import lazy, unset_lazy
-from utilities.naming import split_path, paths_data, factory, object_path_glob
-from utilities.selector import selector_config_match, selector_value_match, selector_parse_fragment, selector_parse_op_fragment
+from utilities.naming import split_path, factory
 from utilities.storage import Storage
 from core.freezer import Freezer
 from core.comm import Crypt
 from .events import EVENTS
+from .objectselector import ObjectIndex
 
 
 class OsvcJournaledData(JournaledData):
@@ -43,6 +42,8 @@ def __init__(self):
             ],
             # disable journaling if we have no peer, as nothing purges the journal
             journal_condition=lambda: bool(LOCAL_GEN_MERGED_ON_PEER),
+            # readers get shared read-only snapshots instead of deep copies
+            cow=True,
         )
 
 
@@ -103,12 +104,26 @@ def __init__(self):
 SERVICES = {}
 SERVICES_LOCK = RLock()
 
-# The encrypted message all the heartbeat tx threads send.
-# It is refreshed in the monitor thread loop.
-HB_MSG = None
-HB_MSG_LEN = 0
+# The encrypted full dataset messages the heartbeat tx threads send, indexed
+# by message format. It is reset in the monitor thread loop.
+HB_MSG = {}
 HB_MSG_LOCK = RLock()
 
+# The encrypted gen delta frames the heartbeat tx threads concatenate in the
+# peer-specific patch messages, indexed by message format and gen.
+HB_DELTA_MSG = {}
+
+# The maximum number of gen deltas kept in GEN_DIFF for a lagging peer.
+# A peer lagging further behind is sent a full dataset.
+GEN_DIFF_WINDOW = 100
+
+# The monitor status workers pool, evaluating the objects instance status.
+# None when disabled, in which case status commands are forked.
+STATUS_WORKERS = None
+
+# The cluster objects index used by the object selector
+OBJECT_INDEX = ObjectIndex()
+
 # the node monitor states evicting a node from ranking algorithms
 NMON_STATES_PRESERVED = (
    "maintenance",
@@ -1397,6 +1412,7 @@ def purge_log(self):
             # alone, truncate the log, we'll do a full
             to_remove = [gen for gen in GEN_DIFF]
         else:
+            oldest = max(oldest, GEN - GEN_DIFF_WINDOW)
             to_remove = [gen for gen in GEN_DIFF if gen < oldest]
         for gen in to_remove:
             # self.log.info("purge gen %d", gen)
@@ -1703,35 +1719,60 @@ def update_status(self):
         self.thread_data.set([], data)
 
     def daemon_status(self):
-        data = self.daemon_status_data.get_copy()
-        return data
+        """
+        Return a read-only snapshot of the daemon status data.
+        """
+        return self.daemon_status_data.snapshot()
 
     def filter_daemon_status(self, data, namespace=None, namespaces=None, selector=None, relatives=False):
+        """
+        Return a copy of <data> without the objects not matching the
+        selector. The <data> structure is not modified, and the branches
+        not filtered are shared with the returned structure.
+        """
         if selector is None:
             selector = "**"
-        keep = self.object_selector(selector=selector, namespace=namespace, namespaces=namespaces, relatives=relatives)
-        for node in [n for n in data.get("monitor", {}).get("nodes", {})]:
-            for path in [p for p in data["monitor"]["nodes"][node].get("services", {}).get("status", {})]:
-                if path not in keep:
-                    del data["monitor"]["nodes"][node]["services"]["status"][path]
-            for path in [p for p in data["monitor"]["nodes"][node].get("services", {}).get("config", {})]:
-                if path not in keep:
-                    del data["monitor"]["nodes"][node]["services"]["config"][path]
-        for path in [p for p in data.get("monitor", {}).get("services", {})]:
-            if path not in keep:
-                del data["monitor"]["services"][path]
+        keep = set(self.object_selector(selector=selector, namespace=namespace, namespaces=namespaces, relatives=relatives))
+
+        def filter_paths(paths_data):
+            return dict((path, value) for path, value in paths_data.items() if path in keep)
+
+        if "monitor" not in data:
+            return data
+        data = dict(data)
+        data["monitor"] = dict(data["monitor"])
+        if "nodes" in data["monitor"]:
+            nodes = {}
+            for node, node_data in data["monitor"]["nodes"].items():
+                if "services" in node_data:
+                    node_data = dict(node_data)
+                    node_data["services"] = dict(node_data["services"])
+                    for key in ("status", "config"):
+                        if key in node_data["services"]:
+                            node_data["services"][key] = filter_paths(node_data["services"][key])
+                nodes[node] = node_data
+            data["monitor"]["nodes"] = nodes
+        if "services" in data["monitor"]:
+            data["monitor"]["services"] = filter_paths(data["monitor"]["services"])
         return data
 
     @staticmethod
     def data_without_non_updated_gens(data):
         """Return data without non updated gen
         when our gen information is not yet part of remote node gens, return original data
+        The <data> structure is not modified.
         """
         local_node = Env.nodename
-        for other_node in [n for n in data.get("monitor", {"nodes": {}})["nodes"].keys() if n != local_node]:
+        if "monitor" not in data:
+            return data
+        data = dict(data)
+        data["monitor"] = dict(data["monitor"])
+        data["monitor"]["nodes"] = dict(data["monitor"]["nodes"])
+        for other_node in [n for n in data["monitor"]["nodes"].keys() if n != local_node]:
             other_node_gens = data["monitor"]["nodes"][other_node].get("gen", {})
             # Only filter remote node known gens when local node gen is known by remote
             if local_node in other_node_gens:
+                data["monitor"]["nodes"][other_node] = dict(data["monitor"]["nodes"][other_node])
                 data["monitor"]["nodes"][other_node]["gen"] = {
                     local_node: other_node_gens[local_node]
                 }
@@ -1750,106 +1791,22 @@ def object_selector(self, selector=None, namespace=None, namespaces=None, kind=N
                 return []
             # noinspection PySetFunctionToLiteral
             namespaces = set([namespace])
-        if "root" in namespaces:
-            namespaces.add(None)
 
+        data = self.daemon_status_data.data
+        nodenames = self.cluster_nodes
+        OBJECT_INDEX.refresh(data, nodenames)
         if paths is None:
             # all objects
-            paths = self.list_cluster_paths()
-        pds = paths_data(paths)
-        pds = [pd for pd in pds if pd["namespace"] in namespaces]
-        if kind:
-            pds = [pd for pd in pds if pd["kind"] == kind]
+            paths = OBJECT_INDEX.paths
+        candidates = OBJECT_INDEX.candidates(paths, namespaces, kind=kind)
         if selector == "**":
-            return [pd["display"] for pd in pds]
+            return [OBJECT_INDEX.path_data(path)["display"] for path in candidates]
 
         # all services
         if selector == "*":
             kind = kind or "svc"
-            return [pd["display"] for pd in pds if pd["kind"] == kind]
-
-        def or_fragment_selector(s):
-            expanded = []
-            for _selector in s.split(","):
-                for p in and_fragment_selector(_selector):
-                    if p in expanded:
-                        continue
-                    expanded.append(p)
-            return expanded
-
-        def and_fragment_selector(s):
-            expanded = None
-            for _selector in s.split("+"):
-                _expanded = fragment_selector(_selector)
-                if expanded is None:
-                    expanded = _expanded
-                else:
-                    expanded = [p for p in expanded if p in _expanded]
-            return expanded
-
-        def selector_parse_jsonpath_expr(param):
-            if param.startswith("."):
-                param = "$"+param
-
-            if param.startswith("$."):
-                jsonpath_expr = parse(param)
-            else:
-                jsonpath_expr = None
-            return jsonpath_expr
-
-        def fragment_selector(s):
-            # empty
-            if not s:
-                return []
-
-            # explicit object path
-            if s in self.list_cluster_paths():
-                if s not in paths:
-                    return []
-                return [s]
-
-            # fnmatch expression
-            negate, s, elts = selector_parse_fragment(s)
-
-            if len(elts) == 1:
-                return object_path_glob(s, pds=pds, namespace=namespace, kind=kind, negate=negate)
-
-            try:
-                param, op, value = selector_parse_op_fragment(elts)
-            except ValueError:
-                return []
-
-            expanded = []
-            jsonpath_expr = selector_parse_jsonpath_expr(param)
-
-            for path in paths:
-                ret = svc_matching(path, param, op, value, jsonpath_expr)
-                if ret ^ negate:
-                    expanded.append(path)
-
-            return expanded
-
-        def selector_status_matching(path, jsonpath_expr, op, value):
-            try:
-                data = self.object_data(path)
-                matches = jsonpath_expr.find(data)
-                for match in matches:
-                    current = match.value
-                    if selector_value_match(current, op, value):
-                        return True
-            except Exception:
-                return False
-            return False
-
-        def svc_matching(path, param, op, value, jsonpath_expr):
-            if jsonpath_expr:
-                return selector_status_matching(path, jsonpath_expr, op, value)
-            else:
-                try:
-                    svc = SERVICES[path]
-                except KeyError:
-                    return False
-                return selector_config_match(svc, param, op, value)
+            return [OBJECT_INDEX.path_data(path)["display"] for path in candidates
+                    if OBJECT_INDEX.path_data(path)["kind"] == kind]
 
         def add_relatives(selected):
             l = set()
@@ -1862,11 +1819,20 @@ def add_relatives(selected):
                     pass
             return list(l)
 
-        expanded = or_fragment_selector(selector)
+        expanded = OBJECT_INDEX.select(selector, paths, candidates, SERVICES, data, nodenames,
+                                       namespace=namespace, kind=kind)
         if relatives:
             expanded = add_relatives(expanded)
         return expanded
 
+    def object_index(self):
+        """
+        Return the cluster objects index, refreshed from the daemon status
+        data.
+        """
+        OBJECT_INDEX.refresh(self.daemon_status_data.data, self.cluster_nodes)
+        return OBJECT_INDEX
+
     def object_data(self, path):
         """
         Extract from the cluster data the structures refering to a
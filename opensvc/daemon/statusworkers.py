@@ -0,0 +1,414 @@
+"""
+A pool of pre-forked processes evaluating the objects instance status.
+
+The workers keep the objects they evaluated in memory, so the next
+evaluations of the same object do not pay the interpreter startup, the
+modules import, the configuration parsing and the resources instantiation.
+A cached object is rebuilt when its configuration, the node configuration
+or the cluster configuration changes.
+"""
+import logging
+import multiprocessing
+import os
+import select
+import signal
+import threading
+import time
+
+from env import Env
+from utilities.files import fsum
+
+# The maximum number of concurrent status evaluations
+DEFAULT_WORKERS = 4
+
+# Seconds a status evaluation can run before its worker is killed
+DEFAULT_TIMEOUT = 300
+
+try:
+    # fork, so the workers inherit the modules already imported by the daemon
+    MP = multiprocessing.get_context("fork")
+except AttributeError:
+    # py2
+    MP = multiprocessing
+
+
+def mtime(fpath):
+    try:
+        return os.path.getmtime(fpath)
+    except OSError:
+        return 0
+
+
+def get_object(cache, path):
+    """
+    Return the object <path> from the <cache> dict, instantiating it if not
+    cached yet or if its configuration changed since it was cached.
+    """
+    from core.node import Node
+    from utilities.naming import factory, split_path, svc_pathcf
+
+    node_key = (mtime(Env.paths.nodeconf), mtime(Env.paths.clusterconf))
+    if cache.get("node_key") != node_key:
+        cache.clear()
+        cache["node_key"] = node_key
+        cache["node"] = Node()
+        cache["objects"] = {}
+    key = fsum(svc_pathcf(path))
+    try:
+        cached_key, obj = cache["objects"][path]
+    except KeyError:
+        cached_key, obj = None, None
+    if cached_key != key:
+        name, namespace, kind = split_path(path)
+        obj = factory(kind)(name, namespace, node=cache["node"], log_handlers=["file"])
+        cache["objects"][path] = (key, obj)
+    return obj
+
+
+def eval_status(cache, path):
+    """
+    Evaluate and write the instance status of the object <path>, like
+    "om <path> status --refresh --waitlock=0" does.
+    """
+    obj = get_object(cache, path)
+    obj.options.waitlock = 0
+    obj.options.refresh = True
+    obj.print_status_data(refresh=True)
+
+
+def reinit_after_fork():
+    """
+    Replace, in a forked worker, the locks a daemon thread may have held
+    at fork time, as the worker inherits them locked.
+    """
+    import daemon.shared as shared
+    for name in dir(shared):
+        if name.endswith("_LOCK"):
+            setattr(shared, name, shared.RLock())
+        elif name.endswith("_TICKER"):
+            setattr(shared, name, threading.Condition())
+    logging._lock = threading.RLock()
+    for logger in [logging.getLogger()] + list(logging.Logger.manager.loggerDict.values()):
+        for handler in getattr(logger, "handlers", []):
+            handler.createLock()
+
+
+def worker_main(conn):
+    """
+    The status worker process main loop. Receive object paths, evaluate
+    their status and send back (path, error, duration, None) tuples.
+    """
+    reinit_after_fork()
+    # the daemon signal handlers are inherited through fork
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    os.environ["OSVC_ACTION_ORIGIN"] = "daemon"
+    cache = {}
+    while True:
+        try:
+            path = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if path is None:
+            break
+        begin = time.time()
+        try:
+            eval_status(cache, path)
+            error = None
+        except Exception as exc:
+            error = str(exc) or exc.__class__.__name__
+            cache.get("objects", {}).pop(path, None)
+        except SystemExit as exc:
+            error = "exit %s" % exc.code
+            cache.get("objects", {}).pop(path, None)
+        try:
+            conn.send((path, error, time.time() - begin, None))
+        except (EOFError, IOError, OSError):
+            break
+
+
+class StatusTask(object):
+    """
+    A status evaluation request for a set of objects.
+
+    The task quacks like a multiprocessing.Process, so it can be queued
+    with OsvcThread.push_proc() and its callbacks run by janitor_procs().
+    """
+    def __init__(self, paths):
+        self.paths = list(paths)
+        self.pending = set(self.paths)
+        self.errors = 0
+        self.event = threading.Event()
+        if not self.pending:
+            self.event.set()
+
+    @property
+    def exitcode(self):
+        if self.pending:
+            return
+        return 1 if self.errors else 0
+
+    def is_alive(self):
+        return bool(self.pending)
+
+    def terminate(self):
+        """
+        Forget the evaluations not yet done. The running ones complete.
+        """
+        self.pending = set()
+        self.event.set()
+
+    def wait(self, timeout=None):
+        return self.event.wait(timeout)
+
+    def done(self, path, error=None):
+        if path not in self.pending:
+            return
+        self.pending.discard(path)
+        if error:
+            self.errors += 1
+        if not self.pending:
+            self.event.set()
+
+
+class StatusWorker(object):
+    """
+    A pre-forked status evaluation process and its pipe.
+    """
+    def __init__(self, target=worker_main):
+        self.conn, child_conn = MP.Pipe()
+        self.proc = MP.Process(target=target, args=(child_conn,))
+        self.proc.daemon = True
+        self.proc.start()
+        child_conn.close()
+        self.path = None
+        self.started = 0
+        self.killed = False
+
+    def send(self, path, request=None):
+        self.path = path
+        self.started = time.time()
+        self.conn.send(path if request is None else request)
+
+    def stop(self, timeout=1):
+        try:
+            self.conn.send(None)
+        except Exception:
+            pass
+        self.proc.join(timeout)
+        if self.proc.is_alive():
+            self.kill()
+        self.conn.close()
+
+    def kill(self):
+        self.killed = True
+        try:
+            self.proc.terminate()
+            self.proc.join(1)
+            if self.proc.is_alive():
+                os.kill(self.proc.pid, signal.SIGKILL)
+                self.proc.join(1)
+        except Exception:
+            pass
+
+
+class StatusWorkers(object):
+    """
+    The status workers pool. Requests are queued and dispatched to at most
+    <size> workers by a dispatcher thread. A path already queued is not
+    queued twice, and a path is never evaluated by two workers at once.
+    """
+    name = "status"
+
+    def __init__(self, size=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, log=None):
+        self.size = size
+        self.timeout = timeout
+        self.log = log
+        self.lock = threading.RLock()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.queue = []
+        self.tasks = {}
+        self.running = {}
+        self.workers = []
+        self.thread = None
+        self.counters = {
+            "evals": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "time": 0.0,
+        }
+        self.objects = {}
+
+    def start(self):
+        # fork the workers now, not on demand from the dispatcher thread
+        with self.lock:
+            while len(self.workers) < self.size:
+                self.workers.append(self.new_worker())
+        self.thread = threading.Thread(target=self.loop, name=self.name + "workers")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join(5)
+        with self.lock:
+            for worker in self.workers:
+                worker.stop()
+            self.workers = []
+            for tasks in list(self.tasks.values()) + list(self.running.values()):
+                for task in tasks:
+                    task.terminate()
+            self.tasks = {}
+            self.running = {}
+            self.queue = []
+
+    def submit(self, paths):
+        """
+        Queue the status evaluation of <paths> and return a StatusTask.
+        """
+        task = StatusTask(paths)
+        with self.lock:
+            for path in task.paths:
+                if path not in self.tasks:
+                    self.tasks[path] = []
+                    self.queue.append(path)
+                self.tasks[path].append(task)
+        self.wakeup.set()
+        return task
+
+    @staticmethod
+    def new_worker():
+        return StatusWorker()
+
+    @staticmethod
+    def request(path, tasks):
+        """
+        Return the message sent to the worker to process the <tasks>
+        queued for <path>.
+        """
+        return path
+
+    def busy_workers(self):
+        return [worker for worker in self.workers if worker.path is not None]
+
+    def loop(self):
+        while not self.stopped.is_set():
+            try:
+                self.dispatch()
+                self.collect()
+            except Exception as exc:
+                if self.log:
+                    self.log.exception(exc)
+                time.sleep(1)
+
+    def dispatch(self):
+        with self.lock:
+            self.workers = [worker for worker in self.workers
+                            if worker.path is not None or
+                            (not worker.killed and worker.proc.is_alive())]
+            for path in list(self.queue):
+                if path in self.running:
+                    # wait for the running evaluation, which may have
+                    # read the configuration before its last change
+                    continue
+                idle = [worker for worker in self.workers if worker.path is None]
+                if idle:
+                    worker = idle[0]
+                elif len(self.workers) < self.size:
+                    # replace a worker killed or dead, the inherited locks
+                    # are reset by reinit_after_fork()
+                    worker = self.new_worker()
+                    self.workers.append(worker)
+                else:
+                    break
+                self.queue.remove(path)
+                self.running[path] = self.tasks.pop(path)
+                try:
+                    worker.send(path, self.request(path, self.running[path]))
+                except Exception as exc:
+                    worker.path = None
+                    worker.kill()
+                    self.done(path, str(exc), 0)
+
+    def collect(self):
+        busy = self.busy_workers()
+        if not busy:
+            self.wakeup.wait(1)
+            self.wakeup.clear()
+            return
+        try:
+            readable, _, _ = select.select([worker.conn for worker in busy], [], [], 0.2)
+        except (select.error, ValueError, OSError):
+            readable = []
+        now = time.time()
+        for worker in busy:
+            if worker.conn in readable:
+                try:
+                    path, error, duration, result = worker.conn.recv()
+                except Exception as exc:
+                    path, error, duration, result = worker.path, "worker died: %s" % exc, now - worker.started, None
+                    worker.kill()
+                worker.path = None
+                self.done(path, error, duration, result)
+            elif now - worker.started > self.timeout:
+                path = worker.path
+                if self.log:
+                    self.log.warning("kill the %s worker processing %s for more than %ds", self.name, path, self.timeout)
+                worker.kill()
+                worker.path = None
+                self.counters["timeouts"] += 1
+                self.done(path, "timeout", now - worker.started)
+
+    def done(self, path, error, duration, result=None):
+        with self.lock:
+            self.counters["evals"] += 1
+            self.counters["time"] += duration
+            stats = self.objects.setdefault(path, {
+                "evals": 0,
+                "errors": 0,
+                "time": 0.0,
+                "last": 0.0,
+                "max": 0.0,
+            })
+            stats["evals"] += 1
+            stats["time"] += duration
+            stats["last"] = duration
+            stats["max"] = max(stats["max"], duration)
+            if error:
+                self.counters["errors"] += 1
+                stats["errors"] += 1
+                if self.log:
+                    self.log.warning("%s %s error: %s", path, self.name, error)
+            self.notify(self.running.pop(path, []), path, error, result)
+
+    @staticmethod
+    def notify(tasks, path, error, result):
+        for task in tasks:
+            task.done(path, error)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "workers": len(self.workers),
+                "busy": len(self.busy_workers()),
+                "queued": len(self.queue),
+                "running": sorted(self.running),
+                "evals": self.counters["evals"],
+                "errors": self.counters["errors"],
+                "timeouts": self.counters["timeouts"],
+                "time": self.counters["time"],
+            }
+
+    def object_stats(self, path):
+        with self.lock:
+            stats = self.objects.get(path)
+            if stats is None:
+                return
+            return dict(stats)
+
+    def forget(self, path):
+        with self.lock:
+            self.objects.pop(path, None)
@@ -0,0 +1,192 @@
+"""
+A pool of pre-forked processes running the lightweight scheduled tasks.
+
+The scheduler forks a "om svc -s <path> <action> --cron" command per task,
+each one paying the interpreter startup, the modules import and the object
+instantiation. The whitelisted actions, whose side effects are bounded to
+the object status and the collector, can instead run in these workers,
+which keep the objects loaded between runs. The tasks queued for the same
+object before a worker picks them are run in a single worker request.
+
+The actions still create the scheduler launched flag and update the tasks
+last run timestamps, so the scheduler handles them like forked commands.
+"""
+import os
+import signal
+import time
+
+from env import Env
+from daemon.statusworkers import StatusWorker, StatusWorkers, get_object, reinit_after_fork
+from utilities.storage import Storage
+
+# The actions run in the task workers
+WARM_ACTIONS = (
+    "status",
+    "resource_monitor",
+    "push_resinfo",
+)
+
+# The maximum number of concurrent task runs
+DEFAULT_WORKERS = 2
+
+# Seconds a request can run before its worker is killed
+DEFAULT_TIMEOUT = 300
+
+# The environment variables set by the scheduler for a task run
+SCHED_ENV = (
+    "OSVC_SCHED_TIME",
+    "OSVC_SCHED_FLAG",
+    "OSVC_PARENT_SESSION_UUID",
+)
+
+
+def run_action(cache, path, action, rids, now, flag_launched, session_id):
+    """
+    Run the scheduled <action> on the object <path>, like
+    "om svc -s <path> <action> --waitlock=1 --rid <rids> --cron" does,
+    and return the action exit code.
+    """
+    obj = get_object(cache, path)
+    saved_options = dict(obj.options)
+    os.environ["OSVC_SCHED_TIME"] = str(now)
+    os.environ["OSVC_SCHED_FLAG"] = flag_launched
+    os.environ["OSVC_PARENT_SESSION_UUID"] = session_id
+    Env.session_uuid = session_id
+    options = Storage({
+        "waitlock": 1,
+        "cron": True,
+        "rid": ",".join(sorted(rids)) if rids else None,
+    })
+    try:
+        return obj.action(action, options) or 0
+    finally:
+        for var in SCHED_ENV:
+            os.environ.pop(var, None)
+        obj.options.clear()
+        obj.options.update(saved_options)
+
+
+def worker_main(conn):
+    """
+    The task worker process main loop. Receive (path, runs) requests, run
+    the actions and send back (path, error, duration, exitcodes) tuples.
+    """
+    reinit_after_fork()
+    # the daemon signal handlers are inherited through fork
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    os.environ["OSVC_ACTION_ORIGIN"] = "daemon"
+    cache = {}
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if request is None:
+            break
+        path, runs = request
+        begin = time.time()
+        error = None
+        exitcodes = []
+        for action, rids, now, flag_launched, session_id in runs:
+            try:
+                exitcode = run_action(cache, path, action, rids, now, flag_launched, session_id)
+            except Exception as exc:
+                error = str(exc) or exc.__class__.__name__
+                exitcode = 1
+                cache.get("objects", {}).pop(path, None)
+            except SystemExit as exc:
+                error = "exit %s" % exc.code
+                exitcode = exc.code if isinstance(exc.code, int) else 1
+                cache.get("objects", {}).pop(path, None)
+            exitcodes.append(exitcode)
+        try:
+            conn.send((path, error, time.time() - begin, exitcodes))
+        except (EOFError, IOError, OSError):
+            break
+
+
+class TaskRun(object):
+    """
+    A scheduled task run request.
+
+    The run quacks like a multiprocessing.Process, so the scheduler can
+    queue it with OsvcThread.push_proc() and have post_exec_action()
+    called by janitor_procs() when done.
+    """
+    def __init__(self, action, rids, now, flag_launched, session_id):
+        self.action = action
+        self.rids = sorted(rids) if rids else None
+        self.now = now
+        self.flag_launched = flag_launched
+        self.session_id = session_id
+        self.exitcode = None
+
+    def is_alive(self):
+        return self.exitcode is None
+
+    def terminate(self):
+        """
+        Forget the run if not done yet. A running run completes.
+        """
+        self.done(-signal.SIGTERM)
+
+    def done(self, exitcode):
+        if self.exitcode is not None:
+            return
+        self.exitcode = exitcode
+
+    def request(self):
+        return (self.action, self.rids, self.now, self.flag_launched, self.session_id)
+
+
+class TaskWorkers(StatusWorkers):
+    """
+    The task workers pool. The runs submitted for a path are queued until
+    a worker is available and no other run of the same path is running,
+    then sent to the worker in a single request.
+    """
+    name = "task"
+
+    def __init__(self, size=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, log=None):
+        StatusWorkers.__init__(self, size=size, timeout=timeout, log=log)
+
+    @staticmethod
+    def new_worker():
+        return StatusWorker(target=worker_main)
+
+    def submit(self, path, run):
+        """
+        Queue the <run> TaskRun of the object <path> and return it.
+        """
+        with self.lock:
+            if path not in self.tasks:
+                self.tasks[path] = []
+                self.queue.append(path)
+            self.tasks[path].append(run)
+        self.wakeup.set()
+        return run
+
+    def submit_runs(self, runs):
+        """
+        Queue the (path, TaskRun) <runs> in a single dispatch hold, so the
+        runs of the same object are sent to a worker in a single request.
+        """
+        with self.lock:
+            for path, run in runs:
+                self.submit(path, run)
+
+    @staticmethod
+    def request(path, runs):
+        return (path, [run.request() for run in runs])
+
+    @staticmethod
+    def notify(runs, path, error, exitcodes):
+        if exitcodes is None:
+            # worker died or timed out
+            exitcodes = []
+        for idx, run in enumerate(runs):
+            try:
+                run.done(exitcodes[idx])
+            except IndexError:
+                run.done(1)
@@ -103,7 +103,7 @@ def reload_config(self):
         The dev parameter can use exposed_devs reference that were not
         resolvable at build time, as the ressource exposing can be down.
         """
-        self.svc.ref_cache = {}
+        self.svc.clear_ref_cache()
         self.clear_caches()
         self.devs = set()
         self.original_devs = self.oget('devs')
@@ -209,6 +209,7 @@
 class BaseFs(Resource):
     """Define a mount resource
     """
+    status_thread_safe = True
 
     def __init__(self,
                  mount_point=None,
@@ -19,6 +19,8 @@
 
 
 class BaseFsFlag(Resource):
+    status_thread_safe = True
+
     def __init__(self, type='fs.flag', **kwargs):
         super(BaseFsFlag, self).__init__(type=type, **kwargs)
 
@@ -131,6 +131,18 @@ def is_up(self):
             self.status_log("mnt is not defined", "info")
             return False
         self.mounts = Mounts()
+
+        # a block device is mounted whatever the alias used to mount it
+        try:
+            st = os.stat(self.device)
+        except OSError:
+            st = None
+        if st and S_ISBLK(st.st_mode):
+            majmin = "%d:%d" % (os.major(st.st_rdev), os.minor(st.st_rdev))
+            if self.mounts.has_majmin(majmin, self.mount_point.rstrip("/") or "/") or \
+               self.mounts.has_majmin(majmin, os.path.realpath(self.mount_point)):
+                return True
+
         for dev in [self.device] + utilities.devices.linux.udevadm_query_symlink(self.device):
             ret = self.mounts.has_mount(dev, self.mount_point)
             if ret:
@@ -149,6 +149,7 @@ class Ip(Resource):
     """
     Base ip resource driver.
     """
+    status_thread_safe = True
 
     def __init__(self,
                  ipdev=None,
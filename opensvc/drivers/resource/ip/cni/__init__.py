@@ -121,6 +121,9 @@ class DupAlloc(ex.OsvcException):
     pass
 
 class IpCni(IpHost):
+    # the status depends on the container resource status
+    status_thread_safe = False
+
     def __init__(self,
                  network=None,
                  netns=None,
@@ -103,6 +103,9 @@ def driver_capabilities(node=None):
     return []
 
 class IpNetns(IpHost):
+    # the status depends on the container resource status
+    status_thread_safe = False
+
     def __init__(self,
                  mode=None,
                  network=None,
@@ -22,6 +22,9 @@ def driver_capabilities(node=None):
 
 
 class IpZone(IpHost):
+    # the status depends on the container resource status
+    status_thread_safe = False
+
     def __init__(self, zone=None, **kwargs):
         super(IpZone, self).__init__(type="ip.zone", **kwargs)
         self.zone = zone
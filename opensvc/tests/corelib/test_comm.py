@@ -1,11 +1,13 @@
 import json
+import os
 import socket
 import uuid
 import time
 
 import pytest
 
-from core.comm import Crypt, PAUSE, SOCK_TMO_REQUEST
+import core.comm
+from core.comm import Crypt, H2ConnectionPool, StaleConnection, PAUSE, SOCK_TMO_REQUEST
 from core.node import Node
 from env import Env
 
@@ -200,3 +202,206 @@ class TestClusterNodes:
     def test_is_array_with_nodename(mocker):
         mocker.patch.object(Crypt, 'get_node', return_value=Node())
         assert Crypt().cluster_nodes == [Env.nodename]
+
+
+class H2Conn(object):
+    def __init__(self, data=b"{}", can_read=False, side_effect=None):
+        self.data = data
+        self._sock = type("Sock", (object,), {"can_read": can_read})()
+        self.side_effect = side_effect
+        self.closed = False
+        self.requests = 0
+
+    def request(self, method, path, headers=None, body=None):
+        if self.side_effect:
+            raise self.side_effect
+        self.requests += 1
+        return self.requests
+
+    def get_response(self, stream_id):
+        data = self.data
+        return type("Resp", (object,), {"read": lambda self: data})()
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.mark.ci
+class TestH2ConnectionPool:
+    @staticmethod
+    def test_reuses_released_connection():
+        pool = H2ConnectionPool()
+        entry = pool.acquire("key", H2Conn)
+        pool.release(entry)
+        assert pool.acquire("key", H2Conn) is entry
+
+    @staticmethod
+    def test_prefers_a_new_connection_over_a_busy_one():
+        pool = H2ConnectionPool()
+        entry1 = pool.acquire("key", H2Conn)
+        entry2 = pool.acquire("key", H2Conn)
+        assert entry1.conn is not entry2.conn
+
+    @staticmethod
+    def test_multiplexes_streams_past_max_conns(mocker):
+        mocker.patch.object(core.comm, "H2_POOL_MAX_CONNS", 2)
+        pool = H2ConnectionPool()
+        entries = [pool.acquire("key", H2Conn) for _ in range(3)]
+        assert len(pool.conns["key"]) == 2
+        assert entries[2] is entries[0]
+        assert entries[2].streams == 2
+
+    @staticmethod
+    def test_keys_are_isolated():
+        pool = H2ConnectionPool()
+        entry = pool.acquire("key1", H2Conn)
+        pool.release(entry)
+        assert pool.acquire("key2", H2Conn) is not entry
+
+    @staticmethod
+    def test_evicts_idle_connections(mocker):
+        pool = H2ConnectionPool()
+        entry = pool.acquire("key", H2Conn)
+        pool.release(entry)
+        entry.last_used -= core.comm.H2_POOL_IDLE_TMO + 1
+        assert pool.acquire("key", H2Conn) is not entry
+        assert entry.conn.closed
+
+    @staticmethod
+    def test_discards_unhealthy_connections():
+        pool = H2ConnectionPool()
+        entry = pool.acquire("key", H2Conn)
+        pool.release(entry)
+        entry.conn._sock.can_read = True
+        assert pool.acquire("key", H2Conn) is not entry
+        assert entry.conn.closed
+        assert len(pool.conns["key"]) == 1
+
+    @staticmethod
+    def test_release_without_reuse_closes_connection():
+        pool = H2ConnectionPool()
+        entry = pool.acquire("key", H2Conn)
+        pool.release(entry, reuse=False)
+        assert entry.conn.closed
+        assert pool.conns["key"] == []
+
+    @staticmethod
+    def test_forgets_connections_inherited_through_fork():
+        pool = H2ConnectionPool()
+        entry = pool.acquire("key", H2Conn)
+        pool.release(entry)
+        pool.pid -= 1
+        assert pool.acquire("key", H2Conn) is not entry
+        assert not entry.conn.closed
+        assert len(pool.conns["key"]) == 1
+
+    @staticmethod
+    def test_caches_ssl_context_until_files_change(mocker, tmp_path):
+        factory = mocker.patch.object(core.comm, "get_http2_client_ssl_context",
+                                      side_effect=lambda **kwargs: object())
+        cafile = tmp_path / "ca"
+        cafile.write_text(u"ca")
+        pool = H2ConnectionPool()
+        ctx = pool.get_ssl_context(cafile=str(cafile))
+        assert pool.get_ssl_context(cafile=str(cafile)) is ctx
+        assert factory.call_count == 1
+        mtime = cafile.stat().st_mtime + 10
+        os.utime(str(cafile), (mtime, mtime))
+        assert pool.get_ssl_context(cafile=str(cafile)) is not ctx
+        assert factory.call_count == 2
+
+
+@pytest.mark.ci
+class TestH2DaemonRequest:
+    @staticmethod
+    def test_returns_response_body_and_counts_requests():
+        pool = H2ConnectionPool()
+        entry = pool.acquire("key", H2Conn)
+        assert Crypt._h2_daemon_request(entry, "GET", "/", {}, b"", 1) == b"{}"
+        assert entry.requests == 1
+
+    @staticmethod
+    def test_reused_connection_reset_raises_stale():
+        pool = H2ConnectionPool()
+        entry = pool.acquire("key", lambda: H2Conn(side_effect=socket.error()))
+        entry.requests = 1
+        with pytest.raises(StaleConnection):
+            Crypt._h2_daemon_request(entry, "GET", "/", {}, b"", 1)
+
+    @staticmethod
+    def test_new_connection_error_returns_error():
+        pool = H2ConnectionPool()
+        entry = pool.acquire("key", lambda: H2Conn(side_effect=socket.error()))
+        result = Crypt._h2_daemon_request(entry, "GET", "/", {}, b"", 0)
+        assert result["status"] == 1
+
+    @staticmethod
+    def test_retries_stale_pooled_connection_with_a_new_one(mocker):
+        pool = H2ConnectionPool()
+        mocker.patch.object(core.comm, "H2_POOL", pool)
+        stale = pool.acquire(("sock", True), lambda: H2Conn(side_effect=socket.error()))
+        stale.requests = 1
+        pool.release(stale)
+        crypt = Crypt()
+        mocker.patch.object(crypt, "h2_pool_key", return_value=("sock", True))
+        mocker.patch.object(crypt, "h2c", return_value=H2Conn(data=b'{"status": 0}'))
+        mocker.patch.object(crypt, "get_cluster_name", return_value="demo")
+        mocker.patch.object(crypt, "get_secret", return_value="secret")
+        sp = mocker.Mock(to="sock", tls=False)
+        assert crypt.h2_daemon_request({"action": "test"}, sp=sp) == {"status": 0}
+        assert stale.conn.closed
+        assert len(pool.conns[("sock", True)]) == 1
+
+
+@pytest.fixture()
+def frame_crypt(mocker):
+    mocker.patch.object(Crypt, 'cluster_name', 'demo')
+    mocker.patch.object(Crypt, 'cluster_names', set(['demo']))
+    mocker.patch.object(Crypt, 'cluster_key', b'0123456789abcdef0123456789abcdef')
+    mocker.patch.object(Crypt, 'cluster_drpnodes', [])
+    crypt = Crypt()
+    crypt.log = mocker.Mock(name='log')
+    return crypt
+
+
+@pytest.mark.ci
+class TestHbFrame:
+    @staticmethod
+    @pytest.mark.parametrize('zdict', [False, True])
+    def test_decrypt_returns_the_encrypted_data(frame_crypt, zdict):
+        data = {"monitor": {"status": "idle"}, "services": {"status": {}}}
+        frame = frame_crypt.encrypt_frame(data, zdict=zdict)
+        assert core.comm.is_hb_frame(frame)
+        assert core.comm.hb_frame_len(frame) == len(frame)
+        assert frame_crypt.decrypt(frame) == ('demo', Env.nodename, data)
+
+    @staticmethod
+    def test_frame_is_smaller_than_the_json_envelope(frame_crypt):
+        data = {"services": {"status": dict(("ns/svc/s%d" % idx, {
+            "avail": "up",
+            "overall": "up",
+            "frozen": 0,
+            "monitor": {"status": "idle", "global_expect": None},
+        }) for idx in range(100))}}
+        assert len(frame_crypt.encrypt_frame(data)) < 0.8 * len(frame_crypt.encrypt(data, encode=False))
+
+    @staticmethod
+    def test_hb_frame_len_needs_a_complete_header(frame_crypt):
+        frame = frame_crypt.encrypt_frame({})
+        assert core.comm.hb_frame_len(frame[:core.comm.HB_FRAME.size - 1]) is None
+
+    @staticmethod
+    def test_legacy_messages_are_not_frames(frame_crypt):
+        message = frame_crypt.encrypt({"a": 1})
+        assert not core.comm.is_hb_frame(message)
+        assert frame_crypt.decrypt(message) == ('demo', Env.nodename, {"a": 1})
+
+    @staticmethod
+    def test_discards_frames_from_other_clusters(frame_crypt):
+        frame = frame_crypt.encrypt_frame({}, cluster_name="other")
+        assert frame_crypt.decrypt(frame) == (None, None, None)
+
+    @staticmethod
+    def test_discards_truncated_frames(frame_crypt):
+        frame = frame_crypt.encrypt_frame({"a": 1})
+        assert frame_crypt.decrypt(frame[:-1]) == (None, None, None)
@@ -0,0 +1,104 @@
+import os
+import time
+
+import pytest
+
+import core.configfile.cache as cache
+from core.objects.svc import Svc
+
+CONFIG = """\
+[DEFAULT]
+id = 0e5a4a42-8c6b-4f06-a2c4-ab9ff1e8b1d1
+[fs#1]
+# the app fs
+type = flag
+"""
+
+
+def write_config(fpath, content, age=10):
+    with open(fpath, "w") as ofile:
+        ofile.write(content)
+    mtime = time.time() - age
+    os.utime(fpath, (mtime, mtime))
+
+
+@pytest.fixture(scope='function')
+def cf(osvc_path_tests):
+    cache.CACHE.clear()
+    cache.LAST_PRUNE[0] = 0
+    fpath = os.path.join(str(osvc_path_tests), "svc.conf")
+    write_config(fpath, CONFIG)
+    return fpath
+
+
+@pytest.fixture(scope='function')
+def svc(osvc_path_tests):
+    return Svc(name="svc", volatile=True)
+
+
+@pytest.mark.ci
+class TestConfigFileCache:
+    @staticmethod
+    def test_parsed_once(cf, svc, mocker):
+        parse = mocker.patch.object(Svc, "_parse_config_file", wraps=Svc._parse_config_file)
+        data = svc.parse_config_file(cf)
+        assert data["fs#1"]["type"] == "flag"
+        assert data["fs#1"]["comment"] == "the app fs"
+        assert svc.parse_config_file(cf) == data
+        assert parse.call_count == 1
+
+    @staticmethod
+    def test_disk_cache_survives_process_cache(cf, svc, mocker):
+        data = svc.parse_config_file(cf)
+        cache.CACHE.clear()
+        parse = mocker.patch.object(Svc, "_parse_config_file", wraps=Svc._parse_config_file)
+        assert svc.parse_config_file(cf) == data
+        assert parse.call_count == 0
+        fpath = cache.cache_fpath([cf])
+        assert os.stat(fpath).st_mode & 0o777 == 0o600
+
+    @staticmethod
+    def test_returns_copies(cf, svc):
+        data = svc.parse_config_file(cf)
+        data["fs#1"]["type"] = "changed"
+        del data["DEFAULT"]
+        data = svc.parse_config_file(cf)
+        assert data["fs#1"]["type"] == "flag"
+        assert "DEFAULT" in data
+
+    @staticmethod
+    def test_invalidated_on_change(cf, svc):
+        svc.parse_config_file(cf)
+        write_config(cf, CONFIG.replace("flag", "flag2"), age=5)
+        assert svc.parse_config_file(cf)["fs#1"]["type"] == "flag2"
+
+    @staticmethod
+    def test_recently_modified_file_is_not_cached(cf, svc, mocker):
+        write_config(cf, CONFIG, age=0)
+        parse = mocker.patch.object(Svc, "_parse_config_file", wraps=Svc._parse_config_file)
+        svc.parse_config_file(cf)
+        svc.parse_config_file(cf)
+        assert parse.call_count == 2
+        assert not os.path.exists(cache.cache_fpath([cf]))
+
+    @staticmethod
+    def test_drop(cf, svc):
+        svc.parse_config_file(cf)
+        cache.drop(cf)
+        assert cache.CACHE == {}
+        assert not os.path.exists(cache.cache_fpath([cf]))
+
+    @staticmethod
+    def test_deleted_file_is_pruned(cf, svc):
+        svc.parse_config_file(cf)
+        os.unlink(cf)
+        cache.prune(now=time.time() + cache.PRUNE_INTERVAL)
+        assert cache.CACHE == {}
+        assert not os.path.exists(cache.cache_fpath([cf]))
+
+    @staticmethod
+    def test_prune_interval(cf, svc):
+        svc.parse_config_file(cf)
+        os.unlink(cf)
+        cache.prune()
+        assert list(cache.CACHE) == [cf]
@@ -0,0 +1,91 @@
+import pytest
+
+import core.exceptions as ex
+from core.objects.svc import Svc
+from utilities.lazy import unset_lazy
+
+
+def config(parents="svc1 svc2"):
+    return {
+        "DEFAULT": {
+            "parents": parents,
+        },
+        "fs#1": {
+            "type": "flag",
+        },
+    }
+
+
+@pytest.fixture(scope='function')
+def svc(osvc_path_tests):
+    return Svc(name="svc", volatile=True, cd=config())
+
+
+@pytest.mark.ci
+class TestConfGetCache:
+    @staticmethod
+    def test_memoized(svc, mocker):
+        uncached = mocker.spy(svc, "conf_get_uncached")
+        stats = dict(svc.conf_cache_stats)
+        assert svc.oget("DEFAULT", "parents") == ["svc1", "svc2"]
+        assert svc.oget("DEFAULT", "parents") == ["svc1", "svc2"]
+        assert uncached.call_count == 1
+        assert svc.conf_cache_stats["miss"] == stats["miss"] + 1
+        assert svc.conf_cache_stats["hit"] == stats["hit"] + 1
+
+    @staticmethod
+    def test_memoized_opt_not_found(svc, mocker):
+        uncached = mocker.spy(svc, "conf_get_uncached")
+        assert svc.oget("DEFAULT", "orchestrate") == "no"
+        with pytest.raises(ex.OptNotFound) as exc:
+            svc.conf_get("DEFAULT", "orchestrate")
+        assert exc.value.default == "no"
+        assert uncached.call_count == 1
+
+    @staticmethod
+    def test_returns_copies(svc):
+        svc.oget("DEFAULT", "parents").append("svc3")
+        assert svc.oget("DEFAULT", "parents") == ["svc1", "svc2"]
+
+    @staticmethod
+    def test_cleared_by_clear_ref_cache(svc, mocker):
+        svc.oget("DEFAULT", "parents")
+        svc.clear_ref_cache()
+        uncached = mocker.spy(svc, "conf_get_uncached")
+        svc.oget("DEFAULT", "parents")
+        assert uncached.call_count == 1
+
+    @staticmethod
+    def test_cleared_on_cd_change(svc):
+        assert svc.oget("DEFAULT", "parents") == ["svc1", "svc2"]
+        svc.raw_cd = config(parents="svc3")
+        unset_lazy(svc, "cd")
+        assert svc.oget("DEFAULT", "parents") == ["svc3"]
+
+    @staticmethod
+    def test_explicit_cd_is_not_memoized(svc, mocker):
+        uncached = mocker.spy(svc, "conf_get_uncached")
+        cd = config(parents="svc3")
+        assert svc.oget("DEFAULT", "parents", cd=cd) == ["svc3"]
+        assert svc.oget("DEFAULT", "parents") == ["svc1", "svc2"]
+        assert svc.oget("DEFAULT", "parents", cd=cd) == ["svc3"]
+        assert uncached.call_count == 3
+
+    @staticmethod
+    def test_node_selectors_are_not_memoized(svc, mocker):
+        svc.node = mocker.Mock()
+        svc.node.listener = None
+        svc.node.nodes_selector.return_value = ["node1"]
+        svc.oget("DEFAULT", "nodes")
+        svc.oget("DEFAULT", "nodes")
+        assert svc.node.nodes_selector.call_count == 2
+
+    @staticmethod
+    def test_deferred_references_are_not_memoized(svc, mocker):
+        def resolve_deferred(*args, **kwargs):
+            svc.conf_cache_skip += 1
+            return ["/dev/sda"]
+        uncached = mocker.patch.object(svc, "conf_get_uncached", side_effect=resolve_deferred)
+        svc.oget("fs#1", "dev")
+        svc.oget("fs#1", "dev")
+        assert uncached.call_count == 2
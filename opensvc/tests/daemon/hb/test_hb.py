@@ -0,0 +1,145 @@
+import pytest
+
+import daemon.shared as shared
+from core.comm import Crypt, HAS_ZDICT, hb_frame_caps
+from daemon.hb.relay import HbRelayTx
+from daemon.hb.ucast import HbUcastTx
+from env import Env
+
+
+@pytest.fixture(scope='function')
+def tx(mocker, shared_data):
+    thr = HbUcastTx("hb#1")
+    thr.log = mocker.MagicMock()
+    thr.hb_nodes = [Env.nodename, "node2", "node3"]
+    return thr
+
+
+def set_peer_caps(nodename, caps):
+    shared.DAEMON_STATUS.set(["monitor", "nodes", nodename], {"hb_frame": caps})
+
+
+@pytest.mark.ci
+@pytest.mark.usefixtures('osvc_path_tests')
+class TestHbGetFrameOpts:
+    @staticmethod
+    def test_uses_frames_when_all_peers_support_them(tx):
+        set_peer_caps("node2", hb_frame_caps())
+        set_peer_caps("node3", hb_frame_caps())
+        assert tx.get_frame_opts() == {"zdict": HAS_ZDICT, "deltas": True}
+
+    @staticmethod
+    def test_uses_legacy_format_when_a_peer_dataset_is_unknown(tx):
+        set_peer_caps("node2", hb_frame_caps())
+        assert tx.get_frame_opts() is None
+
+    @staticmethod
+    def test_uses_legacy_format_when_a_peer_does_not_support_frames(tx):
+        set_peer_caps("node2", hb_frame_caps())
+        shared.DAEMON_STATUS.set(["monitor", "nodes", "node3"], {"compat": 10})
+        assert tx.get_frame_opts() is None
+
+    @staticmethod
+    def test_disables_zdict_when_a_peer_does_not_support_it(tx):
+        set_peer_caps("node2", hb_frame_caps())
+        set_peer_caps("node3", {"version": 1, "zdict": False, "deltas": True})
+        assert tx.get_frame_opts() == {"zdict": False, "deltas": True}
+
+    @staticmethod
+    def test_relay_does_not_use_frames(mocker, shared_data):
+        thr = HbRelayTx("hb#1")
+        assert thr.get_frame_opts() is None
+
+
+@pytest.fixture(scope='function')
+def gens(mocker, tx):
+    mocker.patch.object(Crypt, 'cluster_name', 'demo')
+    mocker.patch.object(Crypt, 'cluster_names', set(['demo']))
+    mocker.patch.object(Crypt, 'cluster_key', b'0123456789abcdef0123456789abcdef')
+    mocker.patch.object(Crypt, 'cluster_drpnodes', [])
+    mocker.patch.object(shared, 'GEN', 10)
+    mocker.patch.object(shared, 'GEN_DIFF', dict((gen, [[["gen"], gen]]) for gen in range(5, 11)))
+    mocker.patch.object(shared, 'LOCAL_GEN_MERGED_ON_PEER', {"node2": 8, "node3": 9})
+    mocker.patch.object(shared, 'PEER_GEN_MERGED', {"node2": 3, "node3": 4})
+    mocker.patch.object(shared, 'HB_MSG', {})
+    mocker.patch.object(shared, 'HB_DELTA_MSG', {})
+    set_peer_caps("node2", hb_frame_caps())
+    set_peer_caps("node3", hb_frame_caps())
+    shared.DAEMON_STATUS.set(["monitor", "nodes", Env.nodename, "monitor"], {"status": "idle"})
+
+
+def decrypt_all(thr, message):
+    return [thr.decrypt(fragment)[2] for fragment in thr.split_message(message)]
+
+
+@pytest.mark.ci
+@pytest.mark.usefixtures('osvc_path_tests', 'gens')
+class TestHbGetMessageDeltas:
+    @staticmethod
+    def test_sends_the_deltas_missing_on_the_peer(tx):
+        message, message_bytes = tx.get_message("node2")
+        assert message_bytes == len(message)
+        messages = decrypt_all(tx, message)
+        assert [msg["kind"] for msg in messages] == ["delta", "delta", "patch"]
+        assert [msg["deltas"] for msg in messages[:2]] == [{"9": [[["gen"], 9]]}, {"10": [[["gen"], 10]]}]
+        assert messages[2]["deltas"] == {}
+        assert messages[2]["gen"] == {Env.nodename: 10, "node2": 3, "node3": 4}
+
+    @staticmethod
+    def test_encrypts_each_delta_once(tx, mocker):
+        encrypt_frame = mocker.spy(tx, "encrypt_frame")
+        tx.get_message("node2")
+        tx.get_message("node3")
+        # gen 9 and 10 deltas, and one trailer
+        assert encrypt_frame.call_count == 3
+        assert decrypt_all(tx, tx.get_message("node3")[0])[0]["deltas"] == {"10": [[["gen"], 10]]}
+
+    @staticmethod
+    def test_drops_purged_deltas_from_the_cache(tx):
+        tx.get_message("node2")
+        del shared.GEN_DIFF[9]
+        shared.LOCAL_GEN_MERGED_ON_PEER["node2"] = 9
+        tx.get_message("node2")
+        assert sorted(gen for _, gen in shared.HB_DELTA_MSG) == [10]
+
+    @staticmethod
+    def test_sends_a_full_to_a_peer_lagging_behind_the_window(tx):
+        shared.LOCAL_GEN_MERGED_ON_PEER["node2"] = 2
+        messages = decrypt_all(tx, tx.get_message("node2")[0])
+        assert len(messages) == 1
+        assert messages[0]["monitor"] == {"status": "idle"}
+        assert tx.stats.messages["node2"]["full"] == 1
+
+    @staticmethod
+    def test_accounts_full_and_patch_messages_per_peer(tx):
+        tx.get_message("node2")
+        tx.get_message("node2")
+        shared.LOCAL_GEN_MERGED_ON_PEER["node2"] = 0
+        tx.get_message("node2")
+        tx.get_message("node3")
+        assert tx.stats.messages["node2"]["patch"] == 2
+        assert tx.stats.messages["node2"]["full"] == 1
+        assert tx.stats.messages["node2"]["full_ratio"] == 1.0 / 3
+        assert tx.stats.messages["node3"]["patch"] == 1
+
+    @staticmethod
+    def test_uses_a_single_patch_message_for_legacy_peers(tx):
+        shared.DAEMON_STATUS.set(["monitor", "nodes", "node3"], {"compat": 10})
+        message, _ = tx.get_message()
+        assert not isinstance(message, bytes)
+        messages = decrypt_all(tx, message)
+        assert len(messages) == 1
+        # node2 has the oldest gen
+        assert sorted(messages[0]["deltas"]) == ["10", "9"]
+
+
+@pytest.mark.ci
+@pytest.mark.usefixtures('osvc_path_tests')
+class TestPurgeLog:
+    @staticmethod
+    def test_keeps_at_most_gen_diff_window_deltas(mocker, tx):
+        mocker.patch.object(shared, 'GEN', 300)
+        mocker.patch.object(shared, 'GEN_DIFF', dict((gen, []) for gen in range(1, 301)))
+        mocker.patch.object(shared, 'LOCAL_GEN_MERGED_ON_PEER', {"node2": 1, "node3": 299})
+        tx.purge_log()
+        assert min(shared.GEN_DIFF) == 300 - shared.GEN_DIFF_WINDOW
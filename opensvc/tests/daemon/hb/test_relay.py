@@ -0,0 +1,172 @@
+import pytest
+
+import daemon.shared as shared
+from core.comm import Crypt
+from daemon.handlers.relay.bulk_rx.get import Handler as BulkRxHandler
+from daemon.handlers.relay.rx.get import Handler as RxHandler
+from daemon.handlers.relay.tx.post import Handler as TxHandler
+from daemon.hb.relay import HbRelayRx
+from env import Env
+
+CLUSTER_ID = "c7d9e524-5a8e-11ee-8c99-0242ac120002"
+
+
+def relay_tx(nodename, msg, cluster_id=CLUSTER_ID):
+    TxHandler().action(nodename, options={"cluster_id": cluster_id, "cluster_name": "demo", "msg": msg})
+
+
+class Relay(object):
+    """
+    A daemon_get replacement routing the requests to the relay handlers.
+    """
+    def __init__(self, bulk=True):
+        self.bulk = bulk
+        self.requests = []
+        self.responses = []
+
+    def __call__(self, request, **kwargs):
+        self.requests.append(request)
+        if request["action"] != "relay_bulk_rx":
+            response = RxHandler().action(None, options=request["options"])
+        elif self.bulk:
+            response = BulkRxHandler().action(None, options=request["options"])
+        else:
+            response = {"status": 501, "error": "handler GET relay_bulk_rx is not supported"}
+        self.responses.append(response)
+        return response
+
+    def actions(self):
+        return [request["action"] for request in self.requests]
+
+
+@pytest.fixture(scope='function')
+def relay_data(mocker):
+    mocker.patch.object(shared, 'RELAY_DATA', {})
+
+
+@pytest.fixture(scope='function')
+def rx(mocker, shared_data, relay_data):
+    mocker.patch.object(Crypt, 'cluster_name', 'demo')
+    mocker.patch.object(HbRelayRx, 'cluster_id', CLUSTER_ID)
+    thr = HbRelayRx("hb#1")
+    thr.log = mocker.MagicMock()
+    thr.hb_nodes = [Env.nodename, "node2", "node3"]
+    thr.relay = "relay1"
+    thr.secret = "secret"
+    thr.timeout = 15
+    thr.reset_stats()
+    mocker.patch.object(thr, 'janitor_procs')
+    mocker.patch.object(thr, 'reload_config')
+    mocker.patch.object(thr, 'event')
+    mocker.patch.object(thr, 'decrypt', side_effect=lambda data, sender_id=None: ("demo", data.decode().split(":")[0], data))
+    mocker.patch.object(thr, 'queue_rx_data')
+    return thr
+
+
+def received(rx):
+    return sorted(call[0][1] for call in rx.queue_rx_data.call_args_list)
+
+
+@pytest.mark.ci
+@pytest.mark.usefixtures('relay_data')
+class TestRelayBulkRxHandler:
+    @staticmethod
+    def test_returns_the_cluster_slots():
+        relay_tx("node1", "node1:1")
+        relay_tx("node2", "node2:1")
+        relay_tx("node1", "other:1", cluster_id="other")
+        result = BulkRxHandler().action(None, options={"cluster_id": CLUSTER_ID})
+        assert result["status"] == 0
+        assert sorted(result["data"]) == ["node1", "node2"]
+        assert result["data"]["node1"]["msg"] == "node1:1"
+
+    @staticmethod
+    def test_filters_the_requested_slots():
+        relay_tx("node1", "node1:1")
+        relay_tx("node2", "node2:1")
+        result = BulkRxHandler().action(None, options={"cluster_id": CLUSTER_ID, "slots": ["node2", "node3"]})
+        assert sorted(result["data"]) == ["node2"]
+
+    @staticmethod
+    def test_does_not_return_the_unchanged_payloads():
+        relay_tx("node1", "node1:1")
+        relay_tx("node2", "node2:1")
+        updated = shared.RELAY_DATA[CLUSTER_ID + "/node1"]["updated"]
+        result = BulkRxHandler().action(None, options={"cluster_id": CLUSTER_ID, "updated": {"node1": updated, "node2": 0}})
+        assert result["data"]["node1"] == {"updated": updated}
+        assert result["data"]["node2"]["msg"] == "node2:1"
+
+
+@pytest.mark.ci
+@pytest.mark.usefixtures('osvc_path_tests')
+class TestHbRelayRx:
+    @staticmethod
+    def test_reads_the_slots_with_a_single_request(rx, mocker):
+        relay = Relay()
+        mocker.patch.object(rx, 'daemon_get', side_effect=relay)
+        relay_tx("node2", "node2:1")
+        relay_tx("node3", "node3:1")
+        rx.do()
+        assert relay.actions() == ["relay_bulk_rx"]
+        assert received(rx) == ["node2", "node3"]
+        assert rx.stats.beats == 2
+        assert rx.is_beating("node2")
+        assert rx.is_beating("node3")
+
+    @staticmethod
+    def test_unchanged_slots_are_not_transferred(rx, mocker):
+        relay = Relay()
+        mocker.patch.object(rx, 'daemon_get', side_effect=relay)
+        relay_tx("node2", "node2:1")
+        relay_tx("node3", "node3:1")
+        rx.do()
+        relay_tx("node3", "node3:2")
+        rx.do()
+        assert received(rx) == ["node2", "node3", "node3"]
+        assert sorted(relay.requests[-1]["options"]["updated"]) == ["node2", "node3"]
+        assert "msg" not in relay.responses[-1]["data"]["node2"]
+        assert rx.stats.beats == 3
+        assert rx.stats.errors == 0
+        assert rx.is_beating("node2")
+
+    @staticmethod
+    def test_missing_slot_is_an_error(rx, mocker):
+        mocker.patch.object(rx, 'daemon_get', side_effect=Relay())
+        relay_tx("node2", "node2:1")
+        rx.do()
+        assert received(rx) == ["node2"]
+        assert rx.stats.errors == 1
+        assert not rx.get_last("node3").success
+
+    @staticmethod
+    def test_relay_error_is_reported_on_each_slot(rx, mocker):
+        mocker.patch.object(rx, 'daemon_get', return_value=None)
+        rx.do()
+        assert rx.stats.errors == 2
+        assert not rx.get_last("node2").success
+        assert not rx.get_last("node3").success
+        assert rx.bulk_retry == 0
+
+    @staticmethod
+    def test_fallback_to_per_slot_reads_with_old_relays(rx, mocker):
+        relay = Relay(bulk=False)
+        mocker.patch.object(rx, 'daemon_get', side_effect=relay)
+        relay_tx("node2", "node2:1")
+        relay_tx("node3", "node3:1")
+        rx.do()
+        assert relay.actions()[0] == "relay_bulk_rx"
+        assert sorted(relay.actions()[1:]) == ["relay_rx", "relay_rx"]
+        assert received(rx) == ["node2", "node3"]
+
+        # the bulk request is not retried before the retry interval
+        rx.do()
+        assert relay.actions().count("relay_bulk_rx") == 1
+        assert received(rx) == ["node2", "node3"]
+
+        relay.bulk = True
+        rx.bulk_retry = 0
+        relay_tx("node2", "node2:2")
+        rx.do()
+        assert relay.actions()[-1] == "relay_bulk_rx"
+        assert received(rx) == ["node2", "node2", "node3"]
+        rx.shutdown()
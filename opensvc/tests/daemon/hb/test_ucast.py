@@ -0,0 +1,203 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from core.comm import HB_FRAME, HB_FRAME_MAGIC
+from daemon.hb.ucast import HbUcastRx, HbUcastTx
+from env import Env
+
+
+class Server(object):
+    """
+    A tcp server recording the connections accepted and the data received.
+    """
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(5)
+        self.port = self.sock.getsockname()[1]
+        self.conns = []
+        self.data = b""
+        self.thr = threading.Thread(target=self.serve)
+        self.thr.daemon = True
+        self.thr.start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except Exception:
+                return
+            self.conns.append(conn)
+            thr = threading.Thread(target=self.recv, args=(conn,))
+            thr.daemon = True
+            thr.start()
+
+    def recv(self, conn):
+        while True:
+            try:
+                chunk = conn.recv(4096)
+            except Exception:
+                return
+            if not chunk:
+                return
+            self.data += chunk
+
+    def wait_data(self, size, timeout=2):
+        limit = time.time() + timeout
+        while len(self.data) < size and time.time() < limit:
+            time.sleep(0.01)
+        return self.data
+
+    def close(self):
+        self.sock.close()
+        for conn in self.conns:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except Exception:
+                pass
+            conn.close()
+
+
+@pytest.fixture(scope='function')
+def server():
+    srv = Server()
+    yield srv
+    srv.close()
+
+
+@pytest.fixture(scope='function')
+def tx(mocker, shared_data):
+    thr = HbUcastTx("hb#1")
+    thr.log = mocker.MagicMock()
+    thr.timeout = 15
+    mocker.patch.object(thr, "reload_config")
+    mocker.patch.object(thr, "janitor_procs")
+    mocker.patch.object(thr, "set_beating")
+    mocker.patch.object(thr, "get_message", return_value=("msg", 3))
+    yield thr
+    thr.shutdown()
+
+
+@pytest.mark.ci
+@pytest.mark.usefixtures('osvc_path_tests')
+class TestHbUcastTx:
+    @staticmethod
+    def test_reuses_the_peer_connection(tx, server):
+        tx.peer_config = {"node2": {"addr": "127.0.0.1", "port": server.port}}
+        tx.do()
+        tx.do()
+        assert server.wait_data(8) == b"msg\0msg\0"
+        assert len(server.conns) == 1
+        assert tx.stats.beats == 2
+
+    @staticmethod
+    def test_reconnects_when_the_peer_closed_the_connection(tx, server):
+        tx.peer_config = {"node2": {"addr": "127.0.0.1", "port": server.port}}
+        tx.do()
+        server.wait_data(4)
+        server.conns[0].shutdown(socket.SHUT_RDWR)
+        server.conns[0].close()
+        time.sleep(0.1)
+        tx.do()
+        assert server.wait_data(8) == b"msg\0msg\0"
+        assert len(server.conns) == 2
+        assert tx.stats.errors == 0
+
+    @staticmethod
+    def test_backs_off_reconnections_to_an_unreachable_peer(tx, server, mocker):
+        port = server.port
+        server.close()
+        tx.peer_config = {"node2": {"addr": "127.0.0.1", "port": port}}
+        create_connection = mocker.patch("daemon.hb.ucast.socket.create_connection",
+                                         side_effect=socket.create_connection)
+        tx.do()
+        tx.do()
+        assert create_connection.call_count == 1
+        assert tx.stats.errors == 2
+        assert tx.conns["node2"].failures == 1
+
+    @staticmethod
+    def test_an_unreachable_peer_does_not_delay_the_others(tx, mocker):
+        servers = [Server() for _ in range(3)]
+        try:
+            tx.peer_config = dict(("node%d" % idx, {"addr": "127.0.0.1", "port": srv.port})
+                                  for idx, srv in enumerate(servers))
+            tx.peer_config["blackholed"] = {"addr": "127.0.0.1", "port": 1}
+            create_connection = socket.create_connection
+
+            def slow_create_connection(address, timeout=None):
+                if address[1] == 1:
+                    time.sleep(timeout)
+                    raise socket.timeout()
+                return create_connection(address, timeout)
+
+            mocker.patch("daemon.hb.ucast.socket.create_connection", side_effect=slow_create_connection)
+            tx.sock_tmo = 0.5
+            begin = time.time()
+            tx.do()
+            assert time.time() - begin < 0.9
+            for srv in servers:
+                assert srv.wait_data(4) == b"msg\0"
+            assert tx.stats.beats == 3
+            assert tx.stats.errors == 1
+        finally:
+            for srv in servers:
+                srv.close()
+
+
+def frame(data):
+    return HB_FRAME.pack(HB_FRAME_MAGIC, 1, 0, 4, 5, b"i" * 16, len(data)) + b"demonode2" + data
+
+
+@pytest.fixture(scope='function')
+def rx(mocker, shared_data):
+    thr = HbUcastRx("hb#1")
+    thr.log = mocker.MagicMock()
+    thr.timeout = 15
+    thr.sock_recv_tmo = 0.1
+    thr.hb_nodes = [Env.nodename, "node2"]
+    mocker.patch.object(thr, "set_beating")
+    mocker.patch.object(thr, "decrypt", side_effect=lambda data, sender_id=None: (
+        thr.cluster_name, "node2", {"data": data.rstrip(b"\0").decode()}
+    ))
+    mocker.patch.object(thr, "queue_rx_data")
+    return thr
+
+
+@pytest.mark.ci
+@pytest.mark.usefixtures('osvc_path_tests')
+class TestHbUcastRx:
+    @staticmethod
+    def test_handles_multiple_messages_per_connection(rx):
+        client, conn = socket.socketpair()
+        client.sendall(b"m1\0m2\0m")
+        client.sendall(b"3\0m4")
+        client.close()
+        rx.handle_client(conn, ("127.0.0.1", 0))
+        assert [call[0][0]["data"] for call in rx.queue_rx_data.call_args_list] == ["m1", "m2", "m3", "m4"]
+
+    @staticmethod
+    def test_closes_idle_connections(rx):
+        client, conn = socket.socketpair()
+        rx.timeout = 0.2
+        client.sendall(b"m1\0")
+        begin = time.time()
+        rx.handle_client(conn, ("127.0.0.1", 0))
+        assert time.time() - begin < 1
+        assert rx.queue_rx_data.call_count == 1
+        client.close()
+
+    @staticmethod
+    def test_handles_frames_and_null_terminated_messages(rx):
+        client, conn = socket.socketpair()
+        frame1 = frame(b"f1\0\0")
+        frame2 = frame(b"f2")
+        client.sendall(b"m1\0" + frame1[:10])
+        client.sendall(frame1[10:] + frame2 + b"m2\0")
+        client.close()
+        rx.handle_client(conn, ("127.0.0.1", 0))
+        received = [call[0][0]["data"] for call in rx.queue_rx_data.call_args_list]
+        assert received == ["m1", frame1.rstrip(b"\0").decode(), frame2.decode(), "m2"]
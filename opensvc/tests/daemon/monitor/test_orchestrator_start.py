@@ -177,6 +177,9 @@ def service_command_mock(*args, **kwargs):
             self.log('detect mock service_command(%s, %s)' % (args, kwargs))
             return Popen(self.execs["service_command_exe"])
 
+        # disable the status workers, so status evaluations are forked
+        # through the mocked service_command
+        self.mocker.patch.object(Monitor, 'init_status_workers')
         self.service_command = self.mocker.patch.object(Monitor,
                                                         'service_command',
                                                         side_effect=service_command_mock)
@@ -0,0 +1,149 @@
+import base64
+
+import pytest
+
+import daemon.shared as shared
+from daemon.authcache import AuthCache, fingerprint
+from daemon.listener import ClientHandler
+from daemon.objectselector import ObjectIndex
+from env import Env
+
+AUTHORIZATION = "Basic " + base64.b64encode(b"usr1:secret").decode()
+
+
+class FakeUsr(object):
+    def __init__(self, name, grant):
+        self.name = name
+        self.path = "system/usr/" + name
+        self.grant = grant
+
+    def oget(self, section, option):
+        return self.grant
+
+
+def set_config(path, csum):
+    shared.DAEMON_STATUS.set(["monitor", "nodes", Env.nodename, "services", "config", path], {"csum": csum})
+
+
+@pytest.mark.ci
+class TestAuthCache:
+    @staticmethod
+    def test_fingerprint_does_not_contain_the_credential():
+        key = fingerprint("basic", AUTHORIZATION)
+        assert key[0] == "basic"
+        assert AUTHORIZATION not in key[1]
+        assert key == fingerprint("basic", AUTHORIZATION.encode())
+        assert key != fingerprint("x509", AUTHORIZATION)
+
+    @staticmethod
+    def test_entries_expire():
+        cache = AuthCache(ttl=10)
+        cache.set("k", "usr", {}, "csum", 1, now=100)
+        assert cache.get("k", now=109).usr == "usr"
+        assert cache.get("k", now=110) is None
+        assert cache.entries == {}
+
+    @staticmethod
+    def test_ttl_is_capped():
+        cache = AuthCache(ttl=10)
+        cache.set("k", "usr", {}, "csum", 1, ttl=100, now=100)
+        assert cache.get("k", now=111) is None
+        cache.set("k", "usr", {}, "csum", 1, ttl=5, now=100)
+        assert cache.get("k", now=106) is None
+        cache.set("k", "usr", {}, "csum", 1, ttl=-1, now=100)
+        assert cache.get("k", now=100) is None
+
+    @staticmethod
+    def test_size_is_bounded():
+        cache = AuthCache(ttl=10, size=2)
+        cache.set("k1", "usr", {}, "csum", 1, now=100)
+        cache.set("k2", "usr", {}, "csum", 1, now=105)
+        cache.set("k3", "usr", {}, "csum", 1, now=111)
+        assert sorted(cache.entries) == ["k2", "k3"]
+        cache.set("k4", "usr", {}, "csum", 1, now=111)
+        assert sorted(cache.entries) == ["k4"]
+
+
+@pytest.fixture(scope='function')
+def parent(mocker):
+    mocker.patch.object(shared, 'DAEMON_STATUS', shared.OsvcJournaledData())
+    mocker.patch.object(shared, 'OBJECT_INDEX', ObjectIndex())
+    shared.DAEMON_STATUS.set([], {"monitor": {
+        "nodes": {Env.nodename: {"services": {"config": {}, "status": {}}}},
+        "services": {},
+    }})
+    set_config("system/usr/usr1", "csum1")
+    set_config("ns1/svc/svc1", "csum")
+    set_config("ns2/svc/svc1", "csum")
+    parent = mocker.MagicMock()
+    parent.auth_cache = AuthCache()
+    return parent
+
+
+def new_client(parent, mocker, grant="guest:ns1* admin:ns2"):
+    thr = ClientHandler(parent, None, ["10.0.0.1", 1000], False, "h2", True, None)
+    thr._lazy_cluster_nodes = [Env.nodename]
+    thr.log = mocker.MagicMock()
+    authenticate = mocker.patch.object(thr, "authenticate_client_basic", side_effect=lambda authorization: FakeUsr("usr1", grant))
+    return thr, authenticate
+
+
+@pytest.mark.ci
+class TestClientHandlerAuthCache:
+    @staticmethod
+    def test_get_all_ns(parent, mocker):
+        thr, _ = new_client(parent, mocker)
+        assert thr.get_all_ns() == set(["system", "ns1", "ns2"])
+        set_config("svc1", "csum")
+        assert thr.get_all_ns() == set(["root", "system", "ns1", "ns2"])
+
+    @staticmethod
+    def test_connections_share_the_authentication(parent, mocker):
+        thr1, authenticate1 = new_client(parent, mocker)
+        thr1.authenticate_client({"authorization": AUTHORIZATION})
+        assert authenticate1.call_count == 1
+        assert thr1.usr_grants["guest"] == set(["ns1", "ns2"])
+        assert thr1.get_namespaces() == set(["ns1", "ns2"])
+
+        thr2, authenticate2 = new_client(parent, mocker)
+        thr2.authenticate_client({"authorization": AUTHORIZATION})
+        assert authenticate2.call_count == 0
+        assert thr2.usr is thr1.usr
+        assert thr2.usr_auth == "basic"
+        assert thr2.usr_grants == thr1.usr_grants
+
+    @staticmethod
+    def test_other_credential_is_authenticated(parent, mocker):
+        thr1, _ = new_client(parent, mocker)
+        thr1.authenticate_client({"authorization": AUTHORIZATION})
+        thr2, authenticate2 = new_client(parent, mocker)
+        thr2.authenticate_client({"authorization": "Basic " + base64.b64encode(b"usr1:wrong").decode()})
+        assert authenticate2.call_count == 1
+
+    @staticmethod
+    def test_usr_config_change_invalidates_the_cache(parent, mocker):
+        thr1, _ = new_client(parent, mocker)
+        thr1.authenticate_client({"authorization": AUTHORIZATION})
+        set_config("system/usr/usr1", "csum2")
+        thr2, authenticate2 = new_client(parent, mocker, grant="admin:ns1")
+        thr2.authenticate_client({"authorization": AUTHORIZATION})
+        assert authenticate2.call_count == 1
+        assert thr2.usr_grants["admin"] == set(["ns1"])
+
+    @staticmethod
+    def test_new_namespace_invalidates_the_cache(parent, mocker):
+        thr1, _ = new_client(parent, mocker)
+        thr1.authenticate_client({"authorization": AUTHORIZATION})
+        set_config("ns10/svc/svc1", "csum")
+        thr2, authenticate2 = new_client(parent, mocker)
+        thr2.authenticate_client({"authorization": AUTHORIZATION})
+        assert authenticate2.call_count == 1
+        assert thr2.usr_grants["guest"] == set(["ns1", "ns10", "ns2"])
+
+    @staticmethod
+    def test_failed_authentication_is_not_cached(parent, mocker):
+        thr, authenticate = new_client(parent, mocker)
+        authenticate.side_effect = Exception("wrong password")
+        with pytest.raises(Exception):
+            thr.authenticate_client({"authorization": AUTHORIZATION})
+        assert parent.auth_cache.entries == {}
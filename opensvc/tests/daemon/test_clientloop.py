@@ -0,0 +1,318 @@
+import json
+import os
+import shutil
+import socket
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+
+import pytest
+
+import daemon.clientloop as clientloop
+from daemon.clientloop import ClientLoop, ClientWorkers
+from daemon.listener import ClientHandler
+from utilities.storage import Storage
+
+
+def wait_for(fn, timeout=5):
+    limit = time.time() + timeout
+    while time.time() < limit:
+        if fn():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class Server(object):
+    """
+    A unix socket server feeding the accepted connections to the client
+    loop, like the listener does.
+    """
+    def __init__(self, mocker, scheme, size=2, tls_context=None):
+        self.tmpdir = tempfile.mkdtemp(dir="/tmp")
+        self.tls_context = tls_context
+        self.path = os.path.join(self.tmpdir, "lsnr.sock")
+        self.scheme = scheme
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(16)
+        self.parent = mocker.Mock()
+        self.parent.name = "listener"
+        self.parent.threads = []
+        self.parent.stats = Storage({"sessions": Storage({
+            "rx": 0,
+            "tx": 0,
+            "auth_validated": 0,
+            "alive": Storage(),
+            "clients": Storage({"local": Storage({"rx": 0, "tx": 0, "auth_validated": 0})}),
+        })})
+        self.workers = ClientWorkers(size=size)
+        self.parent.client_workers = self.workers
+        self.loop = ClientLoop(self.workers)
+        self.accepter = threading.Thread(target=self.accept)
+        self.accepter.daemon = True
+
+    def start(self):
+        self.workers.start()
+        self.loop.start()
+        self.accepter.start()
+
+    def stop(self):
+        self.loop.stop()
+        self.loop.join(5)
+        self.workers.stop()
+        self.sock.close()
+        shutil.rmtree(self.tmpdir)
+
+    def accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except (OSError, socket.error):
+                return
+            tls = self.tls_context is not None
+            thr = ClientHandler(self.parent, conn, ["local"], False, self.scheme, tls, self.tls_context)
+            thr.open_session()
+            self.loop.add(thr)
+
+    def alive(self):
+        return len(self.parent.stats.sessions.alive)
+
+
+@pytest.fixture(scope='function')
+def raw_server(mocker):
+    server = Server(mocker, "raw")
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(scope='function')
+def h2_server(mocker):
+    server = Server(mocker, "h2")
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(scope='function')
+def tls_server(mocker, tmp_path):
+    keyfile = str(tmp_path / "key.pem")
+    certfile = str(tmp_path / "cert.pem")
+    try:
+        subprocess.check_call(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                               "-subj", "/CN=localhost", "-keyout", keyfile, "-out", certfile],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip("openssl is required to generate the test certificate")
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certfile, keyfile)
+    context.set_alpn_protocols(["h2"])
+    server = Server(mocker, "h2", tls_context=context)
+    server.start()
+    yield server
+    server.stop()
+
+
+def raw_request(path, data):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    sock.sendall((json.dumps(data) + "\0").encode())
+    chunks = []
+    while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    sock.close()
+    return json.loads(b"".join(chunks).decode().rstrip("\0"))
+
+
+def h2_connection(path, tls=False):
+    import foreign.hyper as hyper
+    if not tls:
+        return hyper.HTTP20Connection(path, port=0, secure=False)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    context.set_alpn_protocols(["h2"])
+    return hyper.HTTP20Connection(path, port=0, secure=True, ssl_context=context)
+
+
+def h2_request(conn, path):
+    stream_id = conn.request("GET", path, headers={"Content-Length": "2"}, body=b"{}")
+    return json.loads(conn.get_response(stream_id).read().decode())
+
+
+@pytest.mark.ci
+class TestClientWorkers:
+    @staticmethod
+    def test_detached_worker_is_replaced():
+        pool = ClientWorkers(size=2)
+        pool.start()
+        release = threading.Event()
+        done = []
+
+        def blocking_job():
+            pool.detach()
+            release.wait(5)
+            done.append("blocking")
+
+        try:
+            pool.submit(blocking_job)
+            assert wait_for(lambda: pool.stats().detached == 1)
+            assert len(pool.workers) == 2
+            for idx in range(4):
+                pool.submit(done.append, idx)
+            assert wait_for(lambda: len(done) == 4)
+            release.set()
+            assert wait_for(lambda: "blocking" in done)
+            assert len(pool.workers) == 2
+        finally:
+            release.set()
+            pool.stop()
+
+    @staticmethod
+    def test_detach_outside_a_worker_is_noop():
+        pool = ClientWorkers(size=1)
+        assert pool.detach() is False
+        assert pool.stats().detached == 0
+
+
+@pytest.mark.ci
+class TestClientLoopRaw:
+    @staticmethod
+    def test_requests_are_served_by_the_workers(raw_server, mocker):
+        idents = set()
+
+        def router(self, nodename, data, **kwargs):
+            idents.add(threading.current_thread().name)
+            return {"status": 0, "data": data["options"]}
+
+        mocker.patch.object(ClientHandler, "router", router)
+        for idx in range(5):
+            result = raw_request(raw_server.path, {"action": "test", "options": {"idx": idx}})
+            assert result == {"status": 0, "data": {"idx": idx}}
+        assert all(name.startswith(ClientWorkers.name) for name in idents)
+        assert raw_server.parent.threads == []
+        assert wait_for(lambda: raw_server.alive() == 0)
+
+    @staticmethod
+    def test_concurrent_clients(raw_server, mocker):
+        def router(self, nodename, data, **kwargs):
+            time.sleep(0.05)
+            return {"status": 0, "data": data["options"]}
+
+        mocker.patch.object(ClientHandler, "router", router)
+        results = {}
+
+        def client(idx):
+            results[idx] = raw_request(raw_server.path, {"action": "test", "options": {"idx": idx}})
+
+        clients = [threading.Thread(target=client, args=(idx,)) for idx in range(20)]
+        for thr in clients:
+            thr.start()
+        for thr in clients:
+            thr.join(10)
+        assert sorted(results) == list(range(20))
+        assert all(results[idx]["data"]["idx"] == idx for idx in results)
+        assert len(raw_server.workers.workers) == 2
+
+    @staticmethod
+    def test_idle_connection_times_out(raw_server, mocker):
+        mocker.patch.object(clientloop, "SESSION_TIMEOUT", 0.2)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(raw_server.path)
+        sock.settimeout(5)
+        assert sock.recv(4096) == b""
+        sock.close()
+        assert wait_for(lambda: raw_server.alive() == 0)
+
+    @staticmethod
+    def test_stream_request_is_promoted_to_a_thread(raw_server, mocker):
+        def router(self, nodename, data, **kwargs):
+            return {"status": 0, "data": threading.current_thread() is self}
+
+        mocker.patch.object(ClientHandler, "router", router)
+        mocker.patch.object(ClientHandler, "raw_is_stream", lambda self, data: True)
+        result = raw_request(raw_server.path, {"action": "events"})
+        assert result == {"status": 0, "data": True}
+        assert len(raw_server.parent.threads) == 1
+
+
+@pytest.mark.ci
+class TestClientLoopH2:
+    @staticmethod
+    def test_connection_is_reused(h2_server, mocker):
+        def h2_router(self, stream_id):
+            return 200, "application/json", {"status": 0, "data": self.sid}
+
+        mocker.patch.object(ClientHandler, "h2_router", h2_router)
+        conn = h2_connection(h2_server.path)
+        try:
+            sids = set()
+            for _ in range(3):
+                result = h2_request(conn, "/test")
+                assert result["status"] == 0
+                sids.add(result["data"])
+                assert wait_for(lambda: len(h2_server.loop.sessions) == 1)
+            assert len(sids) == 1
+            assert h2_server.parent.threads == []
+        finally:
+            conn.close()
+        assert wait_for(lambda: h2_server.alive() == 0)
+
+    @staticmethod
+    def test_blocking_requests_do_not_starve_the_workers(h2_server, mocker):
+        release = threading.Event()
+
+        def h2_router(self, stream_id):
+            path = dict(self.streams[stream_id]["request"].headers)[b":path"]
+            if path == b"/block":
+                self.detach_worker()
+                release.wait(5)
+            return 200, "application/json", {"status": 0}
+
+        mocker.patch.object(ClientHandler, "h2_router", h2_router)
+        blocked = []
+        conns = [h2_connection(h2_server.path) for _ in range(3)]
+        try:
+            for conn in conns[:2]:
+                thr = threading.Thread(target=lambda conn=conn: blocked.append(h2_request(conn, "/block")))
+                thr.daemon = True
+                thr.start()
+            assert wait_for(lambda: h2_server.workers.stats().detached == 2)
+            assert h2_request(conns[2], "/test") == {"status": 0}
+            release.set()
+            assert wait_for(lambda: len(blocked) == 2)
+        finally:
+            release.set()
+            for conn in conns:
+                conn.close()
+
+    @staticmethod
+    def test_tls_handshake(tls_server, mocker):
+        mocker.patch.object(ClientHandler, "h2_router", lambda self, stream_id: (200, "application/json", {"status": 0}))
+        conns = [h2_connection(tls_server.path, tls=True) for _ in range(3)]
+        try:
+            for conn in conns:
+                assert h2_request(conn, "/test") == {"status": 0}
+            for conn in conns:
+                assert h2_request(conn, "/test") == {"status": 0}
+            assert wait_for(lambda: len(tls_server.loop.sessions) == 3)
+        finally:
+            for conn in conns:
+                conn.close()
+        assert wait_for(lambda: tls_server.alive() == 0)
+
+    @staticmethod
+    def test_tls_handshake_timeout(tls_server, mocker):
+        mocker.patch.object(clientloop, "SESSION_TIMEOUT", 0.2)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(tls_server.path)
+        sock.settimeout(5)
+        assert sock.recv(4096) == b""
+        sock.close()
+        assert wait_for(lambda: tls_server.alive() == 0)
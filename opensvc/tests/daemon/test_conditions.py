@@ -0,0 +1,161 @@
+import threading
+import time
+
+import pytest
+
+import core.exceptions as ex
+import daemon.conditions as conditions
+import daemon.shared as shared
+from daemon.conditions import (ConditionWatcher, compile_condition,
+                               compile_jsonpath, jsonpath_prefix)
+from daemon.handlers.wait.get import TICK, Handler
+
+
+def patch_event(*paths):
+    return {"kind": "patch", "data": [[path, "x"] for path in paths]}
+
+
+@pytest.fixture(scope='function')
+def status(mocker):
+    mocker.patch.object(shared, 'DAEMON_STATUS', shared.OsvcJournaledData())
+    mocker.patch.object(conditions, 'CONDITIONS', {})
+    shared.DAEMON_STATUS.set([], {"monitor": {"services": {
+        "svc1": {"avail": "down"},
+        "svc2": {"avail": "up"},
+    }}})
+    return shared.DAEMON_STATUS
+
+
+@pytest.mark.ci
+class TestCompile:
+    @staticmethod
+    @pytest.mark.parametrize("path, expected", [
+        ["$.monitor.services.svc1.avail", (["monitor", "services", "svc1", "avail"], True)],
+        ["monitor.services.'svc1'.avail", (["monitor", "services", "svc1", "avail"], True)],
+        ["monitor.nodes.*.services", (["monitor", "nodes"], False)],
+        ["$.monitor.services[?avail=up]", (["monitor", "services"], False)],
+        ["$.monitor.list[0].avail", (["monitor", "list", 0, "avail"], True)],
+        ["$..avail", ([], False)],
+    ])
+    def test_jsonpath_prefix(path, expected):
+        assert jsonpath_prefix(compile_jsonpath(path)) == expected
+
+    @staticmethod
+    def test_compiled_conditions_are_shared(status):
+        condition = compile_condition("!monitor.services.svc1.avail=up")
+        assert compile_condition("!monitor.services.svc1.avail=up") is condition
+        assert condition.neg
+        assert (condition.oper, condition.val) == ("=", "up")
+        assert condition.jsonpath_expr is compile_jsonpath("monitor.services.svc1.avail")
+
+    @staticmethod
+    def test_invalid_jsonpath():
+        with pytest.raises(ex.Error):
+            compile_condition("monitor.services[=up")
+
+    @staticmethod
+    def test_result_is_cached_until_the_prefix_data_changes(status, mocker):
+        condition = compile_condition("monitor.services.svc1.avail=up")
+        eval_condition = mocker.patch.object(conditions, "eval_condition", wraps=conditions.eval_condition)
+        assert not condition.satisfied(status.get())
+        status.set(["monitor", "services", "svc2", "avail"], "down")
+        assert not condition.satisfied(status.get())
+        assert eval_condition.call_count == 1
+        status.set(["monitor", "services", "svc1", "avail"], "up")
+        assert condition.satisfied(status.get())
+        assert eval_condition.call_count == 2
+
+
+@pytest.mark.ci
+class TestConditionWatcher:
+    @staticmethod
+    def test_only_touched_conditions_are_evaluated(status, mocker):
+        watcher = ConditionWatcher()
+        waiter1 = watcher.register("monitor.services.svc1.avail=up")
+        waiter2 = watcher.register("monitor.services.*.avail=up")
+        waiter3 = watcher.register("monitor.nodes.n1.frozen")
+        assert watcher.touched([["monitor", "services", "svc1", "avail"]]) == set([waiter1, waiter2])
+        assert watcher.touched([["monitor", "services", "svc2"]]) == set([waiter2])
+        assert watcher.touched([["monitor"]]) == set([waiter1, waiter2, waiter3])
+        assert watcher.touched([["cluster", "name"]]) == set()
+
+        satisfied = mocker.patch.object(conditions.Condition, "satisfied", wraps=conditions.Condition.satisfied, autospec=True)
+        watcher.notify(patch_event(["cluster", "name"]), status.get())
+        assert satisfied.call_count == 0
+
+        status.set(["monitor", "services", "svc1", "avail"], "up")
+        watcher.notify(patch_event(["monitor", "services", "svc1", "avail"]), status.get())
+        assert satisfied.call_count == 2
+        assert waiter1.event.is_set()
+        assert waiter2.event.is_set()
+        assert not waiter3.event.is_set()
+
+    @staticmethod
+    def test_waiters_of_a_condition_share_the_evaluation(status, mocker):
+        watcher = ConditionWatcher()
+        waiters = [watcher.register("!monitor.services.svc2.avail=up") for _ in range(10)]
+        satisfied = mocker.patch.object(conditions.Condition, "satisfied", wraps=conditions.Condition.satisfied, autospec=True)
+        status.set(["monitor", "services", "svc2", "avail"], "down")
+        watcher.notify(patch_event(["monitor", "services", "svc2", "avail"]), status.get())
+        assert satisfied.call_count == 1
+        assert all(waiter.event.is_set() for waiter in waiters)
+
+    @staticmethod
+    def test_unregister_prunes_the_tree(status):
+        watcher = ConditionWatcher()
+        waiter1 = watcher.register("monitor.services.svc1.avail=up")
+        waiter2 = watcher.register("monitor.services.svc1.avail=up")
+        watcher.unregister(waiter1)
+        assert watcher.all() == set([waiter2])
+        watcher.unregister(waiter2)
+        assert watcher.root.children == {}
+        assert watcher.all() == set()
+
+    @staticmethod
+    def test_event_messages(status):
+        watcher = ConditionWatcher()
+        waiter1 = watcher.register("data.path=svc1")
+        waiter2 = watcher.register("!data.path=svc1")
+        watcher.notify({"kind": "event", "data": {"path": "svc2"}}, status.get())
+        assert not waiter1.event.is_set()
+        watcher.notify({"kind": "event", "data": {"path": "svc1"}}, status.get())
+        assert waiter1.event.is_set()
+        assert not waiter2.event.is_set()
+
+
+@pytest.mark.ci
+class TestWaitHandler:
+    @staticmethod
+    @pytest.fixture(scope='function')
+    def thr(mocker, status):
+        thr = mocker.Mock()
+        thr.parent.waiters = ConditionWatcher()
+        thr.daemon_status_data = status
+        return thr
+
+    @staticmethod
+    def test_satisfied(thr):
+        result = Handler().action(None, thr=thr, options={"condition": "monitor.services.svc2.avail=up"})
+        assert result["status"] == 0
+        assert result["data"]["satisfied"]
+        assert thr.parent.waiters.all() == set()
+
+    @staticmethod
+    def test_timeout(thr):
+        result = Handler().action(None, thr=thr, options={"condition": "monitor.services.svc1.avail=up", "duration": "1s"})
+        assert result["status"] == 1
+        assert not result["data"]["satisfied"]
+        assert thr.parent.waiters.all() == set()
+
+    @staticmethod
+    def test_waiter_is_woken_up_by_the_patch_event(thr, status):
+        def change():
+            time.sleep(0.2)
+            status.set(["monitor", "services", "svc1", "avail"], "up")
+            thr.parent.waiters.notify(patch_event(["monitor", "services", "svc1", "avail"]), status.get())
+        changer = threading.Thread(target=change)
+        changer.start()
+        result = Handler().action(None, thr=thr, options={"condition": "monitor.services.svc1.avail=up"})
+        changer.join()
+        assert result["status"] == 0
+        assert result["data"]["elapsed"] < TICK
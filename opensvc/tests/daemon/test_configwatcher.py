@@ -0,0 +1,140 @@
+import os
+
+import pytest
+
+import daemon.monitor
+import daemon.shared as shared
+from daemon.configwatcher import ConfigWatcher, cf_path
+from daemon.main import Daemon
+from daemon.monitor import Monitor
+from env import Env
+
+
+def write_conf(fpath):
+    d = os.path.dirname(fpath)
+    if not os.path.exists(d):
+        os.makedirs(d)
+    with open(fpath, "w") as ofile:
+        ofile.write("[DEFAULT]\n")
+
+
+@pytest.fixture(scope='function')
+def etc(osvc_path_tests):
+    if not os.path.exists(Env.paths.pathetc):
+        os.makedirs(Env.paths.pathetc)
+    return Env.paths.pathetc
+
+
+@pytest.fixture(scope='function')
+def watcher(etc):
+    try:
+        watcher = ConfigWatcher()
+    except OSError:
+        pytest.skip("inotify not supported")
+    yield watcher
+    watcher.close()
+
+
+@pytest.mark.ci
+class TestCfPath:
+    @staticmethod
+    @pytest.mark.parametrize("relpath, expected", [
+        ["svc1.conf", "svc1"],
+        ["cluster.conf", "cluster"],
+        ["vol/vol1.conf", "vol/vol1"],
+        ["sec/sec1.conf", "sec/sec1"],
+        ["namespaces/ns1/svc/svc1.conf", "ns1/svc/svc1"],
+        ["namespaces/ns1/namespace.conf", "ns1/"],
+        ["node.conf", None],
+        ["svc1.conf.tmp", None],
+        ["foo/svc1.conf", None],
+        ["namespaces/ns1/svc/foo/svc1.conf", None],
+    ])
+    def test_cf_path(osvc_path_tests, relpath, expected):
+        assert cf_path(os.path.join(Env.paths.pathetc, relpath)) == expected
+
+
+@pytest.mark.ci
+class TestConfigWatcher:
+    @staticmethod
+    def test_reports_root_config_changes(watcher, etc):
+        assert watcher.changes() == set()
+        fpath = os.path.join(etc, "svc1.conf")
+        write_conf(fpath)
+        assert watcher.changes() == set([fpath])
+        assert watcher.changes() == set()
+        os.utime(fpath, (1, 1))
+        assert watcher.changes() == set([fpath])
+        os.unlink(fpath)
+        assert watcher.changes() == set([fpath])
+
+    @staticmethod
+    def test_reports_renamed_config(watcher, etc):
+        tmpfpath = os.path.join(etc, "svc1.tmp")
+        fpath = os.path.join(etc, "svc1.conf")
+        write_conf(tmpfpath)
+        os.rename(tmpfpath, fpath)
+        assert watcher.changes() == set([fpath])
+
+    @staticmethod
+    def test_new_namespace_requires_a_rescan(watcher):
+        fpath = os.path.join(Env.paths.pathetcns, "ns1", "svc", "svc1.conf")
+        write_conf(fpath)
+        assert watcher.changes() is None
+        with open(fpath, "a") as ofile:
+            ofile.write("nodes = *\n")
+        assert watcher.changes() == set([fpath])
+
+
+@pytest.fixture(scope='function')
+def monitor(mocker, etc, shared_data, has_cluster_config):
+    mocker.patch.object(shared, 'DAEMON', Daemon())
+    monitor = Monitor()
+    monitor.log = mocker.Mock()
+    monitor.node_data.set([], {"services": {"config": {}, "status": {}}})
+
+    def update_service_config(path):
+        if not os.path.exists(daemon.monitor.svc_pathcf(path)):
+            return
+        return {"updated": 1, "csum": path, "scope": [Env.nodename]}
+
+    mocker.patch.object(monitor, "update_service_config", side_effect=update_service_config)
+    return monitor
+
+
+@pytest.mark.ci
+class TestMonitorUpdateServicesConfig:
+    @staticmethod
+    def test_sweep_without_watcher(monitor, etc, mocker):
+        list_services = mocker.patch.object(daemon.monitor, "list_services", wraps=daemon.monitor.list_services)
+        write_conf(os.path.join(etc, "svc1.conf"))
+        assert list(monitor.update_services_config()) == ["cluster", "svc1"]
+        assert list(monitor.update_services_config()) == ["cluster", "svc1"]
+        assert list_services.call_count == 2
+
+    @staticmethod
+    def test_watched_changes_only(monitor, etc, mocker):
+        write_conf(os.path.join(etc, "svc1.conf"))
+        write_conf(os.path.join(etc, "svc2.conf"))
+        try:
+            monitor.init_config_watcher()
+        except OSError:
+            pytest.skip("inotify not supported")
+        if monitor.config_watcher is None:
+            pytest.skip("inotify not supported")
+        list_services = mocker.patch.object(daemon.monitor, "list_services", wraps=daemon.monitor.list_services)
+
+        assert sorted(monitor.update_services_config()) == ["cluster", "svc1", "svc2"]
+        assert list_services.call_count == 1
+        assert monitor.update_service_config.call_count == 3
+
+        write_conf(os.path.join(etc, "svc3.conf"))
+        os.unlink(os.path.join(etc, "svc1.conf"))
+        assert sorted(monitor.update_services_config()) == ["cluster", "svc2", "svc3"]
+        assert list_services.call_count == 1
+        assert monitor.update_service_config.call_count == 5
+
+        monitor.last_config_sweep = 0
+        assert sorted(monitor.update_services_config()) == ["cluster", "svc2", "svc3"]
+        assert list_services.call_count == 2
+        monitor.stop_config_watcher()
@@ -0,0 +1,219 @@
+import datetime
+import time
+
+import pytest
+
+import daemon.shared as shared
+from daemon.scheduler import Scheduler
+from env import Env
+from utilities.storage import Storage
+
+NODE_CSUM = "ncsum"
+
+
+class FakeSchedule(object):
+    def __init__(self, interval):
+        self.interval = interval
+
+    def get_next(self, now, last):
+        if not last:
+            last = now - self.interval / 2
+        return datetime.datetime.fromtimestamp(last + self.interval), self.interval
+
+
+class FakeSched(object):
+    def __init__(self, n_tasks, interval):
+        self.actions = {}
+        self.configured = 0
+        for idx in range(n_tasks):
+            action = "action%d" % idx
+            self.actions[action] = [Storage(
+                section="DEFAULT" if idx % 2 else "task#%d" % idx,
+                schedule_option=action + "_schedule",
+                fname="last_" + action,
+                req_collector=False,
+            )]
+        self.schedule = FakeSchedule(interval)
+
+    def configure(self):
+        self.configured += 1
+
+    def get_schedule(self, section, option):
+        return self.schedule
+
+    @staticmethod
+    def get_last(fname):
+        return
+
+
+class FakeResource(object):
+    def __init__(self):
+        self.checks = 0
+
+    def check_requires(self, action, cluster_data=None):
+        self.checks += 1
+
+
+class FakeSvc(object):
+    def __init__(self, path, n_tasks=10, interval=600):
+        self.path = path
+        self.peers = [Env.nodename]
+        self.options = Storage()
+        self.sched = FakeSched(n_tasks, interval)
+        self.resource = FakeResource()
+
+    def get_resource(self, rid):
+        return self.resource
+
+
+class FakeNode(object):
+    def __init__(self):
+        self.sched = Storage(actions={})
+        self.options = Storage()
+        self.max_parallel = 10
+        self.collector_env = Storage(dbopensvc=None)
+
+
+def set_config(path, csum):
+    shared.DAEMON_STATUS.set(["monitor", "nodes", Env.nodename, "services", "config", path], {"csum": csum})
+
+
+@pytest.fixture(scope='function')
+def scheduler(mocker):
+    mocker.patch.object(shared, 'DAEMON_STATUS', shared.OsvcJournaledData())
+    mocker.patch.object(shared, 'SERVICES', {})
+    mocker.patch.object(shared, 'NODE', FakeNode())
+    shared.DAEMON_STATUS.set([], {"monitor": {
+        "nodes": {Env.nodename: {
+            "config": {"csum": NODE_CSUM},
+            "monitor": {"status": "idle"},
+            "services": {"config": {}, "status": {}},
+        }},
+        "services": {},
+    }})
+    sched = Scheduler()
+    sched.log = mocker.Mock()
+    sched._lazy_privlog = mocker.Mock()
+    for attr in ("delayed", "blacklist", "lasts", "session_ids", "sched_keys"):
+        setattr(sched, attr, {})
+    sched.delayed_heap = []
+    sched.running = set()
+    sched.dropped_via_notify = set()
+    sched.sched_dirty = set()
+    sched.exec_action = mocker.Mock()
+    return sched
+
+
+def add_services(n_objects, n_tasks=10, interval=600):
+    for idx in range(n_objects):
+        path = "svc%d" % idx
+        shared.SERVICES[path] = FakeSvc(path, n_tasks=n_tasks, interval=interval)
+        set_config(path, "csum")
+        shared.DAEMON_STATUS.set(["monitor", "services", path], {"provisioned": True})
+
+
+@pytest.mark.ci
+class TestScheduler:
+    @staticmethod
+    def test_queues_all_tasks(scheduler):
+        add_services(3)
+        scheduler.run_scheduler(time.time())
+        assert len(scheduler.delayed) == 30
+        assert ("action0", "svc0", "task#0") in scheduler.delayed
+        assert ("action1", "svc0", None) in scheduler.delayed
+
+    @staticmethod
+    def test_dequeues_due_tasks_in_queued_order(scheduler):
+        add_services(2, n_tasks=2, interval=600)
+        now = time.time()
+        scheduler.run_scheduler(now)
+        assert scheduler.get_todo(now) == []
+        assert scheduler.next_expire(now) == pytest.approx(now + 300, abs=1)
+        scheduler.dequeue_actions(now + 301)
+        assert scheduler.exec_action.call_count == 4
+        assert scheduler.delayed == {}
+
+    @staticmethod
+    def test_open_slots_limit_the_dequeued_tasks(scheduler):
+        add_services(10, n_tasks=2, interval=600)
+        now = time.time()
+        scheduler.run_scheduler(now)
+        scheduler.dequeue_actions(now + 301)
+        assert scheduler.exec_action.call_count == 10
+        assert len(scheduler.delayed) == 10
+        scheduler.dequeue_actions(now + 301)
+        assert scheduler.exec_action.call_count == 20
+        assert scheduler.delayed == {}
+
+    @staticmethod
+    def test_promoted_task_is_due_now(scheduler):
+        add_services(1, n_tasks=1, interval=600)
+        now = time.time()
+        scheduler.run_scheduler(now)
+        scheduler.queue_action("action0", 0, "svc0", "task#0", now=now + 1, csum="csum")
+        assert scheduler.next_expire(now + 1) == now + 1
+        assert [task["sigs"] for task in scheduler.get_todo(now + 1)] == [[("action0", "svc0", "task#0")]]
+
+    @staticmethod
+    def test_unchanged_objects_are_not_recomputed(scheduler, mocker):
+        add_services(3)
+        now = time.time()
+        scheduler.run_scheduler(now)
+        get_lasts = mocker.patch.object(scheduler, "get_lasts", return_value={})
+        scheduler.run_scheduler(now + 10)
+        assert get_lasts.call_count == 0
+
+    @staticmethod
+    def test_config_change_reschedules_the_object(scheduler, mocker):
+        add_services(3)
+        now = time.time()
+        scheduler.run_scheduler(now)
+        shared.SERVICES["svc1"] = FakeSvc("svc1", n_tasks=1, interval=60)
+        set_config("svc1", "csum2")
+        get_lasts = mocker.patch.object(scheduler, "get_lasts", return_value={})
+        scheduler.run_scheduler(now + 10)
+        assert get_lasts.call_count == 1
+        assert len([sig for sig in scheduler.delayed if sig[1] == "svc1"]) == 1
+        assert scheduler.delayed[("action0", "svc1", "task#0")]["expire"] == pytest.approx(now + 10 + 30, abs=1)
+
+    @staticmethod
+    def test_deleted_object_tasks_are_dropped(scheduler):
+        add_services(3)
+        now = time.time()
+        scheduler.run_scheduler(now)
+        del shared.SERVICES["svc1"]
+        scheduler.run_scheduler(now + 10)
+        assert len(scheduler.delayed) == 20
+        assert not [sig for sig in scheduler.delayed if sig[1] == "svc1"]
+
+    @staticmethod
+    def test_ran_task_is_rescheduled(scheduler, mocker):
+        add_services(3, n_tasks=1)
+        now = time.time()
+        scheduler.run_scheduler(now)
+        scheduler.dequeue_actions(now + 301)
+        assert scheduler.delayed == {}
+        get_lasts = mocker.patch.object(scheduler, "get_lasts", return_value={})
+        scheduler.run_scheduler(now + 310)
+        assert get_lasts.call_count == 3
+        assert len(scheduler.delayed) == 3
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize('n_objects, n_tasks', [(5000, 10)])
+class TestSchedulerBenchmark(object):
+    @staticmethod
+    def test_run_scheduler(scheduler, n_objects, n_tasks):
+        add_services(n_objects, n_tasks=n_tasks, interval=3600)
+        now = time.time()
+        begin = time.time()
+        scheduler.run_scheduler(now)
+        first = time.time() - begin
+        assert len(scheduler.delayed) == n_objects * n_tasks
+
+        begin = time.time()
+        for tick in range(1, 11):
+            scheduler.run_scheduler(now + tick * 10)
+            scheduler.dequeue_actions(now + tick * 10)
+        steady = (time.time() - begin) / 10
+        print("%d objects x %d tasks: first run %.3fs, steady tick %.4fs" % (n_objects, n_tasks, first, steady))
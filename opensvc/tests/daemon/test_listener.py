@@ -0,0 +1,179 @@
+import json
+import time
+
+import pytest
+
+# noinspection PyUnresolvedReferences
+from foreign.six.moves import queue
+import daemon.shared as shared
+from daemon.listener import ClientHandler, Listener, SharedEvent
+from env import Env
+from utilities.storage import Storage
+
+
+PATCH_EVENT = {
+    "kind": "patch",
+    "id": 1,
+    "data": [
+        [["monitor", "services", "ns1/svc/s1"], {"avail": "up"}],
+        [["monitor", "services", "ns2/svc/s2"], {"avail": "up"}],
+    ],
+}
+
+
+class Client(object):
+    h2conn = None
+    events_stream_ids = []
+
+    def __init__(self, usr=False, usr_grants=None, selector=None, namespaces=None):
+        self.usr = usr
+        self.usr_grants = usr_grants if usr_grants is not None else {"root": None}
+        self.selector = selector
+        self.namespaces = namespaces
+        self.event_queue = queue.Queue()
+        self.sid = str(id(self))
+
+    def get_namespaces(self):
+        return set(self.namespaces)
+
+
+@pytest.fixture(scope='function')
+def listener(mocker):
+    thr = Listener()
+    thr.log = mocker.MagicMock()
+    thr.events_clients = []
+    thr.stats = Storage({
+        "sessions": Storage({"alive": Storage({})}),
+        "events": Storage({
+            "received": 0,
+            "sent": 0,
+            "rate": 0.0,
+            "classes": 0,
+            "fanout_time": 0.0,
+            "last_fanout_time": 0.0,
+        }),
+    })
+    mocker.patch.object(thr, 'object_selector', side_effect=lambda selector=None, namespaces=None, paths=None, **kwargs: [
+        path for path in paths if path.split("/")[0] in namespaces
+    ])
+    return thr
+
+
+def add_clients(listener, clients):
+    for client in clients:
+        listener.events_clients.append(client)
+        listener.threads.append(client)
+
+
+@pytest.mark.ci
+class TestListenerFanoutEvent:
+    @staticmethod
+    def test_root_clients_share_the_unfiltered_event(listener):
+        clients = [Client(), Client()]
+        add_clients(listener, clients)
+        listener.fanout_event(PATCH_EVENT)
+        events = [client.event_queue.get(False) for client in clients]
+        assert events[0] is events[1]
+        assert events[0].data is PATCH_EVENT
+        assert listener.stats.events.sent == 2
+        assert listener.stats.events.classes == 1
+
+    @staticmethod
+    def test_clients_with_same_grants_share_the_filtered_event(listener, mocker):
+        clients = [
+            Client(usr=True, usr_grants={}, selector="**", namespaces=["ns1"]),
+            Client(usr=True, usr_grants={}, selector="**", namespaces=["ns1"]),
+            Client(usr=True, usr_grants={}, selector="**", namespaces=["ns2"]),
+        ]
+        add_clients(listener, clients)
+        filter_event = mocker.spy(listener, 'filter_event')
+        listener.fanout_event(PATCH_EVENT)
+        events = [client.event_queue.get(False) for client in clients]
+        assert filter_event.call_count == 2
+        assert events[0] is events[1]
+        assert events[0].data["data"] == [[["monitor", "services", "ns1/svc/s1"], {"avail": "up"}]]
+        assert events[2].data["data"] == [[["monitor", "services", "ns2/svc/s2"], {"avail": "up"}]]
+        assert listener.stats.events.classes == 2
+
+    @staticmethod
+    def test_filter_does_not_change_the_event(listener):
+        event = json.loads(json.dumps(PATCH_EVENT))
+        client = Client(usr=True, usr_grants={}, selector="**", namespaces=["ns1"])
+        listener.filter_event(event, client)
+        assert event == PATCH_EVENT
+
+    @staticmethod
+    def test_drop_clients_no_longer_running(listener):
+        client = Client()
+        listener.events_clients.append(client)
+        listener.fanout_event(PATCH_EVENT)
+        assert listener.events_clients == []
+        assert client.event_queue.empty()
+
+
+@pytest.mark.ci
+class TestSharedEvent:
+    @staticmethod
+    def test_encodings_are_cached(mocker):
+        fn = mocker.MagicMock(return_value=b"encoded")
+        event = SharedEvent({"kind": "event"})
+        assert event.encode("raw", fn) == b"encoded"
+        assert event.encode("raw", fn) == b"encoded"
+        assert fn.call_count == 1
+        assert event.json() == json.dumps({"kind": "event"})
+
+
+class PeerHandler(object):
+    routes = (("GET", "test"),)
+    stream = False
+    multiplex_timeout = 0.5
+
+    @staticmethod
+    def action(nodename, **kwargs):
+        return {"status": 0, "data": nodename}
+
+
+@pytest.fixture(scope='function')
+def client_handler(mocker):
+    thr = ClientHandler(mocker.MagicMock(), None, ["local"], False, "raw", False, None)
+    thr.log = mocker.MagicMock()
+    mocker.patch.object(thr, 'nodes_data')
+    mocker.patch.object(shared, 'NODE')
+    return thr
+
+
+@pytest.mark.ci
+class TestClientHandlerMultiplex:
+    @staticmethod
+    def test_peers_are_requested_concurrently(client_handler, mocker):
+        peers = ["peer%d" % i for i in range(8)]
+        shared.NODE.nodes_selector.return_value = [Env.nodename] + peers
+
+        def daemon_request(data, server=None, **kwargs):
+            time.sleep(0.2)
+            return {"status": 1 if server == "peer1" else 0, "data": server}
+
+        mocker.patch.object(client_handler, 'daemon_request', side_effect=daemon_request)
+        begin = time.time()
+        result = client_handler.multiplex("*", PeerHandler(), {}, {}, Env.nodename, "test")
+        assert time.time() - begin < 1.0
+        assert sorted(result["nodes"]) == sorted([Env.nodename] + peers)
+        assert result["status"] == 1
+        for nodename in [Env.nodename] + peers:
+            assert result["nodes"][nodename]["data"] == nodename
+            assert "elapsed" in result["nodes"][nodename]
+
+    @staticmethod
+    def test_slow_peer_result_is_a_timeout(client_handler, mocker):
+        shared.NODE.nodes_selector.return_value = ["peer1", "peer2"]
+
+        def daemon_request(data, server=None, **kwargs):
+            if server == "peer2":
+                time.sleep(2)
+            return {"status": 0, "data": server}
+
+        mocker.patch.object(client_handler, 'daemon_request', side_effect=daemon_request)
+        result = client_handler.multiplex("*", PeerHandler(), {}, {}, Env.nodename, "test")
+        assert result["nodes"]["peer1"]["data"] == "peer1"
+        assert result["nodes"]["peer2"]["error"] == "timeout"
+        assert result["status"] == 1
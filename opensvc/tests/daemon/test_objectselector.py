@@ -0,0 +1,194 @@
+import time
+
+import pytest
+
+import daemon.objectselector as objectselector
+import daemon.shared as shared
+from daemon.objectselector import ObjectIndex, compile_selector
+from env import Env
+
+PEER = "peer1"
+
+
+class FakeSvc(object):
+    def __init__(self, app):
+        self.app = app
+
+    def _get(self, param, evaluate=True):
+        if param == "env.app":
+            return self.app
+
+    @staticmethod
+    def conf_sections():
+        return ["DEFAULT", "env"]
+
+
+def set_object(path, avail="up", nodes=(Env.nodename,), app="web"):
+    for nodename in nodes:
+        base = ["monitor", "nodes", nodename, "services"]
+        shared.DAEMON_STATUS.set(base + ["config", path], {"csum": "abc"})
+        shared.DAEMON_STATUS.set(base + ["status", path], {"avail": avail})
+    shared.DAEMON_STATUS.set(["monitor", "services", path], {"avail": avail})
+    shared.SERVICES[path] = FakeSvc(app)
+
+
+def del_object(path):
+    for nodename in (Env.nodename, PEER):
+        for key in ("config", "status"):
+            shared.DAEMON_STATUS.unset_safe(["monitor", "nodes", nodename, "services", key, path])
+    shared.DAEMON_STATUS.unset_safe(["monitor", "services", path])
+    shared.SERVICES.pop(path, None)
+
+
+@pytest.fixture(scope='function')
+def thr(mocker):
+    mocker.patch.object(shared, 'DAEMON_STATUS', shared.OsvcJournaledData())
+    mocker.patch.object(shared, 'SERVICES', {})
+    mocker.patch.object(shared, 'OBJECT_INDEX', ObjectIndex())
+    shared.DAEMON_STATUS.set([], {"monitor": {
+        "nodes": {
+            Env.nodename: {"services": {"config": {}, "status": {}}},
+            PEER: {"services": {"config": {}, "status": {}}},
+        },
+        "services": {},
+    }})
+    thr = shared.OsvcThread()
+    thr._lazy_cluster_nodes = [Env.nodename, PEER]
+    return thr
+
+
+@pytest.fixture(scope='function')
+def objects(thr):
+    set_object("svc1")
+    set_object("svc2", avail="down", app="db")
+    set_object("vol/vol1")
+    set_object("ns1/svc/web1", nodes=(PEER,))
+    set_object("ns1/svc/web2", avail="down")
+    set_object("ns1/cfg/cfg1")
+    set_object("ns2/svc/web1")
+
+
+def select(thr, selector, namespaces=("root", "ns1", "ns2"), **kwargs):
+    return sorted(thr.object_selector(selector, namespaces=set(namespaces), **kwargs))
+
+
+@pytest.mark.ci
+@pytest.mark.usefixtures("objects")
+class TestObjectSelector:
+    @staticmethod
+    @pytest.mark.parametrize("selector, expected", [
+        ["**", ["ns1/cfg/cfg1", "ns1/svc/web1", "ns1/svc/web2", "ns2/svc/web1", "svc1", "svc2", "vol/vol1"]],
+        ["*", ["ns1/svc/web1", "ns1/svc/web2", "ns2/svc/web1", "svc1", "svc2"]],
+        ["svc1", ["svc1"]],
+        ["svc*", ["svc1", "svc2"]],
+        ["!svc1", ["ns1/cfg/cfg1", "ns1/svc/web1", "ns1/svc/web2", "ns2/svc/web1", "svc2", "vol/vol1"]],
+        ["ns1/**", ["ns1/cfg/cfg1", "ns1/svc/web1", "ns1/svc/web2"]],
+        ["**/web1", ["ns1/svc/web1", "ns2/svc/web1"]],
+        ["vol/*", ["vol/vol1"]],
+        ["*/svc/web*+ns1/**", ["ns1/svc/web1", "ns1/svc/web2"]],
+        ["svc1,ns2/svc/web1,svc1", ["ns2/svc/web1", "svc1"]],
+        ["svc1+svc2", []],
+        [".avail=down", ["ns1/svc/web2", "svc2"]],
+        ["$.nodes.%s.status.avail=up" % PEER, ["ns1/svc/web1"]],
+        ["env.app=db", ["svc2"]],
+        ["!env.app=web", ["svc2"]],
+        ["svc*+.avail=up", ["svc1"]],
+        ["", []],
+        ["avail>up", []],
+    ])
+    def test_selector(thr, selector, expected):
+        assert select(thr, selector) == expected
+
+    @staticmethod
+    def test_namespaces_restrict_the_globs(thr):
+        assert select(thr, "**", namespaces=["ns1"]) == ["ns1/cfg/cfg1", "ns1/svc/web1", "ns1/svc/web2"]
+        assert select(thr, "**", namespace="ns2", namespaces=["ns1"]) == []
+        assert select(thr, "*", namespaces=["root"]) == ["svc1", "svc2"]
+        assert select(thr, "**", namespaces=["ns1"], kind="cfg") == ["ns1/cfg/cfg1"]
+
+    @staticmethod
+    def test_match_object_selector(thr):
+        namespaces = set(["root", "ns1"])
+        assert thr.match_object_selector("svc*", namespaces=namespaces, path="svc1")
+        assert not thr.match_object_selector("svc*", namespaces=namespaces, path="ns1/svc/web1")
+        assert thr.match_object_selector(".avail=down", namespaces=namespaces, path="svc2")
+        assert not thr.match_object_selector("ns2/**", namespaces=namespaces, path="ns2/svc/web1")
+
+    @staticmethod
+    def test_index_follows_the_objects(thr):
+        assert "svc3" not in select(thr, "svc*")
+        set_object("svc3")
+        del_object("svc1")
+        assert select(thr, "svc*") == ["svc2", "svc3"]
+        assert "svc1" not in shared.OBJECT_INDEX.pds
+
+    @staticmethod
+    def test_status_change_invalidates_the_cached_match(thr, mocker):
+        assert select(thr, ".avail=down") == ["ns1/svc/web2", "svc2"]
+        status_match = mocker.patch.object(ObjectIndex, "_status_match", wraps=ObjectIndex._status_match)
+        assert select(thr, ".avail=down") == ["ns1/svc/web2", "svc2"]
+        assert status_match.call_count == 0
+        set_object("svc1", avail="down")
+        assert select(thr, ".avail=down") == ["ns1/svc/web2", "svc1", "svc2"]
+        assert status_match.call_count == 1
+
+    @staticmethod
+    def test_new_instance_invalidates_the_cached_match(thr, mocker):
+        assert select(thr, "env.app=db") == ["svc2"]
+        config_match = mocker.patch.object(objectselector, "selector_config_match",
+                                           wraps=objectselector.selector_config_match)
+        assert select(thr, "env.app=db") == ["svc2"]
+        assert config_match.call_count == 0
+        shared.SERVICES["svc1"] = FakeSvc("db")
+        assert select(thr, "env.app=db") == ["svc1", "svc2"]
+        assert config_match.call_count == 1
+
+    @staticmethod
+    def test_fragment_results_caches_are_bounded(thr, mocker):
+        mocker.patch.object(objectselector, "SELECTOR_CACHE_SIZE", 2)
+        for app in ("a", "b", "c"):
+            select(thr, "env.app=" + app)
+            select(thr, ".avail=" + app)
+        assert list(shared.OBJECT_INDEX.config_matches) == ["env.app=c"]
+        assert list(shared.OBJECT_INDEX.status_matches) == [".avail=c"]
+
+
+@pytest.mark.ci
+class TestCompileSelector:
+    @staticmethod
+    def test_compiled_selectors_are_cached():
+        compiled = compile_selector("svc*+.avail=up,!vol/*")
+        assert compile_selector("svc*+.avail=up,!vol/*") is compiled
+        assert [[fragment.raw for fragment in alternative] for alternative in compiled] == [["svc*", ".avail=up"], ["!vol/*"]]
+        glob, status = compiled[0]
+        assert glob.pattern == "svc*"
+        assert status.jsonpath_expr is not None
+        assert (status.op, status.value) == ("=", "up")
+        assert compiled[1][0].negate
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize('n_objects', [10000])
+class TestObjectSelectorBenchmark(object):
+    @staticmethod
+    def test_object_selector(thr, n_objects):
+        config = dict(("ns%d/svc/svc%d" % (idx % 100, idx), {"csum": "abc"}) for idx in range(n_objects))
+        status = dict((path, {"avail": "up"}) for path in config)
+        for nodename in (Env.nodename, PEER):
+            shared.DAEMON_STATUS.set(["monitor", "nodes", nodename, "services"], {"config": config, "status": status})
+        shared.DAEMON_STATUS.set(["monitor", "services"], status)
+        namespaces = set("ns%d" % idx for idx in range(100))
+        for selector in ("**", "ns1/svc/svc1*", ".avail=up"):
+            begin = time.time()
+            paths = thr.object_selector(selector, namespaces=set(namespaces))
+            first = time.time() - begin
+            begin = time.time()
+            for _ in range(10):
+                thr.object_selector(selector, namespaces=set(namespaces))
+            cached = (time.time() - begin) / 10
+            begin = time.time()
+            for path in list(config)[:1000]:
+                thr.match_object_selector(selector, namespaces=namespaces, path=path)
+            match = (time.time() - begin) / 1000
+            print("%d objects, %s: %d selected, first %.4fs, next %.4fs, match %.6fs" % (
+                n_objects, selector, len(paths), first, cached, match))
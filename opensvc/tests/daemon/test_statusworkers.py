@@ -0,0 +1,196 @@
+import os
+import time
+
+import pytest
+
+import daemon.statusworkers as statusworkers
+from daemon.statusworkers import StatusTask, StatusWorkers
+from env import Env
+
+CLUSTER_CONF = """[DEFAULT]
+id = 2c35dd38-4065-4a52-bd78-9a560e006374
+
+[cluster]
+nodes = %s
+secret = e0843584cab411f1a5aa02fc00000001
+"""
+
+
+def fake_eval_status(cache, path):
+    """
+    Record the evaluations in the worker cache, and make them observable
+    from the parent through the path name.
+    """
+    if path.startswith("sleep"):
+        time.sleep(float(path.split("=")[-1]))
+    elif path.startswith("fail"):
+        raise Exception("failed")
+    elif path.startswith("exit"):
+        raise SystemExit(2)
+    elif path.startswith("record"):
+        cache.setdefault("count", 0)
+        cache["count"] += 1
+        with open(path.split("=", 1)[-1], "a") as filep:
+            filep.write("%d %d\n" % (os.getpid(), cache["count"]))
+
+
+@pytest.fixture(scope='function')
+def workers(mocker):
+    mocker.patch.object(statusworkers, 'eval_status', fake_eval_status)
+    pool = StatusWorkers(size=2, timeout=5)
+    pool.start()
+    yield pool
+    pool.stop()
+
+
+@pytest.mark.ci
+class TestStatusTask:
+    @staticmethod
+    def test_empty_task_is_done():
+        task = StatusTask([])
+        assert task.exitcode == 0
+        assert not task.is_alive()
+
+    @staticmethod
+    def test_exitcode_reflects_errors():
+        task = StatusTask(["a", "b"])
+        assert task.exitcode is None
+        task.done("a")
+        assert task.exitcode is None
+        task.done("b", "failed")
+        assert task.exitcode == 1
+        assert task.wait(0)
+
+    @staticmethod
+    def test_terminate_completes_task():
+        task = StatusTask(["a"])
+        task.terminate()
+        assert not task.is_alive()
+        assert task.exitcode == 0
+
+
+@pytest.mark.ci
+class TestStatusWorkers:
+    @staticmethod
+    def test_workers_are_forked_on_start(workers):
+        assert workers.stats()["workers"] == 2
+        assert workers.stats()["busy"] == 0
+
+    @staticmethod
+    def test_task_completes(workers):
+        task = workers.submit(["ok1", "ok2", "ok3"])
+        assert task.wait(5)
+        assert task.exitcode == 0
+        stats = workers.stats()
+        assert stats["evals"] == 3
+        assert stats["errors"] == 0
+        assert stats["workers"] <= 2
+
+    @staticmethod
+    def test_errors_are_reported(workers):
+        task = workers.submit(["ok", "fail", "exit"])
+        assert task.wait(5)
+        assert task.exitcode == 1
+        assert workers.stats()["errors"] == 2
+        assert workers.object_stats("fail")["errors"] == 1
+        assert workers.object_stats("ok")["errors"] == 0
+
+    @staticmethod
+    def test_object_stats_record_timing(workers):
+        assert workers.submit(["sleep=0.2"]).wait(5)
+        stats = workers.object_stats("sleep=0.2")
+        assert stats["evals"] == 1
+        assert stats["last"] >= 0.2
+        assert stats["max"] == stats["last"]
+        assert workers.object_stats("unknown") is None
+
+    @staticmethod
+    def test_workers_are_reused(workers, tmp_path):
+        fpath = str(tmp_path / "record")
+        for _ in range(4):
+            assert workers.submit(["record=" + fpath]).wait(5)
+        with open(fpath) as filep:
+            lines = [line.split() for line in filep.read().splitlines()]
+        pids = set(line[0] for line in lines)
+        assert len(pids) <= 2
+        assert max(int(line[1]) for line in lines) > 1
+
+    @staticmethod
+    def test_concurrency_is_limited(workers):
+        paths = ["sleep%d=0.5" % i for i in range(4)]
+        begin = time.time()
+        task = workers.submit(paths)
+        time.sleep(0.2)
+        assert workers.stats()["busy"] == 2
+        assert task.wait(5)
+        assert time.time() - begin >= 1.0
+
+    @staticmethod
+    def test_queued_path_is_evaluated_once(workers):
+        task1 = workers.submit(["sleep=0.3"])
+        task2 = workers.submit(["sleep=0.3"])
+        assert task1.wait(5)
+        assert task2.wait(5)
+        assert workers.stats()["evals"] == 1
+
+    @staticmethod
+    def test_timeout_kills_worker(mocker):
+        mocker.patch.object(statusworkers, 'eval_status', fake_eval_status)
+        pool = StatusWorkers(size=1, timeout=0.5)
+        pool.start()
+        try:
+            task = pool.submit(["sleep=30"])
+            assert task.wait(5)
+            assert task.exitcode == 1
+            assert pool.stats()["timeouts"] == 1
+            task = pool.submit(["ok"])
+            assert task.wait(5)
+            assert task.exitcode == 0
+        finally:
+            pool.stop()
+
+    @staticmethod
+    def test_stop_terminates_pending_tasks(mocker):
+        mocker.patch.object(statusworkers, 'eval_status', fake_eval_status)
+        pool = StatusWorkers(size=1, timeout=30)
+        pool.start()
+        task = pool.submit(["sleep=0.5", "ok"])
+        pool.stop()
+        assert not task.is_alive()
+        assert pool.stats()["workers"] == 0
+
+
+@pytest.mark.ci
+@pytest.mark.usefixtures('osvc_path_tests')
+class TestEvalStatus:
+    @staticmethod
+    def write_config(osvc_path_tests, text):
+        etc = os.path.join(str(osvc_path_tests), "etc")
+        if not os.path.exists(etc):
+            os.makedirs(etc)
+        with open(os.path.join(etc, "svc1.conf"), "w") as filep:
+            filep.write(text)
+        fpath = os.path.join(etc, "cluster.conf")
+        if not os.path.exists(fpath):
+            # avoid a cluster.conf creation by the first evaluation
+            with open(fpath, "w") as filep:
+                filep.write(CLUSTER_CONF % Env.nodename)
+
+    def test_writes_status_and_caches_object(self, osvc_path_tests):
+        from utilities.naming import svc_pathvar
+        self.write_config(osvc_path_tests, "[DEFAULT]\nid = 8b1d5b1c-5c1e-4f2b-9b7a-2f3c0c0e4d10\nnodes = *\n")
+        cache = {}
+        statusworkers.eval_status(cache, "svc1")
+        assert os.path.exists(svc_pathvar("svc1", "status.json"))
+        obj = cache["objects"]["svc1"][1]
+        statusworkers.eval_status(cache, "svc1")
+        assert cache["objects"]["svc1"][1] is obj
+
+    def test_config_change_reloads_object(self, osvc_path_tests):
+        self.write_config(osvc_path_tests, "[DEFAULT]\nid = 8b1d5b1c-5c1e-4f2b-9b7a-2f3c0c0e4d10\nnodes = *\n")
+        cache = {}
+        statusworkers.eval_status(cache, "svc1")
+        obj = cache["objects"]["svc1"][1]
+        self.write_config(osvc_path_tests, "[DEFAULT]\nid = 8b1d5b1c-5c1e-4f2b-9b7a-2f3c0c0e4d10\nnodes = *\n\n[fs#1]\ntype = flag\n")
+        statusworkers.eval_status(cache, "svc1")
+        assert cache["objects"]["svc1"][1] is not obj
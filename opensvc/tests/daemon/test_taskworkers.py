@@ -0,0 +1,237 @@
+import os
+import time
+
+import pytest
+
+import daemon.shared as shared
+import daemon.taskworkers as taskworkers
+from daemon.scheduler import Scheduler
+from daemon.taskworkers import TaskRun, TaskWorkers
+from env import Env
+
+CLUSTER_CONF = """[DEFAULT]
+id = 2c35dd38-4065-4a52-bd78-9a560e006374
+
+[cluster]
+nodes = %s
+secret = e0843584cab411f1a5aa02fc00000001
+"""
+
+
+def fake_run_action(cache, path, action, rids, now, flag_launched, session_id):
+    """
+    Record the runs in the file named by the path, with the worker pid
+    and the number of requests served by the worker.
+    """
+    if action == "sleep":
+        time.sleep(0.3)
+    elif action == "fail":
+        raise Exception("failed")
+    elif action == "exit":
+        raise SystemExit(2)
+    elif action == "ret":
+        return 3
+    cache.setdefault("count", 0)
+    cache["count"] += 1
+    with open(path, "a") as filep:
+        filep.write("%d %s %s\n" % (os.getpid(), action, ",".join(rids or [])))
+    return 0
+
+
+def wait(runs, timeout=5):
+    limit = time.time() + timeout
+    while time.time() < limit:
+        if not [run for run in runs if run.is_alive()]:
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def new_run(action, rids=None):
+    return TaskRun(action, rids, time.time(), "/dev/null", "session")
+
+
+@pytest.fixture(scope='function')
+def workers(mocker):
+    mocker.patch.object(taskworkers, 'run_action', fake_run_action)
+    pool = TaskWorkers(size=2, timeout=5)
+    pool.start()
+    yield pool
+    pool.stop()
+
+
+@pytest.mark.ci
+class TestTaskRun:
+    @staticmethod
+    def test_quacks_like_a_process():
+        run = new_run("status", set(["fs#2", "fs#1"]))
+        assert run.is_alive()
+        assert run.exitcode is None
+        assert run.request()[:2] == ("status", ["fs#1", "fs#2"])
+        run.done(0)
+        assert not run.is_alive()
+        assert run.exitcode == 0
+
+    @staticmethod
+    def test_terminate_does_not_override_the_exitcode():
+        run = new_run("status")
+        run.done(1)
+        run.terminate()
+        assert run.exitcode == 1
+        run = new_run("status")
+        run.terminate()
+        assert run.exitcode < 0
+
+
+@pytest.mark.ci
+class TestTaskWorkers:
+    @staticmethod
+    def test_workers_are_forked_on_start(workers):
+        assert workers.stats()["workers"] == 2
+
+    @staticmethod
+    def test_exitcodes_are_reported(workers, tmp_path):
+        fpath = str(tmp_path / "record")
+        runs = [workers.submit(fpath, new_run(action)) for action in ("status", "fail", "exit", "ret")]
+        assert wait(runs)
+        assert [run.exitcode for run in runs] == [0, 1, 2, 3]
+        assert workers.stats()["errors"] == 1
+
+    @staticmethod
+    def test_runs_of_the_same_object_are_batched(workers, tmp_path):
+        fpath = str(tmp_path / "record")
+        runs = [new_run("status"), new_run("resource_monitor", ["app#1"])]
+        workers.submit_runs([(fpath, run) for run in runs])
+        assert wait(runs)
+        assert workers.stats()["evals"] == 1
+        with open(fpath) as filep:
+            lines = [line.split() for line in filep.read().splitlines()]
+        assert [line[1:] for line in lines] == [["status"], ["resource_monitor", "app#1"]]
+        assert len(set(line[0] for line in lines)) == 1
+
+    @staticmethod
+    def test_same_object_runs_are_serialized(workers, tmp_path):
+        fpath = str(tmp_path / "record")
+        run1 = workers.submit(fpath, new_run("sleep"))
+        time.sleep(0.1)
+        run2 = workers.submit(fpath, new_run("status"))
+        time.sleep(0.1)
+        assert workers.stats()["busy"] == 1
+        assert wait([run1, run2])
+        assert workers.stats()["evals"] == 2
+
+    @staticmethod
+    def test_stop_terminates_pending_runs(mocker, tmp_path):
+        mocker.patch.object(taskworkers, 'run_action', fake_run_action)
+        pool = TaskWorkers(size=1, timeout=30)
+        pool.start()
+        run1 = pool.submit(str(tmp_path / "a"), new_run("sleep"))
+        run2 = pool.submit(str(tmp_path / "b"), new_run("status"))
+        pool.stop()
+        assert not run1.is_alive()
+        assert not run2.is_alive()
+
+
+@pytest.mark.ci
+@pytest.mark.usefixtures('osvc_path_tests')
+class TestRunAction:
+    @staticmethod
+    def write_config(osvc_path_tests):
+        etc = os.path.join(str(osvc_path_tests), "etc")
+        if not os.path.exists(etc):
+            os.makedirs(etc)
+        with open(os.path.join(etc, "svc1.conf"), "w") as filep:
+            filep.write("[DEFAULT]\nid = 8b1d5b1c-5c1e-4f2b-9b7a-2f3c0c0e4d10\nnodes = *\n")
+        with open(os.path.join(etc, "cluster.conf"), "w") as filep:
+            filep.write(CLUSTER_CONF % Env.nodename)
+
+    def test_writes_the_launched_flag_and_last_timestamp(self, osvc_path_tests):
+        from utilities.naming import svc_pathvar
+        self.write_config(osvc_path_tests)
+        flag_launched = os.path.join(str(osvc_path_tests), "launched.flag")
+        now = time.time() - 100
+        cache = {}
+        taskworkers.run_action(cache, "svc1", "status", None, now, flag_launched, "session")
+        assert os.path.exists(flag_launched)
+        with open(os.path.join(svc_pathvar("svc1"), "scheduler", "last_status")) as filep:
+            assert float(filep.read()) == pytest.approx(now, abs=1)
+        obj = cache["objects"]["svc1"][1]
+        assert obj.options.cron is not True
+        assert "OSVC_SCHED_FLAG" not in os.environ
+
+        os.unlink(flag_launched)
+        taskworkers.run_action(cache, "svc1", "status", None, now + 10, flag_launched, "session")
+        assert os.path.exists(flag_launched)
+        assert cache["objects"]["svc1"][1] is obj
+
+
+class FakeTaskWorkers(object):
+    def __init__(self):
+        import threading
+        self.lock = threading.RLock()
+        self.submitted = []
+
+    def submit(self, path, run):
+        self.submitted.append((path, run))
+        return run
+
+    def submit_runs(self, runs):
+        for path, run in runs:
+            self.submit(path, run)
+
+
+@pytest.mark.ci
+class TestSchedulerExecAction:
+    @staticmethod
+    @pytest.fixture(scope='function')
+    def scheduler(mocker, osvc_path_tests):
+        mocker.patch.object(shared, 'NODE', mocker.Mock(max_parallel=10))
+        sched = Scheduler()
+        sched._lazy_privlog = mocker.Mock()
+        sched.procs = []
+        sched.running = set()
+        sched.lasts = {}
+        sched.session_ids = {}
+        sched.dropped_via_notify = set()
+        sched.devnull = None
+        sched.task_workers = FakeTaskWorkers()
+        mocker.patch("daemon.scheduler.Popen", side_effect=AssertionError("forked"))
+        return sched
+
+    @staticmethod
+    def test_warm_action_is_submitted(scheduler):
+        sig = ("status", "svc1", None)
+        now = time.time()
+        scheduler.exec_action([sig], "svc1", "status", None, now, now, "session")
+        assert len(scheduler.task_workers.submitted) == 1
+        path, run = scheduler.task_workers.submitted[0]
+        assert path == "svc1"
+        assert run.flag_launched.startswith(os.path.join(scheduler.trace_dir, "launched."))
+        assert scheduler.running == set([sig])
+        assert scheduler.lasts[sig] == now
+        assert scheduler.procs[0].proc is run
+
+        # the worker ran the action and created the flag
+        os.makedirs(scheduler.trace_dir)
+        open(run.flag_launched, "w").close()
+        run.done(0)
+        assert scheduler.janitor_procs() == 1
+        assert not os.path.exists(run.flag_launched)
+        assert scheduler.running == set()
+
+    @staticmethod
+    def test_warm_runs_are_collected(scheduler):
+        sig = ("status", "svc1", None)
+        warm_runs = []
+        scheduler.exec_action([sig], "svc1", "status", None, 0, 0, "session", warm_runs)
+        assert scheduler.task_workers.submitted == []
+        assert [path for path, _ in warm_runs] == ["svc1"]
+        assert scheduler.procs[0].proc is warm_runs[0][1]
+
+    @staticmethod
+    def test_other_actions_are_forked(scheduler):
+        with pytest.raises(AssertionError):
+            scheduler.exec_action([("sync_all", "svc1", None)], "svc1", "sync_all", None, 0, 0, "session")
+        with pytest.raises(AssertionError):
+            scheduler.exec_action([("status", None, None)], None, "status", None, 0, 0, "session")
+        assert scheduler.task_workers.submitted == []
@@ -0,0 +1,94 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+OPENSVC_D = os.path.realpath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Run the om entrypoint with the agent paths relocated in a test directory
+OM_SCRIPT = """
+import sys
+import opensvc
+from env import Env
+root = Env.paths.pathsvc
+for attr in ("pathetc", "pathetcns", "pathlog", "pathtmpv", "pathvar", "pathlock",
+             "nodeconf", "clusterconf", "lsnruxsockd", "lsnruxsock", "lsnruxh2sock",
+             "certs", "daemon_pid", "daemon_pid_args", "nodes_info", "capabilities",
+             "daemon_lock"):
+    value = getattr(Env.paths, attr, None)
+    if value:
+        setattr(Env.paths, attr, value.replace(root, sys.argv[1], 1))
+from opensvc.__main__ import main
+sys.exit(main(["om"] + sys.argv[2:]))
+"""
+
+# Heavy modules a local command must not import
+HEAVY_MODULES = [
+    "foreign.hyper",
+    "foreign.h2.connection",
+    "distutils.version",
+    "urllib.request",
+]
+
+# The commands profiled, and their exit code. The svc1 status is n/a.
+COMMANDS = [
+    (["node", "ls"], 0),
+    (["svc1", "status"], 3),
+]
+
+# Cumulative import time budget of the commands, in seconds
+IMPORT_BUDGET = 0.5
+
+
+def om(tmpdir, args, returncode=0):
+    profile = os.path.join(str(tmpdir), "imports")
+    env = dict(os.environ, OSVC_IMPORT_PROFILE=profile)
+    begin = time.time()
+    proc = subprocess.Popen([sys.executable, "-c", OM_SCRIPT, str(tmpdir)] + list(args),
+                            cwd=os.path.dirname(OPENSVC_D), env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, err = proc.communicate()
+    duration = time.time() - begin
+    assert proc.returncode == returncode, err
+    imports = {}
+    with open(profile, "r") as ofile:
+        for line in ofile.readlines()[1:]:
+            _, cumulative, name = line.rstrip("\n").split("|")
+            # top level imports have a single space indent
+            imports[name.strip()] = (int(cumulative), name.startswith("  "))
+    return duration, imports
+
+
+def import_duration(imports):
+    return sum(cumulative for cumulative, nested in imports.values() if not nested) / 1000000.
+
+
+@pytest.fixture(scope='function')
+def svc_conf(tmpdir):
+    etc = os.path.join(str(tmpdir), "etc")
+    os.makedirs(etc)
+    with open(os.path.join(etc, "svc1.conf"), "w") as ofile:
+        ofile.write("[DEFAULT]\nid = 0e5a4a42-8c6b-4f06-a2c4-ab9ff1e8b1d1\n")
+
+
+@pytest.mark.ci
+@pytest.mark.parametrize("args,returncode", COMMANDS)
+class TestStartup:
+    @staticmethod
+    def test_heavy_modules_are_not_imported(tmpdir, svc_conf, args, returncode):
+        _, imports = om(tmpdir, args, returncode)
+        assert "core.node.node" in imports
+        for modname in HEAVY_MODULES:
+            assert modname not in imports
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("args,returncode", COMMANDS)
+class TestStartupDuration:
+    @staticmethod
+    def test_import_budget(tmpdir, svc_conf, args, returncode):
+        duration, imports = om(tmpdir, args, returncode)
+        print("om %s: %.3fs, imports %.3fs" % (" ".join(args), duration, import_duration(imports)))
+        assert import_duration(imports) < IMPORT_BUDGET
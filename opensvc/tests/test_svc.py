@@ -1,6 +1,15 @@
+import json
+import os
+import threading
+import time
+
 import pytest
 
+import core.status
+import env
 from core.objects.svc import Svc
+from drivers.resource.fs.flag import BaseFsFlag
+from utilities.lazy import set_lazy
 
 
 @pytest.fixture(scope='function', name='svc')
@@ -55,3 +64,85 @@ def test_has_fs_flag_resource(mock_sysname, svc):
         mock_sysname('Linux')
         flag_resource = svc.get_resource('fs#flag1')
         assert flag_resource.type == 'fs.flag'
+
+
+@pytest.fixture(scope='function')
+def has_service_with_fs_flags(osvc_path_tests):
+    pathetc = env.Env.paths.pathetc
+    os.mkdir(pathetc)
+    with open(os.path.join(pathetc, 'svc.conf'), mode='w+') as svc_file:
+        config_txt = """
+[DEFAULT]
+id = abcd
+nodes = *
+
+[fs#flag1]
+type = flag
+
+[fs#flag2]
+type = flag
+
+[fs#flag3]
+type = flag
+subset = s1
+
+[fs#flag4]
+type = flag
+subset = s1
+
+[subset#fs:s1]
+parallel = true
+"""
+        svc_file.write(config_txt)
+
+
+@pytest.mark.ci
+@pytest.mark.usefixtures('has_service_with_fs_flags')
+class TestSvcParallelResourcesStatus:
+    @staticmethod
+    def status(svc):
+        data = svc.print_status_data_eval(refresh=True, write_data=False)
+        del data["updated"]
+        return json.dumps(data, sort_keys=True)
+
+    @staticmethod
+    def test_parallel_status_equals_serial_status(mock_sysname, svc):
+        mock_sysname('Linux')
+        svc.get_resource('fs#flag2').start()
+        svc.get_resource('fs#flag4').start()
+        try:
+            parallel = TestSvcParallelResourcesStatus.status(svc)
+            set_lazy(svc, "status_threads", 1)
+            serial = TestSvcParallelResourcesStatus.status(svc)
+        finally:
+            svc.get_resource('fs#flag2').stop()
+            svc.get_resource('fs#flag4').stop()
+        assert parallel == serial
+        assert '"up"' in parallel and '"down"' in parallel
+
+    @staticmethod
+    def test_resourcesets_are_the_unit_of_concurrency(mock_sysname, mocker, svc):
+        mock_sysname('Linux')
+        threads = {}
+
+        def _status(self, verbose=False):
+            threads[self.rid] = threading.current_thread().name
+            time.sleep(0.1)
+            return core.status.DOWN
+
+        mocker.patch.object(BaseFsFlag, '_status', _status)
+        refreshed = svc.parallel_resources_status(svc.get_resourcesets(["fs"]))
+        assert refreshed == set(['fs#flag1', 'fs#flag2', 'fs#flag3', 'fs#flag4'])
+        assert threads['fs#flag1'] == threads['fs#flag2']
+        assert threads['fs#flag3'] != threads['fs#flag4']
+        assert threading.current_thread().name not in threads.values()
+
+    @staticmethod
+    def test_serial_when_one_thread(svc):
+        set_lazy(svc, "status_threads", 1)
+        assert svc.parallel_resources_status(svc.get_resourcesets(["fs"])) == set()
+
+    @staticmethod
+    def test_skip_non_thread_safe_resources(mocker, svc):
+        mocker.patch.object(BaseFsFlag, 'status_thread_safe', False)
+        assert svc.parallel_resources_status(svc.get_resourcesets(["fs"])) == set()
@@ -106,6 +106,28 @@ def foo(self, _, data=None):
         assert test_obj.foo("bar", data=1) == 0
         assert test_obj.foo("bar", data=2) == 2
 
+    @staticmethod
+    def test_cache_threads_run_function_once(osvc_path_tests):
+        import threading
+        calls = []
+
+        class ObjTest(object):
+            @cache("foo.threads")
+            def foo(self):
+                calls.append(1)
+                time.sleep(0.1)
+                return len(calls)
+
+        test_obj = ObjTest()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(test_obj.foo())) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(calls) == 1
+        assert results == [1, 1, 1, 1]
+
     @staticmethod
     def test_named_cache(osvc_path_tests):
         class ObjTest(object):
@@ -0,0 +1,116 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import utilities.drivers
+from core.keywords import KeywordStore
+from core.objects.svcdict import KEYS, SECTIONS, DATA_SECTIONS
+from utilities.drivers import load_drivers_keywords, registry_fpath
+
+GROUPS = SECTIONS + DATA_SECTIONS
+
+LOAD_SCRIPT = """
+import json, sys, time
+begin = time.time()
+from env import Env
+Env.paths.pathvar = sys.argv[1]
+from core.objects.svcdict import KEYS, SECTIONS, DATA_SECTIONS
+from utilities.drivers import load_drivers_keywords
+load_drivers_keywords(KEYS, SECTIONS + DATA_SECTIONS)
+print(json.dumps({
+    "duration": time.time() - begin,
+    "keywords": KEYS.keywords_count(),
+    "drivers": len([m for m in sys.modules if m.startswith("drivers.resource.")]),
+}))
+"""
+
+
+def load_in_subprocess(pathvar):
+    opensvc_d = os.path.dirname(os.path.dirname(os.path.abspath(utilities.drivers.__file__)))
+    out = subprocess.check_output([sys.executable, "-c", LOAD_SCRIPT, pathvar], cwd=opensvc_d)
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+@pytest.fixture(scope='function')
+def registry(osvc_path_tests, mocker):
+    mocker.patch.object(utilities.drivers, "_REGISTRY_LOADED", set())
+    load_drivers_keywords(KEYS, GROUPS)
+    mocker.patch.object(utilities.drivers, "_REGISTRY_LOADED", set())
+    return registry_fpath()
+
+
+@pytest.mark.ci
+class TestDriversRegistry:
+    @staticmethod
+    def test_registry_is_stored(registry):
+        assert os.path.exists(registry)
+
+    @staticmethod
+    def test_replay_does_not_import_drivers(registry, mocker):
+        load_drivers = mocker.patch.object(utilities.drivers, "load_drivers")
+        kwstore = KeywordStore(provision=True)
+        load_drivers_keywords(kwstore, GROUPS)
+        assert load_drivers.call_count == 0
+        assert "fs" in kwstore.sections
+        assert sorted(kwstore.registered_drivers) == sorted(
+            modname for modname, call in KEYS.registered_drivers.items() if call[0] in GROUPS
+        )
+
+    @staticmethod
+    def test_replay_matches_import(registry):
+        kwstore = KeywordStore(provision=True)
+        load_drivers_keywords(kwstore, GROUPS)
+        n_keywords = 0
+        for section in kwstore.sections.values():
+            for sig, keyword in section.data.items():
+                assert KEYS.sections[section.section].data[sig].dump() == keyword.dump()
+                n_keywords += 1
+        assert n_keywords > 1000
+
+    @staticmethod
+    def test_invalidated_on_driver_change(registry, mocker):
+        mocker.patch.object(utilities.drivers, "REGISTRY_VERSION", 0)
+        load_drivers = mocker.patch.object(utilities.drivers, "load_drivers")
+        load_drivers_keywords(KeywordStore(provision=True), GROUPS)
+        assert load_drivers.call_count == 1
+
+    @staticmethod
+    def test_invalidated_on_site_driver_change(registry, mocker, tmp_path):
+        site_d = tmp_path / "site_opensvc" / "drivers" / "resource" / "fs" / "custom"
+        site_d.mkdir(parents=True)
+        mocker.patch.object(sys, "path", [str(tmp_path)] + sys.path)
+        key = utilities.drivers.registry_key(GROUPS)
+        (site_d / "__init__.py").write_text(u"")
+        assert utilities.drivers.registry_key(GROUPS) != key
+
+    @staticmethod
+    def test_corrupt_registry_is_rebuilt(registry, mocker):
+        with open(registry, "w") as ofile:
+            ofile.write("garbage")
+        load_drivers = mocker.patch.object(utilities.drivers, "load_drivers")
+        load_drivers_keywords(KEYS, GROUPS)
+        assert load_drivers.call_count == 1
+
+    @staticmethod
+    def test_fresh_process_does_not_import_drivers(osvc_path_tests):
+        pathvar = os.path.join(str(osvc_path_tests), "var")
+        miss = load_in_subprocess(pathvar)
+        hit = load_in_subprocess(pathvar)
+        assert miss["drivers"] > 0
+        assert hit["drivers"] == 0
+        assert hit["keywords"] == miss["keywords"]
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize('run', range(3))
+class TestDriversRegistryBenchmark(object):
+    @staticmethod
+    def test_load_keywords(osvc_path_tests, run):
+        pathvar = os.path.join(str(osvc_path_tests), "var")
+        miss = load_in_subprocess(pathvar)
+        hit = load_in_subprocess(pathvar)
+        print("import drivers: %.3fs, registry: %.3fs" % (miss["duration"], hit["duration"]))
+        assert hit["keywords"] == miss["keywords"]
@@ -0,0 +1,152 @@
+import os
+
+import pytest
+
+import utilities.devtree.linux
+from utilities.devtree.linux import DevTree
+
+
+def write(path, content):
+    dirname = os.path.dirname(path)
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+    with open(path, "w") as f:
+        f.write(content + "\n")
+
+
+def add_dev(sysfs, devname, devt, size_mb, holders=None, slaves=None, parent=None):
+    if parent:
+        devpath = os.path.join(sysfs, parent, devname)
+        write(os.path.join(devpath, "partition"), "1")
+    else:
+        devpath = os.path.join(sysfs, devname)
+    write(os.path.join(devpath, "dev"), devt)
+    write(os.path.join(devpath, "size"), str(size_mb * 2048))
+    for name, rels in (("holders", holders or []), ("slaves", slaves or [])):
+        os.makedirs(os.path.join(devpath, name))
+        for rel in rels:
+            os.symlink(os.path.join(sysfs, rel), os.path.join(devpath, name, rel))
+    return devpath
+
+
+def add_link(devfs, linkdir, name, devname):
+    linkdir = os.path.join(devfs, linkdir)
+    if not os.path.exists(linkdir):
+        os.makedirs(linkdir)
+    os.symlink("../../" + devname, os.path.join(linkdir, name))
+
+
+def make_tree(root, n_maps=1, n_paths=2):
+    """
+    Create a synthetic sysfs and devfs tree with <n_maps> multipath maps
+    of <n_paths> paths, each holding a logical volume.
+    """
+    sysfs = os.path.join(str(root), "sys", "block")
+    devfs = os.path.join(str(root), "dev")
+    os.makedirs(sysfs)
+    os.makedirs(devfs)
+    sd_minor = 0
+    for i in range(n_maps):
+        mpath = "dm-%d" % (2 * i)
+        lv = "dm-%d" % (2 * i + 1)
+        paths = []
+        for _ in range(n_paths):
+            path = "sd%d" % sd_minor
+            add_dev(sysfs, path, "8:%d" % sd_minor, 1024, holders=[mpath])
+            add_link(devfs, "disk/by-path", "pci-0:0:%d" % sd_minor, path)
+            paths.append(path)
+            sd_minor += 1
+        devpath = add_dev(sysfs, mpath, "253:%d" % (2 * i), 1024, holders=[lv], slaves=paths)
+        write(os.path.join(devpath, "dm", "name"), "mpath%d" % i)
+        write(os.path.join(devpath, "dm", "uuid"), "mpath-3600%08d" % i)
+        devpath = add_dev(sysfs, lv, "253:%d" % (2 * i + 1), 512, slaves=[mpath])
+        write(os.path.join(devpath, "dm", "name"), "vg%d-lv0" % i)
+        write(os.path.join(devpath, "dm", "uuid"), "LVM-%08d" % i)
+    return sysfs, devfs
+
+
+@pytest.fixture(scope='function')
+def tree_factory(tmp_path, mocker):
+    mocker.patch.object(utilities.devtree.linux, 'capabilities', [])
+    popen = mocker.patch.object(utilities.devtree.linux, 'Popen')
+    mounts = mocker.patch.object(utilities.devtree.linux, 'Mounts')
+    mounts.return_value.get_fpath_dev.return_value = "/dev/sdz1"
+
+    def factory(**kwargs):
+        sysfs, devfs = make_tree(tmp_path, **kwargs)
+        tree = DevTree()
+        tree.sysfs_block = sysfs
+        tree.devfs = devfs
+        tree.dev_h = {}
+        tree.di = object()
+        return tree, sysfs, devfs, popen
+
+    return factory
+
+
+@pytest.mark.ci
+class TestDevTreeSysfs:
+    @staticmethod
+    def test_multipath_and_lv_relations(tree_factory):
+        tree, _, devfs, popen = tree_factory()
+        tree.load()
+        assert popen.call_count == 0
+
+        mpath = tree.get_dev("dm-0")
+        assert mpath.devtype == "multipath"
+        assert mpath.alias == "60000000000"
+        assert sorted(r.parent for r in mpath.parents) == ["sd0", "sd1"]
+        assert [r.child for r in mpath.children] == ["dm-1"]
+        assert "/dev/mpath/mpath0" in mpath.devpath
+
+        lv = tree.get_dev("dm-1")
+        assert lv.alias == "vg0-lv0"
+        assert lv.dg == "vg0"
+        assert lv.size == 512
+        assert "/dev/mapper/vg0-lv0" in lv.devpath
+        assert tree.get_dev_by_devpath("/dev/vg0/lv0") is lv
+
+        path = tree.get_dev("sd0")
+        assert path.devpath == [os.path.join(devfs, "disk/by-path/pci-0:0:0"), "/dev/sd0"]
+        assert tree.dev_h["8:0"] == "sd0"
+
+    @staticmethod
+    def test_partitions_md_loop_and_cdrom(tree_factory):
+        tree, sysfs, _, popen = tree_factory()
+        add_dev(sysfs, "sdz", "8:200", 2048, holders=[])
+        add_dev(sysfs, "sdz1", "8:201", 1024, holders=["md0"], parent="sdz")
+        add_dev(sysfs, "sdy", "8:210", 1024, holders=["md0"])
+        devpath = add_dev(sysfs, "md0", "9:0", 1024, slaves=["sdz1", "sdy"])
+        write(os.path.join(devpath, "md", "level"), "raid1")
+        devpath = add_dev(sysfs, "loop0", "7:0", 100)
+        write(os.path.join(devpath, "loop", "backing_file"), "/srv/disk.img")
+        devpath = add_dev(sysfs, "loop1", "7:1", 100)
+        write(os.path.join(devpath, "loop", "backing_file"), "/srv/gone.img (deleted)")
+        devpath = add_dev(sysfs, "sdx", "11:0", 1024)
+        write(os.path.join(devpath, "device", "media"), "cdrom")
+        tree.load()
+        assert popen.call_count == 0
+
+        assert [r.child for r in tree.get_dev("sdz").children] == ["sdz1"]
+        assert tree.get_dev("sdz1").devpath == ["/dev/sdz1"]
+        md = tree.get_dev("md0")
+        assert md.devtype == "raid1"
+        assert sorted(r.parent for r in md.parents) == ["sdy", "sdz1"]
+        assert [r.parent for r in tree.get_dev("loop0").parents] == ["sdz1"]
+        assert tree.get_dev("loop1").parents == []
+        assert tree.get_dev("sdx") is None
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize('n_maps, n_paths', [(500, 4), (250, 16)])
+class TestDevTreeSysfsBenchmark(object):
+    @staticmethod
+    def test_load(tree_factory, n_maps, n_paths):
+        import time
+        tree, _, _, popen = tree_factory(n_maps=n_maps, n_paths=n_paths)
+        begin = time.time()
+        tree.load()
+        duration = time.time() - begin
+        print("%d maps, %d paths: %.3fs" % (n_maps, n_paths, duration))
+        assert popen.call_count == 0
+        assert len(tree.dev) == n_maps * (n_paths + 2)
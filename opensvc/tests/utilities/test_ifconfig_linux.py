@@ -0,0 +1,155 @@
+import socket
+import struct
+
+import pytest
+
+import utilities.ifconfig.netlink
+from utilities.ifconfig.linux import Ifconfig
+from utilities.ifconfig.netlink import (IFADDRMSG, IFINFOMSG, NLMSG_DONE,
+                                        NLMSG_ERROR, NLMSGHDR, RTATTR,
+                                        NetlinkError, parse_addr, parse_attrs,
+                                        parse_link, request)
+from utilities.storage import Storage
+
+IP_OUT = """\
+1: lo: <LOOPBACK,UP,LOWER_UP> mtu 65536 qdisc noqueue state UNKNOWN group default qlen 1000
+    link/loopback 00:00:00:00:00:00 brd 00:00:00:00:00:00
+    inet 127.0.0.1/8 scope host lo
+       valid_lft forever preferred_lft forever
+    inet6 ::1/128 scope host
+       valid_lft forever preferred_lft forever
+2: eth0@if7: <NO-CARRIER,BROADCAST,MULTICAST,UP> mtu 1500 qdisc noqueue state DOWN group default qlen 1000
+    link/ether 02:42:ac:11:00:02 brd ff:ff:ff:ff:ff:ff link-netnsid 0
+    inet 10.0.0.2/24 brd 10.0.0.255 scope global eth0
+       valid_lft forever preferred_lft forever
+    inet 10.0.0.3/24 brd 10.0.0.255 scope global secondary eth0:1
+       valid_lft forever preferred_lft forever
+    inet 10.9.1.1 peer 10.9.1.2/32 scope global eth0
+       valid_lft forever preferred_lft forever
+    inet6 fe80::42:acff:fe11:2/64 scope link
+       valid_lft forever preferred_lft forever
+"""
+
+LINKS = [
+    Storage(index=1, type=772, flags=0x49, name="lo", mtu=65536,
+            address=b"\0" * 6, link=None, link_netnsid=False),
+    Storage(index=2, type=1, flags=0x1003, name="eth0", mtu=1500,
+            address=b"\x02\x42\xac\x11\x00\x02", link=7, link_netnsid=True),
+]
+
+ADDRS = [
+    Storage(family=socket.AF_INET, prefixlen=8, scope=254, index=1,
+            address="127.0.0.1", local="127.0.0.1", broadcast=None, label="lo"),
+    Storage(family=socket.AF_INET, prefixlen=24, scope=0, index=2,
+            address="10.0.0.2", local="10.0.0.2", broadcast="10.0.0.255", label="eth0"),
+    Storage(family=socket.AF_INET, prefixlen=24, scope=0, index=2,
+            address="10.0.0.3", local="10.0.0.3", broadcast="10.0.0.255", label="eth0:1"),
+    Storage(family=socket.AF_INET, prefixlen=32, scope=0, index=2,
+            address="10.9.1.2", local="10.9.1.1", broadcast=None, label="eth0"),
+    Storage(family=socket.AF_INET6, prefixlen=128, scope=254, index=1,
+            address="::1", local=None, broadcast=None, label=None),
+    Storage(family=socket.AF_INET6, prefixlen=64, scope=253, index=2,
+            address="fe80::42:acff:fe11:2", local=None, broadcast=None, label=None),
+]
+
+
+def rtattr(rta_type, value):
+    data = RTATTR.pack(RTATTR.size + len(value), rta_type) + value
+    return data + b"\0" * (-len(data) % 4)
+
+
+def nlmsg(msg_type, seq, payload):
+    return NLMSGHDR.pack(NLMSGHDR.size + len(payload), msg_type, 0, seq, 0) + payload
+
+
+class FakeSocket(object):
+    def __init__(self, *chunks):
+        self.chunks = list(chunks)
+        self.sent = []
+
+    def send(self, data):
+        self.sent.append(data)
+
+    def recv(self, size):
+        return self.chunks.pop(0)
+
+
+@pytest.mark.ci
+class TestNetlinkParsers:
+    @staticmethod
+    def test_parse_attrs_skips_padding():
+        data = rtattr(3, b"eth0\0") + rtattr(4, struct.pack("=I", 1500))
+        attrs = parse_attrs(data, 0)
+        assert attrs[3] == b"eth0\0"
+        assert attrs[4] == struct.pack("=I", 1500)
+
+    @staticmethod
+    def test_parse_link():
+        payload = IFINFOMSG.pack(socket.AF_UNSPEC, 1, 2, 0x1043, 0) + \
+            rtattr(3, b"eth0\0") + rtattr(4, struct.pack("=I", 9000)) + \
+            rtattr(1, b"\x02\x42\xac\x11\x00\x02") + rtattr(5, struct.pack("=I", 7))
+        link = parse_link(payload)
+        assert link.name == "eth0"
+        assert link.mtu == 9000
+        assert link.link == 7
+        assert link.link_netnsid is False
+
+    @staticmethod
+    def test_parse_addr():
+        payload = IFADDRMSG.pack(socket.AF_INET, 24, 0, 0, 2) + \
+            rtattr(1, socket.inet_aton("10.0.0.2")) + \
+            rtattr(2, socket.inet_aton("10.0.0.2")) + \
+            rtattr(4, socket.inet_aton("10.0.0.255")) + \
+            rtattr(3, b"eth0:1\0")
+        addr = parse_addr(payload)
+        assert addr.local == "10.0.0.2"
+        assert addr.broadcast == "10.0.0.255"
+        assert addr.label == "eth0:1"
+        assert addr.prefixlen == 24
+
+    @staticmethod
+    def test_request_collects_until_done():
+        sock = FakeSocket(
+            nlmsg(16, 1, b"a" * 4) + nlmsg(16, 99, b"x" * 4),
+            nlmsg(16, 1, b"b" * 4) + nlmsg(NLMSG_DONE, 1, b"\0" * 4),
+        )
+        assert request(sock, 18, b"", 1) == [b"a" * 4, b"b" * 4]
+        assert len(sock.sent) == 1
+
+    @staticmethod
+    def test_request_raises_on_error():
+        sock = FakeSocket(nlmsg(NLMSG_ERROR, 1, struct.pack("=i", -1)))
+        with pytest.raises(NetlinkError):
+            request(sock, 18, b"", 1)
+
+
+@pytest.mark.ci
+class TestIfconfigNetlink:
+    @staticmethod
+    def test_parse_netlink_matches_parse_ip():
+        expected = Ifconfig(ip_out=IP_OUT)
+        ifconfig = Ifconfig(ip_out="\n")
+        ifconfig.parse_netlink(LINKS, ADDRS)
+        assert [i.name for i in ifconfig.intf] == ["lo", "eth0", "eth0:1"]
+        for i, j in zip(ifconfig.intf, expected.intf):
+            assert vars(i) == vars(j)
+
+    @staticmethod
+    def test_uses_netlink_cache(mocker):
+        mocker.patch.object(utilities.ifconfig.netlink.NETLINK_CACHE, 'get',
+                            return_value=(LINKS, ADDRS))
+        justcall = mocker.patch('utilities.ifconfig.linux.justcall')
+        ifconfig = Ifconfig()
+        assert justcall.call_count == 0
+        assert ifconfig.has_param("ipaddr", "10.0.0.3").name == "eth0:1"
+
+    @staticmethod
+    def test_fallback_to_ip_addr(mocker):
+        mocker.patch.object(utilities.ifconfig.netlink.NETLINK_CACHE, 'get',
+                            side_effect=OSError("not permitted"))
+        mocker.patch('utilities.ifconfig.linux.capabilities', ["node.x.ip"])
+        justcall = mocker.patch('utilities.ifconfig.linux.justcall',
+                                return_value=(IP_OUT, "", 0))
+        ifconfig = Ifconfig()
+        assert justcall.call_count == 1
+        assert ifconfig.has_param("ipaddr", "10.0.0.3").name == "eth0:1"
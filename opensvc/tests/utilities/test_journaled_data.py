@@ -506,3 +506,253 @@ def test_get_full_return_relative_view_from_arg_path():
         data.set(path=["a"], value={"one": 1})
         view = JournaledDataView(data=data, path=["a"])
         assert view.get_full(path=["one"]) == 1
+
+
+@pytest.mark.ci
+@pytest.mark.parametrize('with_queue', [True, False], ids=["with queue", "without queue"])
+class TestJournaledDataCow(object):
+    @staticmethod
+    def test_has_expected_data_and_journal(with_queue):
+        if skip_journal_check:
+            pytest.skip(skip_journal_check)
+        event_q = queue.Queue() if with_queue else None
+        data = JournaledData(journal_head=[], event_q=event_q, emit_interval=0, cow=True)
+        run(data, True)
+        assert data.dump_data() == EXPECTED_FINAL_DATA
+        assert data.dump_changes() == EXPECTED_CHANGES
+
+    @staticmethod
+    def test_can_apply_journal(with_queue):
+        event_q = queue.Queue() if with_queue else None
+        data = JournaledData(journal_head=["a"], event_q=event_q, emit_interval=0, journal_exclude=[["b"]], cow=True)
+        run(data, False)
+        rdata = JournaledData(cow=True)
+        rdata.patch(patchset=data.dump_changes())
+        expected_patched_copy = deepcopy(EXPECTED_FINAL_DATA["a"])
+        expected_patched_copy.update({"b": 0})
+        assert rdata.dump_data() == expected_patched_copy
+
+
+@pytest.mark.ci
+class TestJournaledDataCowSnapshot(object):
+    @staticmethod
+    def test_snapshot_is_not_changed_by_set_and_unset():
+        data = JournaledData(journal_head=[], cow=True)
+        data.set(path=["a"], value={"one": 1, "two": [1, 2]})
+        snapshot = data.snapshot()
+        data.set(path=["a", "one"], value="ONE")
+        data.set(path=["a", "two", 2], value=3)
+        data.unset(path=["a", "two", 0])
+        assert snapshot == {"a": {"one": 1, "two": [1, 2]}}
+        assert data.snapshot() == {"a": {"one": "ONE", "two": [2, 3]}}
+
+    @staticmethod
+    def test_unchanged_branches_are_shared():
+        data = JournaledData(journal_head=[], cow=True)
+        data.set(path=["nodes"], value={"n1": {"a": 1}, "n2": {"b": 2}})
+        snapshot = data.snapshot()
+        data.set(path=["nodes", "n1", "a"], value=2)
+        assert data.snapshot(["nodes", "n2"]) is snapshot["nodes"]["n2"]
+        assert data.snapshot(["nodes", "n1"]) is not snapshot["nodes"]["n1"]
+
+    @staticmethod
+    def test_snapshot_is_a_copy_without_cow():
+        data = JournaledData(journal_head=[])
+        data.set(path=["a"], value={"one": 1})
+        snapshot = data.snapshot()
+        snapshot["a"]["one"] = 2
+        assert data.get(["a", "one"]) == 1
+
+    @staticmethod
+    def test_set_on_missing_parent_keeps_data_unchanged():
+        data = JournaledData(journal_head=[], cow=True)
+        data.set(path=["a"], value={"one": 1})
+        snapshot = data.snapshot()
+        with pytest.raises(KeyError):
+            data.set(path=["b", "c"], value=1)
+        assert data.snapshot() is snapshot
+
+    @staticmethod
+    def test_journal_is_not_changed_by_caller_path_update():
+        data = JournaledData(journal_head=[], cow=True)
+        path = ["a"]
+        data.set(path=path, value=1)
+        path.append("b")
+        assert data.dump_changes() == [[["a"], 1]]
+
+
+def cluster_dataset(n_nodes, n_objects):
+    """
+    Return a daemon status like dataset with <n_nodes> nodes hosting
+    <n_objects> object instances each.
+    """
+    def instance_status(path):
+        return {
+            "avail": "up",
+            "overall": "up",
+            "frozen": 0,
+            "updated": 1600000000.0,
+            "monitor": {"status": "idle", "status_updated": 1600000000.0},
+            "resources": dict(("fs#%d" % i, {
+                "status": "up",
+                "label": "xfs /dev/vg/lv%d@/srv/%s/%d" % (i, path, i),
+                "log": [],
+                "provisioned": {"state": True, "mtime": 1600000000.0},
+            }) for i in range(5)),
+        }
+
+    def instance_config(path):
+        return {"csum": "%032x" % hash(path), "updated": 1600000000.0, "scope": ["n%d" % i for i in range(n_nodes)]}
+
+    paths = ["ns%d/svc/s%d" % (i % 20, i) for i in range(n_objects)]
+    return {
+        "monitor": {
+            "nodes": dict(("n%d" % n, {
+                "gen": dict(("n%d" % i, 1) for i in range(n_nodes)),
+                "services": {
+                    "status": dict((path, instance_status(path)) for path in paths),
+                    "config": dict((path, instance_config(path)) for path in paths),
+                },
+            }) for n in range(n_nodes)),
+            "services": dict((path, {"avail": "up", "overall": "up"}) for path in paths),
+        },
+    }
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize('n_nodes, n_objects, n_loops', [(4, 500, 20), (40, 2000, 2)])
+class TestJournaledDataCowBenchmark(object):
+    @staticmethod
+    def test_cow_is_faster_than_deepcopy(n_nodes, n_objects, n_loops):
+        import time
+
+        def bench(cow):
+            data = JournaledData(journal_head=["monitor", "nodes", "n0"], cow=cow)
+            data.set(path=[], value=cluster_dataset(n_nodes, n_objects))
+            begin = time.time()
+            for i in range(n_loops):
+                path = "ns%d/svc/s%d" % (i % 20, i)
+                data.set(path=["monitor", "nodes", "n0", "services", "status", path, "monitor", "status"],
+                         value="starting")
+                data.snapshot()
+                data.get_full(path=["monitor", "nodes", "n0"])
+            return time.time() - begin
+
+        deepcopy_duration = bench(cow=False)
+        cow_duration = bench(cow=True)
+        print("%d nodes, %d objects, %d loops: deepcopy %.3fs, cow %.3fs" % (n_nodes, n_objects, n_loops, deepcopy_duration, cow_duration))
+        assert cow_duration < deepcopy_duration
+
+
+def reference_diff(src, dst, prefix=None):
+    """
+    The original recursive JournaledData._diff implementation, used to
+    verify the patches are unchanged.
+    """
+    data = []
+    prefix = prefix or []
+    added = []
+
+    def recurse(d1, d2, path=None, changes=True):
+        try:
+            ref_v = JournaledData.get_ref(path, d2)
+        except (KeyError, IndexError, TypeError):
+            yield [path, d1]
+        else:
+            if ref_v is None and d1 is not None:
+                yield [path, d1]
+            elif isinstance(d1, dict):
+                for k, v in d1.items():
+                    for _ in recurse(v, d2, path=path+[k], changes=changes):
+                        yield _
+            elif isinstance(d1, list):
+                if prefix+path not in added:
+                    if changes:
+                        iterator = enumerate(d1)
+                    else:
+                        iterator = reversed(list(enumerate(d1)))
+                    for i, v in iterator:
+                        for _ in recurse(v, d2, path=path+[i], changes=changes):
+                            yield _
+            elif changes and ref_v != d1:
+                yield [path, d1]
+
+    for k, v in recurse(dst, src, [], changes=True):
+        data.append([prefix+k, v])
+        added.append(prefix+k)
+
+    for k, v in recurse(src, dst, [], changes=False):
+        data.append([prefix+k])
+
+    return data
+
+
+def random_tree(rnd, depth=0):
+    choice = rnd.randint(0, 9 if depth < 4 else 4)
+    if choice == 0:
+        return None
+    if choice <= 2:
+        return rnd.randint(0, 3)
+    if choice <= 4:
+        return rnd.choice(["a", "b", ""])
+    if choice <= 6:
+        return [random_tree(rnd, depth+1) for _ in range(rnd.randint(0, 4))]
+    return dict((rnd.choice("abcdef"), random_tree(rnd, depth+1)) for _ in range(rnd.randint(0, 5)))
+
+
+def mutated_tree(rnd, tree, depth=0):
+    if rnd.randint(0, 5) == 0:
+        return random_tree(rnd, depth)
+    if isinstance(tree, dict):
+        tree = dict((k, mutated_tree(rnd, v, depth+1)) for k, v in tree.items() if rnd.randint(0, 9))
+        if not rnd.randint(0, 4):
+            tree[rnd.choice("abcdef")] = random_tree(rnd, depth+1)
+        return tree
+    if isinstance(tree, list):
+        tree = [mutated_tree(rnd, v, depth+1) for v in tree if rnd.randint(0, 9)]
+        if not rnd.randint(0, 4):
+            tree.append(random_tree(rnd, depth+1))
+        return tree
+    return tree
+
+
+@pytest.mark.ci
+class TestJournaledDataDiff(object):
+    @staticmethod
+    @pytest.mark.parametrize('seed', range(20))
+    def test_diff_is_the_same_as_reference(seed):
+        import random
+        rnd = random.Random(seed)
+        data = JournaledData()
+        for _ in range(50):
+            src = random_tree(rnd)
+            dst = mutated_tree(rnd, src)
+            assert data._diff(src, deepcopy(dst), prefix=["p"]) == reference_diff(src, dst, prefix=["p"])
+            assert data._diff(src, dst) == reference_diff(src, dst)
+
+    @staticmethod
+    def test_diff_of_shared_subtrees_is_empty():
+        data = JournaledData(cow=True)
+        subtree = {"a": [1, 2, {"b": 3}]}
+        assert data._diff({"x": subtree, "y": 1}, {"x": subtree, "y": 2}) == [[["y"], 2]]
+
+
+@pytest.mark.slow
+class TestJournaledDataDiffBenchmark(object):
+    @staticmethod
+    def test_full_dataset_install_is_faster_than_reference():
+        import time
+        src = cluster_dataset(4, 2000)["monitor"]["nodes"]["n0"]
+        dst = deepcopy(src)
+        for i in range(0, 2000, 10):
+            dst["services"]["status"]["ns%d/svc/s%d" % (i % 20, i)]["monitor"]["status"] = "starting"
+        data = JournaledData()
+        begin = time.time()
+        diff = data._diff(src, dst)
+        duration = time.time() - begin
+        begin = time.time()
+        expected = reference_diff(src, dst)
+        reference_duration = time.time() - begin
+        print("diff %.3fs, reference diff %.3fs" % (duration, reference_duration))
+        assert diff == expected
+        assert duration < reference_duration
@@ -0,0 +1,110 @@
+import pytest
+
+import utilities.mounts.linux
+from utilities.mounts.linux import (Mounts, MountTable, merge_mount_options,
+                                    parse_mountinfo)
+
+MOUNTINFO = """\
+22 1 253:0 / / rw,relatime shared:1 - ext4 /dev/mapper/vg-root rw,errors=remount-ro
+23 22 0:21 / /proc rw,nosuid,nodev,noexec,relatime shared:5 - proc proc rw
+40 22 8:17 / /srv/my\\040data rw,noatime shared:20 master:3 - xfs /dev/sdb1 rw,attr2,inode64
+41 22 8:17 /sub /srv/bind rw,noatime shared:20 - xfs /dev/sdb1 rw,attr2,inode64
+42 22 0:45 / /srv/gone\\040(deleted) rw - tmpfs none rw,size=1024k
+bad line
+"""
+
+
+@pytest.fixture(scope='function')
+def mountinfo(tmp_path, mocker):
+    fpath = tmp_path / "mountinfo"
+    fpath.write_text(MOUNTINFO)
+    table = MountTable(path=str(fpath))
+    mocker.patch.object(utilities.mounts.linux, 'MOUNT_TABLE', table)
+    return table
+
+
+@pytest.mark.ci
+class TestParseMountinfo:
+    @staticmethod
+    def test_parse_fields():
+        mounts = parse_mountinfo(MOUNTINFO)
+        assert [m.mnt for m in mounts] == ["/", "/proc", "/srv/my data", "/srv/bind", "/srv/gone"]
+        root = mounts[0]
+        assert root.dev == "/dev/mapper/vg-root"
+        assert root.type == "ext4"
+        assert root.majmin == "253:0"
+        assert root.mnt_opt == "rw,relatime,errors=remount-ro"
+        assert mounts[3].root == "/sub"
+        assert mounts[3].dev == "/dev/sdb1"
+
+    @staticmethod
+    def test_merge_mount_options():
+        assert merge_mount_options("ro,noatime", "rw,attr2,noatime") == "ro,noatime,attr2"
+
+
+@pytest.mark.ci
+class TestMountTable:
+    @staticmethod
+    def test_load_builds_indexes(mountinfo):
+        mounts, index = mountinfo.load()
+        assert len(mounts) == 5
+        assert [m.mnt for m in index["dev"]["/dev/sdb1"]] == ["/srv/my data", "/srv/bind"]
+        assert [m.mnt for m in index["majmin"]["8:17"]] == ["/srv/my data", "/srv/bind"]
+        assert index["mnt"]["/proc"][0].type == "proc"
+
+    @staticmethod
+    def test_invalidate_reloads(mountinfo, tmp_path):
+        mountinfo.load()
+        gen = mountinfo.gen
+        (tmp_path / "mountinfo").write_text(MOUNTINFO.splitlines()[0] + "\n")
+        mountinfo.invalidate()
+        mounts, _ = mountinfo.load()
+        assert mountinfo.gen == gen + 1
+        assert len(mounts) == 1
+
+
+@pytest.mark.ci
+class TestMounts:
+    @staticmethod
+    def test_has_mount(mountinfo):
+        mounts = Mounts()
+        assert mounts.has_mount("/dev/mapper/vg-root", "/") is True
+        assert mounts.has_mount("/dev/sdb1", "/srv/bind") is True
+        assert mounts.has_mount("/dev/sdb1", "/srv/other") is False
+
+    @staticmethod
+    def test_has_param(mountinfo):
+        mounts = Mounts()
+        assert mounts.has_param("dev", "/dev/sdb1").mnt == "/srv/my data"
+        assert mounts.has_param("mnt", "/srv/nope") is None
+        assert mounts.has_param("type", "tmpfs").mnt == "/srv/gone"
+
+    @staticmethod
+    def test_has_param_follows_sort(mountinfo):
+        mounts = Mounts()
+        mounts.sort(key="mnt", reverse=True)
+        assert mounts.has_param("dev", "/dev/sdb1").mnt == "/srv/my data"
+        mounts.sort(key="mnt")
+        assert mounts.has_param("dev", "/dev/sdb1").mnt == "/srv/bind"
+
+    @staticmethod
+    def test_has_majmin(mountinfo):
+        mounts = Mounts()
+        assert mounts.has_majmin("8:17", "/srv/bind") is True
+        assert mounts.has_majmin("8:17", "/") is False
+
+    @staticmethod
+    def test_instances_share_the_table(mountinfo):
+        Mounts()
+        Mounts()
+        assert mountinfo.gen == 1
+
+    @staticmethod
+    def test_fallback_to_mount_command(mocker):
+        mocker.patch.object(utilities.mounts.linux, 'MOUNT_TABLE', MountTable(path="/nonexistent"))
+        justcall = mocker.patch.object(utilities.mounts.linux, 'justcall',
+                                       return_value=("/dev/sda1 on /boot type ext4 (rw,relatime)\n", "", 0))
+        mounts = Mounts()
+        assert justcall.call_count == 1
+        assert mounts.has_mount("/dev/sda1", "/boot") is True
+        assert mounts.has_majmin("8:1", "/boot") is False
@@ -1,6 +1,7 @@
 import json
 import os
 import shutil
+import threading
 import time
 from functools import wraps
 
@@ -10,6 +11,22 @@
 from utilities.files import makedirs
 
 
+# The lock files are held per-process, so the threads of a process also
+# serialize on a per-entry thread lock.
+THREAD_LOCKS = {}
+THREAD_LOCKS_LOCK = threading.Lock()
+
+
+def thread_lock(fpath):
+    with THREAD_LOCKS_LOCK:
+        try:
+            return THREAD_LOCKS[fpath]
+        except KeyError:
+            lock = threading.RLock()
+            THREAD_LOCKS[fpath] = lock
+            return lock
+
+
 def cache_uuid():
     return os.environ.get("OSVC_CACHE_UUID") or Env.session_uuid
 
@@ -40,25 +57,26 @@ def decorator(*args, **kwargs):
 
             fpath = cache_fpath(_sig, sid=sid)
 
-            try:
-                lfd = utilities.lock.lock(timeout=30, delay=0.1, lockfile=fpath + '.lock', intent="cache")
-            except Exception as e:
-                if log:
-                    log.warning("cache locking error: %s. run command uncached." % str(e))
-                return fn(*args, **kwargs)
-            try:
-                if ttl > 0 and is_expired(fpath, ttl):
-                    raise Exception("cache TTL reached: %s" % fpath)
-                data = cache_get(fpath, log=log)
-                return data
-            except Exception as e:
-                if log:
-                    log.debug(str(e))
-                data = fn(*args, **kwargs)
-                cache_put(fpath, data, log=log)
-                return data
-            finally:
-                utilities.lock.unlock(lfd)
+            with thread_lock(fpath):
+                try:
+                    lfd = utilities.lock.lock(timeout=30, delay=0.1, lockfile=fpath + '.lock', intent="cache")
+                except Exception as e:
+                    if log:
+                        log.warning("cache locking error: %s. run command uncached." % str(e))
+                    return fn(*args, **kwargs)
+                try:
+                    if ttl > 0 and is_expired(fpath, ttl):
+                        raise Exception("cache TTL reached: %s" % fpath)
+                    data = cache_get(fpath, log=log)
+                    return data
+                except Exception as e:
+                    if log:
+                        log.debug(str(e))
+                    data = fn(*args, **kwargs)
+                    cache_put(fpath, data, log=log)
+                    return data
+                finally:
+                    utilities.lock.unlock(lfd)
 
         return decorator
 
@@ -108,12 +126,13 @@ def clear_cache(sig, o=None, sid=None):
         return
     if o and hasattr(o, "log"):
         o.log.debug("cache CLEAR: %s" % fpath)
-    lfd = utilities.lock.lock(timeout=30, delay=0.1, lockfile=fpath + '.lock')
-    try:
-        os.unlink(fpath)
-    except:
-        pass
-    utilities.lock.unlock(lfd)
+    with thread_lock(fpath):
+        lfd = utilities.lock.lock(timeout=30, delay=0.1, lockfile=fpath + '.lock')
+        try:
+            os.unlink(fpath)
+        except:
+            pass
+        utilities.lock.unlock(lfd)
 
 
 def purge_cache():
@@ -21,12 +21,12 @@
 
 
 class DevRelation(object):
-    def __init__(self, parent, child, used=0):
+    def __init__(self, parent, child, used=0, tree=None):
         self.child = child
         self.parent = parent
         self.used = used
         self.used_set = False
-        self.tree = None
+        self.tree = tree
 
     def set_used(self, used):
         self.used_set = True
@@ -123,9 +123,9 @@ def add_child(self, devname, size=0, devtype=None):
         if r is None:
             r = self.tree.get_relation(self.devname, devname)
             if r is None:
-                r = DevRelation(parent=self.devname, child=devname, used=size)
-                r.tree = self.tree
+                r = self.tree.new_relation(parent=self.devname, child=devname, used=size)
             self.children.append(r)
+            self.tree.child_devnames.add(devname)
         self.tree.add_dev(devname, size, devtype)
         return r
 
@@ -134,8 +134,7 @@ def add_parent(self, devname, size=0, devtype=None):
         if r is None:
             r = self.tree.get_relation(devname, self.devname)
             if r is None:
-                r = DevRelation(parent=devname, child=self.devname, used=size)
-                r.tree = self.tree
+                r = self.tree.new_relation(parent=devname, child=self.devname, used=size)
             else:
                 r.used = size
             self.parents.append(r)
@@ -276,6 +275,12 @@ def __init__(self):
         # root node of the relation tree
         self.root = []
 
+        # relations indexed by (parent, child), and the names of the
+        # root devices and of the devices referenced as a child
+        self.relations = {}
+        self.root_devnames = set()
+        self.child_devnames = set()
+
     def __iadd__(self, o):
         if isinstance(o, Dev):
             o.tree = self
@@ -284,6 +289,7 @@ def __iadd__(self, o):
                 r = DevRelation(parent=None, child=o.devname, used=o.size)
                 r.tree = self
                 self.root.append(r)
+                self.root_devnames.add(o.devname)
         return self
 
     def __str__(self):
@@ -334,14 +340,12 @@ def print_tree_bottom_up(self, devices=None, verbose=False):
         ftree.out()
 
     def has_relations(self, devname):
-        l = []
-        for r in self.root:
-            if r.child == devname:
-                return True
-            d = self.get_dev(r.child)
-            if d.is_parent(devname):
-                return True
-        return False
+        """
+        Return True if <devname> is a root device or a descendant of a
+        root device. As devices are added either as root or as a child,
+        any device referenced as a child is a descendant of a root.
+        """
+        return devname in self.child_devnames or devname in self.root_devnames
 
     def get_dev(self, devname):
         if devname not in self.dev:
@@ -376,18 +380,18 @@ def add_dev(self, devname, size=0, devtype=None):
         self += d
         return d
 
+    def new_relation(self, parent, child, used=0):
+        r = DevRelation(parent=parent, child=child, used=used, tree=self)
+        self.relations[(parent, child)] = r
+        return r
+
     def set_relation_used(self, parent, child, used):
-        for d in self.dev.values():
-            for r in d.children + d.parents:
-                if parent == r.parent and child == r.child:
-                    r.set_used(used)
+        r = self.get_relation(parent, child)
+        if r is not None:
+            r.set_used(used)
 
     def get_relation(self, parent, child):
-        for d in self.dev.values():
-            for r in d.children + d.parents:
-                if parent == r.parent and child == r.child:
-                    return r
-        return None
+        return self.relations.get((parent, child))
 
     def get_bottom_devs(self):
         return [self.dev[devname] for devname in self.dev if len(self.dev[devname].children) == 0]
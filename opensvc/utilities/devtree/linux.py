@@ -13,6 +13,29 @@
 from core.capabilities import capabilities
 from env import Env
 from utilities.mounts import Mounts
+from utilities.storage import Storage
+
+SYSFS_BLOCK = "/sys/block"
+DEVFS = "/dev"
+
+
+def read_attr(path):
+    """
+    Return the stripped content of a sysfs attribute file, or None if the
+    attribute does not exist.
+    """
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def list_dir(path):
+    try:
+        return os.listdir(path)
+    except OSError:
+        return []
 
 
 class Dev(BaseDev):
@@ -42,6 +65,8 @@ class DevTree(DevTreeVeritas, BaseDevTree):
     di = None
     dev_h = {}
     dev_class = Dev
+    sysfs_block = SYSFS_BLOCK
+    devfs = DEVFS
 
     def get_size(self, devpath):
         size = 0
@@ -297,17 +322,6 @@ def load_dm(self):
                 parentdev = self.get_dev(self.dev_h[dev])
                 parentdev.add_child(mapname)
 
-    def set_udev_symlink(self, d, name):
-        if "node.x.udevadm" not in capabilities:
-            return
-        cmd = ["udevadm", "info", "-q", "symlink", "--name", name]
-        p = Popen(cmd, stdout=PIPE, stderr=PIPE)
-        out, err = p.communicate()
-        if p.returncode != 0:
-            return
-        for s in out.decode().split():
-            d.set_devpath("/dev/"+s)
-
     def get_lv_linear(self):
         try:
             return getattr(self, "lv_linear")
@@ -338,23 +352,17 @@ def get_lv_linear(self):
                 self.lv_linear[mapname] = [(devt, length)]
         return self.lv_linear
 
-    def is_cdrom(self, devname):
-        p = '/sys/block/%s/device/media'%devname
-        if not os.path.exists(p):
-            return False
-        with open(p, 'r') as f:
-            buff = f.read()
-        if buff.strip() == "cdrom":
-            return True
-        return False
-
     def get_loop(self):
+        try:
+            return getattr(self, "loop")
+        except AttributeError:
+            pass
         self.loop = {}
         cmd = [Env.syspaths.losetup]
         p = Popen(cmd, stdout=PIPE, stderr=PIPE)
         out, err = p.communicate()
         if p.returncode != 0:
-            return
+            return self.loop
         for line in out.decode().splitlines():
             if not line.startswith("/"):
                 continue
@@ -367,6 +375,7 @@ def get_loop(self):
                 if fpath.startswith("/"):
                     break
             self.loop[loop] = fpath
+        return self.loop
 
     def dev_type(self, devname):
         t = "linear"
@@ -424,13 +433,114 @@ def add_drbd_relations(self):
                 c = self.get_dev(devname)
                 c.add_parent(d.devname)
 
-    def load_dev(self, devname, devpath):
-        if self.is_cdrom(devname):
+    def scan_sysfs(self):
+        """
+        Return the list of block devices and partitions attributes, read
+        from sysfs in a single pass.
+        """
+        devs = []
+        for devname in list_dir(self.sysfs_block):
+            if devname.startswith("Vx"):
+                continue
+            devpath = os.path.join(self.sysfs_block, devname)
+            devs.append(self.scan_sysfs_dev(devname, devpath))
+            for partname in list_dir(devpath):
+                if not partname.startswith(devname):
+                    continue
+                partpath = os.path.join(devpath, partname)
+                if not os.path.exists(partpath + "/partition"):
+                    continue
+                devs.append(self.scan_sysfs_dev(partname, partpath, disk=devname))
+        return devs
+
+    @staticmethod
+    def scan_sysfs_dev(devname, devpath, disk=None):
+        size = read_attr(devpath + "/size")
+        try:
+            size = int(size) // 2048
+        except (TypeError, ValueError):
+            size = 0
+        return Storage({
+            "devname": devname,
+            "disk": disk,
+            "devt": read_attr(devpath + "/dev"),
+            "size": size,
+            "holders": sorted(list_dir(devpath + "/holders")),
+            "slaves": sorted(list_dir(devpath + "/slaves")),
+            "dm_name": read_attr(devpath + "/dm/name"),
+            "dm_uuid": read_attr(devpath + "/dm/uuid"),
+            "md_level": read_attr(devpath + "/md/level"),
+            "backing_file": read_attr(devpath + "/loop/backing_file"),
+            "media": read_attr(devpath + "/device/media"),
+        })
+
+    def scan_udev_links(self):
+        """
+        Return the /dev/disk/by-* and /dev/md/* symlinks, indexed by the
+        name of the device they point to. These are the symlinks
+        "udevadm info -q symlink" reports, less the /dev/mapper and lvm
+        ones, which are derived from the dm map names.
+        """
+        links = {}
+        linkdirs = glob.glob(os.path.join(self.devfs, "disk", "by-*"))
+        linkdirs.append(os.path.join(self.devfs, "md"))
+        for linkdir in linkdirs:
+            for name in list_dir(linkdir):
+                linkpath = os.path.join(linkdir, name)
+                try:
+                    target = os.readlink(linkpath)
+                except OSError:
+                    continue
+                target = os.path.normpath(os.path.join(linkdir, target))
+                devname = os.path.relpath(target, self.devfs).replace("/", "!")
+                links.setdefault(devname, []).append(linkpath)
+        for devname in links:
+            links[devname].sort()
+        return links
+
+    def load_sysfs_maps(self, devs):
+        """
+        Prime the dm, multipath, wwid, md and loop maps from the sysfs
+        scan, instead of running dmsetup, multipath, losetup and parsing
+        /proc/mdstat.
+        """
+        self.dm_h = {}
+        self._dm_h = {}
+        self.mp_h = {}
+        self.wwid_h = {}
+        self.md_h = {}
+        self.loop = {}
+        for info in devs:
+            if info.dm_name:
+                self.dm_h[info.dm_name] = info.devname
+                self._dm_h[info.devname] = info.dm_name
+                if info.dm_uuid and info.dm_uuid.startswith("mpath-"):
+                    self.mp_h[info.devname] = info.dm_name
+                    # strip the naa type digit, like the "multipath -l" parser
+                    self.wwid_h[info.devname] = info.dm_uuid[7:]
+            if info.md_level:
+                self.md_h[info.devname] = info.md_level
+            if info.backing_file:
+                if info.backing_file.endswith("(deleted)"):
+                    self.loop[info.devname] = "(deleted)"
+                else:
+                    self.loop[info.devname] = info.backing_file
+
+        # powerpath pseudo devices are not exposed in sysfs
+        powerpath = self.get_mp_powerpath()
+        self.mp_h.update(powerpath)
+        self.wwid_h.update(powerpath)
+
+        self.mpath_links = {}
+        for name in list_dir(os.path.join(self.devfs, "mpath")):
+            self.mpath_links[name[1:]] = os.path.join(self.devfs, "mpath", name)
+
+    def load_dev(self, info, devs, links):
+        devname = info.devname
+        if info.media == "cdrom":
             return
 
-        mp_h = self.get_mp()
-        wwid_h = self.get_wwid()
-        size = self.get_size(devpath)
+        size = info.size
 
         # exclude 0-sized md, Symmetrix gatekeeper and vcmdb
         if devname in self.mp_h and size in (0, 2, 30, 45):
@@ -442,8 +552,8 @@ def load_dev(self, devname, devpath):
         if d is None:
             return
 
-        self.set_udev_symlink(d, devname)
-        self.get_dm()
+        for link in links.get(devname, []):
+            d.set_devpath(link)
 
         if 'cciss' in devname:
             d.set_devpath('/dev/'+devname.replace('!', '/'))
@@ -455,26 +565,20 @@ def load_dev(self, devname, devpath):
             d.set_devpath('/dev/'+devname)
 
         # store devt
-        try:
-            with open("%s/dev"%devpath, 'r') as f:
-                devt = f.read().strip()
-                self.dev_h[devt] = devname
-        except IOError:
-            pass
+        if info.devt:
+            self.dev_h[info.devt] = devname
 
         # add holders
-        for holderpath in glob.glob("%s/holders/*"%devpath):
-            holdername = os.path.basename(holderpath)
-            if not os.path.exists(holderpath):
+        for holdername in info.holders:
+            if holdername not in devs:
                 # broken symlink
                 continue
-            size = self.get_size(holderpath)
             devtype = self.dev_type(holdername)
             if d.dg == "" and holdername in self._dm_h:
                 alias = self._dm_h[holdername]
                 s = alias.replace('--', ':').replace('-', '/').replace(':','-')
                 d.dg = s.split("/", 1)[0]
-            d.add_child(holdername, size, devtype)
+            d.add_child(holdername, devs[holdername].size, devtype)
 
         # add lv aliases
         if devname in self._dm_h:
@@ -486,23 +590,18 @@ def load_dev(self, devname, devpath):
             d.set_devpath('/dev/'+s)
 
         # add slaves
-        for slavepath in glob.glob("%s/slaves/*"%devpath):
-            slavename = os.path.basename(slavepath)
-            if not os.path.exists(slavepath):
+        for slavename in info.slaves:
+            if slavename not in devs:
                 # broken symlink
                 continue
-            size = self.get_size(slavepath)
             devtype = self.dev_type(slavename)
-            d.add_parent(slavename, size, devtype)
+            d.add_parent(slavename, devs[slavename].size, devtype)
 
-        if devname in wwid_h:
-            wwid = wwid_h[devname]
+        if devname in self.wwid_h:
+            wwid = self.wwid_h[devname]
             d.set_alias(wwid)
-            try:
-                p = glob.glob('/dev/mpath/?'+wwid)[0]
-                d.set_devpath(p)
-            except:
-                pass
+            if wwid in self.mpath_links:
+                d.set_devpath(self.mpath_links[wwid])
 
         return d
 
@@ -572,23 +671,24 @@ def load_fdisk(self):
                 p.add_parent(devname)
 
     def load_sysfs(self):
-        for devpath in glob.glob("/sys/block/*"):
-            devname = os.path.basename(devpath)
-            if devname.startswith("Vx"):
+        """
+        Build the relation graph from a single sysfs and /dev scan. Only
+        the powerpath, lvm segments and drbd relations still need to run
+        external commands, as sysfs does not expose this data.
+        """
+        devs = self.scan_sysfs()
+        self.load_sysfs_maps(devs)
+        links = self.scan_udev_links()
+        index = dict((info.devname, info) for info in devs)
+        for info in devs:
+            d = self.load_dev(info, index, links)
+            if d is None or info.disk is None:
                 continue
-            d = self.load_dev(devname, devpath)
-
-            if d is None:
+            disk = self.get_dev(info.disk)
+            if disk is None:
                 continue
-
-            # add parts
-            for partpath in glob.glob("%s/%s*"%(devpath, devname)):
-                partname = os.path.basename(partpath)
-                p = self.load_dev(partname, partpath)
-                if p is None:
-                    continue
-                d.add_child(partname)
-                p.add_parent(devname)
+            disk.add_child(info.devname)
+            d.add_parent(info.disk)
 
     def tune_lv_relations(self):
         dm_h = self.get_dm()
@@ -611,7 +711,7 @@ def load(self, di=None):
             from utilities.diskinfo import DiskInfo
             self.di = DiskInfo()
 
-        if len(glob.glob("/sys/block/*/slaves")) == 0:
+        if len(glob.glob(os.path.join(self.sysfs_block, "*", "slaves"))) == 0:
             self.load_fdisk()
             self.load_dm()
         else:
@@ -1,12 +1,23 @@
 import importlib
+import marshal
+import os
 import pkgutil
+import sys
+import threading
 
 from env import Env
+from utilities.hash.md5 import hexdigest
 
 DEFAULT_HEAD = "drivers"
 SITE_HEAD = "site_opensvc.drivers"
 _DRIVERS = set()
 
+# Bump when the format of the recorded register_driver() calls changes
+REGISTRY_VERSION = 1
+REGISTRY_LOCK = threading.RLock()
+_REGISTRY_LOADED = set()
+DRIVERS_D = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "drivers", "resource")
+
 
 def driver_import(*args, **kwargs):
     fallback = kwargs.get('fallback', True)
@@ -127,6 +138,113 @@ def load_drivers(groups=None):
         pass
 
 
+def registry_fpath():
+    return os.path.join(Env.paths.pathvar, "drivers_registry.marshal")
+
+
+def site_drivers_dirs():
+    """
+    Return the resource drivers directories of the site_opensvc packages
+    found in the python path.
+    """
+    dirs = []
+    for path in sys.path:
+        dpath = os.path.join(path or os.getcwd(), *(SITE_HEAD.split(".") + ["resource"]))
+        if os.path.isdir(dpath) and dpath not in dirs:
+            dirs.append(dpath)
+    return dirs
+
+
+def registry_key(groups):
+    """
+    Return the key identifying the drivers registry valid for the
+    installed <groups> drivers modules, including the site drivers: any
+    driver module added, removed or modified invalidates the registry.
+    """
+    files = []
+    drivers_ds = [DRIVERS_D] + site_drivers_dirs()
+    for group in groups:
+        for drivers_d in drivers_ds:
+            for root, dirs, fnames in os.walk(os.path.join(drivers_d, group)):
+                dirs.sort()
+                for fname in sorted(fnames):
+                    if not fname.endswith(".py"):
+                        continue
+                    fpath = os.path.join(root, fname)
+                    try:
+                        st = os.stat(fpath)
+                    except OSError:
+                        continue
+                    files.append("%s:%d:%d" % (fpath, st.st_size, int(st.st_mtime * 1000000)))
+    return "%d:%s:%s" % (REGISTRY_VERSION, ".".join(str(v) for v in sys.version_info[:3]), hexdigest("\n".join(files)))
+
+
+def load_registry(key):
+    """
+    Return the recorded register_driver() calls from the registry file,
+    or None if the registry does not exist or is not valid for <key>.
+
+    The keyword definitions contain sets, which json can not serialize,
+    so the registry uses marshal, tied to the python version by the key.
+    """
+    try:
+        with open(registry_fpath(), "rb") as ofile:
+            data = marshal.load(ofile)
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        return
+    if not isinstance(data, dict) or data.get("key") != key:
+        return
+    return data.get("drivers")
+
+
+def store_registry(key, drivers):
+    fpath = registry_fpath()
+    dirpath = os.path.dirname(fpath)
+    tmpfpath = "%s.%d.%d" % (fpath, os.getpid(), threading.current_thread().ident)
+    try:
+        if not os.path.exists(dirpath):
+            os.makedirs(dirpath, 0o0755)
+        with open(tmpfpath, "wb") as ofile:
+            marshal.dump({"key": key, "drivers": drivers}, ofile)
+        os.rename(tmpfpath, fpath)
+    except (IOError, OSError, TypeError, ValueError):
+        try:
+            os.unlink(tmpfpath)
+        except OSError:
+            pass
+
+
+def load_drivers_keywords(kwstore, groups=None):
+    """
+    Register in <kwstore> the keywords of all the <groups> drivers.
+
+    The register_driver() calls done by the drivers modules at import
+    time are replayed from the drivers registry, so the drivers modules
+    are imported only when a resource is instantiated. On registry miss,
+    the drivers modules are imported and the registry is rebuilt.
+    """
+    groups = list(groups or [])
+    signature = (id(kwstore), tuple(groups))
+    with REGISTRY_LOCK:
+        if signature in _REGISTRY_LOADED:
+            return
+        key = registry_key(groups)
+        drivers = load_registry(key)
+        if drivers is None:
+            load_drivers(groups)
+            drivers = dict(
+                (modname, call) for modname, call in kwstore.registered_drivers.items()
+                if call[0] in groups
+            )
+            store_registry(key, drivers)
+        else:
+            for modname, (driver_group, driver_basename, kwargs) in drivers.items():
+                if modname in kwstore.registered_drivers:
+                    continue
+                kwstore.register_driver(driver_group, driver_basename, **kwargs)
+        _REGISTRY_LOADED.add(signature)
+
+
 def rtypes_with_callable(func_name):
     """
     returns drivers rtypes from loaded drivers class that implement callable func_name
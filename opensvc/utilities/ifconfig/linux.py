@@ -1,4 +1,5 @@
 import copy
+import socket
 
 from utilities.net.converters import cidr_to_dotted
 from env import Env
@@ -37,6 +38,8 @@ def __init__(self, mcast=False, ip_out=None):
             self.mcast_data = {}
         if ip_out:
             self.parse_ip(ip_out)
+        elif self.load_netlink():
+            pass
         elif "node.x.ip" in capabilities:
             cmd = [Env.syspaths.ip, 'addr']
             out, _, _ = justcall(cmd)
@@ -46,6 +49,93 @@ def __init__(self, mcast=False, ip_out=None):
             out, _, _ = justcall(cmd)
             self.parse_ifconfig(out)
 
+    def load_netlink(self):
+        """
+        Load the interfaces from the process-wide rtnetlink dump cache.
+        Return False if netlink is not usable, so the caller can fallback
+        to the "ip addr" or "ifconfig -a" parsers.
+        """
+        try:
+            from .netlink import NETLINK_CACHE
+            links, addrs = NETLINK_CACHE.get()
+        except Exception:
+            return False
+        self.parse_netlink(links, addrs)
+        return True
+
+    def parse_netlink(self, links, addrs):
+        """
+        Build the same Interface objects parse_ip() builds from the
+        equivalent "ip addr" output.
+        """
+        from .netlink import (IFF_UP, IFF_BROADCAST, IFF_RUNNING, IFF_MULTICAST,
+                              IFF_LOOPBACK, LINK_TYPES, SCOPES, attr_hwaddr)
+        names = dict((link.index, link.name) for link in links)
+        link_addrs = {}
+        for addr in addrs:
+            link_addrs.setdefault(addr.index, []).append(addr)
+        for link in links:
+            i = Interface(link.name)
+            if link.link is None or link.link == link.index:
+                i.ifkname = None
+            elif link.link == 0:
+                i.ifkname = "@NONE"
+            elif link.link_netnsid or link.link not in names:
+                i.ifkname = "@if%d" % link.link
+            else:
+                i.ifkname = "@" + names[link.link]
+            i.link_encap = LINK_TYPES.get(link.type, "[%d]" % link.type)
+            i.scope = []
+            i.bcast = []
+            i.mask = []
+            i.mtu = "" if link.mtu is None else str(link.mtu)
+            i.ipaddr = []
+            i.ip6addr = []
+            i.ip6mask = []
+            i.hwaddr = ""
+            if i.link_encap == "ether":
+                i.hwaddr = attr_hwaddr(link.address)
+            i.flag_up = bool(link.flags & IFF_UP)
+            i.flag_broadcast = bool(link.flags & IFF_BROADCAST)
+            # iproute2 does not display RUNNING, but NO-CARRIER for up and not running
+            i.flag_running = False
+            i.flag_multicast = bool(link.flags & IFF_MULTICAST)
+            i.flag_loopback = bool(link.flags & IFF_LOOPBACK)
+            i.flag_no_carrier = bool(link.flags & IFF_UP) and not link.flags & IFF_RUNNING
+            self.intf.append(i)
+
+            for addr in link_addrs.get(link.index, []):
+                scope = SCOPES.get(addr.scope, str(addr.scope))
+                if addr.family == socket.AF_INET and scope == "global" and \
+                   addr.label and ":" in addr.label:
+                    # clone parent intf and reset inet fields
+                    _i = copy.copy(i)
+                    _i.name = addr.label
+                    _i.scope = []
+                    _i.bcast = []
+                    _i.mask = []
+                    _i.ipaddr = []
+                    _i.ip6addr = []
+                    _i.ip6mask = []
+                    self.intf.append(_i)
+                else:
+                    _i = i
+                if addr.address and addr.local != addr.address:
+                    # point-to-point, displayed as "<local> peer <address>/<prefixlen>",
+                    # where parse_ip() retains the peer address
+                    ipaddr = addr.address
+                else:
+                    ipaddr = addr.local
+                if addr.family == socket.AF_INET:
+                    _i.ipaddr += [ipaddr]
+                    _i.mask += [cidr_to_dotted(addr.prefixlen)]
+                elif addr.family == socket.AF_INET6:
+                    _i.ip6addr += [ipaddr]
+                    _i.ip6mask += [str(addr.prefixlen)]
+                if addr.broadcast:
+                    _i.bcast += [addr.broadcast]
+                _i.scope += [scope]
+
     def parse_ip(self, out):
         for line in out.splitlines():
             if len(line) == 0:
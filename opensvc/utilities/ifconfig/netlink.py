@@ -0,0 +1,287 @@
+"""
+A rtnetlink links and addresses dumper, used by the Linux Ifconfig to
+avoid forking and parsing "ip addr".
+
+The dump is cached process-wide, and refreshed only when the kernel
+multicasts a link or address change notification.
+"""
+import errno
+import os
+import socket
+import struct
+import threading
+
+from utilities.storage import Storage
+
+NETLINK_ROUTE = 0
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLMSG_OVERRUN = 4
+
+RTM_GETLINK = 18
+RTM_GETADDR = 22
+
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+
+IFLA_ADDRESS = 1
+IFLA_IFNAME = 3
+IFLA_MTU = 4
+IFLA_LINK = 5
+IFLA_LINK_NETNSID = 37
+
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_LABEL = 3
+IFA_BROADCAST = 4
+
+IFF_UP = 0x1
+IFF_BROADCAST = 0x2
+IFF_LOOPBACK = 0x8
+IFF_RUNNING = 0x40
+IFF_MULTICAST = 0x1000
+
+NLMSGHDR = struct.Struct("=IHHII")
+NLMSGERR = struct.Struct("=i")
+IFINFOMSG = struct.Struct("=BxHiII")
+IFADDRMSG = struct.Struct("=BBBBI")
+RTATTR = struct.Struct("=HH")
+
+# The link types names, as displayed by iproute2 "link/<type>"
+LINK_TYPES = {
+    1: "ether",
+    32: "infiniband",
+    280: "can",
+    512: "ppp",
+    768: "ipip",
+    769: "tunnel6",
+    772: "loopback",
+    776: "sit",
+    778: "gre",
+    801: "ieee802.11",
+    823: "gre6",
+    65534: "none",
+    65535: "void",
+}
+
+# The address scopes names, as displayed by iproute2 "scope <name>"
+SCOPES = {
+    0: "global",
+    200: "site",
+    253: "link",
+    254: "host",
+    255: "nowhere",
+}
+
+RECV_SIZE = 65536
+
+
+class NetlinkError(Exception):
+    pass
+
+
+def align(length):
+    return (length + 3) & ~3
+
+
+def parse_attrs(data, offset):
+    """
+    Return the dict of rtattr payloads, indexed by attribute type.
+    """
+    attrs = {}
+    end = len(data)
+    while offset + RTATTR.size <= end:
+        length, rta_type = RTATTR.unpack_from(data, offset)
+        if length < RTATTR.size:
+            break
+        attrs[rta_type & 0x7fff] = data[offset+RTATTR.size:offset+length]
+        offset += align(length)
+    return attrs
+
+
+def attr_str(value):
+    if value is None:
+        return
+    return value.split(b"\0", 1)[0].decode("utf-8", "replace")
+
+
+def attr_u32(value):
+    if value is None or len(value) < 4:
+        return
+    return struct.unpack("=I", value[:4])[0]
+
+
+def attr_addr(family, value):
+    if value is None:
+        return
+    try:
+        return socket.inet_ntop(family, value)
+    except (ValueError, OSError, socket.error):
+        return
+
+
+def attr_hwaddr(value):
+    if value is None:
+        return ""
+    return ":".join("%02x" % c for c in bytearray(value))
+
+
+def iter_messages(data):
+    offset = 0
+    while offset + NLMSGHDR.size <= len(data):
+        length, msg_type, flags, seq, pid = NLMSGHDR.unpack_from(data, offset)
+        if length < NLMSGHDR.size:
+            break
+        yield msg_type, seq, data[offset+NLMSGHDR.size:offset+length]
+        offset += align(length)
+
+
+def request(sock, msg_type, payload, seq):
+    """
+    Send a dump request and return the list of response payloads.
+    """
+    msg = NLMSGHDR.pack(NLMSGHDR.size + len(payload), msg_type,
+                        NLM_F_REQUEST | NLM_F_DUMP, seq, 0) + payload
+    sock.send(msg)
+    payloads = []
+    while True:
+        data = sock.recv(RECV_SIZE)
+        if not data:
+            raise NetlinkError("netlink socket closed")
+        for _msg_type, _seq, _payload in iter_messages(data):
+            if _seq != seq:
+                continue
+            if _msg_type == NLMSG_DONE:
+                return payloads
+            if _msg_type == NLMSG_ERROR:
+                err = NLMSGERR.unpack_from(_payload)[0]
+                if err:
+                    raise NetlinkError("netlink error %d" % -err)
+                continue
+            if _msg_type == NLMSG_OVERRUN:
+                raise NetlinkError("netlink overrun")
+            payloads.append(_payload)
+
+
+def parse_link(payload):
+    family, link_type, index, flags, change = IFINFOMSG.unpack_from(payload)
+    attrs = parse_attrs(payload, IFINFOMSG.size)
+    return Storage({
+        "index": index,
+        "type": link_type,
+        "flags": flags,
+        "name": attr_str(attrs.get(IFLA_IFNAME)),
+        "mtu": attr_u32(attrs.get(IFLA_MTU)),
+        "address": attrs.get(IFLA_ADDRESS),
+        "link": attr_u32(attrs.get(IFLA_LINK)),
+        "link_netnsid": IFLA_LINK_NETNSID in attrs,
+    })
+
+
+def parse_addr(payload):
+    family, prefixlen, flags, scope, index = IFADDRMSG.unpack_from(payload)
+    attrs = parse_attrs(payload, IFADDRMSG.size)
+    return Storage({
+        "family": family,
+        "prefixlen": prefixlen,
+        "scope": scope,
+        "index": index,
+        "address": attr_addr(family, attrs.get(IFA_ADDRESS)),
+        "local": attr_addr(family, attrs.get(IFA_LOCAL)),
+        "broadcast": attr_addr(family, attrs.get(IFA_BROADCAST)),
+        "label": attr_str(attrs.get(IFA_LABEL)),
+    })
+
+
+def dump():
+    """
+    Return the (links, addrs) lists dumped from the kernel, in the
+    kernel dump order.
+    """
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+    try:
+        sock.bind((0, 0))
+        links = request(sock, RTM_GETLINK, IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0), 1)
+        addrs = request(sock, RTM_GETADDR, IFADDRMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0), 2)
+    finally:
+        sock.close()
+    return [parse_link(payload) for payload in links], [parse_addr(payload) for payload in addrs]
+
+
+class NetlinkCache(object):
+    """
+    The process-wide links and addresses dump cache.
+
+    A netlink socket subscribed to the link and address change groups
+    tells when the cached dump is outdated. The subscription is done
+    before the dump, so no change can be missed.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.sock = None
+        self.pid = None
+        self.gen = 0
+        self.data = None
+
+    def close(self):
+        with self.lock:
+            if self.sock is not None:
+                self.sock.close()
+            self.sock = None
+            self.pid = None
+
+    def invalidate(self):
+        with self.lock:
+            self.data = None
+
+    def subscribe(self):
+        self.close()
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        try:
+            sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+            sock.setblocking(False)
+        except Exception:
+            sock.close()
+            raise
+        self.sock = sock
+        self.pid = os.getpid()
+
+    def changed(self):
+        """
+        Drain the notifications and return True if any was received.
+        """
+        changed = False
+        while True:
+            try:
+                data = self.sock.recv(RECV_SIZE)
+            except (IOError, OSError, socket.error) as exc:
+                # EAGAIN when drained, ENOBUFS when notifications were lost
+                if getattr(exc, "errno", None) not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    changed = True
+                return changed
+            if not data:
+                return True
+            changed = True
+
+    def get(self):
+        """
+        Return the up-to-date (links, addrs) tuple. The returned lists
+        are never modified, only replaced on refresh.
+        """
+        with self.lock:
+            if self.sock is None or self.pid != os.getpid():
+                # first access, or forked: don't share the parent socket
+                self.subscribe()
+                self.data = None
+            if self.changed() or self.data is None:
+                self.data = dump()
+                self.gen += 1
+            return self.data
+
+
+NETLINK_CACHE = NetlinkCache()
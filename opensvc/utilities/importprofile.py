@@ -0,0 +1,122 @@
+"""
+Record the modules import durations of a command, in the python
+"-X importtime" format, when the OSVC_IMPORT_PROFILE environment variable
+is set to a file path:
+
+    OSVC_IMPORT_PROFILE=/tmp/om.imports om node ls
+    sort -t'|' -k2 -n -r /tmp/om.imports | head
+
+Unlike "-X importtime", this mode works on all python versions and also
+records the modules imported through importlib.import_module(), like
+the drivers.
+"""
+import atexit
+import importlib
+import sys
+import time
+
+try:
+    import builtins
+except ImportError:
+    import __builtin__ as builtins
+
+ENV_VAR = "OSVC_IMPORT_PROFILE"
+HEADER = "import time: self [us] | cumulative | imported package\n"
+
+
+def resolve_name(name, package, level):
+    """
+    Return the absolute name of the <name> module imported relatively to
+    <package>, <level> being the number of leading dots.
+    """
+    package = package or ""
+    if level > 1:
+        package = package.rsplit(".", level - 1)[0]
+    return ".".join(e for e in (package, name) if e)
+
+
+class ImportProfiler(object):
+    def __init__(self):
+        self.records = []
+        self.depth = 0
+        self.children = [0]
+        self.orig_import = None
+        self.orig_import_module = None
+
+    def profile(self, key, func, *args):
+        """
+        Call <func> with <args>, recording the duration under the <key>
+        module name if the call imported new modules.
+        """
+        n_modules = len(sys.modules)
+        self.depth += 1
+        self.children.append(0)
+        begin = time.time()
+        try:
+            return func(*args)
+        finally:
+            cumulative = int((time.time() - begin) * 1000000)
+            children = self.children.pop()
+            self.depth -= 1
+            if len(sys.modules) != n_modules:
+                self.children[-1] += cumulative
+                self.records.append((cumulative - children, cumulative, self.depth, key))
+
+    def install(self):
+        self.orig_import = builtins.__import__
+        self.orig_import_module = importlib.import_module
+
+        def profiled_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if level and globals:
+                key = resolve_name(name, globals.get("__package__"), level)
+            else:
+                key = name
+            if not fromlist and key in sys.modules:
+                return self.orig_import(name, globals, locals, fromlist, level)
+            return self.profile(key, self.orig_import, name, globals, locals, fromlist, level)
+
+        def profiled_import_module(name, package=None):
+            if name.startswith("."):
+                relname = name.lstrip(".")
+                key = resolve_name(relname, package, len(name) - len(relname))
+            else:
+                key = name
+            if key in sys.modules:
+                return self.orig_import_module(name, package)
+            return self.profile(key, self.orig_import_module, name, package)
+
+        builtins.__import__ = profiled_import
+        importlib.import_module = profiled_import_module
+
+    def uninstall(self):
+        builtins.__import__ = self.orig_import
+        importlib.import_module = self.orig_import_module
+
+    def format(self):
+        buff = HEADER
+        for _self, cumulative, depth, name in self.records:
+            buff += "import time: %9d | %10d | %s%s\n" % (_self, cumulative, "  " * depth, name)
+        return buff
+
+    def dump(self, fpath):
+        with open(fpath, "w") as ofile:
+            ofile.write(self.format())
+
+
+def start(fpath):
+    """
+    Install the import profiler and schedule the dump of its records to
+    <fpath> at exit.
+    """
+    profiler = ImportProfiler()
+    profiler.install()
+
+    def dump():
+        profiler.uninstall()
+        try:
+            profiler.dump(fpath)
+        except (IOError, OSError):
+            pass
+
+    atexit.register(dump)
+    return profiler
@@ -0,0 +1,98 @@
+"""
+A minimal ctypes binding of the Linux inotify api.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+import sys
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o0004000
+
+EVENT = struct.Struct("iIII")
+READ_SIZE = 65536
+
+
+class Inotify(object):
+    """
+    A non-blocking inotify instance. Raise OSError if inotify is not
+    supported on this platform.
+    """
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify is not supported on %s" % sys.platform)
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        if self.fd < 0:
+            return
+        os.close(self.fd)
+        self.fd = -1
+
+    def add_watch(self, path, mask):
+        """
+        Watch <path> for the <mask> events and return the watch descriptor.
+        """
+        if not isinstance(path, bytes):
+            path = path.encode()
+        wd = self.libc.inotify_add_watch(self.fd, path, ctypes.c_uint32(mask))
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        return wd
+
+    def rm_watch(self, wd):
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self):
+        """
+        Return the list of pending (wd, mask, cookie, name) events, an empty
+        list if none is pending.
+        """
+        events = []
+        while True:
+            try:
+                buff = os.read(self.fd, READ_SIZE)
+            except OSError as exc:
+                if exc.errno in (errno.EAGAIN, errno.EINTR):
+                    return events
+                raise
+            if not buff:
+                return events
+            events += parse_events(buff)
+
+
+def parse_events(buff):
+    events = []
+    offset = 0
+    while offset + EVENT.size <= len(buff):
+        wd, mask, cookie, length = EVENT.unpack_from(buff, offset)
+        offset += EVENT.size
+        name = buff[offset:offset+length].rstrip(b"\0").decode("utf-8", "replace")
+        offset += length
+        events.append((wd, mask, cookie, name))
+    return events
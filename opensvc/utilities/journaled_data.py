@@ -72,6 +72,25 @@ def patch(self, path=None, patchset=None):
         return self.data.patch(path=path, patchset=patchset)
 
 
+def shallow_copy(node):
+    """
+    Return a shallow copy of a dataset container node.
+    """
+    if type(node) is dict:
+        return node.copy()
+    if type(node) is list:
+        return node[:]
+    return copy.copy(node)
+
+
+def copy_diff(diff):
+    """
+    Return a copy of a json_delta formatted diff sharing the values with
+    <diff>. Only the diff fragments and their paths are copied.
+    """
+    return [[list(fragment[0])] + fragment[1:] for fragment in diff]
+
+
 def debug(m):
     def fn(*args, **kwargs):
         try:
@@ -87,8 +106,17 @@ def fn(*args, **kwargs):
 class JournaledData(object):
     def __init__(self, initial_data=None, journal_head=None,
                  journal_exclude=None, journal_condition=None,
-                 event_q=None, emit_interval=0.3):
+                 event_q=None, emit_interval=0.3, cow=False):
+        """
+        If <cow> is True, the dataset is a persistent tree: the stored nodes
+        are never modified in place. Writers copy the containers on the path
+        of the change and share the other branches with the previous tree,
+        so readers can hold a reference to any node as a consistent
+        snapshot, and the journal and events can reference the stored
+        values without copying them.
+        """
         ok = lambda: True
+        self.cow = cow
         self.data = initial_data or {}
         self.journal_head = journal_head
         self.journal_exclude = journal_exclude or []
@@ -139,7 +167,7 @@ def get_full(self, path=None):
         path = path or []
         with self.lock:
             self.diff = []
-            return copy.deepcopy(self.get_ref(path, self.data))
+            return self._snapshot_lk(path)
 
     def exists(self, path=None):
         if not path:
@@ -156,6 +184,24 @@ def get_copy(self, path=None):
             data = self.get_ref(path, self.data)
             return copy.deepcopy(data)
 
+    def snapshot(self, path=None):
+        """
+        Return a consistent image of the data at <path>.
+
+        In cow mode, the image is the stored node itself, shared with the
+        dataset and the other readers, so it must be considered read-only.
+        Otherwise the image is a deep copy.
+        """
+        path = path or []
+        with self.lock:
+            return self._snapshot_lk(path)
+
+    def _snapshot_lk(self, path):
+        data = self.get_ref(path, self.data)
+        if self.cow:
+            return data
+        return copy.deepcopy(data)
+
     @staticmethod
     def get_ref(path, data):
         return reduce(operator.getitem, path, data)
@@ -213,7 +259,9 @@ def _set(self, path, value):
         """
         Low-level set. No journaling, no messaging.
         """
-        if path:
+        if path and self.cow:
+            self.data = self._cow_set(self.data, path, value)
+        elif path:
             cursor = self.get_ref(path[:-1], self.data)
             key = path[-1]
             try:
@@ -226,6 +274,38 @@ def _set(self, path, value):
         else:
             self.data = value
 
+    def _cow_set(self, node, path, value):
+        """
+        Return a copy of <node> with the data at the relative <path> set
+        to <value>. Only the containers on the path are copied.
+        """
+        node = shallow_copy(node)
+        key = path[0]
+        if len(path) > 1:
+            node[key] = self._cow_set(node[key], path[1:], value)
+            return node
+        try:
+            node[key] = value
+        except IndexError:
+            if len(node) == key:
+                node.append(value)
+            else:
+                raise
+        return node
+
+    def _cow_unset(self, node, path):
+        """
+        Return a copy of <node> without the data at the relative <path>.
+        Only the containers on the path are copied.
+        """
+        node = shallow_copy(node)
+        key = path[0]
+        if len(path) > 1:
+            node[key] = self._cow_unset(node[key], path[1:])
+        else:
+            del node[key]
+        return node
+
     def _to_journal_diff(self, absolute_diff):
         if self.journal_condition() and self.journal_head is not None:
             if not self.journal_head:
@@ -305,6 +385,9 @@ def _unset(self, path):
         """
         Low-level unset. No journaling, no messaging.
         """
+        if self.cow:
+            self.data = self._cow_unset(self.data, path)
+            return
         data = self.get_ref(path[:-1], self.data)
         del data[path[-1]]
 
@@ -338,7 +421,10 @@ def push_diff_lk(self, diff):
         """
         Concat a diff list to the in-flight diff list.
         """
-        self.diff += copy.deepcopy(diff)
+        if self.cow:
+            self.diff += copy_diff(diff)
+        else:
+            self.diff += copy.deepcopy(diff)
 
     def pop_diff(self):
         """
@@ -374,7 +460,10 @@ def emit(self, diff):
         if not diff:
             return
         now = time.time()
-        self.coalesce += copy.deepcopy(diff)
+        if self.cow:
+            self.coalesce += copy_diff(diff)
+        else:
+            self.coalesce += copy.deepcopy(diff)
         next_emit = self.emit_interval - (now - self.last_emit)
         if next_emit > 0:
             if not self.timer:
@@ -450,37 +539,58 @@ def excluded(p):
         return data
 
     def _diff(self, src, dst, prefix=None):
+        """
+        Return the json_delta formatted diff transforming <src> into <dst>,
+        with paths prefixed by <prefix>.
+
+        The subtrees identical in <src> and <dst> are skipped without
+        walking them: by identity, which is O(1) for the branches shared in
+        cow mode, or by a C-level equality test.
+        """
         data = []
         prefix = prefix or []
-        added = []
+        added = set()
+        missing = object()
 
-        def recurse(d1, d2, path=None, changes=True):
+        def child(ref, key):
+            if ref is missing:
+                return missing
             try:
-                ref_v = self.get_ref(path, d2)
+                return ref[key]
             except (KeyError, IndexError, TypeError):
+                return missing
+
+        def recurse(d1, ref_v, path, changes=True):
+            if ref_v is missing:
+                yield [path, d1]
+            elif ref_v is None and d1 is not None:
+                yield [path, d1]
+            elif d1 is ref_v:
+                return
+            elif isinstance(d1, dict):
+                if type(ref_v) is type(d1) and ref_v == d1:
+                    return
+                for k, v in d1.items():
+                    for _ in recurse(v, child(ref_v, k), path+[k], changes=changes):
+                        yield _
+            elif isinstance(d1, list):
+                if tuple(path) in added:
+                    return
+                if type(ref_v) is type(d1) and ref_v == d1:
+                    return
+                if changes:
+                    iterator = enumerate(d1)
+                else:
+                    iterator = reversed(list(enumerate(d1)))
+                for i, v in iterator:
+                    for _ in recurse(v, child(ref_v, i), path+[i], changes=changes):
+                        yield _
+            elif changes and ref_v != d1:
                 yield [path, d1]
-            else:
-                if ref_v is None and d1 is not None:
-                    yield [path, d1]
-                elif isinstance(d1, dict):
-                    for k, v in d1.items():
-                        for _ in recurse(v, d2, path=path+[k], changes=changes):
-                            yield _
-                elif isinstance(d1, list):
-                    if prefix+path not in added:
-                        if changes:
-                            iterator = enumerate(d1)
-                        else:
-                            iterator = reversed(list(enumerate(d1)))
-                        for i, v in iterator:
-                            for _ in recurse(v, d2, path=path+[i], changes=changes):
-                                yield _
-                elif changes and ref_v != d1:
-                    yield [path, d1]
 
         for k, v in recurse(dst, src, [], changes=True):
             data.append([prefix+k, v])
-            added.append(prefix+k)
+            added.add(tuple(k))
 
         for k, v in recurse(src, dst, [], changes=False):
             data.append([prefix+k])
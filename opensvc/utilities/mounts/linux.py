@@ -1,14 +1,187 @@
 import os
+import re
+import select
+import threading
 
 import utilities.devices.linux
 from env import Env
 from utilities.proc import justcall
 from .mounts import BaseMounts, Mount
 
+MOUNTINFO = "/proc/self/mountinfo"
+RE_OCTAL_ESCAPE = re.compile(r"\\([0-7]{3})")
+
+
+def unescape(s):
+    """
+    Decode the octal escapes of spaces, tabs, newlines and backslashes
+    in the mountinfo fields.
+    """
+    if "\\" not in s:
+        return s
+    return RE_OCTAL_ESCAPE.sub(lambda m: chr(int(m.group(1), 8)), s)
+
+
+def merge_mount_options(mnt_opt, super_opt):
+    """
+    Merge the per-mount and per-superblock options the way mount(8) displays
+    them.
+    """
+    opts = mnt_opt.split(",")
+    for opt in super_opt.split(","):
+        if opt in ("rw", "ro") or opt in opts:
+            continue
+        opts.append(opt)
+    return ",".join(opts)
+
+
+def parse_mountinfo(buff):
+    """
+    Parse a /proc/<pid>/mountinfo content and return the list of Mount.
+
+    The line format is:
+    <id> <parent id> <major:minor> <root> <mount point> <mount options>
+    [<optional fields> ...] - <fs type> <source> <super options>
+    """
+    mounts = []
+    for line in buff.splitlines():
+        words = line.split()
+        try:
+            sep = words.index("-", 6)
+            majmin = words[2]
+            root = unescape(words[3])
+            mnt = unescape(words[4])
+            mnt_opt = words[5]
+            fs_type = words[sep+1]
+            dev = unescape(words[sep+2])
+            super_opt = words[sep+3] if len(words) > sep + 3 else ""
+        except (ValueError, IndexError):
+            continue
+        if mnt.endswith(" (deleted)"):
+            mnt = mnt[:-10]
+        mount = Mount(dev, mnt, fs_type, merge_mount_options(mnt_opt, super_opt))
+        mount.majmin = majmin
+        mount.root = root
+        mounts.append(mount)
+    return mounts
+
+
+class MountTable(object):
+    """
+    The process-wide mount table, parsed from /proc/self/mountinfo.
+
+    The table is reloaded only when the kernel signals a mount namespace
+    change, through a POLLPRI event on the mountinfo file descriptor. On
+    systems where the file is not pollable, the table is reloaded on each
+    access, which still avoids a mount(8) fork.
+    """
+    def __init__(self, path=MOUNTINFO):
+        self.path = path
+        self.lock = threading.RLock()
+        self.fd = None
+        self.poller = None
+        self.pid = None
+        self.gen = 0
+        self.mounts = None
+        self.index = None
+
+    def close(self):
+        with self.lock:
+            if self.fd is not None:
+                try:
+                    os.close(self.fd)
+                except OSError:
+                    pass
+            self.fd = None
+            self.poller = None
+            self.pid = None
+
+    def invalidate(self):
+        """
+        Force a reload on next access.
+        """
+        with self.lock:
+            self.mounts = None
+
+    def open(self):
+        self.close()
+        self.fd = os.open(self.path, os.O_RDONLY)
+        self.pid = os.getpid()
+        try:
+            self.poller = select.poll()
+            self.poller.register(self.fd, select.POLLPRI | select.POLLERR)
+        except (AttributeError, OSError, ValueError):
+            self.poller = None
+
+    def changed(self):
+        """
+        Return True if the kernel signaled a mount table change since the
+        last call.
+        """
+        if self.poller is None:
+            return True
+        try:
+            for _, event in self.poller.poll(0):
+                if event & (select.POLLPRI | select.POLLERR):
+                    return True
+        except (OSError, select.error):
+            return True
+        return False
+
+    def read(self):
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        chunks = []
+        while True:
+            chunk = os.read(self.fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return b"".join(chunks).decode("utf-8", "replace")
+
+    def load(self):
+        """
+        Return the up-to-date (mounts, index) tuple. The returned
+        structures are never modified, only replaced on reload.
+        """
+        with self.lock:
+            if self.fd is None or self.pid != os.getpid():
+                # first access, or forked: /proc/self was resolved to the parent
+                self.open()
+                self.mounts = None
+            changed = self.changed()
+            if changed or self.mounts is None:
+                self.mounts = parse_mountinfo(self.read())
+                self.index = self.build_index(self.mounts)
+                self.gen += 1
+            return self.mounts, self.index
+
+    @staticmethod
+    def build_index(mounts):
+        index = {
+            "mnt": {},
+            "dev": {},
+            "majmin": {},
+        }
+        for mount in mounts:
+            index["mnt"].setdefault(mount.mnt, []).append(mount)
+            index["dev"].setdefault(mount.dev, []).append(mount)
+            # mounts parsed from mount(8) have no majmin
+            majmin = getattr(mount, "majmin", None)
+            if majmin:
+                index["majmin"].setdefault(majmin, []).append(mount)
+        return index
+
+
+MOUNT_TABLE = MountTable()
+
 
 class Mounts(BaseMounts):
     df_one_cmd = [Env.syspaths.df, '-l']
 
+    def __init__(self):
+        self.index = None
+        super(Mounts, self).__init__()
+
     def match_mount(self, i, dev, mnt):
         """Given a line of 'mount' output, returns True if (dev, mnt) matches
         this line. Returns False otherwize. Also care about weirdos like loops
@@ -29,6 +202,14 @@ def match_mount(self, i, dev, mnt):
         return False
 
     def parse_mounts(self):
+        try:
+            mounts, self.index = MOUNT_TABLE.load()
+            # the shared list is never modified, but sort() reorders ours
+            return list(mounts)
+        except (OSError, IOError):
+            return self.parse_mounts_cmd()
+
+    def parse_mounts_cmd(self):
         out, err, ret = justcall([Env.syspaths.mount])
         out = out.replace(" (deleted)", "")
         mounts = []
@@ -40,6 +221,48 @@ def parse_mounts(self):
             mounts.append(m)
         return mounts
 
+    def get_index(self):
+        if self.index is None and self.mounts is not None:
+            self.index = MountTable.build_index(self.mounts)
+        return self.index
+
+    def sort(self, key='mnt', reverse=False):
+        super(Mounts, self).sort(key=key, reverse=reverse)
+        # the index lists must follow the mounts order
+        self.index = None
+
+    def has_mount(self, dev, mnt):
+        if self.mounts is None:
+            return super(Mounts, self).has_mount(dev, mnt)
+        for i in self.get_index()["mnt"].get(mnt, []):
+            if self.match_mount(i, dev, mnt):
+                return True
+        return False
+
+    def mount(self, dev, mnt):
+        for i in (self.get_index() or {}).get("mnt", {}).get(mnt, []):
+            if self.match_mount(i, dev, mnt):
+                return i
+        return None
+
+    def has_param(self, param, value):
+        if param not in ("mnt", "dev") or self.mounts is None:
+            return super(Mounts, self).has_param(param, value)
+        try:
+            return self.get_index()[param][value][0]
+        except (KeyError, IndexError):
+            return None
+
+    def has_majmin(self, majmin, mnt):
+        """
+        Return True if the device <majmin> ("<major>:<minor>") is mounted
+        on <mnt>, whatever the device path used to mount it.
+        """
+        for i in (self.get_index() or {}).get("majmin", {}).get(majmin, []):
+            if i.mnt == mnt:
+                return True
+        return False
+
 
 if __name__ == "__main__":
     for m in Mounts():
@@ -419,6 +419,17 @@ def object_path_glob(pattern, pds=None, namespace=None, kind=None, negate=False)
     pds = pds or []
     if kind:
         pds = [pd for pd in pds if pd["kind"] == kind]
+    _selector = path_glob_pattern(pattern, namespace=namespace, kind=kind)
+    if _selector is None:
+        return []
+    return [pd["display"] for pd in pds if negate ^ fnmatch.fnmatch(pd["normalized"], _selector)]
+
+
+def path_glob_pattern(pattern, namespace=None, kind=None):
+    """
+    Return the fnmatch pattern matching the normalized paths selected by
+    the <pattern> path glob, or None if <pattern> is not a valid glob.
+    """
     l = pattern.split("/")
     n = len(l)
     if n == 3:
@@ -450,7 +461,7 @@ def object_path_glob(pattern, pds=None, namespace=None, kind=None, negate=False)
         else:
             _selector = "%s/%s/%s" % (namespace or "root", kind or "svc", l[0])
     else:
-        return []
-    return [pd["display"] for pd in pds if negate ^ fnmatch.fnmatch(pd["normalized"], _selector)]
+        return
+    return _selector
 
 
@@ -8,7 +8,6 @@
 import os
 import re
 import time
-from distutils.version import LooseVersion as V # pylint: disable=no-name-in-module,import-error
 
 import utilities.lock
 import core.status
@@ -201,6 +200,7 @@ def docker_min_version(self, version):
             cmd = [self.docker_exe, "--version"]
         except ex.InitError:
             return False
+        from distutils.version import LooseVersion as V # pylint: disable=no-name-in-module,import-error
         if V(self.docker_version) >= V(version):
             return True
         return False
@@ -0,0 +1 @@
+version = 'dev'
\ No newline at end of file